@@ -0,0 +1,143 @@
+"""
+ASGI entry point: /chat and /chat/stream are served by the asyncio pipeline
+(ChatBot.aprocess_question / aprocess_question_stream), every other route by the Flask app.
+
+Run with: uvicorn asgi:app --host 0.0.0.0 --port 8000
+or, one process per core: gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:app
+"""
+import gc
+import os
+import json
+import asyncio
+import logging
+from asgiref.wsgi import WsgiToAsgi
+
+import main
+import log_config
+
+logger = logging.getLogger(__name__)
+
+# Under gunicorn (set by gunicorn.conf.py) the services are loaded now, as wsgi.py does: with preload_app
+# in the master, before the workers are forked and start their background tasks (post_worker_init)
+if os.getenv("INIT_SERVICES_ON_IMPORT", "false").lower() == "true":
+    main.init_services()
+    # Keep the garbage collector from copying the loaded index into every forked worker
+    gc.freeze()
+
+flask_app = WsgiToAsgi(main.app)
+
+# Flask-CORS allows every origin on the Flask routes; the async routes send the same header
+CORS_HEADERS = [(b"access-control-allow-origin", b"*")]
+
+
+async def read_json(receive) -> dict:
+    """Read the request body and parse it as JSON"""
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    return json.loads(body) if body else {}
+
+
+def assign_request_id(scope) -> list:
+    """Tag the logs of the request (its asyncio task) with the caller's X-Request-ID, or a new ID.
+    Returns the response header carrying it."""
+    header = dict(scope.get("headers") or []).get(b"x-request-id", b"").decode("latin-1")
+    request_id = log_config.set_request_id(header)
+    return [(b"x-request-id", request_id.encode("ascii"))]
+
+
+async def send_json(send, payload: dict, status: int = 200, headers: list = ()):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json")] + CORS_HEADERS + list(headers),
+    })
+    await send({"type": "http.response.body", "body": json.dumps(payload, ensure_ascii=False).encode("utf-8")})
+
+
+async def chat(scope, receive, send):
+    """Async /chat: same request and response as the Flask route"""
+    request_id_header = assign_request_id(scope)
+    try:
+        data = await read_json(receive)
+    except ValueError as e:
+        await send_json(send, {"error": f"Error processing request: {str(e)}"}, status=400, headers=request_id_header)
+        return
+
+    question = data.get('question', '')
+    logger.info("Received chat request: %s", question)
+    response = await main.chatbot.aprocess_question(question, data.get('user_id'), data.get('session_id'))
+    logger.info("Generated response: %s", response.get('type', 'text'))
+    await send_json(send, response, headers=request_id_header)
+
+
+async def chat_stream(scope, receive, send):
+    """Async /chat/stream: same server-sent events as the Flask route"""
+    request_id_header = assign_request_id(scope)
+    try:
+        data = await read_json(receive)
+    except ValueError:
+        data = {}
+
+    question = data.get('question', '')
+    logger.info("Received streaming chat request: %s", question)
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/event-stream; charset=utf-8"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),  # Keep reverse proxies from buffering the stream
+        ] + CORS_HEADERS + request_id_header,
+    })
+    events = main.chatbot.aprocess_question_stream(question, data.get('user_id'), data.get('session_id'))
+    try:
+        async for event, payload in events:
+            if event == "done":
+                logger.info("Generated response: %s", payload.get('type', 'text'))
+            message = f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+            await send({"type": "http.response.body", "body": message.encode("utf-8"), "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        # Stops the LLM stream when the client disconnects
+        await events.aclose()
+
+
+ASYNC_ROUTES = {
+    "/chat": chat,
+    "/chat/stream": chat_stream,
+}
+
+
+async def lifespan(receive, send):
+    """Initialize the vector store and the chatbot on startup, as main.py does"""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                # Already done when asgi.py was imported under gunicorn (see above)
+                await asyncio.to_thread(main.init_services)
+                main.start_background_tasks()
+            except Exception as e:
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+
+    handler = ASYNC_ROUTES.get(scope.get("path")) if scope["type"] == "http" and scope["method"] == "POST" else None
+    if handler is None:
+        await flask_app(scope, receive, send)
+        return
+    await handler(scope, receive, send)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the post -> (id, text, metadata) transformation used while indexing.
+
+Compares the per-post loop that used to be duplicated in VectorStore.index_posts and
+index_posts_from_api with document_builder.build_document, which also parses the numeric
+metadata (price_vnd, area_m2) and the amenity mask the loop did not have.
+
+Usage: python benchmark_document_builder.py [post counts...]   (default: 10000 100000)
+"""
+
+import sys
+import os
+import gc
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from document_builder import build_document
+
+def legacy_transform(posts):
+    """The original per-post loop, kept here as the baseline"""
+    documents = []
+    metadatas = []
+    ids = []
+
+    for post in posts:
+        title = post.get('title', '')
+        description = post.get('description', '')
+        location = post.get('location', '') or (post.get('address', {}).get('fullAddress', '') if post.get('address') else '')
+        price = str(post.get('price', ''))
+        area = str(post.get('area', ''))
+        options = ' '.join(post.get('options', [])) if isinstance(post.get('options', []), list) else str(post.get('options', ''))
+
+        post_text = f"{title} {description} {location} {price} {area} {options}".strip()
+
+        document_id = post.get('post_id') or post.get('_id') or str(post.get('id', ''))
+
+        documents.append(post_text)
+        metadatas.append({
+            "post_id": document_id,
+            "title": title,
+            "description": description,
+            "location": location,
+            "price": str(post.get('price', 0)),
+            "area": str(post.get('area', 0)),
+            "options": ', '.join(post.get('options', [])) if isinstance(post.get('options', []), list) else str(post.get('options', '')),
+            "phone": post.get('phone', ''),
+            "username": post.get('username', ''),
+            "category": post.get('category', ''),
+            "images": ', '.join(post.get('images', [])) if isinstance(post.get('images', []), list) else str(post.get('images', '')),
+            "user_id": post.get('user_id', post.get('userId', '')),
+            "created_at": str(post.get('createdAt', '')),
+            "updated_at": str(post.get('updatedAt', ''))
+        })
+        ids.append(document_id)
+
+    return ids, documents, metadatas
+
+def make_posts(count):
+    return [{
+        "_id": f"66f1c0ffee{i:014d}",
+        "post_id": f"66f1c0ffee{i:014d}",
+        "title": f"Cho thuê phòng trọ số {i} gần đại học",
+        "description": "Phòng rộng rãi, sạch sẽ, có gác lửng, giờ giấc tự do, gần chợ và trường học. " * 3,
+        "address": {"fullAddress": f"Số {i} Nguyễn Trãi, Thanh Xuân, Hà Nội"},
+        "price": 1500000 + (i % 40) * 100000,
+        "area": 15 + i % 30,
+        "options": ["Có máy lạnh", "Có gác", "Giờ giấc tự do"],
+        "images": [f"https://example.com/{i}/1.jpg", f"https://example.com/{i}/2.jpg"],
+        "phone": "0900000000",
+        "username": "chu_tro",
+        "category": "phong-tro",
+        "userId": "user",
+        "createdAt": "2025-09-29T14:09:20.000Z",
+        "updatedAt": "2025-09-30T03:24:22.000Z",
+    } for i in range(count)]
+
+def timed(fn, posts, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn(posts)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+
+    # The builder must produce what the old loop produced (plus the numeric fields it adds)
+    sample = make_posts(100) + [{"title": "no price", "options": "wifi", "images": None}]
+    legacy_ids, legacy_texts, legacy_metadatas = legacy_transform(sample)
+    for post, legacy_id, legacy_text, legacy_metadata in zip(sample, legacy_ids, legacy_texts, legacy_metadatas):
+        doc_id, text, metadata = build_document(post)
+        assert (doc_id, text) == (legacy_id, legacy_text)
+        assert {key: metadata[key] for key in legacy_metadata} == legacy_metadata
+
+    print(f"{'posts':>8} | {'legacy loop':>19} | {'build_document':>19}")
+    for count in counts:
+        posts = make_posts(count)
+        legacy = timed(legacy_transform, posts)
+        single = timed(lambda items: [build_document(post) for post in items], posts)
+        print(f"{count:>8} | {legacy / count * 1e6:>11.2f} us/post | {single / count * 1e6:>11.2f} us/post")
+
+if __name__ == "__main__":
+    main()
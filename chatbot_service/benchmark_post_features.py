@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of filtering retrieved documents by the criteria parsed from a question.
+
+Compares the per-document loop ChatBot._filter_documents_by_criteria used to run (copied
+below as the baseline) with post_features.PostFeatureTable, which reads the features
+parsed at index time into NumPy columns and filters with masks.
+
+Usage: python benchmark_post_features.py [candidate counts...]   (default: 15 500 50000)
+"""
+
+import sys
+import os
+import time
+from typing import Dict, List, Optional
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from document_builder import build_document
+from post_features import PostFeatureTable, canonical_category, parse_area_m2, parse_price_vnd
+from vector_store import VectorStore
+
+OPTIONS = ["Có máy lạnh", "Có gác", "Giờ giấc tự do", "Đầy đủ nội thất", "Có thang máy", "Bảo vệ 24/7", "Có máy giặt"]
+LOCATIONS = ["Nguyễn Trãi, Thanh Xuân, Hà Nội", "Xuân Thủy, Cầu Giấy, Hà Nội", "Tây Sơn, Đống Đa, Hà Nội", "Lê Văn Việt, Quận 9, TP HCM"]
+
+CRITERIA = [
+    dict(location="Thanh Xuân", price_range=(2000000, 4000000), area_range=None, category="", amenities=[]),
+    dict(location="", price_range=(0, 3000000), area_range=(20, float('inf')), category="phong-tro", amenities=["có máy lạnh"]),
+    dict(location="Cầu Giấy", price_range=None, area_range=None, category="", amenities=["có gác", "có an ninh"]),
+    dict(location="", price_range=None, area_range=None, category="can-ho-mini", amenities=["máy lạnh"]),
+]
+
+def make_documents(count):
+    """Documents as VectorStore.search returns them"""
+    metadatas = []
+    for i in range(count):
+        post = {
+            "post_id": f"p{i}",
+            "title": f"Cho thuê phòng số {i}",
+            "description": "Phòng rộng rãi, sạch sẽ",
+            "location": LOCATIONS[i % len(LOCATIONS)],
+            "price": f"{1 + i % 50 / 10:.1f} triệu".replace('.', ','),
+            "area": 12 + i % 30,
+            "options": [OPTIONS[j] for j in range(len(OPTIONS)) if (i >> j) & 1],
+            "category": "phong-tro" if i % 3 else "Căn hộ mini",
+        }
+        metadatas.append(build_document(post)[2])
+    results = {"metadatas": [metadatas], "documents": None, "distances": [[0.2] * count]}
+    return VectorStore._format_query_results(results, 0)
+
+def legacy_filter(docs: List[Dict], location: str, price_range: Optional[tuple], area_range: Optional[tuple] = None, category: str = "", amenities: List[str] = []) -> List[Dict]:
+    """Filter documents based on location, price range, area range, category, and amenities"""
+    filtered_docs = []
+
+    for doc in docs:
+        metadata = doc.get('metadata', {})
+        doc_location = doc.get('location', '').lower()
+        doc_category = canonical_category(metadata.get('category', ''))
+        doc_options = [opt.lower() for opt in doc.get('options', [])]
+
+        # Numeric price/area are stored at index time; older documents are parsed from their strings
+        doc_price = metadata.get('price_vnd')
+        if doc_price is None:
+            doc_price = parse_price_vnd(doc.get('price', '0'))
+        doc_area = metadata.get('area_m2')
+        if doc_area is None:
+            doc_area = parse_area_m2(doc.get('area', '0'))
+
+        # Location filtering - improved matching
+        location_matches = True
+        if location:
+            location_lower = location.lower().strip()
+            if location_lower:
+                # Split location into parts and check if most parts exist in document location
+                location_parts = [part.strip() for part in location_lower.split() if len(part.strip()) > 1]
+
+                if location_parts:
+                    # Count how many location parts match
+                    matching_parts = sum(1 for part in location_parts if part in doc_location)
+                    # Require at least half of the location parts to match
+                    location_matches = matching_parts >= max(1, len(location_parts) // 2)
+
+        # Price range filtering
+        price_matches = True
+        if price_range:
+            min_price, max_price = price_range
+            if max_price == float('inf'):
+                price_matches = doc_price >= min_price
+            else:
+                price_matches = min_price <= doc_price <= max_price
+
+        # Area range filtering
+        area_matches = True
+        if area_range:
+            min_area, max_area = area_range
+            if max_area == float('inf'):
+                area_matches = doc_area >= min_area
+            else:
+                area_matches = min_area <= doc_area <= max_area
+
+        # Category filtering
+        category_matches = True
+        if category:
+            category_matches = doc_category == category.lower()
+
+        # Amenities filtering - improved matching for Vietnamese amenities
+        amenities_matches = True
+        if amenities:
+            for amenity in amenities:
+                amenity_lower = amenity.lower()
+                # Check if the amenity exists in the document options
+                amenity_found = any(amenity_lower in doc_option or doc_option in amenity_lower for doc_option in doc_options)
+
+                # If not found directly, try fuzzy matching or synonyms
+                if not amenity_found:
+                    # Define common synonyms for Vietnamese amenities
+                    synonym_map = {
+                        'máy lạnh': ['máy lạnh', 'may lanh', 'điều hòa', 'dieu hoa'],
+                        'gác': ['gác', 'gac', 'lửng', 'mezzanine'],
+                        'nội thất': ['nội thất', 'noi that', 'đồ đạc', 'do dac'],
+                        'an ninh': ['an ninh', 'an ninh', 'bảo vệ', 'bao ve', 'camera'],
+                        'thang máy': ['thang máy', 'thang may', 'elevator', 'máy nâng']
+                    }
+
+                    # Find synonyms for the requested amenity
+                    synonyms = [amenity_lower]  # Start with the original term
+                    for key, values in synonym_map.items():
+                        if any(amenity_lower in val or val in amenity_lower for val in values):
+                            synonyms.extend(values)
+                            break
+
+                    # Check if any synonym matches
+                    amenity_found = any(
+                        any(synonym in doc_option or doc_option in synonym for synonym in synonyms)
+                        for doc_option in doc_options
+                    )
+
+                if not amenity_found:
+                    amenities_matches = False
+                    break  # If any amenity is not found, the whole match fails
+
+        # Only add if location, price, and area match, and if category/amenities were specified, they also match
+        # If no category or amenities were specified, don't filter by them
+        if location_matches and price_matches and area_matches:
+            # If category was specified, it must match
+            # If amenities were specified, they must match
+            # If neither were specified, just match location, price and area
+            if (not category or category_matches) and (not amenities or amenities_matches):
+                filtered_docs.append(doc)
+
+    return filtered_docs
+def best_time(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [15, 500, 50000]
+
+    print(f"{'candidates':>10} | {'legacy loop':>12} | {'table + mask':>12} | {'mask only':>12}")
+    for count in counts:
+        docs = make_documents(count)
+        repeat = max(3, 20000 // count)
+
+        for criteria in CRITERIA:
+            assert PostFeatureTable(docs).filter(docs, **criteria) == legacy_filter(docs, **criteria), criteria
+
+        legacy = best_time(lambda: [legacy_filter(docs, **criteria) for criteria in CRITERIA], repeat)
+        full = best_time(lambda: [PostFeatureTable(docs).filter(docs, **criteria) for criteria in CRITERIA], repeat)
+        table = PostFeatureTable(docs)
+        masked = best_time(lambda: [table.mask(**criteria) for criteria in CRITERIA], repeat)
+
+        per_call = len(CRITERIA) / 1e3  # Report milliseconds per filter call
+        print(f"{count:>10} | {legacy / per_call:>9.3f} ms | {full / per_call:>9.3f} ms | {masked / per_call:>9.3f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of question parsing: the per-field extraction methods ChatBot used to run
+on every request vs query_parser.QueryParser.parse (one keyword scan, precompiled patterns).
+
+The old methods are copied below as the baseline; both must extract the same intent
+from every sample question.
+
+Usage: python benchmark_query_parser.py [iterations]   (default: 20000)
+"""
+
+import sys
+import os
+import time
+from typing import List, Optional
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from query_parser import QueryParser
+
+QUESTIONS = [
+    "Tôi đang tìm phòng trọ ở Hà Nội giá dưới 3 triệu",
+    "Tìm phòng trọ ở quận Thanh Xuân giá từ 2 triệu đến 4 triệu, diện tích từ 20-30 m2",
+    "Có căn hộ mini nào ở Cầu Giấy có máy lạnh và thang máy không?",
+    "cần thuê nhà nguyên căn tại quận 7 khoảng 10 triệu",
+    "tìm người ở ghép khu vực Đống Đa, giờ giấc tự do, không chung chủ",
+    "Phòng có gác, đầy đủ nội thất, tầm 25m2, giá khoảng 3,5 triệu",
+    "can ho chung cu gan truong dai hoc bach khoa duoi 8 trieu",
+    "tìm phòng giá từ 2000000 đến 3500000 ở phường Dịch Vọng",
+    "Chung cư có hầm để xe và bảo vệ 24/7 trên 50 m2",
+    "Xin chào, bạn có thể giúp gì cho tôi?",
+    "phòng trọ dưới 1500000 gần chợ",
+    "Cho mình hỏi trên 5tr thì có phòng nào rộng trên 30m2 không",
+    "Tìm phòng 20m2 đến 25m2 có ban công, máy giặt, kệ bếp ở Hoàng Mai",
+    "Thuê nhà ở Gò Vấp, ngân sách 7 triệu, có điều hòa",
+    "room for rent near district 1",
+]
+
+def legacy_is_rental_request(question: str) -> bool:
+    """Check if the user question is a rental request - now includes all property types and amenities"""
+    question_lower = question.lower().strip()
+
+    # Keywords that indicate rental/housing requests
+    rental_keywords = [
+        'tìm phòng', 'tìm trọ', 'tìm nhà', 'tìm ở', 'tìm chỗ', 'tìm thuê',
+        'muốn thuê', 'muốn ở', 'muốn tìm', 'cần thuê', 'cần tìm', 'cần ở',
+        'cho thuê', 'phòng trọ', 'nhà trọ', 'chỗ ở', 'cho ở', 'ở thuê',
+        'thuê phòng', 'thuê trọ', 'thuê nhà', 'tìm người ở ghép', 'ở ghép',
+        'tôi muốn tìm', 'tôi cần tìm', 'tôi đang tìm', 'có phòng nào', 'có chỗ nào',
+        'có nhà nào', 'có trọ nào', 'room', 'phòng', 'nhà', 'chỗ ở',
+        'tôi muốn', 'muốn', 'cần', 'tìm kiếm', 'tìm giúp', 'giúp tìm',
+        'phòng cho thuê', 'nhà cho thuê', 'tìm phòng trọ', 'tìm nhà trọ',
+        # Property categories
+        'nhà nguyên căn', 'căn hộ chung cư', 'căn hộ mini', 'ở ghép',
+        'nhà nguyên can', 'can ho chung cu', 'can ho mini', 'o ghep',
+        # Amenities
+        'có gác', 'có máy lạnh', 'đầy đủ nội thất', 'không chung chủ',
+        'giờ giấc tự do', 'có ban công', 'có nội thất', 'có an ninh',
+        'có thang máy', 'có kệ bếp', 'có máy giặt', 'có hầm để xe',
+        'co gac', 'co may lanh', 'day du noi that', 'khong chung chu',
+        'gio gic tu do', 'co ban cong', 'co noi that', 'co an ninh',
+        'co thang may', 'co ke bep', 'co may giat', 'co ham de xe',
+    ]
+
+    # Check if it contains rental keywords
+    has_rental_keyword = any(keyword in question_lower for keyword in rental_keywords)
+
+    # A rental request is identified by having rental-related keywords
+    return has_rental_keyword
+
+def legacy_extract_location_from_question(question: str) -> str:
+    """Extract location from question if present"""
+    import re
+    # Common ways people specify location in Vietnamese
+    question_lower = question.lower()
+
+    # Look for location keywords and extract what follows
+    for keyword in ['ở', 'tại', 'khu vực', 'khu vuc', 'quận', 'phường', 'huyện', 'xã', 'gần', 'thuộc']:
+        pos = question_lower.find(keyword)
+        if pos != -1:
+            # Extract the portion after the location keyword
+            after_keyword = question[pos + len(keyword):].strip()
+
+            # Use regex to extract location more precisely
+            # Look for patterns like "khu vực phú lương", "ở quận thanh xuân", etc.
+            # Stop at common non-location words like "diện tích", "giá", "có", etc.
+            stop_words = ['diện tích', 'dien tich', 'giá', 'gia', 'và', 'va', 'có', 'co', 'không', 'khong',
+                         'm2', 'triệu', 'triệu/tháng', 'triệu/thang', 'tr/tháng', 'tr/thang']
+
+            # Split into words and stop at first stop word
+            words = after_keyword.split()
+            location_words = []
+
+            for word in words:
+                # Check if this word is a stop word
+                is_stop_word = any(stop_word in word or word in stop_word for stop_word in stop_words)
+                if is_stop_word:
+                    break
+                location_words.append(word)
+                # Limit to reasonable length
+                if len(location_words) >= 4:  # Usually location names don't exceed 4 words
+                    break
+
+            location = ' '.join(location_words).strip('.,!?')
+
+            # Additional cleanup: remove common Vietnamese address words that might not be part of the location
+            location = re.sub(r'\b(từ|với|có|giá|diện tích|và|trên|dưới|khoảng|tầm|gần|ở)\b', '', location).strip()
+
+            return location
+
+    # If no specific location keyword found, return empty string
+    return ""
+
+def legacy_extract_price_range_from_question(question: str) -> Optional[tuple]:
+    """Extract min and max price from question if present"""
+    import re
+
+    question_lower = question.lower()
+
+    # Handle raw numbers (VND) first - this should come first
+    raw_price_patterns = [
+        r'(?:từ|trên)\s*(\d{6,})\s*(?:đến|đến khoảng)?\s*(\d{6,})?',  # From X to Y (large numbers for VND)
+        r'(\d{6,})\s*(?:đến|->|–|–)\s*(\d{6,})',  # X đến Y
+        r'(?:dưới|ít hơn)\s*(\d{6,})',  # Under X VND
+        r'(?:trên|nhiều hơn)\s*(\d{6,})',  # Over X VND
+    ]
+
+    for pattern in raw_price_patterns:
+        matches = re.findall(pattern, question_lower)
+        if matches:
+            match = matches[0]
+            if isinstance(match, tuple) and len(match) >= 2 and match[0] and match[1]:
+                min_price = int(match[0])
+                max_price = int(match[1])
+                return (min_price, max_price)
+            elif isinstance(match, tuple) and len(match) >= 1 and match[0]:
+                price = int(match[0])
+                if 'dưới' in question_lower or 'ít hơn' in question_lower:
+                    return (0, price)
+                elif 'trên' in question_lower or 'nhiều hơn' in question_lower:
+                    return (price, float('inf'))
+                else:
+                    return (price - 500000, price + 500000)  # Allow ±500k buffer
+
+    # Then handle "triệu" patterns and convert to VND
+    price_patterns = [
+        r'(?:tầm|khoảng|gần|ngân sách|trong khoảng)\s*(\d+(?:[,\.]\d+)?)\s*(?:triệu|tr)',
+        r'(?:từ|trên)\s*(\d+(?:[,\.]\d+)?)\s*(?:triệu|tr)\s*(?:đến|đến khoảng)?\s*(\d+(?:[,\.]\d+)?)?(?:triệu|tr)?',
+        r'(\d+(?:[,\.]\d+)?)\s*(?:triệu|tr)\s*(?:đến|đến khoảng)\s*(\d+(?:[,\.]\d+)?)\s*(?:triệu|tr)',
+        r'(?:dưới|ít hơn)\s*(\d+(?:[,\.]\d+)?)\s*(?:triệu|tr)',
+        r'(?:trên|nhiều hơn)\s*(\d+(?:[,\.]\d+)?)\s*(?:triệu|tr)',
+    ]
+
+    for pattern in price_patterns:
+        matches = re.findall(pattern, question_lower)
+        if matches:
+            match = matches[0]
+            if isinstance(match, tuple):
+                if len(match) == 2 and match[0] and match[1]:  # Range
+                    min_price = float(match[0].replace(',', '.')) * 1000000  # Convert to VND
+                    max_price = float(match[1].replace(',', '.')) * 1000000
+                    return (min_price, max_price)
+                elif len(match) == 1 and match[0]:  # Single price or first in range
+                    # For "dưới" or "trên" patterns, we need to interpret differently
+                    price = float(match[0].replace(',', '.')) * 1000000
+                    if 'dưới' in question_lower or 'ít hơn' in question_lower:
+                        return (0, price)
+                    elif 'trên' in question_lower or 'nhiều hơn' in question_lower:
+                        return (price, float('inf'))
+                    else:
+                        # For "khoảng", allow some flexibility
+                        return (price - 500000, price + 500000)
+            else:
+                # Single value matched
+                price = float(match.replace(',', '.')) * 1000000
+                return (price - 500000, price + 500000)
+
+    return None
+
+def legacy_extract_area_range_from_question(question: str) -> Optional[tuple]:
+    """Extract min and max area from question if present"""
+    import re
+
+    question_lower = question.lower()
+
+    # Common Vietnamese area terms - improved patterns to match "từ 25-30 m2" format
+    area_patterns = [
+        r'(?:khoảng|tầm|gần|diện tích|khoảng\s+từ)?\s*(\d+(?:[,\.]\d+)?)\s*(?:m2|m²|met vuông|vuông)\s*(?:đến|đến khoảng)?\s*(\d+(?:[,\.]\d+)?)?(?:m2|m²|met vuông|vuông)?',
+        r'(?:từ|trên)\s*(\d+(?:[,\.]\d+)?)\s*(?:-|đến)\s*(\d+(?:[,\.]\d+)?)\s*(?:m2|m²|met vuông|vuông)',  # Pattern for "từ 25-30 m2"
+        r'(?:từ|trên)\s*(\d+(?:[,\.]\d+)?)\s*(?:m2|m²|met vuông|vuông)\s*(?:đến|đến khoảng)?\s*(\d+(?:[,\.]\d+)?)?(?:m2|m²|met vuông|vuông)?',
+        r'(\d+(?:[,\.]\d+)?)\s*(?:m2|m²|met vuông|vuông)\s*(?:đến|đến khoảng)\s*(\d+(?:[,\.]\d+)?)\s*(?:m2|m²|met vuông|vuông)',
+        r'(?:dưới|ít hơn)\s*(\d+(?:[,\.]\d+)?)\s*(?:m2|m²|met vuông|vuông)',
+        r'(?:trên|nhiều hơn)\s*(\d+(?:[,\.]\d+)?)\s*(?:m2|m²|met vuông|vuông)',
+    ]
+
+    for pattern in area_patterns:
+        matches = re.findall(pattern, question_lower)
+        if matches:
+            for match in matches:
+                if isinstance(match, tuple):
+                    if len(match) == 2 and match[0] and match[1]:  # Range
+                        min_area = float(match[0].replace(',', '.'))
+                        max_area = float(match[1].replace(',', '.'))
+                        return (min_area, max_area)
+                    elif len(match) == 1 and match[0]:  # Single area or first in range
+                        # For "dưới" or "trên" patterns, we need to interpret differently
+                        area = float(match[0].replace(',', '.'))
+                        if 'dưới' in question_lower or 'ít hơn' in question_lower:
+                            return (0, area)
+                        elif 'trên' in question_lower or 'nhiều hơn' in question_lower:
+                            return (area, float('inf'))
+                        else:
+                            # For "khoảng", allow some flexibility
+                            return (area - 2, area + 2)
+                else:
+                    # Single value matched
+                    area = float(match.replace(',', '.'))
+                    return (area - 2, area + 2)
+
+    return None
+
+def legacy_extract_category_from_question(question: str) -> str:
+    """Extract property category from question if present"""
+    question_lower = question.lower()
+
+    # Category mappings
+    category_keywords = {
+        'phong-tro': ['phòng trọ', 'phong tro', 'tro', 'phong'],
+        'nha-nguyen-can': ['nhà nguyên căn', 'nha nguyen can', 'nhà nguyên can', 'nha nguyen căn', 'nguyên căn', 'nguyen can'],
+        'can-ho-chung-cu': ['căn hộ chung cư', 'can ho chung cu', 'căn hộ', 'can ho', 'chung cư', 'chung cu'],
+        'can-ho-mini': ['căn hộ mini', 'can ho mini', 'căn hộ nhỏ', 'can ho nho'],
+        'o-ghep': ['ở ghép', 'o ghep', 'ghép', 'ghep', 'người ở ghép', 'nguoi o ghep']
+    }
+
+    for category, keywords in category_keywords.items():
+        for keyword in keywords:
+            if keyword in question_lower:
+                return category
+
+    return ""
+
+def legacy_extract_amenities_from_question(question: str) -> List[str]:
+    """Extract amenities from question if present"""
+    question_lower = question.lower()
+
+    # Amenity mappings
+    amenity_keywords = {
+        'có gác': ['có gác', 'co gac', 'gác', 'gac'],
+        'có máy lạnh': ['có máy lạnh', 'co may lanh', 'máy lạnh', 'may lanh', 'điều hòa', 'dieu hoa'],
+        'đầy đủ nội thất': ['đầy đủ nội thất', 'day du noi that', 'đầy đủ', 'day du', 'nội thất', 'noi that'],
+        'không chung chủ': ['không chung chủ', 'khong chung chu', 'không chung', 'khong chung'],
+        'giờ giấc tự do': ['giờ giấc tự do', 'gio gic tu do', 'giờ tự do', 'gio tu do'],
+        'có ban công': ['có ban công', 'co ban cong', 'ban công', 'ban cong'],
+        'có nội thất': ['có nội thất', 'co noi that', 'nội thất', 'noi that'],
+        'có an ninh': ['có an ninh', 'co an ninh', 'an ninh', 'bảo vệ', 'bao ve'],
+        'có thang máy': ['có thang máy', 'co thang may', 'thang máy', 'thang may'],
+        'có kệ bếp': ['có kệ bếp', 'co ke bep', 'kệ bếp', 'ke bep'],
+        'có máy giặt': ['có máy giặt', 'co may giat', 'máy giặt', 'may giat'],
+        'có hầm để xe': ['có hầm để xe', 'co ham de xe', 'hầm để xe', 'ham de xe', 'chỗ để xe', 'cho de xe']
+    }
+
+    found_amenities = []
+    for standard_amenity, keywords in amenity_keywords.items():
+        for keyword in keywords:
+            if keyword in question_lower and standard_amenity not in found_amenities:
+                found_amenities.append(standard_amenity)
+
+    return found_amenities
+
+def legacy_parse(question):
+    return (legacy_is_rental_request(question), legacy_extract_location_from_question(question),
+            legacy_extract_price_range_from_question(question), legacy_extract_area_range_from_question(question),
+            legacy_extract_category_from_question(question), legacy_extract_amenities_from_question(question))
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    parser = QueryParser()
+
+    for question in QUESTIONS:
+        intent = parser.parse(question)
+        parsed = (intent.is_rental_request, intent.location, intent.price_range, intent.area_range,
+                  intent.category, intent.amenities)
+        assert parsed == legacy_parse(question), (question, parsed, legacy_parse(question))
+
+    print(f"{'parser':>16} | {'questions/s':>12} | {'us/question':>11}")
+    for name, parse in (("legacy methods", legacy_parse), ("QueryParser", parser.parse)):
+        count = 0
+        start = time.perf_counter()
+        while count < iterations:
+            for question in QUESTIONS:
+                parse(question)
+            count += len(QUESTIONS)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>16} | {count / elapsed:>12.0f} | {elapsed / count * 1e6:>11.1f}")
+
+    start = time.perf_counter()
+    QueryParser()
+    print(f"Building the parser (once per process): {(time.perf_counter() - start) * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
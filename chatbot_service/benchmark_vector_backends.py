@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the vector backends: Chroma vs the NumPy backend (exact float32, exact
+float16 and IVF approximate search).
+
+Each backend first builds a collection of random 1536-dimensional vectors (the size of
+ada-002 embeddings) with numeric metadata, then a fresh process loads it and runs the
+queries, so the reported RSS is what a serving process pays for the index.
+
+Usage: python benchmark_vector_backends.py [vector counts...]   (default: 10000 50000)
+"""
+
+import sys
+import os
+import json
+import shutil
+import subprocess
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from vector_backends import create_vector_client
+
+DIMENSIONS = 1536
+QUERIES = 200
+TOP_K = 15
+
+BACKENDS = {
+    "chroma": ("chroma", {}),
+    "numpy": ("numpy", {"dtype": "float32"}),
+    "numpy-f16": ("numpy", {"dtype": "float16"}),
+    "numpy-ivf": ("numpy", {"dtype": "float32", "index_mode": "ivf"}),
+}
+
+def rss_mb() -> float:
+    """Current resident set size of this process"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Peak, where /proc is unavailable
+
+def make_vectors(count: int, seed: int) -> np.ndarray:
+    # Clustered like real embeddings, so the IVF mode is measured on realistic data
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(64, DIMENSIONS)).astype(np.float32)
+    return centers[rng.integers(0, 64, size=count)] + rng.normal(scale=0.5, size=(count, DIMENSIONS)).astype(np.float32)
+
+def build(name: str, path: str, count: int):
+    backend, options = BACKENDS[name]
+    client = create_vector_client(backend, path, **options)
+    collection = client.create_collection("posts", metadata={"hnsw:space": "cosine"})
+    for start in range(0, count, 5000):
+        vectors = make_vectors(min(5000, count - start), seed=start)
+        ids = [f"p{i}" for i in range(start, start + len(vectors))]
+        metadatas = [{"price_vnd": float(1000000 + i % 50 * 100000), "area_m2": float(15 + i % 40)} for i in range(start, start + len(vectors))]
+        collection.add(ids=ids, embeddings=vectors.tolist(), metadatas=metadatas)
+    if hasattr(collection, "persist"):
+        collection.persist()
+
+def serve(name: str, path: str) -> dict:
+    backend, options = BACKENDS[name]
+    baseline = rss_mb()
+    started = time.perf_counter()
+    collection = create_vector_client(backend, path, **options).get_collection("posts")
+    load_seconds = time.perf_counter() - started
+
+    queries = make_vectors(QUERIES, seed=10 ** 6).tolist()
+    where = {"$and": [{"price_vnd": {"$gte": 2000000}}, {"price_vnd": {"$lte": 4000000}}]}
+    timings = {"plain": [], "filtered": []}
+    results = []
+    for i, query in enumerate(queries):
+        for kind, clause in (("plain", None), ("filtered", where)):
+            started = time.perf_counter()
+            result = collection.query(query_embeddings=[query], n_results=TOP_K, where=clause, include=["distances"])
+            timings[kind].append(time.perf_counter() - started)
+            if kind == "plain":
+                results.append(result["ids"][0])
+
+    report = {"load_s": load_seconds, "rss_mb": rss_mb() - baseline, "ids": results}
+    for kind, values in timings.items():
+        report[f"{kind}_p50_ms"] = float(np.percentile(values, 50) * 1000)
+        report[f"{kind}_p95_ms"] = float(np.percentile(values, 95) * 1000)
+    return report
+
+def run_child(*args) -> str:
+    return subprocess.run([sys.executable, os.path.abspath(__file__), *args], check=True,
+                          capture_output=True, text=True).stdout
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] in ("--build", "--serve"):
+        mode, name, path = sys.argv[1:4]
+        if mode == "--build":
+            build(name, path, int(sys.argv[4]))
+        else:
+            print(json.dumps(serve(name, path)))
+        return
+
+    counts = [int(arg) for arg in sys.argv[1:]] or [10000, 50000]
+    print(f"{'vectors':>8} | {'backend':>10} | {'build':>7} | {'load':>6} | {'RSS':>8} | {'p50':>8} | {'p95':>8} | {'filtered p50':>12} | {'recall@15':>9}")
+    for count in counts:
+        exact_ids = None
+        for name in BACKENDS:
+            path = tempfile.mkdtemp()
+            try:
+                started = time.perf_counter()
+                run_child("--build", name, path, str(count))
+                build_seconds = time.perf_counter() - started
+                report = json.loads(run_child("--serve", name, path))
+            finally:
+                shutil.rmtree(path, ignore_errors=True)
+
+            # Recall against the exact NumPy ranking (Chroma's HNSW is approximate too)
+            if name == "numpy":
+                exact_ids = report["ids"]
+            recall = "" if exact_ids is None else f"{np.mean([len(set(a) & set(b)) / TOP_K for a, b in zip(exact_ids, report['ids'])]):.3f}"
+            print(f"{count:>8} | {name:>10} | {build_seconds:>6.1f}s | {report['load_s']:>5.2f}s | {report['rss_mb']:>6.0f}MB | "
+                  f"{report['plain_p50_ms']:>6.2f}ms | {report['plain_p95_ms']:>6.2f}ms | {report['filtered_p50_ms']:>10.2f}ms | {recall:>9}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+from bson import ObjectId, json_util
+from pymongo.errors import OperationFailure, PyMongoError
+from document_builder import iter_documents
+from metrics import registry
+from reindex_jobs import index_write_lock_path, try_lock_file
+
+logger = logging.getLogger(__name__)
+
+CHANGE_EVENTS = registry.counter("chatbot_change_stream_events_total", "Change stream events received", label="operation")
+CHANGE_BATCH_SECONDS = registry.histogram("chatbot_change_stream_batch_seconds", "Time to embed and write a change batch")
+
+# Only events that change a post; the rest (e.g. a dropped collection, which ends the stream) are not matched
+PIPELINE = [{"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}]
+# Resuming from a token the oplog no longer holds (ChangeStreamHistoryLost) or a corrupt token
+HISTORY_LOST_CODES = (280, 286)
+
+
+def _iso_date(value: datetime) -> str:
+    """Date formatted like the JSON of the post API (JavaScript's toISOString), so incremental
+    reindexes from the API see the same updated_at as the change stream wrote"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.strftime("%Y-%m-%dT%H:%M:%S.") + f"{value.microsecond // 1000:03d}Z"
+
+
+def post_from_document(document: Dict[str, Any]) -> Dict[str, Any]:
+    """A posts document as the post API returns it: string IDs and ISO dates"""
+    post = {key: _iso_date(value) if isinstance(value, datetime) else str(value) if isinstance(value, ObjectId) else value
+            for key, value in document.items()}
+    post["post_id"] = post["_id"]
+    return post
+
+
+def is_listed(document: Dict[str, Any], now: Optional[datetime] = None) -> bool:
+    """Whether the post API lists the post: active and not past its end date"""
+    end_date = document.get("endDate")
+    if document.get("status") != "active":
+        return False
+    if isinstance(end_date, datetime):
+        # pymongo returns naive UTC datetimes unless the client is tz_aware
+        now = now or datetime.now(timezone.utc)
+        if end_date.tzinfo is None:
+            now = now.replace(tzinfo=None)
+        return end_date >= now
+    return True
+
+
+class ChangeStreamIndexer:
+    """Keeps the vector index in sync with the MongoDB posts collection by tailing its change stream.
+
+    Events are debounced into micro-batches: the first event opens a window of debounce_seconds
+    (or until max_batch_size posts changed) in which later events for the same post replace the
+    earlier ones. Listed posts of the batch are then embedded and upserted, the others deleted.
+    The resume token of the last event written is saved in chroma_data/change_stream_token.json,
+    so a restart continues where it stopped; when the oplog no longer holds it, on_history_lost
+    is called (e.g. to submit an incremental reindex) and the stream restarts from now.
+
+    Batches are written while holding the reindex job lock, so they wait for a running reindex
+    (which could otherwise overwrite or drop them) and are written after it.
+
+    A batch is written at most every min_batch_interval seconds, events arriving in between
+    joining the next one.
+    """
+
+    def __init__(self, vector_store, collection, debounce_seconds: float = 1.0, max_batch_size: int = 100,
+                 token_path: Optional[str] = None, on_history_lost: Optional[Callable[[], None]] = None,
+                 retry_seconds: float = 5.0, min_batch_interval: float = 0.0):
+        self.vector_store = vector_store
+        self.collection = collection
+        self.debounce_seconds = debounce_seconds
+        self.max_batch_size = max_batch_size
+        self.token_path = token_path or os.path.join(vector_store.persist_path, "change_stream_token.json")
+        self.on_history_lost = on_history_lost
+        self.retry_seconds = retry_seconds
+        self.min_batch_interval = min_batch_interval
+        self.resume_token = self._load_token()
+        # post_id -> post to upsert, or None to delete; the token of the last event added
+        self._pending: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._pending_token = None
+        self._window_started = 0.0
+        self._retry_at = 0.0
+        self._batch_written_at = None  # time.monotonic() of the last batch written
+        self._token_saved_at = 0.0
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.counters = {"events": 0, "batches": 0, "upserted": 0, "deleted": 0, "deferred": 0, "errors": 0}
+        self.last_event_at = None
+        self.last_batch_at = None
+
+    def start(self):
+        if self.resume_token is None and self.on_history_lost is not None:
+            # Posts changed while nothing watched the stream are caught up by the callback
+            self.on_history_lost()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.run, name="change-stream-indexer", daemon=True)
+        self._thread.start()
+        logger.info("Change stream indexing started (%s)", "resuming" if self.resume_token else "from now")
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self):
+        """Watch the collection until stopped, reopening the stream after errors"""
+        while not self._stop_event.is_set():
+            try:
+                self._watch()
+            except OperationFailure as e:
+                if e.code not in HISTORY_LOST_CODES:
+                    self._retry_after_error(e)
+                    continue
+                logger.warning("Change stream cannot resume (%s), restarting from now", e)
+                self.resume_token = None
+                self._save_token(None)
+                if self.on_history_lost is not None:
+                    self.on_history_lost()
+            except PyMongoError as e:
+                self._retry_after_error(e)
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.counters, pending=len(self._pending), running=bool(self._thread and self._thread.is_alive()),
+                    last_event_at=self.last_event_at, last_batch_at=self.last_batch_at)
+
+    def _retry_after_error(self, error: Exception):
+        self.counters["errors"] += 1
+        logger.error("Change stream failed: %s, reopening in %ss", error, self.retry_seconds)
+        self._stop_event.wait(self.retry_seconds)
+
+    def _watch(self):
+        options = {"full_document": "updateLookup", "max_await_time_ms": 200}
+        if self.resume_token is not None:
+            options["resume_after"] = self.resume_token
+        with self.collection.watch(PIPELINE, **options) as stream:
+            while not self._stop_event.is_set():
+                change = stream.try_next()
+                if change is not None:
+                    self._add(change)
+                if self._pending:
+                    if self._batch_due():
+                        self._flush()
+                elif change is None:
+                    # No event: the stream's token still advances, keep the saved one from falling out of the oplog
+                    self._save_idle_token(stream.resume_token)
+
+    def _add(self, change: Dict[str, Any]):
+        operation = change["operationType"]
+        CHANGE_EVENTS.inc(1, operation)
+        self.counters["events"] += 1
+        self.last_event_at = time.time()
+
+        document = change.get("fullDocument")
+        post_id = str(change["documentKey"]["_id"])
+        # The document of an update is looked up when the event is read; None if deleted since
+        listed = operation != "delete" and document is not None and is_listed(document)
+        if not self._pending:
+            self._window_started = time.monotonic()
+        self._pending[post_id] = post_from_document(document) if listed else None
+        self._pending_token = change["_id"]
+
+    def _batch_due(self) -> bool:
+        now = time.monotonic()
+        if now < self._retry_at:
+            return False
+        if self._batch_written_at is not None and now - self._batch_written_at < self.min_batch_interval:
+            return False
+        return len(self._pending) >= self.max_batch_size or now - self._window_started >= self.debounce_seconds
+
+    def _flush(self):
+        """Write the pending batch, unless a reindex is running; the batch is then retried after it"""
+        lock_file = try_lock_file(index_write_lock_path(self.vector_store))
+        if lock_file is None:
+            self.counters["deferred"] += 1
+            self._retry_at = time.monotonic() + min(self.retry_seconds, 1.0)
+            return
+
+        pending, token = self._pending, self._pending_token
+        posts = [post for post in pending.values() if post is not None]
+        removed_ids = [post_id for post_id, post in pending.items() if post is None]
+        started = time.perf_counter()
+        try:
+            self.vector_store.apply_changes(list(iter_documents(posts)), removed_ids)
+        except Exception as e:
+            # Keep the batch (and its events still arriving) and retry; the token is not saved
+            self.counters["errors"] += 1
+            self._retry_at = time.monotonic() + self.retry_seconds
+            logger.error("Could not index %d changed posts: %s", len(pending), e)
+            return
+        finally:
+            lock_file.close()
+
+        CHANGE_BATCH_SECONDS.observe(time.perf_counter() - started)
+        self._pending, self._pending_token = {}, None
+        self.counters["batches"] += 1
+        self.counters["upserted"] += len(posts)
+        self.counters["deleted"] += len(removed_ids)
+        self.last_batch_at = time.time()
+        self._batch_written_at = time.monotonic()
+        self.resume_token = token
+        self._save_token(token)
+        logger.info("Indexed changed posts: %d upserted, %d deleted in %.2fs", len(posts), len(removed_ids),
+                    time.perf_counter() - started)
+
+    def _save_idle_token(self, token):
+        if token is not None and token != self.resume_token and time.monotonic() - self._token_saved_at >= 10:
+            self.resume_token = token
+            self._save_token(token)
+
+    def _load_token(self):
+        try:
+            with open(self.token_path, encoding="utf-8") as f:
+                return json_util.loads(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable change stream resume token: %s", e)
+            return None
+
+    def _save_token(self, token):
+        self._token_saved_at = time.monotonic()
+        try:
+            if token is None:
+                if os.path.exists(self.token_path):
+                    os.remove(self.token_path)
+                return
+            os.makedirs(os.path.dirname(self.token_path), exist_ok=True)
+            temp_path = f"{self.token_path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(json_util.dumps(token))
+            os.replace(temp_path, self.token_path)
+        except OSError as e:
+            logger.warning("Could not save the change stream resume token: %s", e)
@@ -1,20 +1,132 @@
 import os
+import asyncio
 import logging
-from typing import Dict, Any, List, Optional
+import threading
+import time
+from typing import AsyncIterator, Dict, Any, Iterator, List, Optional, Tuple
 from vector_store import VectorStore
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 from google.generativeai import GenerativeModel
 import google.generativeai as genai
 import json
+from post_features import PostFeatureTable
+from context_builder import ContextBuilder, llm_cost, output_token_cap
+from metrics import STAGE_SECONDS, registry, stage_timer
+from log_config import verbose_enabled
+from query_parser import CATEGORY_LABELS, QueryIntent, get_query_parser
+from response_cache import ResponseCache
 
 logger = logging.getLogger(__name__)
 
+# The LLM answers with this prefix followed by JSON when the rooms should be shown as cards
+SHOW_ROOMS_PREFIX = "__SHOW_ROOMS__::"
+
+
+class ShowRoomsStreamFilter:
+    """Passes streamed LLM text through until the __SHOW_ROOMS__:: instruction starts.
+
+    The end of the text seen so far is held back while it could be the start of the prefix,
+    so no part of the instruction is ever passed through.
+    """
+
+    def __init__(self):
+        self.pending = ""
+        self.found = False
+
+    def feed(self, chunk: str) -> str:
+        """Add a streamed chunk, returning the text that can be shown"""
+        if self.found:
+            return ""
+        self.pending += chunk
+        index = self.pending.find(SHOW_ROOMS_PREFIX)
+        if index != -1:
+            self.found = True
+            text, self.pending = self.pending[:index], ""
+            return text
+
+        # Hold back the longest ending that is a start of the prefix
+        held = 0
+        for size in range(min(len(SHOW_ROOMS_PREFIX) - 1, len(self.pending)), 0, -1):
+            if self.pending.endswith(SHOW_ROOMS_PREFIX[:size]):
+                held = size
+                break
+        text = self.pending[:len(self.pending) - held]
+        self.pending = self.pending[len(self.pending) - held:]
+        return text
+
+    def flush(self) -> str:
+        """Text still held back once the stream has ended"""
+        text = "" if self.found else self.pending
+        self.pending = ""
+        return text
+
+
+CHAT_SECONDS = registry.histogram("chatbot_chat_seconds", "Time to answer a chat, by what answered it "
+                                  "(fast_path, cache, llm or error)", label="answered_by")
+LLM_TOKENS = registry.counter("chatbot_llm_tokens_total", "Tokens of the LLM requests", label="type")
+LLM_COST = registry.counter("chatbot_llm_cost_usd_total", "Estimated cost of the LLM requests in USD")
+
+
+# Answer to a pure search that found nothing
+NO_RESULTS_MESSAGE = ("Xin lỗi bạn, hiện tại chúng tôi không có bài đăng nào phù hợp với yêu cầu của bạn. "
+                      "Vui lòng thử lại với tiêu chí tìm kiếm khác (khu vực khác, mức giá khác, danh mục khác, "
+                      "hoặc điều chỉnh các tiện nghi yêu cầu).")
+
+
+def _format_vnd(amount: float) -> str:
+    if amount >= 1000000:
+        return f"{amount / 1000000:g}".replace('.', ',') + " triệu"
+    return f"{amount / 1000:g}".replace('.', ',') + " nghìn"
+
+
+def _format_range(value_range: tuple, format_value) -> str:
+    low, high = value_range
+    if high == float('inf'):
+        return f"từ {format_value(low)}"
+    if low <= 0:
+        return f"dưới {format_value(high)}"
+    return f"từ {format_value(low)} đến {format_value(high)}"
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+
 class ChatBot:
     def __init__(self, vector_store: VectorStore):
         self.vector_store = vector_store
         self.llm_client = None
+        self.async_llm_client = None
         self.model = None
         self.use_openai = os.getenv("USE_OPENAI", "true").lower() == "true"
+        self.query_parser = get_query_parser()
+        # Adaptive over-fetch: top_k grows geometrically while too few retrieved posts match the filters
+        self.retrieval_top_k = int(os.getenv("RETRIEVAL_TOP_K", "15"))
+        self.retrieval_min_results = int(os.getenv("RETRIEVAL_MIN_RESULTS", "5"))
+        self.retrieval_max_top_k = int(os.getenv("RETRIEVAL_MAX_TOP_K", "120"))
+        self.retrieval_growth_factor = max(2, int(os.getenv("RETRIEVAL_GROWTH_FACTOR", "2")))
+        self.last_retrieval_stats = None
+        self.retrieval_stats = {"requests": 0, "searches": 0, "widened": 0, "enough": 0, "exhausted": 0, "budget": 0}
+        self._retrieval_stats_lock = threading.Lock()
+        # Pure searches are answered with the matching posts and a templated message, without the LLM;
+        # fast_path_count counts the responses served that way
+        self.fast_path_enabled = os.getenv("CHAT_FAST_PATH", "true").lower() == "true"
+        self.fast_path_count = 0
+        # Posts packed into prompts within a per-model token budget; tokens and cost recorded per LLM request
+        self._context_builder = None
+        self.last_llm_usage = None
+        self.llm_usage = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0}
+        # LLM answers reused for the same intent and posts; dropped when one of the posts is reindexed
+        self.response_cache = None
+        response_cache_size = int(os.getenv("RESPONSE_CACHE_SIZE", "1000"))
+        if response_cache_size > 0:
+            self.response_cache = ResponseCache(
+                capacity=response_cache_size,
+                ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600")),
+                similarity_threshold=float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.97"))
+            )
+            self.vector_store.add_change_listener(self.response_cache.invalidate_posts)
 
     def init_chatbot(self):
         """Initialize the LLM client"""
@@ -26,6 +138,7 @@ class ChatBot:
                     raise Exception("OPENAI_API_KEY environment variable not set")
 
                 self.llm_client = OpenAI(api_key=openai_api_key)
+                self.async_llm_client = AsyncOpenAI(api_key=openai_api_key)
                 self.model = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
                 logger.info(f"Initialized OpenAI with model: {self.model}")
             else:
@@ -42,344 +155,638 @@ class ChatBot:
             logger.error(f"Error initializing chatbot: {e}")
             raise
 
-    def _call_llm(self, prompt: str) -> str:
-        """Call the LLM with the given prompt"""
+    def warmup(self):
+        """Compile the query parser and load the tokenizer before the first question, without calling the LLM"""
+        started = time.time()
+        self._plan_search("Tìm phòng trọ ở Cầu Giấy giá dưới 3 triệu có máy lạnh")
+        self._get_context_builder()
+        logger.info(f"Chatbot warmed up in {time.time() - started:.2f}s")
+
+    def _model_name(self) -> str:
+        """Name of the configured LLM (Gemini models are objects)"""
+        return self.model if isinstance(self.model, str) else getattr(self.model, "model_name", "gemini")
+
+    def _get_context_builder(self) -> ContextBuilder:
+        """Context builder for the configured model, created on first use"""
+        model_name = self._model_name()
+        if self._context_builder is None or self._context_builder.model != model_name:
+            self._context_builder = ContextBuilder(model_name)
+        return self._context_builder
+
+    def _openai_chat_params(self, prompt: str, max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """Arguments of chat.completions.create for the configured OpenAI model"""
+        # Create different calls based on model type to handle parameter compatibility
+        if self.model == "o1-preview" or self.model.startswith("o1-") or self.model.startswith("gpt-4o"):
+            # Some newer models might not support temperature or may have specific requirements
+            # They also might not support system messages, so we include instructions in the user prompt
+            params = {
+                "model": self.model,
+                "messages": [
+                    {"role": "user", "content": prompt}
+                ]
+            }
+            # o1 models spend completion tokens on reasoning, so a cap could leave no answer
+            if max_tokens and self.model.startswith("gpt-4o"):
+                params["max_completion_tokens"] = max_tokens
+            return params
+        # Standard models support temperature and max_completion_tokens
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": "Bạn là một trợ lý chuyên nghiệp hỗ trợ tìm các loại hình nhà ở bao gồm phòng trọ, nhà nguyên căn, căn hộ chung cư, căn hộ mini và ở ghép. Trả lời tự nhiên và thân thiện. LUÔN LUÔN dựa trên thông tin từ các bài đăng được cung cấp để trả lời."},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.3,  # Giảm nhiệt độ để tăng tính chính xác
+            "max_completion_tokens": max_tokens or 1500
+        }
+
+    @staticmethod
+    def _gemini_config(max_tokens: Optional[int]) -> Dict[str, Any]:
+        return {"generation_config": {"max_output_tokens": max_tokens}} if max_tokens else {}
+
+    def _record_usage(self, prompt: str, response_text: str, usage: Optional[Tuple[int, int]] = None):
+        """Record the tokens and cost of an LLM request; counted with tiktoken when the API did not report them"""
+        estimated = usage is None
+        if estimated:
+            counter = self._get_context_builder()
+            usage = (counter.count_tokens(prompt), counter.count_tokens(response_text))
+        prompt_tokens, completion_tokens = usage
+        cost = llm_cost(self._model_name(), prompt_tokens, completion_tokens)
+
+        record = {"model": self._model_name(), "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "cost_usd": cost, "estimated": estimated}
+        self.last_llm_usage = record
+        with self._retrieval_stats_lock:
+            self.llm_usage["requests"] += 1
+            self.llm_usage["prompt_tokens"] += prompt_tokens
+            self.llm_usage["completion_tokens"] += completion_tokens
+            self.llm_usage["cost_usd"] += cost
+        LLM_TOKENS.inc(prompt_tokens, "prompt")
+        LLM_TOKENS.inc(completion_tokens, "completion")
+        LLM_COST.inc(cost)
+        logger.info("LLM usage: %s", record)
+
+    def get_llm_usage(self) -> Dict[str, Any]:
+        """Tokens and cost of the LLM requests made so far"""
+        with self._retrieval_stats_lock:
+            return dict(self.llm_usage, last=self.last_llm_usage)
+
+    @staticmethod
+    def _openai_usage(usage) -> Optional[Tuple[int, int]]:
+        return (usage.prompt_tokens, usage.completion_tokens) if usage else None
+
+    @staticmethod
+    def _gemini_usage(response) -> Optional[Tuple[int, int]]:
+        metadata = getattr(response, "usage_metadata", None)
+        return (metadata.prompt_token_count, metadata.candidates_token_count) if metadata else None
+
+    def _call_llm(self, prompt: str, max_tokens: Optional[int] = None) -> str:
+        """Call the LLM with the given prompt, answering in at most max_tokens tokens"""
         try:
-            logger.info(f"Sending prompt to LLM (first 200 chars): {prompt[:200]}...")
+            logger.debug("Sending prompt to LLM (first 200 chars): %.200s...", prompt)
 
             if self.use_openai:
-                # Create different calls based on model type to handle parameter compatibility
-                if self.model == "o1-preview" or self.model.startswith("o1-") or self.model.startswith("gpt-4o"):
-                    # Some newer models might not support temperature or may have specific requirements
-                    # They also might not support system messages, so we include instructions in the user prompt
-                    response = self.llm_client.chat.completions.create(
-                        model=self.model,
-                        messages=[
-                            {"role": "user", "content": prompt}
-                        ]
-                    )
-                else:
-                    # Standard models support temperature and max_completion_tokens
-                    response = self.llm_client.chat.completions.create(
-                        model=self.model,
-                        messages=[
-                            {"role": "system", "content": "Bạn là một trợ lý chuyên nghiệp hỗ trợ tìm các loại hình nhà ở bao gồm phòng trọ, nhà nguyên căn, căn hộ chung cư, căn hộ mini và ở ghép. Trả lời tự nhiên và thân thiện. LUÔN LUÔN dựa trên thông tin từ các bài đăng được cung cấp để trả lời."},
-                            {"role": "user", "content": prompt}
-                        ],
-                        temperature=0.3,  # Giảm nhiệt độ để tăng tính chính xác
-                        max_completion_tokens=1500
-                    )
-
+                with stage_timer("llm"):
+                    response = self.llm_client.chat.completions.create(**self._openai_chat_params(prompt, max_tokens))
                 result = response.choices[0].message.content
-                logger.info(f"LLM response received (first 200 chars): {result[:200]}...")
+                logger.debug("LLM response received (first 200 chars): %.200s...", result)
+                self._record_usage(prompt, result, self._openai_usage(getattr(response, "usage", None)))
                 return result
             else:
                 # For Gemini
                 chat = self.model.start_chat()
-                logger.info("Calling Gemini model...")
-                response = chat.send_message(prompt)
+                logger.debug("Calling Gemini model...")
+                with stage_timer("llm"):
+                    response = chat.send_message(prompt, **self._gemini_config(max_tokens))
                 result = response.text
-                logger.info(f"Gemini response received (first 200 chars): {result[:200]}...")
+                logger.debug("Gemini response received (first 200 chars): %.200s...", result)
+                self._record_usage(prompt, result, self._gemini_usage(response))
                 return result
 
         except Exception as e:
-            logger.error(f"Error calling LLM: {e}")
+            logger.error("Error calling LLM: %s", e)
             raise
 
-    def _extract_category_from_question(self, question: str) -> str:
-        """Extract property category from question if present"""
-        question_lower = question.lower()
-
-        # Category mappings
-        category_keywords = {
-            'phong-tro': ['phòng trọ', 'phong tro', 'tro', 'phong'],
-            'nha-nguyen-can': ['nhà nguyên căn', 'nha nguyen can', 'nhà nguyên can', 'nha nguyen căn', 'nguyên căn', 'nguyen can'],
-            'can-ho-chung-cu': ['căn hộ chung cư', 'can ho chung cu', 'căn hộ', 'can ho', 'chung cư', 'chung cu'],
-            'can-ho-mini': ['căn hộ mini', 'can ho mini', 'căn hộ nhỏ', 'can ho nho'],
-            'o-ghep': ['ở ghép', 'o ghep', 'ghép', 'ghep', 'người ở ghép', 'nguoi o ghep']
-        }
+    def _stream_llm(self, prompt: str, max_tokens: Optional[int] = None) -> Iterator[str]:
+        """Call the LLM with the given prompt, yielding the response text as it is generated"""
+        logger.debug("Streaming prompt to LLM (first 200 chars): %.200s...", prompt)
+        chunks = []
+        usage = None
+        started = time.perf_counter()
+
+        if self.use_openai:
+            stream = self.llm_client.chat.completions.create(
+                stream=True, stream_options={"include_usage": True}, **self._openai_chat_params(prompt, max_tokens)
+            )
+            for chunk in stream:
+                # With include_usage the last chunk has the usage and no choices
+                usage = self._openai_usage(getattr(chunk, "usage", None)) or usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    chunks.append(chunk.choices[0].delta.content)
+                    if len(chunks) == 1:
+                        STAGE_SECONDS.observe(time.perf_counter() - started, "llm_first_token")
+                    yield chunk.choices[0].delta.content
+        else:
+            # For Gemini
+            chat = self.model.start_chat()
+            for chunk in chat.send_message(prompt, stream=True, **self._gemini_config(max_tokens)):
+                usage = self._gemini_usage(chunk) or usage
+                if chunk.text:
+                    chunks.append(chunk.text)
+                    if len(chunks) == 1:
+                        STAGE_SECONDS.observe(time.perf_counter() - started, "llm_first_token")
+                    yield chunk.text
+
+        STAGE_SECONDS.observe(time.perf_counter() - started, "llm")
+        self._record_usage(prompt, "".join(chunks), usage)
+
+    async def _acall_llm(self, prompt: str, max_tokens: Optional[int] = None) -> str:
+        """Async _call_llm: the request does not hold a thread while the LLM answers"""
+        try:
+            logger.debug("Sending prompt to LLM (first 200 chars): %.200s...", prompt)
+
+            with stage_timer("llm"):
+                if self.use_openai:
+                    response = await self.async_llm_client.chat.completions.create(**self._openai_chat_params(prompt, max_tokens))
+                else:
+                    # For Gemini
+                    chat = self.model.start_chat()
+                    response = await chat.send_message_async(prompt, **self._gemini_config(max_tokens))
+            if self.use_openai:
+                result = response.choices[0].message.content
+                usage = self._openai_usage(getattr(response, "usage", None))
+            else:
+                result = response.text
+                usage = self._gemini_usage(response)
+            logger.debug("LLM response received (first 200 chars): %.200s...", result)
+            self._record_usage(prompt, result, usage)
+            return result
 
-        for category, keywords in category_keywords.items():
-            for keyword in keywords:
-                if keyword in question_lower:
-                    return category
+        except Exception as e:
+            logger.error("Error calling LLM: %s", e)
+            raise
+
+    async def _astream_llm(self, prompt: str, max_tokens: Optional[int] = None) -> AsyncIterator[str]:
+        """Async _stream_llm"""
+        logger.debug("Streaming prompt to LLM (first 200 chars): %.200s...", prompt)
+        chunks = []
+        usage = None
+        started = time.perf_counter()
+
+        if self.use_openai:
+            stream = await self.async_llm_client.chat.completions.create(
+                stream=True, stream_options={"include_usage": True}, **self._openai_chat_params(prompt, max_tokens)
+            )
+            async for chunk in stream:
+                usage = self._openai_usage(getattr(chunk, "usage", None)) or usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    chunks.append(chunk.choices[0].delta.content)
+                    if len(chunks) == 1:
+                        STAGE_SECONDS.observe(time.perf_counter() - started, "llm_first_token")
+                    yield chunk.choices[0].delta.content
+        else:
+            # For Gemini
+            chat = self.model.start_chat()
+            response = await chat.send_message_async(prompt, stream=True, **self._gemini_config(max_tokens))
+            async for chunk in response:
+                usage = self._gemini_usage(chunk) or usage
+                if chunk.text:
+                    chunks.append(chunk.text)
+                    if len(chunks) == 1:
+                        STAGE_SECONDS.observe(time.perf_counter() - started, "llm_first_token")
+                    yield chunk.text
+
+        STAGE_SECONDS.observe(time.perf_counter() - started, "llm")
+        self._record_usage(prompt, "".join(chunks), usage)
 
-        return ""
+    def _extract_category_from_question(self, question: str) -> str:
+        """Extract property category from question if present"""
+        return self.query_parser.extract_category(question)
 
     def _extract_area_range_from_question(self, question: str) -> Optional[tuple]:
         """Extract min and max area from question if present"""
-        import re
-
-        question_lower = question.lower()
-
-        # Common Vietnamese area terms - improved patterns to match "từ 25-30 m2" format
-        area_patterns = [
-            r'(?:khoảng|tầm|gần|diện tích|khoảng\s+từ)?\s*(\d+(?:[,\.]\d+)?)\s*(?:m2|m²|met vuông|vuông)\s*(?:đến|đến khoảng)?\s*(\d+(?:[,\.]\d+)?)?(?:m2|m²|met vuông|vuông)?',
-            r'(?:từ|trên)\s*(\d+(?:[,\.]\d+)?)\s*(?:-|đến)\s*(\d+(?:[,\.]\d+)?)\s*(?:m2|m²|met vuông|vuông)',  # Pattern for "từ 25-30 m2"
-            r'(?:từ|trên)\s*(\d+(?:[,\.]\d+)?)\s*(?:m2|m²|met vuông|vuông)\s*(?:đến|đến khoảng)?\s*(\d+(?:[,\.]\d+)?)?(?:m2|m²|met vuông|vuông)?',
-            r'(\d+(?:[,\.]\d+)?)\s*(?:m2|m²|met vuông|vuông)\s*(?:đến|đến khoảng)\s*(\d+(?:[,\.]\d+)?)\s*(?:m2|m²|met vuông|vuông)',
-            r'(?:dưới|ít hơn)\s*(\d+(?:[,\.]\d+)?)\s*(?:m2|m²|met vuông|vuông)',
-            r'(?:trên|nhiều hơn)\s*(\d+(?:[,\.]\d+)?)\s*(?:m2|m²|met vuông|vuông)',
-        ]
-
-        for pattern in area_patterns:
-            matches = re.findall(pattern, question_lower)
-            if matches:
-                for match in matches:
-                    if isinstance(match, tuple):
-                        if len(match) == 2 and match[0] and match[1]:  # Range
-                            min_area = float(match[0].replace(',', '.'))
-                            max_area = float(match[1].replace(',', '.'))
-                            return (min_area, max_area)
-                        elif len(match) == 1 and match[0]:  # Single area or first in range
-                            # For "dưới" or "trên" patterns, we need to interpret differently
-                            area = float(match[0].replace(',', '.'))
-                            if 'dưới' in question_lower or 'ít hơn' in question_lower:
-                                return (0, area)
-                            elif 'trên' in question_lower or 'nhiều hơn' in question_lower:
-                                return (area, float('inf'))
-                            else:
-                                # For "khoảng", allow some flexibility
-                                return (area - 2, area + 2)
-                    else:
-                        # Single value matched
-                        area = float(match.replace(',', '.'))
-                        return (area - 2, area + 2)
-
-        return None
+        return self.query_parser.extract_area_range(question.lower())
 
     def _extract_amenities_from_question(self, question: str) -> List[str]:
         """Extract amenities from question if present"""
-        question_lower = question.lower()
-
-        # Amenity mappings
-        amenity_keywords = {
-            'có gác': ['có gác', 'co gac', 'gác', 'gac'],
-            'có máy lạnh': ['có máy lạnh', 'co may lanh', 'máy lạnh', 'may lanh', 'điều hòa', 'dieu hoa'],
-            'đầy đủ nội thất': ['đầy đủ nội thất', 'day du noi that', 'đầy đủ', 'day du', 'nội thất', 'noi that'],
-            'không chung chủ': ['không chung chủ', 'khong chung chu', 'không chung', 'khong chung'],
-            'giờ giấc tự do': ['giờ giấc tự do', 'gio gic tu do', 'giờ tự do', 'gio tu do'],
-            'có ban công': ['có ban công', 'co ban cong', 'ban công', 'ban cong'],
-            'có nội thất': ['có nội thất', 'co noi that', 'nội thất', 'noi that'],
-            'có an ninh': ['có an ninh', 'co an ninh', 'an ninh', 'bảo vệ', 'bao ve'],
-            'có thang máy': ['có thang máy', 'co thang may', 'thang máy', 'thang may'],
-            'có kệ bếp': ['có kệ bếp', 'co ke bep', 'kệ bếp', 'ke bep'],
-            'có máy giặt': ['có máy giặt', 'co may giat', 'máy giặt', 'may giat'],
-            'có hầm để xe': ['có hầm để xe', 'co ham de xe', 'hầm để xe', 'ham de xe', 'chỗ để xe', 'cho de xe']
-        }
-
-        found_amenities = []
-        for standard_amenity, keywords in amenity_keywords.items():
-            for keyword in keywords:
-                if keyword in question_lower and standard_amenity not in found_amenities:
-                    found_amenities.append(standard_amenity)
-
-        return found_amenities
+        return self.query_parser.extract_amenities(question)
 
     def process_question(self, question: str, user_id: Optional[str] = None, session_id: Optional[str] = None) -> Dict[str, Any]:
         """Process a user question using RAG - with detailed debugging"""
+        started = time.perf_counter()
         try:
-            logger.info(f"Processing question: {question}")
-
-            # Determine if the user is asking for rental listings
-            is_rental_request = self._is_rental_request(question)
-            logger.info(f"Is rental request: {is_rental_request}")
-
-            # Extract location, price range, area range, category and amenities from question for better targeting
-            extracted_location = self._extract_location_from_question(question)
-            price_range = self._extract_price_range_from_question(question)
-            area_range = self._extract_area_range_from_question(question)
-            extracted_category = self._extract_category_from_question(question)
-            extracted_amenities = self._extract_amenities_from_question(question)
-            logger.info(f"Extracted location: '{extracted_location}', price range: {price_range}, area range: {area_range}, category: '{extracted_category}', amenities: {extracted_amenities}")
-
-            # Search for relevant documents
-            # Enhance the search query with location, area, category, and amenities for better results
-            search_query = question
-            if extracted_location:
-                # Only add location if it's not already in the question
-                if extracted_location.lower() not in question.lower():
-                    search_query = f"{search_query} {extracted_location}"
-            if area_range:
-                search_query = f"{search_query} {area_range[0]}m2 đến {area_range[1]}m2"
-            if extracted_category:
-                # Only add category if it's not already in the question
-                if extracted_category.replace('-', ' ') not in question.lower():
-                    search_query = f"{search_query} {extracted_category.replace('-', ' ')}"
-            if extracted_amenities:
-                search_query = f"{search_query} {' '.join(extracted_amenities)}"
-
-            logger.info(f"Search query: {search_query}")
-
-            relevant_docs = self.vector_store.search(search_query, top_k=15)
-            logger.info(f"Found {len(relevant_docs)} relevant documents")
-
-            # Log the content of relevant documents for debugging
-            for i, doc in enumerate(relevant_docs[:3]):  # Just log first 3 for brevity
-                logger.info(f"Relevant doc {i+1}: ID={doc['id']}, Title={doc['title'][:100]}, Location={doc['location'][:50]}, Price={doc['price']}, Category={doc['metadata'].get('category', '')}")
-
-            # Filter results based on extracted criteria if available
-            filtered_docs = self._filter_documents_by_criteria(relevant_docs, extracted_location, price_range, area_range, extracted_category, extracted_amenities)
-            logger.info(f"Found {len(filtered_docs)} filtered documents after applying criteria")
-
-            # Log the content of filtered documents for debugging
-            for i, doc in enumerate(filtered_docs[:3]):  # Just log first 3 for brevity
-                logger.info(f"Filtered doc {i+1}: ID={doc['id']}, Title={doc['title'][:100]}, Location={doc['location'][:50]}, Price={doc['price']}, Category={doc['metadata'].get('category', '')}")
-
-            # Format relevant documents for the LLM in a structured way
-            formatted_docs = []
-            for idx, doc in enumerate(filtered_docs):
-                formatted_doc = (
-                    f"--- Bài đăng #{idx+1} ---\n"
-                    f"ID: {doc['id']}\n"
-                    f"Tiêu đề: {doc['title']}\n"
-                    f"Giá: {doc['price']}\n"
-                    f"Địa điểm: {doc['location']}\n"
-                    f"Danh mục: {doc['metadata'].get('category', 'phòng trọ')}\n"
-                    f"Diện tích: {doc['area']} m²\n"
-                    f"Tiện nghi: {', '.join(doc['options']) if isinstance(doc.get('options'), list) and doc.get('options') else 'Không có'}\n"
-                    f"Chi tiết: {doc['description'][:200] if doc.get('description') else 'Không có mô tả'}...\n"
-                    f"Độ tương đồng: {doc['similarity']:.2f}\n"
-                    f"------------------------"
-                )
-                formatted_docs.append(formatted_doc)
-
-            docs_text = "\n\n".join(formatted_docs) if formatted_docs else "KHÔNG CÓ BÀI ĐĂNG NÀO PHÙ HỢP VỚI YÊU CẦU CỦA BẠN"
-
-            if not filtered_docs:
-                # If no relevant documents found, respond generically
-                logger.info("No relevant documents found, responding generically")
-                prompt = f"""
-                BẠN CHỈ ĐƯỢC TRẢ LỜI DỰA TRÊN THÔNG TIN TRONG DỮ LIỆU ĐƯỢC CUNG CẤP.
-
-                HIỆN TẠI KHÔNG CÓ BÀI ĐĂNG NÀO PHÙ HỢP VỚI YÊU CẦU CỦA NGƯỜI DÙNG.
-
-                Câu hỏi của khách hàng: {question}
-
-                Xin lỗi bạn, hiện tại chúng tôi không có bài đăng nào phù hợp với yêu cầu của bạn.
-                Vui lòng thử lại với tiêu chí tìm kiếm khác (khu vực khác, mức giá khác, danh mục khác, hoặc điều chỉnh các tiện nghi yêu cầu).
-
-                Nếu bạn cần hỗ trợ thêm, vui lòng liên hệ đội ngũ hỗ trợ để được tư vấn cụ thể hơn.
-                """
-
-                response_text = self._call_llm(prompt)
-
-                return {
-                    "response": response_text,
-                    "type": "text",
-                    "rooms": None,
-                    "sources": []
-                }
-
-            # Create prompt for LLM with structured retrieved documents
-            if is_rental_request or extracted_location:
-                # Special handler when we detect a rental request or location is mentioned
-                if len(filtered_docs) > 0:
-                    # Take top 5 relevant results
-                    selected_rooms = filtered_docs[:5]
-                    selected_room_ids = [doc['id'] for doc in selected_rooms]
-
-                    # Log the selected rooms
-                    logger.info(f"Selected room IDs: {selected_room_ids}")
-
-                    # Create structured prompt with clear instructions
-                    prompt = f"""
-                    BẠN CHỈ ĐƯỢC TRẢ LỜI DỰA TRÊN THÔNG TIN TRONG DỮ LIỆU ĐƯỢC CUNG CẤP DƯỚI ĐÂY.
-                    KHÔNG ĐƯỢC Bịa đặt thông tin hoặc đưa ra thông tin không có trong dữ liệu được cung cấp.
-
-                    Dưới đây là các bài đăng phù hợp với yêu cầu của người dùng:
-                    {docs_text}
-
-                    Câu hỏi của khách hàng: {question}
-
-                    Vui lòng cung cấp thông tin về các bài đăng phù hợp với yêu cầu của khách hàng dựa hoàn toàn trên các bài đăng được cung cấp ở trên.
-                    QUAN TRỌNG: Nếu bài đăng có danh mục là 'nhà nguyên căn', 'căn hộ chung cư', 'căn hộ mini', hoặc 'ở ghép', bạn PHẢI ghi rõ danh mục này trong câu trả lời, không gọi chung là 'phòng trọ'.
-                    Nếu có thể, hãy sắp xếp theo mức độ phù hợp và đưa ra lựa chọn tốt nhất đầu tiên.
-                    Nếu người dùng yêu cầu tìm bài đăng, hãy trả lời theo định dạng sau:
-                    __SHOW_ROOMS__::{{"message": "Dưới đây là các bài đăng phù hợp với yêu cầu của bạn:", "roomIds": {json.dumps(selected_room_ids)}}}
-
-                    Nếu không thể trả lời dựa trên dữ liệu có sẵn, vui lòng thông báo rõ ràng cho người dùng biết.
-                    """
-
-                    logger.info(f"Sending rental request prompt to LLM, context length: {len(docs_text)} chars")
-                    response_text = self._call_llm(prompt)
-
-                    # Check if the response contains room show instruction
-                    show_rooms_prefix = "__SHOW_ROOMS__::"
-                    if show_rooms_prefix in response_text:
-                        logger.info("Response contains room show instruction")
-                        return self._format_room_response(response_text, filtered_docs)
-                    else:
-                        logger.info("Response does not contain room show instruction")
-                        # Return as text response with room information
-                        return {
-                            "response": response_text,
-                            "type": "text",
-                            "rooms": [self._format_room_for_response(doc) for doc in selected_rooms],
-                            "sources": filtered_docs
-                        }
-                else:
-                    # No relevant documents found - inform the user
-                    prompt = f"""
-                    BẠN CHỈ ĐƯỢC TRẢ LỜI DỰA TRÊN THÔNG TIN TRONG DỮ LIỆU ĐƯỢC CUNG CẤP.
-
-                    HIỆN TẠI KHÔNG CÓ BÀI ĐĂNG NÀO PHÙ HỢP VỚI YÊU CẦU CỦA NGƯỜI DÙNG.
-
-                    Người dùng đang tìm kiếm bài đăng tại khu vực {extracted_location or 'không xác định'} với mức giá {price_range or 'không xác định'}.
-                    Câu hỏi của khách hàng: {question}
-
-                    Xin lỗi bạn, hiện tại chúng tôi không có bài đăng nào phù hợp với yêu cầu của bạn.
-                    Vui lòng thử lại với tiêu chí tìm kiếm khác (khu vực khác, mức giá khác, danh mục khác, hoặc điều chỉnh các tiện nghi yêu cầu).
-                    """
-
-                    response_text = self._call_llm(prompt)
-                    return {
-                        "response": response_text,
-                        "type": "text",
-                        "rooms": None,
-                        "sources": []
-                    }
-            else:
-                # Standard handler for other queries
-                prompt = f"""
-                BẠN CHỈ ĐƯỢC TRẢ LỜI DỰA TRÊN THÔNG TIN TRONG DỮ LIỆU ĐƯỢC CUNG CẤP DƯỚI ĐÂY.
-                KHÔNG ĐƯỢC Bịa đặt thông tin hoặc đưa ra thông tin không có trong dữ liệu được cung cấp.
-
-                Dưới đây là một số bài đăng liên quan đến câu hỏi của người dùng:
-                {docs_text}
+            answer = self._prepare_answer(question)
+            response_text = self._known_response(answer)
+            if response_text is None:
+                response_text = self._call_llm(answer["prompt"], answer["max_tokens"])
+                self._cache_response(answer, response_text)
+            response = self._build_answer(answer, response_text)
+            self._record_answer(answer, started)
+            return response
 
-                Câu hỏi của khách hàng: {question}
+        except Exception as e:
+            logger.error("Error processing question: %s", e)
+            CHAT_SECONDS.observe(time.perf_counter() - started, "error")
+            return self._error_response()
+
+    def process_question_stream(self, question: str, user_id: Optional[str] = None, session_id: Optional[str] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Process a user question like process_question, streaming the answer.
+
+        Yields ("token", {"text": ...}) events while the LLM generates, then one ("done", response)
+        event with the response process_question would return. The __SHOW_ROOMS__:: instruction
+        is never streamed; its rooms come with the "done" event.
+        """
+        started = time.perf_counter()
+        try:
+            answer = self._prepare_answer(question)
+            cached = self._known_response(answer)
+            show_rooms_filter = ShowRoomsStreamFilter()
+            chunks = []
+            for chunk in self._stream_llm(answer["prompt"], answer["max_tokens"]) if cached is None else [cached]:
+                chunks.append(chunk)
+                text = show_rooms_filter.feed(chunk)
+                if text:
+                    yield "token", {"text": text}
+            text = show_rooms_filter.flush()
+            if text:
+                yield "token", {"text": text}
+
+            response_text = "".join(chunks)
+            if cached is None:
+                logger.debug("LLM stream finished (first 200 chars): %.200s...", response_text)
+                self._cache_response(answer, response_text)
+            response = self._build_answer(answer, response_text)
+            self._record_answer(answer, started)
+            yield "done", response
 
-                Trả lời câu hỏi dựa trên thông tin từ các bài đăng được cung cấp. Nếu không liên quan đến bài đăng nào, trả lời một cách tự nhiên và thân thiện.
-                """
+        except Exception as e:
+            logger.error("Error processing question: %s", e)
+            CHAT_SECONDS.observe(time.perf_counter() - started, "error")
+            yield "done", self._error_response()
+
+    async def aprocess_question(self, question: str, user_id: Optional[str] = None, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """Async process_question for the ASGI app: the embedding and LLM requests are awaited,
+        local search runs in a worker thread, so no thread is held while waiting on the network"""
+        started = time.perf_counter()
+        try:
+            answer = await self._aprepare_answer(question)
+            response_text = self._known_response(answer)
+            if response_text is None:
+                response_text = await self._acall_llm(answer["prompt"], answer["max_tokens"])
+                self._cache_response(answer, response_text)
+            response = await asyncio.to_thread(self._build_answer, answer, response_text)
+            self._record_answer(answer, started)
+            return response
 
-                logger.info(f"Sending standard query prompt to LLM, context length: {len(docs_text)} chars")
-                response_text = self._call_llm(prompt)
+        except Exception as e:
+            logger.error("Error processing question: %s", e)
+            CHAT_SECONDS.observe(time.perf_counter() - started, "error")
+            return self._error_response()
 
-                # Check if the response contains room show instruction
-                show_rooms_prefix = "__SHOW_ROOMS__::"
-                if show_rooms_prefix in response_text:
-                    logger.info("Response contains room show instruction")
-                    return self._format_room_response(response_text, filtered_docs)
-                else:
-                    logger.info("Response does not contain room show instruction")
-                    # Return as text response
-                    return {
-                        "response": response_text,
-                        "type": "text",
-                        "rooms": None,
-                        "sources": filtered_docs
-                    }
+    async def aprocess_question_stream(self, question: str, user_id: Optional[str] = None, session_id: Optional[str] = None) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Async process_question_stream, yielding the same events"""
+        started = time.perf_counter()
+        try:
+            answer = await self._aprepare_answer(question)
+            cached = self._known_response(answer)
+            show_rooms_filter = ShowRoomsStreamFilter()
+            chunks = []
+            async for chunk in self._astream_llm(answer["prompt"], answer["max_tokens"]) if cached is None else _aiter([cached]):
+                chunks.append(chunk)
+                text = show_rooms_filter.feed(chunk)
+                if text:
+                    yield "token", {"text": text}
+            text = show_rooms_filter.flush()
+            if text:
+                yield "token", {"text": text}
+
+            response_text = "".join(chunks)
+            if cached is None:
+                logger.debug("LLM stream finished (first 200 chars): %.200s...", response_text)
+                self._cache_response(answer, response_text)
+            response = await asyncio.to_thread(self._build_answer, answer, response_text)
+            self._record_answer(answer, started)
+            yield "done", response
 
         except Exception as e:
-            logger.error(f"Error processing question: {e}")
+            logger.error("Error processing question: %s", e)
+            CHAT_SECONDS.observe(time.perf_counter() - started, "error")
+            yield "done", self._error_response()
+
+    async def _aprepare_answer(self, question: str) -> Dict[str, Any]:
+        """Async _prepare_answer: the query embedding is awaited (concurrent identical queries share
+        one request), then the vector search and filtering run in a worker thread"""
+        intent, search_query, search_filters = self._plan_search(question)
+        with stage_timer("embed_query"):
+            query_embedding = await self.vector_store.aembed_query(search_query)
+        relevant_docs, filtered_docs = await asyncio.to_thread(
+            self._retrieve_documents, search_query, search_filters, intent, query_embedding
+        )
+        with stage_timer("build_prompt"):
+            answer = self._build_prompt(question, intent, relevant_docs, filtered_docs)
+        return self._with_cache_key(answer, question, intent, query_embedding)
+
+    def _error_response(self) -> Dict[str, Any]:
+        """Response sent when a question could not be answered"""
+        return {
+            "response": "Xin lỗi, tôi đang gặp sự cố. Vui lòng thử lại sau.",
+            "type": "text",
+            "rooms": None,
+            "sources": []
+        }
+
+    def _prepare_answer(self, question: str) -> Dict[str, Any]:
+        """Retrieve the posts for a question and build the LLM prompt.
+
+        Returns the prompt with what _build_answer needs to turn the LLM response into the
+        chat response: the kind of prompt, the filtered posts and the rooms offered.
+        """
+        intent, search_query, search_filters = self._plan_search(question)
+        with stage_timer("embed_query"):
+            query_embedding = self.vector_store.embed_query(search_query)
+        relevant_docs, filtered_docs = self._retrieve_documents(search_query, search_filters, intent, query_embedding)
+        with stage_timer("build_prompt"):
+            answer = self._build_prompt(question, intent, relevant_docs, filtered_docs)
+        return self._with_cache_key(answer, question, intent, query_embedding)
+
+    def _plan_search(self, question: str) -> Tuple[QueryIntent, str, Dict[str, Any]]:
+        """Parse the question into its criteria, the enriched search query and the vector query filters"""
+        logger.debug("Processing question: %s", question)
+
+        # Parse the question once: rental request, location, price range, area range, category and amenities
+        with stage_timer("parse"):
+            intent = self.query_parser.parse(question)
+        is_rental_request = intent.is_rental_request
+        logger.debug("Is rental request: %s", is_rental_request)
+
+        extracted_location = intent.location
+        price_range = intent.price_range
+        area_range = intent.area_range
+        extracted_category = intent.category
+        extracted_amenities = intent.amenities
+        logger.debug("Extracted location: '%s', price range: %s, area range: %s, category: '%s', amenities: %s",
+                     extracted_location, price_range, area_range, extracted_category, extracted_amenities)
+
+        # Search for relevant documents
+        # Enhance the search query with location, area, category, and amenities for better results
+        search_query = question
+        if extracted_location:
+            # Only add location if it's not already in the question
+            if extracted_location.lower() not in question.lower():
+                search_query = f"{search_query} {extracted_location}"
+        if area_range:
+            search_query = f"{search_query} {area_range[0]}m2 đến {area_range[1]}m2"
+        if extracted_category:
+            # Only add category if it's not already in the question
+            if extracted_category.replace('-', ' ') not in question.lower():
+                search_query = f"{search_query} {extracted_category.replace('-', ' ')}"
+        if extracted_amenities:
+            search_query = f"{search_query} {' '.join(extracted_amenities)}"
+
+        logger.info("Search query: %s", search_query)
+
+        # Push price/area/category down into the vector query so all hits can match them
+        search_filters = {}
+        if price_range:
+            search_filters["min_price"], search_filters["max_price"] = price_range
+        if area_range:
+            search_filters["min_area"], search_filters["max_area"] = area_range
+        if extracted_category:
+            search_filters["category"] = extracted_category
+
+        return intent, search_query, search_filters
+
+    def _build_prompt(self, question: str, intent: QueryIntent, relevant_docs: List[Dict], filtered_docs: List[Dict]) -> Dict[str, Any]:
+        """Build the LLM prompt from the retrieved and filtered posts (see _prepare_answer)"""
+        is_rental_request = intent.is_rental_request
+        extracted_location = intent.location
+        logger.info("Found %d relevant documents, %d after applying criteria", len(relevant_docs), len(filtered_docs))
+
+        # Log the first documents for debugging, for a sample of the requests (LOG_VERBOSE_SAMPLE_RATE)
+        if verbose_enabled(logger):
+            for label, docs in (("Relevant", relevant_docs), ("Filtered", filtered_docs)):
+                for i, doc in enumerate(docs[:3]):  # Just log first 3 for brevity
+                    logger.debug("%s doc %d: ID=%s, Title=%.100s, Location=%.50s, Price=%s, Category=%s", label, i + 1,
+                                 doc['id'], doc['title'], doc['location'], doc['price'], doc['metadata'].get('category', ''))
+
+        if not filtered_docs:
+            # If no relevant documents found, respond generically
+            logger.info("No relevant documents found, responding generically")
+            prompt = f"""
+            BẠN CHỈ ĐƯỢC TRẢ LỜI DỰA TRÊN THÔNG TIN TRONG DỮ LIỆU ĐƯỢC CUNG CẤP.
+
+            HIỆN TẠI KHÔNG CÓ BÀI ĐĂNG NÀO PHÙ HỢP VỚI YÊU CẦU CỦA NGƯỜI DÙNG.
+
+            Câu hỏi của khách hàng: {question}
+
+            Xin lỗi bạn, hiện tại chúng tôi không có bài đăng nào phù hợp với yêu cầu của bạn.
+            Vui lòng thử lại với tiêu chí tìm kiếm khác (khu vực khác, mức giá khác, danh mục khác, hoặc điều chỉnh các tiện nghi yêu cầu).
+
+            Nếu bạn cần hỗ trợ thêm, vui lòng liên hệ đội ngũ hỗ trợ để được tư vấn cụ thể hơn.
+            """
+
+            answer = {"kind": "no_results", "prompt": prompt, "filtered_docs": [], "selected_rooms": [],
+                      "max_tokens": output_token_cap("no_results")}
+            if self._use_fast_path(intent):
+                answer["response_text"] = NO_RESULTS_MESSAGE
+            return answer
+
+        # Create prompt for LLM with structured retrieved documents
+        if is_rental_request or extracted_location:
+            # Special handler when we detect a rental request or location is mentioned
+            # Take top 5 relevant results
+            selected_rooms = filtered_docs[:5]
+            selected_room_ids = [doc['id'] for doc in selected_rooms]
+
+            # Log the selected rooms
+            logger.debug("Selected room IDs: %s", selected_room_ids)
+
+            if self._use_fast_path(intent):
+                # The rooms are known: answer with them directly instead of asking the LLM to list them
+                message = self._fast_path_message(intent, len(selected_rooms))
+                return {"kind": "rental", "prompt": None, "filtered_docs": filtered_docs, "selected_rooms": selected_rooms,
+                        "response_text": f"{SHOW_ROOMS_PREFIX}{json.dumps({'message': message, 'roomIds': selected_room_ids}, ensure_ascii=False)}"}
+
+            # Most relevant posts within the token budget; the rooms offered must be among them
+            docs_text, context_docs, context_stats = self._get_context_builder().pack(filtered_docs)
+            selected_rooms = context_docs[:5]
+            selected_room_ids = [doc['id'] for doc in selected_rooms]
+
+            # Create structured prompt with clear instructions
+            prompt = f"""
+            BẠN CHỈ ĐƯỢC TRẢ LỜI DỰA TRÊN THÔNG TIN TRONG DỮ LIỆU ĐƯỢC CUNG CẤP DƯỚI ĐÂY.
+            KHÔNG ĐƯỢC Bịa đặt thông tin hoặc đưa ra thông tin không có trong dữ liệu được cung cấp.
+
+            Dưới đây là các bài đăng phù hợp với yêu cầu của người dùng:
+            {docs_text}
+
+            Câu hỏi của khách hàng: {question}
+
+            Vui lòng cung cấp thông tin về các bài đăng phù hợp với yêu cầu của khách hàng dựa hoàn toàn trên các bài đăng được cung cấp ở trên.
+            QUAN TRỌNG: Nếu bài đăng có danh mục là 'nhà nguyên căn', 'căn hộ chung cư', 'căn hộ mini', hoặc 'ở ghép', bạn PHẢI ghi rõ danh mục này trong câu trả lời, không gọi chung là 'phòng trọ'.
+            Nếu có thể, hãy sắp xếp theo mức độ phù hợp và đưa ra lựa chọn tốt nhất đầu tiên.
+            Nếu người dùng yêu cầu tìm bài đăng, hãy trả lời theo định dạng sau:
+            {SHOW_ROOMS_PREFIX}{{"message": "Dưới đây là các bài đăng phù hợp với yêu cầu của bạn:", "roomIds": {json.dumps(selected_room_ids)}}}
+
+            Nếu không thể trả lời dựa trên dữ liệu có sẵn, vui lòng thông báo rõ ràng cho người dùng biết.
+            """
+
+            logger.info("Sending rental request prompt to LLM, context: %d posts, %d tokens", context_stats['posts'], context_stats['tokens'])
+            return {"kind": "rental", "prompt": prompt, "filtered_docs": filtered_docs, "selected_rooms": selected_rooms,
+                    "max_tokens": output_token_cap("rental"), "context": context_stats}
+
+        # Standard handler for other queries
+        docs_text, context_docs, context_stats = self._get_context_builder().pack(filtered_docs)
+        prompt = f"""
+        BẠN CHỈ ĐƯỢC TRẢ LỜI DỰA TRÊN THÔNG TIN TRONG DỮ LIỆU ĐƯỢC CUNG CẤP DƯỚI ĐÂY.
+        KHÔNG ĐƯỢC Bịa đặt thông tin hoặc đưa ra thông tin không có trong dữ liệu được cung cấp.
+
+        Dưới đây là một số bài đăng liên quan đến câu hỏi của người dùng:
+        {docs_text}
+
+        Câu hỏi của khách hàng: {question}
+
+        Trả lời câu hỏi dựa trên thông tin từ các bài đăng được cung cấp. Nếu không liên quan đến bài đăng nào, trả lời một cách tự nhiên và thân thiện.
+        """
+
+        logger.info("Sending standard query prompt to LLM, context: %d posts, %d tokens", context_stats['posts'], context_stats['tokens'])
+        return {"kind": "standard", "prompt": prompt, "filtered_docs": filtered_docs, "selected_rooms": [],
+                "max_tokens": output_token_cap("standard"), "context": context_stats}
+
+    def _use_fast_path(self, intent: QueryIntent) -> bool:
+        if not (self.fast_path_enabled and intent.is_pure_search):
+            return False
+        logger.info("Pure search, answering without the LLM")
+        return True
+
+    @staticmethod
+    def _fast_path_message(intent: QueryIntent, count: int) -> str:
+        """Vietnamese sentence introducing the rooms found for the criteria of a pure search"""
+        message = f"Dưới đây là {count} {CATEGORY_LABELS.get(intent.category, 'bài đăng')}"
+        if intent.location:
+            message += f" tại {intent.location}"
+        if intent.price_range:
+            message += f", giá {_format_range(intent.price_range, _format_vnd)}"
+        if intent.area_range:
+            message += f", diện tích {_format_range(intent.area_range, lambda area: f'{area:g} m²')}"
+        if intent.amenities:
+            message += f", {', '.join(intent.amenities)}"
+        return message + " phù hợp với yêu cầu của bạn:"
+
+    def _with_cache_key(self, answer: Dict[str, Any], question: str, intent: QueryIntent, query_embedding: List[float]) -> Dict[str, Any]:
+        """Add what the response cache needs to look up and store the answer to a prompt"""
+        answer["cache_key"] = ResponseCache.make_key(answer["kind"], question, intent, answer["filtered_docs"])
+        # Until the index watcher applies what another worker wrote, the posts retrieved (and the cached
+        # answers naming them) may be outdated: the answer is neither looked up nor stored
+        answer["cacheable"] = not self.vector_store.has_unapplied_changes()
+        answer["query_embedding"] = query_embedding
+        return answer
+
+    def _known_response(self, answer: Dict[str, Any]) -> Optional[str]:
+        """Response of the fast path or cached for the same intent and posts, or None if the LLM must answer.
+        Sets answer["answered_by"] for the metrics."""
+        answer["answered_by"] = "llm"
+        if answer.get("response_text") is not None:
+            answer["answered_by"] = "fast_path"
+            return answer["response_text"]
+        if not self.response_cache or not answer["cacheable"]:
+            return None
+        response_text = self.response_cache.get(answer["cache_key"], answer["query_embedding"])
+        if response_text is not None:
+            answer["answered_by"] = "cache"
+            logger.info("Serving LLM response from the response cache")
+        return response_text
+
+    def _record_answer(self, answer: Dict[str, Any], started: float):
+        """Count a response once it is built: its time by who answered, and the fast path answers"""
+        if answer["answered_by"] == "fast_path":
+            with self._retrieval_stats_lock:
+                self.fast_path_count += 1
+        CHAT_SECONDS.observe(time.perf_counter() - started, answer["answered_by"])
+
+    def _cache_response(self, answer: Dict[str, Any], response_text: str):
+        if self.response_cache and answer["cacheable"] and response_text:
+            self.response_cache.put(answer["cache_key"], response_text, answer["query_embedding"])
+
+    def _build_answer(self, answer: Dict[str, Any], response_text: str) -> Dict[str, Any]:
+        """Turn the LLM response to a prompt from _prepare_answer into the chat response"""
+        if answer["kind"] == "no_results":
             return {
-                "response": "Xin lỗi, tôi đang gặp sự cố. Vui lòng thử lại sau.",
+                "response": response_text,
                 "type": "text",
                 "rooms": None,
                 "sources": []
             }
 
+        filtered_docs = answer["filtered_docs"]
+        # Check if the response contains room show instruction
+        if SHOW_ROOMS_PREFIX in response_text:
+            logger.debug("Response contains room show instruction")
+            return self._format_room_response(response_text, filtered_docs)
+
+        logger.debug("Response does not contain room show instruction")
+        if answer["kind"] == "rental":
+            # Return as text response with room information
+            return {
+                "response": response_text,
+                "type": "text",
+                "rooms": [self._format_room_for_response(doc) for doc in answer["selected_rooms"]],
+                "sources": filtered_docs
+            }
+        # Return as text response
+        return {
+            "response": response_text,
+            "type": "text",
+            "rooms": None,
+            "sources": filtered_docs
+        }
+
+    def _retrieve_documents(self, search_query: str, search_filters: Dict[str, Any], intent: QueryIntent,
+                            query_embedding: Optional[List[float]] = None) -> Tuple[List[Dict], List[Dict]]:
+        """Search and filter by the question's criteria, returning (retrieved, filtered) documents.
+
+        When fewer than retrieval_min_results posts pass the filters, top_k is multiplied by
+        retrieval_growth_factor and the search repeated (the query embedding is cached), until
+        enough posts match, the collection has no more candidates or retrieval_max_top_k is
+        reached. At most retrieval_top_k filtered posts are returned.
+        """
+        top_k = self.retrieval_top_k
+        rounds = 0
+        while True:
+            rounds += 1
+            relevant_docs = self.vector_store.search(search_query, top_k=top_k, filters=search_filters,
+                                                     query_embedding=query_embedding)
+            with stage_timer("filter"):
+                filtered_docs = self._filter_documents_by_criteria(relevant_docs, intent.location, intent.price_range,
+                                                                   intent.area_range, intent.category, intent.amenities)
+            if len(filtered_docs) >= self.retrieval_min_results:
+                outcome = "enough"
+            elif len(relevant_docs) < top_k:
+                outcome = "exhausted"  # Every candidate has been seen
+            elif top_k >= self.retrieval_max_top_k:
+                outcome = "budget"
+            else:
+                top_k = min(top_k * self.retrieval_growth_factor, self.retrieval_max_top_k)
+                continue
+            break
+
+        stats = {"rounds": rounds, "top_k": top_k, "candidates": len(relevant_docs),
+                 "matched": len(filtered_docs), "outcome": outcome}
+        self.last_retrieval_stats = stats
+        with self._retrieval_stats_lock:
+            self.retrieval_stats["requests"] += 1
+            self.retrieval_stats["searches"] += rounds
+            self.retrieval_stats["widened"] += rounds > 1
+            self.retrieval_stats[outcome] += 1
+        logger.info("Retrieval: %s", stats)
+
+        return relevant_docs, filtered_docs[:self.retrieval_top_k]
+
+    def get_retrieval_stats(self) -> Dict[str, Any]:
+        """Counters of how far retrieval had to widen top_k"""
+        with self._retrieval_stats_lock:
+            return dict(self.retrieval_stats, last=self.last_retrieval_stats)
+
     def _format_room_for_response(self, doc: Dict) -> Dict:
         """Format a document for room response"""
         # Parse images from metadata (stored as comma-separated string)
@@ -406,10 +813,9 @@ class ChatBot:
         """Extract and format room data from the LLM response"""
         try:
             # Check if the response contains room show instruction
-            show_rooms_prefix = "__SHOW_ROOMS__::"
-            if show_rooms_prefix in response_text:
+            if SHOW_ROOMS_PREFIX in response_text:
                 # Extract the JSON part
-                parts = response_text.split(show_rooms_prefix)
+                parts = response_text.split(SHOW_ROOMS_PREFIX)
                 text_before = parts[0].strip() if len(parts) > 0 and parts[0].strip() else ""
                 json_part = parts[1].strip()
 
@@ -421,33 +827,20 @@ class ChatBot:
                 rooms = []
 
                 if room_ids:
-                    # Get full room details from vector store
+                    # Rooms retrieved for this request are used as they are; only the others are looked up,
+                    # all in one batch
+                    docs_by_id = {doc['id']: doc for doc in relevant_docs}
+                    fetched = self.vector_store.get_documents_by_ids([room_id for room_id in room_ids if room_id not in docs_by_id])
+
                     for room_id in room_ids:
-                        room_doc = self.vector_store.get_document_by_id(room_id)
-                        if room_doc:
-                            # Add the document score/similarity for ranking
-                            matching_doc = next((doc for doc in relevant_docs if doc['id'] == room_id), None)
-
-                            # Parse images from metadata (stored as comma-separated string)
-                            images_str = room_doc["metadata"].get("images", "")
-                            images = []
-                            if images_str:
-                                # Split by comma and clean up whitespace
-                                images = [img.strip() for img in images_str.split(",") if img.strip()]
-
-                            room_doc_with_score = {
-                                "_id": room_doc["id"],
-                                "title": room_doc["title"],
-                                "description": room_doc["description"],
-                                "location": room_doc["location"],
-                                "price": room_doc["price"],
-                                "area": room_doc["area"],
-                                "options": room_doc["options"],
-                                "category": room_doc["metadata"].get("category", "phòng trọ"),
-                                "images": images,
-                                "similarity": matching_doc["similarity"] if matching_doc else 0
-                            }
-                            rooms.append(room_doc_with_score)
+                        room_doc = docs_by_id.get(room_id)
+                        if room_doc is None:
+                            room_doc = fetched.get(room_id)
+                            if room_doc is None:
+                                continue
+                            # Not among the search results, so there is no similarity score
+                            room_doc = dict(room_doc, similarity=0)
+                        rooms.append(self._format_room_for_response(room_doc))
 
                 return {
                     "response": (text_before + " " + rooms_data.get("message", "")).strip(),
@@ -464,7 +857,7 @@ class ChatBot:
                     "sources": relevant_docs
                 }
         except Exception as parse_error:
-            logger.error(f"Error parsing room data: {parse_error}")
+            logger.error("Error parsing room data: %s", parse_error)
             # If parsing fails, return as text
             return {
                 "response": response_text,
@@ -475,281 +868,24 @@ class ChatBot:
 
     def _extract_location_from_question(self, question: str) -> str:
         """Extract location from question if present"""
-        import re
-        # Common ways people specify location in Vietnamese
-        question_lower = question.lower()
-
-        # Look for location keywords and extract what follows
-        for keyword in ['ở', 'tại', 'khu vực', 'khu vuc', 'quận', 'phường', 'huyện', 'xã', 'gần', 'thuộc']:
-            pos = question_lower.find(keyword)
-            if pos != -1:
-                # Extract the portion after the location keyword
-                after_keyword = question[pos + len(keyword):].strip()
-
-                # Use regex to extract location more precisely
-                # Look for patterns like "khu vực phú lương", "ở quận thanh xuân", etc.
-                # Stop at common non-location words like "diện tích", "giá", "có", etc.
-                stop_words = ['diện tích', 'dien tich', 'giá', 'gia', 'và', 'va', 'có', 'co', 'không', 'khong',
-                             'm2', 'triệu', 'triệu/tháng', 'triệu/thang', 'tr/tháng', 'tr/thang']
-
-                # Split into words and stop at first stop word
-                words = after_keyword.split()
-                location_words = []
-
-                for word in words:
-                    # Check if this word is a stop word
-                    is_stop_word = any(stop_word in word or word in stop_word for stop_word in stop_words)
-                    if is_stop_word:
-                        break
-                    location_words.append(word)
-                    # Limit to reasonable length
-                    if len(location_words) >= 4:  # Usually location names don't exceed 4 words
-                        break
-
-                location = ' '.join(location_words).strip('.,!?')
-
-                # Additional cleanup: remove common Vietnamese address words that might not be part of the location
-                location = re.sub(r'\b(từ|với|có|giá|diện tích|và|trên|dưới|khoảng|tầm|gần|ở)\b', '', location).strip()
-
-                return location
-
-        # If no specific location keyword found, return empty string
-        return ""
+        return self.query_parser.extract_location(question)
 
     def _is_rental_request(self, question: str) -> bool:
         """Check if the user question is a rental request - now includes all property types and amenities"""
-        question_lower = question.lower().strip()
-
-        # Keywords that indicate rental/housing requests
-        rental_keywords = [
-            'tìm phòng', 'tìm trọ', 'tìm nhà', 'tìm ở', 'tìm chỗ', 'tìm thuê',
-            'muốn thuê', 'muốn ở', 'muốn tìm', 'cần thuê', 'cần tìm', 'cần ở',
-            'cho thuê', 'phòng trọ', 'nhà trọ', 'chỗ ở', 'cho ở', 'ở thuê',
-            'thuê phòng', 'thuê trọ', 'thuê nhà', 'tìm người ở ghép', 'ở ghép',
-            'tôi muốn tìm', 'tôi cần tìm', 'tôi đang tìm', 'có phòng nào', 'có chỗ nào',
-            'có nhà nào', 'có trọ nào', 'room', 'phòng', 'nhà', 'chỗ ở',
-            'tôi muốn', 'muốn', 'cần', 'tìm kiếm', 'tìm giúp', 'giúp tìm',
-            'phòng cho thuê', 'nhà cho thuê', 'tìm phòng trọ', 'tìm nhà trọ',
-            # Property categories
-            'nhà nguyên căn', 'căn hộ chung cư', 'căn hộ mini', 'ở ghép',
-            'nhà nguyên can', 'can ho chung cu', 'can ho mini', 'o ghep',
-            # Amenities
-            'có gác', 'có máy lạnh', 'đầy đủ nội thất', 'không chung chủ',
-            'giờ giấc tự do', 'có ban công', 'có nội thất', 'có an ninh',
-            'có thang máy', 'có kệ bếp', 'có máy giặt', 'có hầm để xe',
-            'co gac', 'co may lanh', 'day du noi that', 'khong chung chu',
-            'gio gic tu do', 'co ban cong', 'co noi that', 'co an ninh',
-            'co thang may', 'co ke bep', 'co may giat', 'co ham de xe',
-        ]
-
-        # Check if it contains rental keywords
-        has_rental_keyword = any(keyword in question_lower for keyword in rental_keywords)
-
-        # A rental request is identified by having rental-related keywords
-        return has_rental_keyword
+        return self.query_parser.is_rental_request(question)
 
     def _extract_price_range_from_question(self, question: str) -> Optional[tuple]:
         """Extract min and max price from question if present"""
-        import re
-
-        question_lower = question.lower()
-
-        # Handle raw numbers (VND) first - this should come first
-        raw_price_patterns = [
-            r'(?:từ|trên)\s*(\d{6,})\s*(?:đến|đến khoảng)?\s*(\d{6,})?',  # From X to Y (large numbers for VND)
-            r'(\d{6,})\s*(?:đến|->|–|–)\s*(\d{6,})',  # X đến Y
-            r'(?:dưới|ít hơn)\s*(\d{6,})',  # Under X VND
-            r'(?:trên|nhiều hơn)\s*(\d{6,})',  # Over X VND
-        ]
-
-        for pattern in raw_price_patterns:
-            matches = re.findall(pattern, question_lower)
-            if matches:
-                match = matches[0]
-                if isinstance(match, tuple) and len(match) >= 2 and match[0] and match[1]:
-                    min_price = int(match[0])
-                    max_price = int(match[1])
-                    return (min_price, max_price)
-                elif isinstance(match, tuple) and len(match) >= 1 and match[0]:
-                    price = int(match[0])
-                    if 'dưới' in question_lower or 'ít hơn' in question_lower:
-                        return (0, price)
-                    elif 'trên' in question_lower or 'nhiều hơn' in question_lower:
-                        return (price, float('inf'))
-                    else:
-                        return (price - 500000, price + 500000)  # Allow ±500k buffer
-
-        # Then handle "triệu" patterns and convert to VND
-        price_patterns = [
-            r'(?:tầm|khoảng|gần|ngân sách|trong khoảng)\s*(\d+(?:[,\.]\d+)?)\s*(?:triệu|tr)',
-            r'(?:từ|trên)\s*(\d+(?:[,\.]\d+)?)\s*(?:triệu|tr)\s*(?:đến|đến khoảng)?\s*(\d+(?:[,\.]\d+)?)?(?:triệu|tr)?',
-            r'(\d+(?:[,\.]\d+)?)\s*(?:triệu|tr)\s*(?:đến|đến khoảng)\s*(\d+(?:[,\.]\d+)?)\s*(?:triệu|tr)',
-            r'(?:dưới|ít hơn)\s*(\d+(?:[,\.]\d+)?)\s*(?:triệu|tr)',
-            r'(?:trên|nhiều hơn)\s*(\d+(?:[,\.]\d+)?)\s*(?:triệu|tr)',
-        ]
-
-        for pattern in price_patterns:
-            matches = re.findall(pattern, question_lower)
-            if matches:
-                match = matches[0]
-                if isinstance(match, tuple):
-                    if len(match) == 2 and match[0] and match[1]:  # Range
-                        min_price = float(match[0].replace(',', '.')) * 1000000  # Convert to VND
-                        max_price = float(match[1].replace(',', '.')) * 1000000
-                        return (min_price, max_price)
-                    elif len(match) == 1 and match[0]:  # Single price or first in range
-                        # For "dưới" or "trên" patterns, we need to interpret differently
-                        price = float(match[0].replace(',', '.')) * 1000000
-                        if 'dưới' in question_lower or 'ít hơn' in question_lower:
-                            return (0, price)
-                        elif 'trên' in question_lower or 'nhiều hơn' in question_lower:
-                            return (price, float('inf'))
-                        else:
-                            # For "khoảng", allow some flexibility
-                            return (price - 500000, price + 500000)
-                else:
-                    # Single value matched
-                    price = float(match.replace(',', '.')) * 1000000
-                    return (price - 500000, price + 500000)
-
-        return None
+        return self.query_parser.extract_price_range(question.lower())
 
     def _filter_documents_by_criteria(self, docs: List[Dict], location: str, price_range: Optional[tuple], area_range: Optional[tuple] = None, category: str = "", amenities: List[str] = []) -> List[Dict]:
         """Filter documents based on location, price range, area range, category, and amenities"""
-        filtered_docs = []
-
-        for doc in docs:
-            doc_location = doc.get('location', '').lower()
-            doc_price_str = str(doc.get('price', '0'))
-            doc_area_str = str(doc.get('area', '0'))
-            doc_category = doc.get('metadata', {}).get('category', '').lower()
-            doc_options = [opt.lower() for opt in doc.get('options', [])]
-
-            # Extract price from document with improved parsing
-            doc_price = 0
-            import re
-            try:
-                # Handle various price formats
-                doc_price_str_clean = doc_price_str.lower().replace(',', '').replace('.', '')
-
-                # Look for million VND first
-                price_match = re.search(r'(\d+(?:[,.]\d+)?)\s*(?:triệu|tr|trieu)', doc_price_str_clean)
-                if price_match:
-                    doc_price = float(price_match.group(1).replace(',', '.')) * 1000000
-                else:
-                    # Look for thousand VND
-                    price_match = re.search(r'(\d+(?:[,.]\d+)?)\s*(?:ngàn|k|nghìn|ngan)', doc_price_str_clean)
-                    if price_match:
-                        doc_price = float(price_match.group(1).replace(',', '.')) * 1000
-                    else:
-                        # Look for raw numbers (could be in VND)
-                        # Only consider numbers that look like prices (greater than 100,000 VND)
-                        numeric_matches = re.findall(r'(\d{6,})', doc_price_str_clean)
-                        if numeric_matches:
-                            # Take the largest number that looks like a monthly rent
-                            possible_prices = [int(num) for num in numeric_matches if int(num) >= 100000]
-                            if possible_prices:
-                                doc_price = max(possible_prices)
-                            else:
-                                doc_price = int(numeric_matches[0]) if numeric_matches else 0
-                        else:
-                            # Last resort: extract any number
-                            numeric_match = re.search(r'(\d+(?:[,.]\d+)?)', doc_price_str_clean)
-                            if numeric_match:
-                                doc_price = float(numeric_match.group(1).replace(',', '.')) * 1000000  # Assume million
-            except ValueError:
-                doc_price = 0
-
-            # Extract area from document
-            doc_area = 0
-            try:
-                doc_area = float(doc_area_str)
-            except ValueError:
-                # If area is not a number, try to extract from string
-                area_match = re.search(r'(\d+(?:[,.]\d+)?)', doc_area_str)
-                if area_match:
-                    doc_area = float(area_match.group(1).replace(',', '.'))
-
-            # Location filtering - improved matching
-            location_matches = True
-            if location:
-                location_lower = location.lower().strip()
-                if location_lower:
-                    # Split location into parts and check if most parts exist in document location
-                    location_parts = [part.strip() for part in location_lower.split() if len(part.strip()) > 1]
-
-                    if location_parts:
-                        # Count how many location parts match
-                        matching_parts = sum(1 for part in location_parts if part in doc_location)
-                        # Require at least half of the location parts to match
-                        location_matches = matching_parts >= max(1, len(location_parts) // 2)
-
-            # Price range filtering
-            price_matches = True
-            if price_range:
-                min_price, max_price = price_range
-                if max_price == float('inf'):
-                    price_matches = doc_price >= min_price
-                else:
-                    price_matches = min_price <= doc_price <= max_price
-
-            # Area range filtering
-            area_matches = True
-            if area_range:
-                min_area, max_area = area_range
-                if max_area == float('inf'):
-                    area_matches = doc_area >= min_area
-                else:
-                    area_matches = min_area <= doc_area <= max_area
-
-            # Category filtering
-            category_matches = True
-            if category:
-                category_matches = doc_category == category.lower()
-
-            # Amenities filtering - improved matching for Vietnamese amenities
-            amenities_matches = True
-            if amenities:
-                for amenity in amenities:
-                    amenity_lower = amenity.lower()
-                    # Check if the amenity exists in the document options
-                    amenity_found = any(amenity_lower in doc_option or doc_option in amenity_lower for doc_option in doc_options)
-
-                    # If not found directly, try fuzzy matching or synonyms
-                    if not amenity_found:
-                        # Define common synonyms for Vietnamese amenities
-                        synonym_map = {
-                            'máy lạnh': ['máy lạnh', 'may lanh', 'điều hòa', 'dieu hoa'],
-                            'gác': ['gác', 'gac', 'lửng', 'mezzanine'],
-                            'nội thất': ['nội thất', 'noi that', 'đồ đạc', 'do dac'],
-                            'an ninh': ['an ninh', 'an ninh', 'bảo vệ', 'bao ve', 'camera'],
-                            'thang máy': ['thang máy', 'thang may', 'elevator', 'máy nâng']
-                        }
-
-                        # Find synonyms for the requested amenity
-                        synonyms = [amenity_lower]  # Start with the original term
-                        for key, values in synonym_map.items():
-                            if any(amenity_lower in val or val in amenity_lower for val in values):
-                                synonyms.extend(values)
-                                break
-
-                        # Check if any synonym matches
-                        amenity_found = any(
-                            any(synonym in doc_option or doc_option in synonym for synonym in synonyms)
-                            for doc_option in doc_options
-                        )
-
-                    if not amenity_found:
-                        amenities_matches = False
-                        break  # If any amenity is not found, the whole match fails
-
-            # Only add if location, price, and area match, and if category/amenities were specified, they also match
-            # If no category or amenities were specified, don't filter by them
-            if location_matches and price_matches and area_matches:
-                # If category was specified, it must match
-                # If amenities were specified, they must match
-                # If neither were specified, just match location, price and area
-                if (not category or category_matches) and (not amenities or amenities_matches):
-                    filtered_docs.append(doc)
-
-        return filtered_docs
\ No newline at end of file
+        # Price, area, category and amenities were parsed at index time; the criteria are applied as array masks
+        return PostFeatureTable(docs).filter(
+            docs,
+            location=location,
+            price_range=price_range,
+            area_range=area_range,
+            category=category,
+            amenities=amenities
+        )
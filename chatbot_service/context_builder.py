@@ -0,0 +1,130 @@
+import os
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+from text_utils import count_tokens, get_token_encoding
+
+logger = logging.getLogger(__name__)
+
+# Tokens of retrieved posts per prompt, by model name prefix (the longest matching prefix wins).
+# Far below the context windows: more posts mostly add latency and cost, not better answers.
+MODEL_CONTEXT_BUDGETS = {
+    "gpt-3.5": 2000,
+    "gpt-4": 2500,
+    "gpt-4o": 3000,
+    "o1": 3000,
+    "gemini": 3000,
+}
+DEFAULT_CONTEXT_BUDGET = 2500
+
+# Completion tokens by answer kind: a room listing only needs a short text and the room IDs
+OUTPUT_TOKEN_CAPS = {
+    "rental": 600,
+    "standard": 1000,
+    "no_results": 250,
+}
+
+# USD per million (prompt, completion) tokens, by model name prefix
+MODEL_PRICES = {
+    "gpt-3.5-turbo": (0.5, 1.5),
+    "gpt-4": (30.0, 60.0),
+    "gpt-4-turbo": (10.0, 30.0),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "o1": (15.0, 60.0),
+    "o1-mini": (3.0, 12.0),
+    "gemini-pro": (0.5, 1.5),
+    "gemini-1.5-flash": (0.075, 0.3),
+    "gemini-1.5-pro": (1.25, 5.0),
+}
+
+# Field sets from the richest to the leanest: the least useful fields are dropped first
+DETAIL_LEVELS = [
+    {"similarity": True, "description": 200, "options": True},
+    {"similarity": False, "description": 200, "options": True},
+    {"similarity": False, "description": 100, "options": True},
+    {"similarity": False, "description": 0, "options": True},
+    {"similarity": False, "description": 0, "options": False},
+]
+
+
+def _by_model_prefix(table: Dict[str, Any], model: str, default: Any) -> Any:
+    model = model.lower().rsplit("/", 1)[-1]  # Gemini model names look like "models/gemini-pro"
+    matches = [prefix for prefix in table if model.startswith(prefix)]
+    return table[max(matches, key=len)] if matches else default
+
+
+def context_budget(model: str) -> int:
+    """Token budget for the posts in a prompt to the model (LLM_CONTEXT_TOKENS overrides it)"""
+    if os.getenv("LLM_CONTEXT_TOKENS"):
+        return int(os.getenv("LLM_CONTEXT_TOKENS"))
+    return _by_model_prefix(MODEL_CONTEXT_BUDGETS, model, DEFAULT_CONTEXT_BUDGET)
+
+
+def output_token_cap(kind: str) -> int:
+    return OUTPUT_TOKEN_CAPS.get(kind, OUTPUT_TOKEN_CAPS["standard"])
+
+
+def llm_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Cost in USD of a request, 0 for models without a known price"""
+    prompt_price, completion_price = _by_model_prefix(MODEL_PRICES, model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000000
+
+
+class ContextBuilder:
+    """Formats retrieved posts for the LLM prompt within a token budget.
+
+    Posts are kept in relevance order. If they do not all fit with every field, fields are
+    dropped from all posts following DETAIL_LEVELS (similarity, then the description is
+    shortened and dropped, then the amenities); if they still do not fit at the leanest
+    level, the least relevant posts are left out.
+    """
+
+    def __init__(self, model: str, budget: Optional[int] = None):
+        self.model = model
+        self.budget = budget if budget is not None else context_budget(model)
+        self.encoding = get_token_encoding(model)
+
+    def count_tokens(self, text: str) -> int:
+        return count_tokens(text, self.encoding)
+
+    @staticmethod
+    def format_doc(index: int, doc: Dict, level: Dict[str, Any]) -> str:
+        lines = [
+            f"--- Bài đăng #{index + 1} ---",
+            f"ID: {doc['id']}",
+            f"Tiêu đề: {doc['title']}",
+            f"Giá: {doc['price']}",
+            f"Địa điểm: {doc['location']}",
+            f"Danh mục: {doc['metadata'].get('category', 'phòng trọ')}",
+            f"Diện tích: {doc['area']} m²",
+        ]
+        if level["options"]:
+            lines.append(f"Tiện nghi: {', '.join(doc['options']) if isinstance(doc.get('options'), list) and doc.get('options') else 'Không có'}")
+        if level["description"]:
+            lines.append(f"Chi tiết: {doc['description'][:level['description']] if doc.get('description') else 'Không có mô tả'}...")
+        if level["similarity"]:
+            lines.append(f"Độ tương đồng: {doc['similarity']:.2f}")
+        lines.append("------------------------")
+        return "\n".join(lines)
+
+    def pack(self, docs: List[Dict]) -> Tuple[str, List[Dict], Dict[str, Any]]:
+        """Format as many posts as fit the budget, returning (text, posts included, stats)"""
+        separator_tokens = self.count_tokens("\n\n")
+        for level_index, level in enumerate(DETAIL_LEVELS):
+            entries = [self.format_doc(i, doc, level) for i, doc in enumerate(docs)]
+            tokens = [self.count_tokens(entry) + separator_tokens for entry in entries]
+            if sum(tokens) <= self.budget:
+                break
+
+        # At the leanest level, keep the most relevant posts that fit
+        count, total = 0, 0
+        for entry_tokens in tokens:
+            if total + entry_tokens > self.budget:
+                break
+            count, total = count + 1, total + entry_tokens
+
+        stats = {"posts": count, "dropped_posts": len(docs) - count, "detail_level": level_index,
+                 "tokens": total, "budget": self.budget}
+        if count < len(docs) or level_index:
+            logger.info("Context packed to the token budget: %s", stats)
+        return "\n\n".join(entries[:count]), docs[:count], stats
@@ -0,0 +1,72 @@
+from typing import Any, Dict, Iterable, Iterator, Tuple
+from post_features import amenity_mask, canonical_category, parse_area_m2, parse_price_vnd
+
+# Bumped whenever the metadata layout changes so incremental reindexes rewrite older documents
+INDEX_SCHEMA_VERSION = 3
+# First schema version with price_vnd/area_m2, required to push filters into the vector query
+NUMERIC_METADATA_SCHEMA_VERSION = 2
+
+# (document id, text to embed, metadata)
+Record = Tuple[str, str, Dict[str, Any]]
+
+def build_document(post: Dict[str, Any]) -> Record:
+    """Convert a raw post (from MongoDB or the API) into an (id, text, metadata) record.
+
+    Every field is read from the post once and list fields are joined once per
+    separator, so the per-post cost stays low on large ingests.
+    """
+    get = post.get
+
+    title = get('title', '')
+    description = get('description', '')
+    address = get('address')
+    location = get('location', '') or (address.get('fullAddress', '') if address else '')
+
+    options = get('options', [])
+    if isinstance(options, list):
+        options_text = ' '.join(options)
+        options_meta = ', '.join(options)
+    else:
+        options_text = options_meta = str(options)
+
+    images = get('images', [])
+    images_meta = ', '.join(images) if isinstance(images, list) else str(images)
+
+    # A missing price/area is blank in the embedded text but "0" in the metadata
+    has_price = 'price' in post
+    has_area = 'area' in post
+    price_text = str(post['price']) if has_price else ''
+    area_text = str(post['area']) if has_area else ''
+
+    document_id = get('post_id') or get('_id') or str(get('id', ''))
+
+    text = f"{title} {description} {location} {price_text} {area_text} {options_text}".strip()
+    metadata = {
+        "post_id": document_id,
+        "title": title,
+        "description": description,
+        "location": location,
+        "price": price_text if has_price else '0',
+        "area": area_text if has_area else '0',
+        "options": options_meta,
+        "phone": get('phone', ''),
+        "username": get('username', ''),
+        "category": canonical_category(get('category', '')),
+        "images": images_meta,
+        "user_id": get('user_id', get('userId', '')),
+        "created_at": str(get('createdAt', '')),
+        "updated_at": str(get('updatedAt', '')),
+        # Normalized numeric fields so price/area filters can be pushed down into the vector query
+        "price_vnd": parse_price_vnd(post['price']) if has_price else 0.0,
+        "area_m2": parse_area_m2(post['area']) if has_area else 0.0,
+        # Canonical amenities offered, as a bitmask (see post_features.AMENITY_IDS); computed from
+        # the options exactly as they are read back from the metadata
+        "amenity_mask": amenity_mask(options_meta.split(', ') if options_meta else []),
+        "schema_version": INDEX_SCHEMA_VERSION
+    }
+    return document_id, text, metadata
+
+def iter_documents(posts: Iterable[Dict[str, Any]]) -> Iterator[Record]:
+    """Lazily convert posts into records, for streaming ingestion"""
+    for post in posts:
+        yield build_document(post)
@@ -0,0 +1,210 @@
+import os
+import sqlite3
+import hashlib
+import logging
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+import numpy as np
+from text_utils import normalize_query
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingCache:
+    """Persistent embedding cache stored in a local SQLite file.
+
+    Entries are keyed by (embedding model, sha256 of the normalized text) so the same
+    post text is never sent to the embeddings API twice. When the number of entries
+    grows past max_entries the least recently used ones are evicted.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, "
+            "text_hash TEXT NOT NULL, "
+            "vector BLOB NOT NULL, "
+            "last_used REAL NOT NULL, "
+            "PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """Normalize unicode form and whitespace so cosmetic differences share a cache entry"""
+        return " ".join(unicodedata.normalize("NFC", text).split())
+
+    @classmethod
+    def text_hash(cls, text: str) -> str:
+        return hashlib.sha256(cls.normalize_text(text).encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Return cached embeddings in the order of texts, None for every miss"""
+        if not texts:
+            return []
+
+        hashes = [self.text_hash(text) for text in texts]
+        found = {}
+        unique_hashes = list(set(hashes))
+
+        with self._lock:
+            # Stay well below SQLite's bound parameter limit
+            for i in range(0, len(unique_hashes), 500):
+                chunk = unique_hashes[i:i+500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model] + chunk
+                ).fetchall()
+                for text_hash, vector in rows:
+                    found[text_hash] = vector
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, text_hash) for text_hash in found]
+                )
+                self._conn.commit()
+
+            results = []
+            for text_hash in hashes:
+                vector = found.get(text_hash)
+                if vector is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    results.append(np.frombuffer(vector, dtype=np.float32).tolist())
+
+        return results
+
+    def put_many(self, model: str, texts: List[str], embeddings: List[List[float]]):
+        """Store embeddings for texts and evict least recently used entries if over capacity"""
+        if not texts:
+            return
+
+        now = time.time()
+        rows = [
+            (model, self.text_hash(text), np.asarray(embedding, dtype=np.float32).tobytes(), now)
+            for text, embedding in zip(texts, embeddings)
+        ]
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+            if self._entries > self.max_entries:
+                # Evict down to 90% of capacity so eviction does not run on every insert
+                overflow = self._entries - int(self.max_entries * 0.9)
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE rowid IN "
+                    "(SELECT rowid FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (overflow,)
+                )
+                self.evictions += overflow
+                self._entries -= overflow
+                logger.info(f"Evicted {overflow} least recently used embeddings from cache")
+
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and size of the cache"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "entries": self._entries,
+            "max_entries": self.max_entries,
+            "path": self.path
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class QueryEmbeddingCache:
+    """In-process LRU cache for query embeddings with a time-to-live per entry.
+
+    Queries are normalized (lowercase, collapsed whitespace and optionally accent-folded)
+    so that near-identical questions hit the same entry.
+    """
+
+    def __init__(self, capacity: int = 1000, ttl_seconds: float = 3600, fold_accents: bool = False):
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self.fold_accents = fold_accents
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (expires_at, embedding)
+        self._lock = threading.Lock()
+
+    def make_key(self, model: str, query: str) -> tuple:
+        return (model, normalize_query(query, fold=self.fold_accents))
+
+    def get(self, model: str, query: str) -> Optional[List[float]]:
+        key = self.make_key(model, query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, embedding = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, model: str, query: str, embedding: List[float]):
+        key = self.make_key(model, query)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "capacity": self.capacity,
+            "ttl_seconds": self.ttl_seconds
+        }
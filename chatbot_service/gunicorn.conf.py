@@ -0,0 +1,50 @@
+"""
+Gunicorn settings for serving the API with one worker process per core:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+    gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:app
+"""
+import os
+import re
+import tempfile
+import multiprocessing
+from dotenv import load_dotenv
+
+load_dotenv()
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+# Threads per worker: requests mostly wait on the embeddings and LLM APIs
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+# LLM answers and synchronous /reindex calls can take well over the default 30s
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+# Load the index once in the master and fork the workers from it. The numpy backend's vectors are
+# memory-mapped, so the workers share one copy through the page cache. Chroma's SQLite connection
+# and in-memory HNSW index must not cross a fork, so with Chroma every worker loads its own.
+preload_app = os.getenv(
+    "GUNICORN_PRELOAD",
+    "true" if os.getenv("VECTOR_BACKEND", "chroma").lower() == "numpy" else "false"
+).lower() == "true"
+
+# asgi.py loads the services when imported, as wsgi.py does: in the master with preload_app, in each
+# worker otherwise, before post_worker_init starts the background tasks
+os.environ.setdefault("INIT_SERVICES_ON_IMPORT", "true")
+
+# Each worker saves its metrics to this directory and /metrics reports the sum of all workers
+os.environ.setdefault("METRICS_MULTIPROC_DIR",
+                      os.path.join(tempfile.gettempdir(), "chatbot_metrics_" + re.sub(r"\W", "_", bind)))
+
+
+def on_starting(server):
+    """Runs in the master before the workers start: the metrics of the previous run are not carried over"""
+    from metrics import clear_directory
+    clear_directory(os.environ["METRICS_MULTIPROC_DIR"])
+
+
+def post_worker_init(worker):
+    """Runs in each worker once the app is loaded, before it accepts requests"""
+    import main
+    main.after_fork()
+    main.start_background_tasks()
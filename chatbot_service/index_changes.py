@@ -0,0 +1,71 @@
+import os
+import json
+import time
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class IndexChangeLog:
+    """Append-only log of the writes to each collection generation, shared by the processes serving it.
+
+    A process writing posts to a generation appends one line with the IDs it upserted and removed,
+    once the write is on disk; the other processes read what was appended since they last looked
+    and apply only those posts (see VectorStore.reload_if_changed). A position in the file is the
+    sequence number of a change.
+    One file per generation, chroma_data/index_changes/<collection>.jsonl: a forced reindex, which
+    builds a new generation, starts a new log.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _file(self, collection_name: str) -> str:
+        return os.path.join(self.path, f"{collection_name}.jsonl")
+
+    def position(self, collection_name: str) -> int:
+        """Length of the log of a generation (0 when nothing was logged)"""
+        try:
+            return os.path.getsize(self._file(collection_name))
+        except OSError:
+            return 0
+
+    def append(self, collection_name: str, writer: str, upserted: Iterable[str],
+               removed: Iterable[str] = ()) -> Optional[Tuple[int, int]]:
+        """Log a write; writer identifies the store that made it, which skips it when reading.
+        Returns the positions before and after the line written (None when there was nothing to log)."""
+        entry = {"writer": writer, "at": time.time(), "upserted": list(upserted), "removed": list(removed)}
+        if not entry["upserted"] and not entry["removed"]:
+            return None
+        line = (json.dumps(entry) + "\n").encode("utf-8")
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._file(collection_name), "ab") as f:
+            try:
+                import fcntl
+                fcntl.flock(f, fcntl.LOCK_EX)  # Whole lines only; released when the file is closed
+            except ImportError:
+                pass  # Windows: a single process
+            start = f.seek(0, os.SEEK_END)
+            f.write(line)
+        return start, start + len(line)
+
+    def read(self, collection_name: str, position: int) -> Tuple[List[Dict[str, Any]], int]:
+        """Changes appended after position, and the position after them. A line still being
+        written is left for the next read."""
+        try:
+            with open(self._file(collection_name), "rb") as f:
+                f.seek(position)
+                data = f.read()
+        except FileNotFoundError:
+            return [], position
+        end = data.rfind(b"\n") + 1
+        return [json.loads(line) for line in data[:end].splitlines() if line.strip()], position + end
+
+    def delete(self, collection_name: str):
+        try:
+            os.remove(self._file(collection_name))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning("Could not delete the change log of %s: %s", collection_name, e)
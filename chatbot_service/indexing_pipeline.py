@@ -0,0 +1,193 @@
+import logging
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from document_builder import Record
+from text_utils import count_tokens, get_token_encoding
+
+logger = logging.getLogger(__name__)
+
+class TokenBatcher:
+    """Group records into embedding requests bounded by item count and token count.
+
+    Token counts come from tiktoken for the embedding model. If the tokenizer cannot be
+    loaded (e.g. no network to download the BPE file) a conservative character-based
+    estimate is used instead.
+    """
+
+    def __init__(self, model: str, max_batch_size: int = 200, max_batch_tokens: int = 60000,
+                 max_text_tokens: int = 8191):
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_text_tokens = max_text_tokens
+        self.encoding = get_token_encoding(model)
+
+    def count_tokens(self, text: str) -> int:
+        return count_tokens(text, self.encoding)
+
+    def truncate(self, text: str) -> Tuple[str, int]:
+        """Cut text to the model's per-input token limit, returning (text, token count)"""
+        if self.encoding:
+            tokens = self.encoding.encode(text, disallowed_special=())
+            if len(tokens) > self.max_text_tokens:
+                tokens = tokens[:self.max_text_tokens]
+                text = self.encoding.decode(tokens)
+            return text, len(tokens)
+
+        tokens = self.count_tokens(text)
+        if tokens > self.max_text_tokens:
+            text = text[:self.max_text_tokens * 2]
+            tokens = self.max_text_tokens
+        return text, tokens
+
+    def iter_batches(self, records: Iterable[Record]) -> Iterator[List[Record]]:
+        batch = []
+        batch_tokens = 0
+
+        for doc_id, text, metadata in records:
+            text, tokens = self.truncate(text)
+            if batch and (len(batch) >= self.max_batch_size or batch_tokens + tokens > self.max_batch_tokens):
+                yield batch
+                batch = []
+                batch_tokens = 0
+            batch.append((doc_id, text, metadata))
+            batch_tokens += tokens
+
+        if batch:
+            yield batch
+
+
+class AdaptiveBackoff:
+    """Retry policy shared by all embedding workers.
+
+    A 429 or 5xx response pauses every worker (not just the one that got it) until the
+    server's Retry-After or an exponentially growing, jittered delay has passed. The
+    delay shrinks again as requests succeed.
+    """
+
+    def __init__(self, max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self._delay = base_delay
+        self._pause_until = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_retryable(error: Exception) -> bool:
+        status_code = getattr(error, "status_code", None)
+        if status_code is not None:
+            return status_code == 429 or status_code >= 500
+        # Connection errors and timeouts carry no status code
+        return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+    @staticmethod
+    def retry_after(error: Exception) -> Optional[float]:
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None)
+        if not headers:
+            return None
+        try:
+            return float(headers.get("retry-after"))
+        except (TypeError, ValueError):
+            return None
+
+    def call(self, fn: Callable, *args, **kwargs):
+        attempt = 0
+        while True:
+            with self._lock:
+                wait = self._pause_until - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not self.is_retryable(e):
+                    raise
+
+                with self._lock:
+                    delay = self.retry_after(e) or self._delay * (0.5 + random.random() / 2)
+                    self._delay = min(self.max_delay, self._delay * 2)
+                    self._pause_until = max(self._pause_until, time.monotonic() + delay)
+                    self.retries += 1
+
+                attempt += 1
+                logger.warning(f"Embedding request failed ({e}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                continue
+
+            with self._lock:
+                self._delay = max(self.base_delay, self._delay / 2)
+            return result
+
+
+class IndexingPipeline:
+    """Embed records with a bounded pool of workers while a single writer thread stores them.
+
+    Embedding requests for the next batches run while earlier batches are being written,
+    and at most max_workers * 2 batches are in flight so memory stays bounded even when
+    records are streamed from a large source.
+    """
+
+    def __init__(self, embed_fn: Callable[[List[str]], List[List[float]]], batcher: TokenBatcher,
+                 max_workers: int = 4, max_pending_writes: int = 8):
+        self.embed_fn = embed_fn
+        self.batcher = batcher
+        self.max_workers = max_workers
+        self.max_pending_writes = max_pending_writes
+
+    def run(self, records: Iterable[Record], write_fn: Callable[[List[str], List[List[float]], List[Dict[str, Any]]], None],
+            total: Optional[int] = None) -> int:
+        """Embed and write all records, returning the number of records written"""
+        write_queue = queue.Queue(maxsize=self.max_pending_writes)
+        in_flight = threading.Semaphore(self.max_workers * 2)
+        errors = []
+        written = [0]
+
+        def writer():
+            while True:
+                item = write_queue.get()
+                if item is None:
+                    return
+                if errors:
+                    continue  # Drain the queue without writing once something failed
+                ids, embeddings, metadatas = item
+                try:
+                    write_fn(ids, embeddings, metadatas)
+                    written[0] += len(ids)
+                    logger.info(f"Indexed batch: {written[0]}/{total if total is not None else '?'} posts")
+                except Exception as e:
+                    errors.append(e)
+
+        def embed_batch(batch: List[Record]):
+            try:
+                if errors:
+                    return
+                embeddings = self.embed_fn([text for _, text, _ in batch])
+                write_queue.put(([doc_id for doc_id, _, _ in batch], embeddings, [meta for _, _, meta in batch]))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                in_flight.release()
+
+        writer_thread = threading.Thread(target=writer, name="index-writer", daemon=True)
+        writer_thread.start()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="embed-worker") as executor:
+                for batch in self.batcher.iter_batches(records):
+                    if errors:
+                        break
+                    in_flight.acquire()
+                    executor.submit(embed_batch, batch)
+        finally:
+            write_queue.put(None)
+            writer_thread.join()
+
+        if errors:
+            raise errors[0]
+        return written[0]
@@ -0,0 +1,117 @@
+import math
+import heapq
+import re
+import threading
+from typing import Any, Dict, List, Tuple
+from text_utils import normalize_query
+
+# Runs of letters/digits; punctuation splits phrases so bigrams never span "Cầu Giấy, Hà Nội"
+_PHRASE_PATTERN = re.compile(r"[^\W_]+(?:\s+[^\W_]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Accent-folded, lowercased syllables plus the bigrams of adjacent syllables.
+
+    Vietnamese words are mostly two syllables ("thanh xuân", "phú lương"), so the
+    bigram "thanh_xuan" matches the place name instead of two common syllables.
+    """
+    tokens = []
+    for phrase in _PHRASE_PATTERN.findall(normalize_query(text, fold=True)):
+        syllables = phrase.split()
+        tokens.extend(syllables)
+        tokens.extend(f"{first}_{second}" for first, second in zip(syllables, syllables[1:]))
+    return tokens
+
+
+def metadata_text(metadata: Dict[str, Any]) -> str:
+    """Text of an indexed post used for lexical search, rebuilt from its metadata"""
+    return " . ".join(str(metadata.get(field) or "") for field in ("title", "location", "options", "description"))
+
+
+def rrf_fuse(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Reciprocal rank fusion: sum of 1 / (k + rank) over the rankings a document appears in"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+
+class BM25Index:
+    """In-memory inverted index scored with Okapi BM25, updated one document at a time.
+
+    Query terms found in more than max_df_ratio of the documents ("phòng", "trọ", "hà_nội")
+    are skipped: they barely change the ranking and scoring their postings would visit
+    nearly every document.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, max_df_ratio: float = 0.5):
+        self.k1 = k1
+        self.b = b
+        self.max_df_ratio = max_df_ratio
+        self._postings: Dict[str, Dict[str, int]] = {}  # term -> {doc_id: term frequency}
+        self._doc_terms: Dict[str, Dict[str, int]] = {}  # doc_id -> {term: term frequency}, for removal
+        self._doc_lengths: Dict[str, int] = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._doc_lengths)
+
+    def add(self, doc_id: str, text: str):
+        """Index a document, replacing its previous text"""
+        term_counts: Dict[str, int] = {}
+        for token in tokenize(text):
+            term_counts[token] = term_counts.get(token, 0) + 1
+
+        with self._lock:
+            self._remove(doc_id)
+            for term, count in term_counts.items():
+                self._postings.setdefault(term, {})[doc_id] = count
+            self._doc_terms[doc_id] = term_counts
+            length = sum(term_counts.values())
+            self._doc_lengths[doc_id] = length
+            self._total_length += length
+
+    def remove(self, doc_ids: List[str]):
+        with self._lock:
+            for doc_id in doc_ids:
+                self._remove(doc_id)
+
+    def _remove(self, doc_id: str):
+        term_counts = self._doc_terms.pop(doc_id, None)
+        if term_counts is None:
+            return
+        for term in term_counts:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._doc_lengths.pop(doc_id)
+
+    def search(self, query: str, limit: int = 10, min_relative_score: float = 0.0) -> List[Tuple[str, float]]:
+        """(doc_id, score) of the best matching documents, best first.
+        Documents scoring below min_relative_score times the best score are left out."""
+        terms = set(tokenize(query))
+        scores: Dict[str, float] = {}
+        with self._lock:
+            doc_count = len(self._doc_lengths)
+            if not doc_count:
+                return []
+            average_length = self._total_length / doc_count
+            max_df = max(doc_count * self.max_df_ratio, 1)
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings or len(postings) > max_df:
+                    continue
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[doc_id] / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        if best and min_relative_score:
+            best = [(doc_id, score) for doc_id, score in best if score >= best[0][1] * min_relative_score]
+        return best
+
+    def stats(self) -> Dict[str, int]:
+        return {"documents": len(self._doc_lengths), "terms": len(self._postings)}
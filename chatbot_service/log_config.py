@@ -0,0 +1,119 @@
+import os
+import re
+import sys
+import uuid
+import queue
+import atexit
+import random
+import logging
+import contextvars
+import logging.handlers
+from typing import Optional, Tuple
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"
+
+# Request IDs accepted from the X-Request-ID header; anything else (e.g. a newline forging log lines) is replaced
+_REQUEST_ID_PATTERN = re.compile(r"[\w.:-]{1,64}")
+
+_request_id = contextvars.ContextVar("request_id", default="-")
+_verbose = contextvars.ContextVar("verbose_logging", default=False)
+
+# Share of requests logging their per-document debug lines (LOG_VERBOSE_SAMPLE_RATE)
+verbose_sample_rate = 0.1
+
+_queue_handler: Optional[logging.handlers.QueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def set_request_id(request_id: Optional[str] = None) -> str:
+    """Tag the logs of the current request (thread or asyncio task) with request_id, or a new one
+    when it is missing or invalid, and decide whether the request logs its verbose debug lines"""
+    if not request_id or not _REQUEST_ID_PATTERN.fullmatch(request_id):
+        request_id = uuid.uuid4().hex[:16]
+    _request_id.set(request_id)
+    _verbose.set(random.random() < verbose_sample_rate)
+    return request_id
+
+
+def get_request_id() -> str:
+    return _request_id.get()
+
+
+def verbose_enabled(logger: logging.Logger) -> bool:
+    """Whether the current request was sampled to log per-document lines at DEBUG"""
+    return _verbose.get() and logger.isEnabledFor(logging.DEBUG)
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds the request ID to records. Must run on the logging thread, where the contextvar is set."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get()
+        return True
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler leaving the formatting of records to the listener thread.
+
+    The standard QueueHandler formats the message before enqueueing it, on the request thread.
+    The queue is in-process, so records can be passed as they are; log arguments must not be
+    mutated after the call.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def create_queue_handler(*handlers: logging.Handler) -> Tuple[DeferredQueueHandler, logging.handlers.QueueListener]:
+    """Handler for the request threads enqueueing records, and the started listener thread
+    formatting and writing them with handlers"""
+    queue_handler = DeferredQueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(RequestIdFilter())
+    listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return queue_handler, listener
+
+
+def configure_logging(level: Optional[str] = None):
+    """Configure the root logger from LOG_LEVEL (default INFO), LOG_ASYNC (default true) and
+    LOG_VERBOSE_SAMPLE_RATE. With LOG_ASYNC, records are written by a background thread
+    so a slow stderr or log collector does not add latency to requests."""
+    global verbose_sample_rate, _queue_handler, _listener
+    verbose_sample_rate = float(os.getenv("LOG_VERBOSE_SAMPLE_RATE", str(verbose_sample_rate)))
+
+    root = logging.getLogger()
+    root.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
+    _stop_listener()
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    if os.getenv("LOG_ASYNC", "true").lower() == "true":
+        _queue_handler, _listener = create_queue_handler(stream_handler)
+    else:
+        stream_handler.addFilter(RequestIdFilter())
+        _queue_handler = stream_handler
+    root.addHandler(_queue_handler)
+
+
+def after_fork():
+    """Restart the listener in a forked worker: the thread of the parent does not exist in the child"""
+    global _listener
+    if _listener is None:
+        return
+    # Records left in the copied queue are written by the parent
+    _queue_handler.queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def _stop_listener():
+    """Remove the handler installed by configure_logging, writing the records still queued"""
+    global _queue_handler, _listener
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+    if _listener is not None:
+        _listener.stop()
+    _queue_handler, _listener = None, None
+
+
+atexit.register(_stop_listener)
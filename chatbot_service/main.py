@@ -1,28 +1,119 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 import os
+import json
+import atexit
 import logging
+import threading
+import time
 from dotenv import load_dotenv
 
 # Import necessary modules
 from vector_store import VectorStore
 from chatbot import ChatBot
+from metrics import registry, render_directory
+from reindex_jobs import ReindexConflict, ReindexJobManager, index_write_lock_path, try_lock_file
+from change_stream_indexer import ChangeStreamIndexer
+from database import MongoDBHandler
+import log_config
 
 # Load environment variables
 load_dotenv()
 
-# Setup logging
-logging.basicConfig(level=logging.INFO)
+# Setup logging: written by a background thread, tagged with the request ID
+log_config.configure_logging()
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
-
 # Initialize vector store with API-based indexing (no database handler needed)
 vector_store = VectorStore()  # No database handler needed as we'll use API
 chatbot = ChatBot(vector_store)
+# Reindexes run as background jobs, one at a time (see reindex_jobs.py)
+reindex_jobs = ReindexJobManager(vector_store)
+# Tails the MongoDB change stream of posts when CHANGE_STREAM_INDEXING is enabled (see start_change_stream_indexer)
+change_stream_indexer = None
+
+# Worker processes save their metrics there and /metrics adds them up (set by gunicorn.conf.py)
+METRICS_DIR = os.getenv("METRICS_MULTIPROC_DIR")
+
+# Routes, registered on the app by create_app
+api = Blueprint('api', __name__)
+
+def _cache_stats() -> dict:
+    caches = {
+        "embedding": vector_store.embedding_cache,
+        "query": vector_store.query_cache,
+        "response": chatbot.response_cache,
+    }
+    return {name: cache.stats() for name, cache in caches.items() if cache is not None}
+
+def _register_metrics():
+    """Metrics read from the services when /metrics is scraped"""
+    registry.callback_counter("chatbot_cache_hits_total", "Cache hits", lambda: {name: stats["hits"] for name, stats in _cache_stats().items()}, label="cache")
+    registry.callback_counter("chatbot_cache_misses_total", "Cache misses", lambda: {name: stats["misses"] for name, stats in _cache_stats().items()}, label="cache")
+    registry.gauge("chatbot_cache_entries", "Entries in each cache", lambda: {name: stats["entries"] for name, stats in _cache_stats().items()}, label="cache")
+    registry.callback_counter("chatbot_retrieval_total", "Retrievals by how they ended, and searches and widenings they made",
+                              lambda: {key: value for key, value in chatbot.get_retrieval_stats().items() if key != "last"}, label="counter")
+    registry.gauge("chatbot_indexed_documents", "Documents in the active collection", lambda: vector_store.collection.count() if vector_store.collection else None)
+    registry.gauge("chatbot_lexical_index_terms", "Terms in the lexical index", lambda: vector_store.lexical_index.stats()["terms"] if vector_store.lexical_index is not None else None)
+    registry.gauge("chatbot_reindex_running", "1 while a reindex runs", lambda: int(vector_store.index_progress["running"]))
+    registry.gauge("chatbot_reindex_documents_written", "Documents written by the running or last reindex", lambda: vector_store.index_progress["written"])
+    registry.gauge("chatbot_reindex_last_documents", "Documents of the last reindex by outcome", lambda: dict(vector_store.last_index_stats), label="result")
+
+_register_metrics()
+
+# Process that initialized the services, and the one running the background tasks
+_services_pid = None
+_background_pid = None
+_reindex_lock_file = None
+
+def init_services(warmup: bool = True):
+    """Load the vector index and the LLM client, once per process and before serving requests.
+    A server preloading the app calls this in its master process, so forked workers share the loaded index."""
+    global _services_pid
+    if _services_pid is not None:
+        return
+
+    logger.info("Initializing vector store...")
+    vector_store.init_store()
+
+    logger.info("Loading chatbot...")
+    chatbot.init_chatbot()
+
+    if warmup:
+        vector_store.warmup()
+        chatbot.warmup()
+    _services_pid = os.getpid()
+
+def after_fork():
+    """In a worker forked after init_services: recreate the connections, keep the loaded index"""
+    global _services_pid
+    if _services_pid is None or _services_pid == os.getpid():
+        return
+    log_config.after_fork()
+    # What the parent recorded (the warmup) would otherwise be counted again by every worker
+    registry.reset()
+    vector_store.after_fork()
+    chatbot.init_chatbot()
+    _services_pid = os.getpid()
 
-@app.route('/', methods=['GET'])
+def create_app() -> Flask:
+    """Flask application serving the API. Services are initialized separately by init_services."""
+    flask_app = Flask(__name__)
+    CORS(flask_app)  # Enable CORS for all routes
+    flask_app.register_blueprint(api)
+    return flask_app
+
+@api.before_request
+def assign_request_id():
+    """Tag the logs of the request with the caller's X-Request-ID, or a new ID"""
+    g.request_id = log_config.set_request_id(request.headers.get('X-Request-ID'))
+
+@api.after_request
+def send_request_id(response):
+    response.headers['X-Request-ID'] = g.request_id
+    return response
+
+@api.route('/', methods=['GET'])
 def root():
     """Root endpoint with API information"""
     return jsonify({
@@ -30,17 +121,44 @@ def root():
         "version": "1.0.0",
         "endpoints": {
             "chat": "/chat (POST)",
-            "reindex": "/reindex (POST)",
-            "health": "/health (GET)"
+            "chat_stream": "/chat/stream (POST, server-sent events)",
+            "reindex": "/reindex (POST, returns a job)",
+            "reindex_jobs": "/reindex/jobs (GET), /reindex/jobs/<id> (GET), /reindex/jobs/<id>/cancel (POST)",
+            "rollback": "/reindex/rollback (POST)",
+            "health": "/health (GET)",
+            "stats": "/stats (GET)",
+            "metrics": "/metrics (GET, Prometheus)"
         }
     })
 
-@app.route('/health', methods=['GET'])
+@api.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint to verify service is running"""
-    return jsonify({"status": "healthy", "service": "chatbot-api"})
+    return jsonify({"status": "healthy", "service": "chatbot-api", "ready": _services_pid is not None})
+
+@api.route('/stats', methods=['GET'])
+def stats():
+    """Cache statistics of the vector store, retrieval counters, fast path answers and response cache statistics of the chatbot"""
+    return jsonify(dict(
+        vector_store.get_cache_stats(),
+        retrieval=chatbot.get_retrieval_stats(),
+        fast_path_answers=chatbot.fast_path_count,
+        response_cache=chatbot.response_cache.stats() if chatbot.response_cache else None,
+        llm_usage=chatbot.get_llm_usage(),
+        reindex_job=reindex_jobs.active(),
+        change_stream=change_stream_indexer.stats() if change_stream_indexer else None
+    ))
 
-@app.route('/chat', methods=['POST'])
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    """Metrics in the Prometheus text format: per-stage latency histograms, chat answers, LLM tokens and
+    cost, cache hits and reindex progress. Those of every worker with METRICS_MULTIPROC_DIR, else of this process."""
+    if METRICS_DIR:
+        registry.write_snapshot(METRICS_DIR)
+        return Response(render_directory(METRICS_DIR), mimetype='text/plain; version=0.0.4')
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@api.route('/chat', methods=['POST'])
 def chat():
     """
     Chat with the RAG-based chatbot.
@@ -52,72 +170,235 @@ def chat():
         user_id = data.get('user_id')
         session_id = data.get('session_id')
 
-        logger.info(f"Received chat request: {question}")
+        logger.info("Received chat request: %s", question)
 
         # Process the question using the RAG system
         response = chatbot.process_question(question, user_id, session_id)
 
-        logger.info(f"Generated response: {response.get('type', 'text')}")
+        logger.info("Generated response: %s", response.get('type', 'text'))
         return jsonify(response)
 
     except Exception as e:
-        logger.error(f"Error processing chat request: {str(e)}")
+        logger.error("Error processing chat request: %s", e)
         return jsonify({"error": f"Error processing request: {str(e)}"}), 500
 
-@app.route('/reindex', methods=['POST'])
+@api.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Chat with the RAG-based chatbot, streaming the answer as server-sent events.
+    "token" events carry the text as the LLM generates it; the final "done" event
+    carries the same response as /chat, including the room cards.
+    """
+    data = request.get_json(silent=True) or {}
+    question = data.get('question', '')
+    user_id = data.get('user_id')
+    session_id = data.get('session_id')
+
+    logger.info("Received streaming chat request: %s", question)
+
+    def generate():
+        for event, payload in chatbot.process_question_stream(question, user_id, session_id):
+            if event == "done":
+                logger.info("Generated response: %s", payload.get('type', 'text'))
+            yield f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Keep reverse proxies from buffering the stream
+        }
+    )
+
+@api.route('/reindex', methods=['POST'])
 def reindex():
     """
     Reindex all rental posts in the vector database.
     This should be called when new posts are added to ensure they're searchable.
+    The reindex runs as a background job; the response carries its ID, see /reindex/jobs/<id>.
     """
     try:
-        data = request.get_json()
-        force = data.get('force', False) if data else False
-        source = data.get('source', 'database') if data else 'database'  # Can be 'database' or 'api'
-        logger.info(f"Starting reindex process (force={force}, source={source})")
-
-        if source == 'api':
-            count = vector_store.index_posts_from_api(force=force)
-        else:
-            count = vector_store.index_posts(force=force)
-
-        message = f"Successfully indexed {count} posts in vector store from {source}"
-        logger.info(message)
+        data = request.get_json(silent=True) or {}
+        force = data.get('force', False)
+        source = data.get('source', 'database')  # Can be 'database' or 'api'
+        incremental = data.get('incremental', False)  # Only embed new/changed posts
+        mode = 'force' if force else 'incremental' if incremental else 'full'
+        logger.info(f"Reindex requested (mode={mode}, source={source})")
 
+        job, created = reindex_jobs.submit(source, mode)
         return jsonify({
-            "indexed_count": count,
-            "message": message,
-            "source": source
-        })
+            "message": f"Reindex job {job.id} queued" if created else f"Merged into queued reindex job {job.id}",
+            "job": reindex_jobs.get(job.id),
+            "status_url": f"/reindex/jobs/{job.id}",
+            "source": source,
+            "incremental": incremental
+        }), 202
 
+    except ReindexConflict as e:
+        return jsonify({"error": str(e), "job": reindex_jobs.get(e.job.id)}), 409
     except Exception as e:
         logger.error(f"Error during reindexing: {str(e)}")
         return jsonify({"error": f"Error during reindexing: {str(e)}"}), 500
 
-if __name__ == '__main__':
-    logger.info("Initializing vector store...")
-    vector_store.init_store()
+@api.route('/reindex/jobs', methods=['GET'])
+def list_reindex_jobs():
+    """Recent reindex jobs of every worker, most recent first"""
+    return jsonify({"jobs": reindex_jobs.list()})
 
-    logger.info("Loading chatbot...")
-    chatbot.init_chatbot()
+@api.route('/reindex/jobs/<job_id>', methods=['GET'])
+def get_reindex_job(job_id):
+    """State of a reindex job: status, posts read and written, throughput, ETA and the final stats"""
+    job = reindex_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown reindex job {job_id}"}), 404
+    return jsonify(dict(job, active_collection=vector_store.active_collection_name))
+
+@api.route('/reindex/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_reindex_job(job_id):
+    """Cancel a queued or running reindex job. A cancelled forced reindex leaves the active collection unchanged."""
+    job = reindex_jobs.cancel(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown reindex job {job_id}"}), 404
+    if job["status"] in ("succeeded", "failed"):
+        return jsonify({"error": f"Reindex job {job_id} already {job['status']}", "job": job}), 409
+    return jsonify({"job": job}), 202
+
+@api.route('/reindex/rollback', methods=['POST'])
+def rollback_reindex():
+    """
+    Switch searches back to the collection generation that was active before the last forced reindex.
+    Refused with 409 while a reindex job or a change batch writes the index (it could swap generations too).
+    """
+    lock_file = try_lock_file(index_write_lock_path(vector_store))
+    if lock_file is None:
+        return jsonify({"error": "A reindex is running, retry the rollback once it has finished"}), 409
+    try:
+        active = vector_store.rollback_collection()
+        return jsonify({
+            "message": f"Rolled back to collection {active}",
+            "active_collection": active,
+            "previous_collection": vector_store.previous_collection_name
+        })
+    except Exception as e:
+        logger.error(f"Error during rollback: {str(e)}")
+        return jsonify({"error": f"Error during rollback: {str(e)}"}), 500
+    finally:
+        lock_file.close()
+
+def start_periodic_reindex():
+    """Submit a reindex job on the REINDEX_INTERVAL_SECONDS schedule (default: an incremental reindex
+    from the API every 6 hours, which only re-embeds new and changed posts)"""
+    interval = float(os.getenv("REINDEX_INTERVAL_SECONDS", str(6 * 60 * 60)))
+    if interval <= 0:
+        return
+    reindex_jobs.start_scheduler(interval, source=os.getenv("REINDEX_SCHEDULE_SOURCE", "api"),
+                                 mode=os.getenv("REINDEX_SCHEDULE_MODE", "incremental"))
+
+def start_change_stream_indexer():
+    """Index new, changed and removed posts within seconds by tailing the change stream of the MongoDB
+    posts collection (requires a replica set). Posts changed while it was not running are caught up
+    by an incremental reindex job."""
+    global change_stream_indexer
+    db_handler = MongoDBHandler()
+    if not db_handler.connect():
+        logger.error("Change stream indexing disabled: MongoDB is not reachable")
+        return
+
+    source = os.getenv("REINDEX_SCHEDULE_SOURCE", "api")
 
-    logger.info("Starting periodic reindexing...")
-    # Start periodic reindexing in a separate thread
-    import threading
-    def periodic_reindex():
-        import time
+    def catch_up():
+        try:
+            reindex_jobs.submit(source, "incremental", trigger="change_stream")
+        except ReindexConflict as e:
+            logger.info(f"Change stream catch-up reindex skipped: {e}")
+
+    change_stream_indexer = ChangeStreamIndexer(
+        vector_store,
+        db_handler.db.posts,
+        debounce_seconds=float(os.getenv("CHANGE_STREAM_DEBOUNCE_SECONDS", "1")),
+        max_batch_size=int(os.getenv("CHANGE_STREAM_MAX_BATCH_SIZE", "100")),
+        min_batch_interval=float(os.getenv("CHANGE_STREAM_MIN_INTERVAL_SECONDS", "0")),
+        on_history_lost=catch_up
+    )
+    change_stream_indexer.start()
+
+def start_index_watcher(interval: float):
+    """Pick up what other worker processes wrote to the index, checking every interval seconds (two file stats)"""
+    def watch_index():
         while True:
+            time.sleep(interval)
             try:
-                # Reindex every 6 hours
-                time.sleep(6 * 60 * 60)  # 6 hours in seconds
-                logger.info("Starting periodic reindexing from API...")
-                count = vector_store.index_posts_from_api()  # Changed to API-based indexing
-                logger.info(f"Periodic reindexing completed. Indexed {count} posts from API")
+                vector_store.reload_if_changed()
             except Exception as e:
-                logger.error(f"Error in periodic reindexing: {e}")
+                logger.error(f"Error reloading the index: {e}")
+
+    threading.Thread(target=watch_index, daemon=True).start()
+
+def start_metrics_writer(directory: str, interval: float):
+    """Save the metrics of this process to directory every interval seconds, and when it exits"""
+    def write_metrics():
+        try:
+            registry.write_snapshot(directory)
+        except Exception as e:
+            logger.error(f"Error saving metrics: {e}")
+
+    def write_periodically():
+        while True:
+            time.sleep(interval)
+            write_metrics()
+
+    write_metrics()
+    atexit.register(write_metrics)
+    threading.Thread(target=write_periodically, daemon=True).start()
+
+def _acquire_reindex_lock() -> bool:
+    """Whether this process runs the periodic reindex: the first worker to lock chroma_data/reindex.lock.
+    The lock is released when the process exits, so a replacement worker takes over."""
+    global _reindex_lock_file
+    try:
+        import fcntl
+    except ImportError:
+        return True  # Windows: a single process
+    os.makedirs(vector_store.persist_path, exist_ok=True)
+    lock_file = open(os.path.join(vector_store.persist_path, "reindex.lock"), "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _reindex_lock_file = lock_file
+    return True
+
+def start_background_tasks():
+    """Start the periodic reindex (in one process only), the index watcher and the metrics writer, once per process.
+    They need the loaded services: called before init_services, nothing is started (and a later call starts them)."""
+    global _background_pid
+    if _background_pid == os.getpid():
+        return
+    if _services_pid != os.getpid():
+        logger.warning("Background tasks not started: the services are not initialized in this process")
+        return
+    _background_pid = os.getpid()
+
+    if _acquire_reindex_lock():
+        start_periodic_reindex()
+        if os.getenv("CHANGE_STREAM_INDEXING", "false").lower() == "true":
+            start_change_stream_indexer()
 
-    reindex_thread = threading.Thread(target=periodic_reindex, daemon=True)
-    reindex_thread.start()
+    interval = float(os.getenv("INDEX_RELOAD_INTERVAL_SECONDS", "2"))
+    if interval > 0:
+        start_index_watcher(interval)
+
+    if METRICS_DIR:
+        start_metrics_writer(METRICS_DIR, float(os.getenv("METRICS_WRITE_INTERVAL_SECONDS", "5")))
+
+# Module-level app for the development server, tests, wsgi.py and asgi.py
+app = create_app()
+
+if __name__ == '__main__':
+    init_services()
+    start_background_tasks()
 
-    # Run Flask app
-    app.run(host='0.0.0.0', port=8000, debug=False)
\ No newline at end of file
+    # Run Flask app (development server, single process; see wsgi.py for production)
+    app.run(host='0.0.0.0', port=8000, debug=False)
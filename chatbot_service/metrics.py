@@ -0,0 +1,331 @@
+import os
+import json
+import math
+import time
+import bisect
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds: sub-millisecond local stages up to LLM answers
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+class _Metric:
+    """A metric with at most one label; every sample is kept per label value"""
+
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, label: Optional[str] = None):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self._lock = threading.Lock()
+
+    def _labels(self, value: Optional[str]) -> Dict[str, str]:
+        return {self.label: value} if self.label else {}
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def reset(self):
+        """Forget what was recorded (metrics read from callbacks have nothing to forget)"""
+
+    def render(self) -> str:
+        return "\n".join([f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"] + self.samples())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, label: Optional[str] = None):
+        super().__init__(name, help_text, label)
+        self._values: Dict[Optional[str], float] = {}
+
+    def inc(self, amount: float = 1, label: Optional[str] = None):
+        with self._lock:
+            self._values[label] = self._values.get(label, 0) + amount
+
+    def value(self, label: Optional[str] = None) -> float:
+        return self._values.get(label, 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            values = list(self._values.items())
+        return {"kind": self.kind, "values": values}
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(self._labels(label))} {_format_value(value)}" for label, value in values.items()]
+
+
+class CallbackMetric(_Metric):
+    """Gauge, or counter kept elsewhere, read from a callback at scrape time: a number, or a dict of
+    label value -> number (None values are left out)"""
+
+    def __init__(self, name: str, help_text: str, callback: Callable[[], Union[float, Dict[str, float]]],
+                 label: Optional[str] = None, kind: str = "gauge"):
+        super().__init__(name, help_text, label)
+        self.callback = callback
+        self.kind = kind
+
+    def _values(self) -> Dict[Optional[str], float]:
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {None: values}
+        return {label: value for label, value in values.items() if value is not None}
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"kind": self.kind, "values": list(self._values().items())}
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self._labels(label))} {_format_value(value)}"
+                for label, value in self._values().items()]
+
+
+class _Timer:
+    """Context manager observing the time spent in its block (a class: cheaper than contextlib)"""
+
+    __slots__ = ("histogram", "label", "started")
+
+    def __init__(self, histogram: "Histogram", label: Optional[str]):
+        self.histogram = histogram
+        self.label = label
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, self.label)
+        return False
+
+
+class Histogram(_Metric):
+    """Observations counted in fixed buckets, from which Prometheus computes percentiles"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, label: Optional[str] = None, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, label)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Optional[str], list] = {}  # label -> [bucket counts (last: +Inf), sum, count]
+
+    def observe(self, value: float, label: Optional[str] = None):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = self._series[label] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, label: Optional[str] = None) -> _Timer:
+        return _Timer(self, label)
+
+    def count(self, label: Optional[str] = None) -> int:
+        series = self._series.get(label)
+        return series[2] if series else 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            series = [(label, list(counts), total, count) for label, (counts, total, count) in self._series.items()]
+        return {"kind": self.kind, "buckets": self.buckets, "series": series}
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series_by_label = {label: (list(counts), total, count) for label, (counts, total, count) in self._series.items()}
+        lines = []
+        for label, (counts, total, count) in series_by_label.items():
+            labels = self._labels(label)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(dict(labels, le=_format_value(bound)))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """The metrics of a process, rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            # Registering again (e.g. a module reloaded) replaces the metric of the same name
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, label: Optional[str] = None) -> Counter:
+        return self._register(Counter(name, help_text, label))
+
+    def histogram(self, name: str, help_text: str, label: Optional[str] = None,
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, label, buckets))
+
+    def gauge(self, name: str, help_text: str, callback: Callable[[], Union[float, Dict[str, float]]],
+              label: Optional[str] = None) -> CallbackMetric:
+        return self._register(CallbackMetric(name, help_text, callback, label))
+
+    def callback_counter(self, name: str, help_text: str, callback: Callable[[], Union[float, Dict[str, float]]],
+                         label: Optional[str] = None) -> CallbackMetric:
+        """Counter whose value is kept by another object (e.g. the hits of a cache)"""
+        return self._register(CallbackMetric(name, help_text, callback, label, kind="counter"))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        sections = []
+        for metric in metrics:
+            try:
+                sections.append(metric.render())
+            except Exception as e:
+                # A failing callback must not take down the whole scrape
+                logger.warning(f"Could not collect metric {metric.name}: {e}")
+        return "\n".join(sections) + "\n"
+
+    def reset(self):
+        """Forget every observation, e.g. those a forked worker inherited from its parent"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Current values of every metric, as written by write_snapshot"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        snapshot = []
+        for metric in metrics:
+            try:
+                snapshot.append(dict(metric.snapshot(), name=metric.name, help=metric.help_text, label=metric.label))
+            except Exception as e:
+                logger.warning(f"Could not collect metric {metric.name}: {e}")
+        return snapshot
+
+    def write_snapshot(self, directory: str, pid: Optional[int] = None):
+        """Save the metrics of this process (pid) to <directory>/<pid>.json, for render_directory"""
+        pid = pid or os.getpid()
+        path = os.path.join(directory, f"{pid}.json")
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temp file and rename so a scrape never reads a half-written snapshot
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"pid": pid, "metrics": self.snapshot()}, f)
+        os.replace(path + ".tmp", path)
+
+
+def clear_directory(directory: str):
+    """Delete the snapshots of a previous run, before its processes' pids can be reused"""
+    for filename in os.listdir(directory) if os.path.isdir(directory) else []:
+        if filename.endswith((".json", ".tmp")):
+            try:
+                os.remove(os.path.join(directory, filename))
+            except FileNotFoundError:
+                pass
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # Alive, owned by another user
+    return True
+
+
+def render_directory(directory: str) -> str:
+    """Render the metrics of every process that saved them to directory (see write_snapshot).
+
+    Counters and histograms are added up over all the snapshots, those of exited processes included, so
+    totals never go down when a worker is replaced. Gauges describe a live process: each one is reported
+    with a pid label, and those of exited processes are left out.
+    """
+    merged: Dict[str, Dict[str, Any]] = {}
+    gauges: Dict[str, List[str]] = {}
+    for filename in sorted(os.listdir(directory) if os.path.isdir(directory) else []):
+        if not filename.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, filename), encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read metrics snapshot {filename}: {e}")
+            continue
+        pid = snapshot["pid"]
+        alive = _process_alive(pid)
+        for data in snapshot["metrics"]:
+            metric = merged.get(data["name"])
+            if metric is None:
+                if data["kind"] == "histogram":
+                    metric = Histogram(data["name"], data["help"], data["label"], data["buckets"])
+                elif data["kind"] == "counter":
+                    metric = Counter(data["name"], data["help"], data["label"])
+                else:
+                    metric = _Metric(data["name"], data["help"], data["label"])
+                    metric.kind = data["kind"]
+                merged[data["name"]] = metric
+                gauges[data["name"]] = []
+
+            if isinstance(metric, Histogram):
+                if tuple(data["buckets"]) != metric.buckets:
+                    continue  # Written by another version of the code
+                for label, counts, total, count in data["series"]:
+                    series = metric._series.setdefault(label, [[0] * (len(metric.buckets) + 1), 0.0, 0])
+                    series[0] = [a + b for a, b in zip(series[0], counts)]
+                    series[1] += total
+                    series[2] += count
+            elif isinstance(metric, Counter):
+                for label, value in data["values"]:
+                    metric.inc(value, label)
+            elif alive:
+                for label, value in data["values"]:
+                    labels = dict(metric._labels(label), pid=str(pid))
+                    gauges[data["name"]].append(f"{metric.name}{_format_labels(labels)} {_format_value(value)}")
+
+    sections = []
+    for name, metric in merged.items():
+        header = [f"# HELP {name} {metric.help_text}", f"# TYPE {name} {metric.kind}"]
+        sections.append("\n".join(header + (metric.samples() if isinstance(metric, (Counter, Histogram)) else gauges[name])))
+    return "\n".join(sections) + "\n"
+
+
+# Shared by every module of the process
+registry = MetricsRegistry()
+
+# Time per stage of answering a chat (parse, embed_query, vector_query, lexical, filter, build_prompt, llm, ...)
+STAGE_SECONDS = registry.histogram("chatbot_stage_seconds", "Time spent in each stage of answering a chat", label="stage")
+
+
+def stage_timer(stage: str) -> _Timer:
+    """with stage_timer("parse"): ... observes the block's duration in chatbot_stage_seconds"""
+    return _Timer(STAGE_SECONDS, stage)
@@ -0,0 +1,229 @@
+import re
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+
+from query_parser import AMENITY_KEYWORDS
+from text_utils import fold_accents
+
+# Compiled once; used both at index time and for documents indexed before numeric metadata existed
+_PRICE_MILLION = re.compile(r'(\d+(?:[,.]\d+)?)\s*(?:triệu|trieu|tr)\b')
+_PRICE_THOUSAND = re.compile(r'(\d+(?:[,.]\d+)?)\s*(?:ngàn|nghìn|ngan|nghin|k)\b')
+_NUMBER = re.compile(r'\d+(?:[,.]\d+)*')
+
+CATEGORY_SLUGS = ('phong-tro', 'nha-nguyen-can', 'can-ho-chung-cu', 'can-ho-mini', 'o-ghep')
+
+# Accent-folded display names that map to a category slug
+_CATEGORY_ALIASES = {
+    'phong tro': 'phong-tro',
+    'nha tro': 'phong-tro',
+    'nha nguyen can': 'nha-nguyen-can',
+    'can ho chung cu': 'can-ho-chung-cu',
+    'chung cu': 'can-ho-chung-cu',
+    'can ho mini': 'can-ho-mini',
+    'o ghep': 'o-ghep',
+}
+
+def _to_float(number: str) -> float:
+    return float(number.replace(',', '.'))
+
+def parse_price_vnd(value: Any) -> float:
+    """Parse a post price into VND: 2500000, "2500000", "2,5 triệu", "800k" ..."""
+    if isinstance(value, bool) or value is None:
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+
+    text = str(value).lower().strip()
+    if not text:
+        return 0.0
+    try:
+        number = float(text)
+        # A bare small number is a price in millions ("3" -> 3 triệu)
+        return number if number >= 1000 else number * 1000000
+    except ValueError:
+        pass
+
+    match = _PRICE_MILLION.search(text)
+    if match:
+        return _to_float(match.group(1)) * 1000000
+
+    match = _PRICE_THOUSAND.search(text)
+    if match:
+        return _to_float(match.group(1)) * 1000
+
+    # Raw numbers with thousands separators, e.g. "2.500.000 đ"
+    numbers = [int(re.sub(r'[,.]', '', number)) for number in _NUMBER.findall(text)]
+    prices = [number for number in numbers if number >= 100000]
+    if prices:
+        return float(max(prices))
+    if numbers:
+        # A bare small number is a price in millions ("3" -> 3 triệu)
+        return _to_float(_NUMBER.search(text).group(0)) * 1000000
+    return 0.0
+
+def parse_area_m2(value: Any) -> float:
+    """Parse a post area into square meters: 25, "25", "25,5 m2" ..."""
+    if isinstance(value, bool) or value is None:
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+
+    text = str(value).strip()
+    try:
+        return float(text)
+    except ValueError:
+        match = re.search(r'\d+(?:[,.]\d+)?', text)
+        return _to_float(match.group(0)) if match else 0.0
+
+def canonical_category(value: Any) -> str:
+    """Map a category (slug or Vietnamese name) to its slug, e.g. "Căn hộ mini" -> "can-ho-mini" """
+    text = str(value or '').strip().lower()
+    if text in CATEGORY_SLUGS:
+        return text
+
+    folded = fold_accents(text).replace('-', ' ').replace('_', ' ')
+    folded = ' '.join(folded.split())
+    slug = folded.replace(' ', '-')
+    if slug in CATEGORY_SLUGS:
+        return slug
+    return _CATEGORY_ALIASES.get(folded, text)
+
+# Canonical amenities (as extracted from questions); an amenity's ID is its bit in amenity_mask
+AMENITY_IDS = {amenity: bit for bit, amenity in enumerate(AMENITY_KEYWORDS)}
+
+# Other ways posts describe some amenities
+AMENITY_SYNONYMS = {
+    'máy lạnh': ['máy lạnh', 'may lanh', 'điều hòa', 'dieu hoa'],
+    'gác': ['gác', 'gac', 'lửng', 'mezzanine'],
+    'nội thất': ['nội thất', 'noi that', 'đồ đạc', 'do dac'],
+    'an ninh': ['an ninh', 'an ninh', 'bảo vệ', 'bao ve', 'camera'],
+    'thang máy': ['thang máy', 'thang may', 'elevator', 'máy nâng']
+}
+
+def _amenity_terms(amenity: str) -> List[str]:
+    """The amenity itself followed by the synonyms of the first synonym group it overlaps"""
+    terms = [amenity]
+    for values in AMENITY_SYNONYMS.values():
+        if any(amenity in value or value in amenity for value in values):
+            terms.extend(values)
+            break
+    return terms
+
+_CANONICAL_AMENITY_TERMS = {amenity: _amenity_terms(amenity) for amenity in AMENITY_IDS}
+
+def amenity_matches(amenity: str, options: Sequence[str]) -> bool:
+    """Whether a post with these (lowercased) options offers the amenity, directly or through a synonym"""
+    amenity = amenity.lower()
+    terms = _CANONICAL_AMENITY_TERMS.get(amenity) or _amenity_terms(amenity)
+    return any(term in option or option in term for term in terms for option in options)
+
+_option_masks: Dict[str, int] = {}
+
+def amenity_mask(options: Sequence[str]) -> int:
+    """Bitmask of the canonical amenities (AMENITY_IDS) that a post's options offer"""
+    mask = 0
+    for option in options:
+        # Options mostly come from a fixed checklist, so the mask of each one is cached
+        option_mask = _option_masks.get(option)
+        if option_mask is None:
+            lowered = [option.lower()]
+            option_mask = sum(1 << bit for amenity, bit in AMENITY_IDS.items() if amenity_matches(amenity, lowered))
+            if len(_option_masks) < 10000:
+                _option_masks[option] = option_mask
+        mask |= option_mask
+    return mask
+
+
+class PostFeatureTable:
+    """Columnar features of a list of retrieved documents, for filtering them with NumPy masks.
+
+    Price, area, category and amenities come from the metadata written at index time;
+    documents indexed before those fields existed are parsed once when the table is built.
+    Text columns (category, location, options) are stored as codes into their distinct
+    values, which are few, so string matching runs once per distinct value.
+    """
+
+    __slots__ = ("size", "price", "area", "amenities", "category_codes", "categories",
+                 "location_codes", "locations", "options_codes", "options")
+
+    def __init__(self, documents: List[Dict[str, Any]]):
+        self.size = len(documents)
+        price = np.empty(self.size, dtype=np.float64)
+        area = np.empty(self.size, dtype=np.float64)
+        amenities = np.empty(self.size, dtype=np.int64)
+        category_codes = np.empty(self.size, dtype=np.int64)
+        location_codes = np.empty(self.size, dtype=np.int64)
+        options_codes = np.empty(self.size, dtype=np.int64)
+        categories = {}
+        locations = {}
+        options = {}
+
+        for i, doc in enumerate(documents):
+            metadata = doc.get('metadata', {})
+            doc_options = tuple(doc.get('options', []))
+
+            value = metadata.get('price_vnd')
+            price[i] = parse_price_vnd(doc.get('price', '0')) if value is None else value
+            value = metadata.get('area_m2')
+            area[i] = parse_area_m2(doc.get('area', '0')) if value is None else value
+            value = metadata.get('amenity_mask')
+            amenities[i] = amenity_mask(doc_options) if value is None else value
+            category_codes[i] = categories.setdefault(metadata.get('category', ''), len(categories))
+            location_codes[i] = locations.setdefault(doc.get('location', '').lower(), len(locations))
+            options_codes[i] = options.setdefault(doc_options, len(options))
+
+        self.price = price
+        self.area = area
+        self.amenities = amenities
+        self.category_codes = category_codes
+        self.categories = [canonical_category(category) for category in categories]
+        self.location_codes = location_codes
+        self.locations = list(locations)
+        self.options_codes = options_codes
+        self.options = [[option.lower() for option in doc_options] for doc_options in options]
+
+    @staticmethod
+    def _match_values(values: List[Any], codes: np.ndarray, predicate) -> np.ndarray:
+        """Evaluate predicate once per distinct value and spread the result over the rows"""
+        matches = np.fromiter((predicate(value) for value in values), dtype=bool, count=len(values))
+        return matches[codes]
+
+    def mask(self, location: str = "", price_range: Optional[tuple] = None, area_range: Optional[tuple] = None,
+             category: str = "", amenities: Sequence[str] = ()) -> np.ndarray:
+        """Boolean mask of the documents matching every given criterion"""
+        mask = np.ones(self.size, dtype=bool)
+        if not self.size:
+            return mask
+
+        # At least half of the location words (longer than one character) must appear in the post location
+        location_parts = [part for part in (location or '').lower().split() if len(part) > 1]
+        if location_parts:
+            needed = max(1, len(location_parts) // 2)
+            mask &= self._match_values(self.locations, self.location_codes,
+                                       lambda doc_location: sum(part in doc_location for part in location_parts) >= needed)
+
+        if price_range:
+            mask &= (self.price >= price_range[0]) & (self.price <= price_range[1])
+        if area_range:
+            mask &= (self.area >= area_range[0]) & (self.area <= area_range[1])
+        if category:
+            category = category.lower()
+            mask &= self._match_values(self.categories, self.category_codes, lambda doc_category: doc_category == category)
+
+        required = 0
+        for amenity in amenities:
+            bit = AMENITY_IDS.get(amenity.lower())
+            if bit is not None:
+                required |= 1 << bit
+            else:
+                # Not a canonical amenity: match it against each distinct set of options
+                mask &= self._match_values(self.options, self.options_codes,
+                                           lambda doc_options, amenity=amenity: amenity_matches(amenity, doc_options))
+        if required:
+            mask &= (self.amenities & required) == required
+
+        return mask
+
+    def filter(self, documents: List[Dict[str, Any]], **criteria) -> List[Dict[str, Any]]:
+        """The documents (the ones the table was built from) matching the criteria, in order"""
+        return [documents[i] for i in np.flatnonzero(self.mask(**criteria))]
@@ -0,0 +1,334 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+# Keyword tables, checked against the lowercased question as substrings
+
+CATEGORY_KEYWORDS = {
+    'phong-tro': ['phòng trọ', 'phong tro', 'tro', 'phong'],
+    'nha-nguyen-can': ['nhà nguyên căn', 'nha nguyen can', 'nhà nguyên can', 'nha nguyen căn', 'nguyên căn', 'nguyen can'],
+    'can-ho-chung-cu': ['căn hộ chung cư', 'can ho chung cu', 'căn hộ', 'can ho', 'chung cư', 'chung cu'],
+    'can-ho-mini': ['căn hộ mini', 'can ho mini', 'căn hộ nhỏ', 'can ho nho'],
+    'o-ghep': ['ở ghép', 'o ghep', 'ghép', 'ghep', 'người ở ghép', 'nguoi o ghep']
+}
+
+# How each category is named in answers
+CATEGORY_LABELS = {
+    'phong-tro': 'phòng trọ',
+    'nha-nguyen-can': 'nhà nguyên căn',
+    'can-ho-chung-cu': 'căn hộ chung cư',
+    'can-ho-mini': 'căn hộ mini',
+    'o-ghep': 'phòng ở ghép'
+}
+
+AMENITY_KEYWORDS = {
+    'có gác': ['có gác', 'co gac', 'gác', 'gac'],
+    'có máy lạnh': ['có máy lạnh', 'co may lanh', 'máy lạnh', 'may lanh', 'điều hòa', 'dieu hoa'],
+    'đầy đủ nội thất': ['đầy đủ nội thất', 'day du noi that', 'đầy đủ', 'day du', 'nội thất', 'noi that'],
+    'không chung chủ': ['không chung chủ', 'khong chung chu', 'không chung', 'khong chung'],
+    'giờ giấc tự do': ['giờ giấc tự do', 'gio gic tu do', 'giờ tự do', 'gio tu do'],
+    'có ban công': ['có ban công', 'co ban cong', 'ban công', 'ban cong'],
+    'có nội thất': ['có nội thất', 'co noi that', 'nội thất', 'noi that'],
+    'có an ninh': ['có an ninh', 'co an ninh', 'an ninh', 'bảo vệ', 'bao ve'],
+    'có thang máy': ['có thang máy', 'co thang may', 'thang máy', 'thang may'],
+    'có kệ bếp': ['có kệ bếp', 'co ke bep', 'kệ bếp', 'ke bep'],
+    'có máy giặt': ['có máy giặt', 'co may giat', 'máy giặt', 'may giat'],
+    'có hầm để xe': ['có hầm để xe', 'co ham de xe', 'hầm để xe', 'ham de xe', 'chỗ để xe', 'cho de xe']
+}
+
+RENTAL_KEYWORDS = [
+    'tìm phòng', 'tìm trọ', 'tìm nhà', 'tìm ở', 'tìm chỗ', 'tìm thuê',
+    'muốn thuê', 'muốn ở', 'muốn tìm', 'cần thuê', 'cần tìm', 'cần ở',
+    'cho thuê', 'phòng trọ', 'nhà trọ', 'chỗ ở', 'cho ở', 'ở thuê',
+    'thuê phòng', 'thuê trọ', 'thuê nhà', 'tìm người ở ghép', 'ở ghép',
+    'tôi muốn tìm', 'tôi cần tìm', 'tôi đang tìm', 'có phòng nào', 'có chỗ nào',
+    'có nhà nào', 'có trọ nào', 'room', 'phòng', 'nhà', 'chỗ ở',
+    'tôi muốn', 'muốn', 'cần', 'tìm kiếm', 'tìm giúp', 'giúp tìm',
+    'phòng cho thuê', 'nhà cho thuê', 'tìm phòng trọ', 'tìm nhà trọ',
+    # Property categories
+    'nhà nguyên căn', 'căn hộ chung cư', 'căn hộ mini', 'ở ghép',
+    'nhà nguyên can', 'can ho chung cu', 'can ho mini', 'o ghep',
+    # Amenities
+    'có gác', 'có máy lạnh', 'đầy đủ nội thất', 'không chung chủ',
+    'giờ giấc tự do', 'có ban công', 'có nội thất', 'có an ninh',
+    'có thang máy', 'có kệ bếp', 'có máy giặt', 'có hầm để xe',
+    'co gac', 'co may lanh', 'day du noi that', 'khong chung chu',
+    'gio gic tu do', 'co ban cong', 'co noi that', 'co an ninh',
+    'co thang may', 'co ke bep', 'co may giat', 'co ham de xe',
+]
+
+# Whole words asking for advice, comparisons or details rather than a list of posts
+OPEN_QUESTION_KEYWORDS = [
+    'tại sao', 'vì sao', 'tai sao', 'vi sao', 'như thế nào', 'thế nào', 'the nao', 'ra sao',
+    'so sánh', 'so sanh', 'tư vấn', 'tu van', 'nên', 'khác nhau', 'khác gì', 'là gì', 'la gi',
+    'giải thích', 'nhất', 'gần', 'thủ tục', 'hợp đồng', 'đặt cọc', 'tiền cọc', 'liên hệ',
+    'số điện thoại', 'chủ nhà', 'khi nào', 'bao giờ', 'đánh giá', 'review', 'kinh nghiệm', 'lưu ý',
+]
+
+# In priority order: the first of these found in the question starts the location
+LOCATION_KEYWORDS = ['ở', 'tại', 'khu vực', 'khu vuc', 'quận', 'phường', 'huyện', 'xã', 'gần', 'thuộc']
+
+# The location ends at the first word containing (or contained in) one of these
+LOCATION_STOP_WORDS = ['diện tích', 'dien tich', 'giá', 'gia', 'và', 'va', 'có', 'co', 'không', 'khong',
+                       'm2', 'triệu', 'triệu/tháng', 'triệu/thang', 'tr/tháng', 'tr/thang']
+
+_LOCATION_FILLER = re.compile(r'\b(từ|với|có|giá|diện tích|và|trên|dưới|khoảng|tầm|gần|ở)\b')
+
+_AREA_UNIT = r'(?:m2|m²|met vuông|vuông)'
+_AREA_PATTERNS = [re.compile(pattern) for pattern in (
+    r'(?:khoảng|tầm|gần|diện tích|khoảng\s+từ)?\s*(\d+(?:[,\.]\d+)?)\s*' + _AREA_UNIT + r'\s*(?:đến|đến khoảng)?\s*(\d+(?:[,\.]\d+)?)?' + _AREA_UNIT + '?',
+    r'(?:từ|trên)\s*(\d+(?:[,\.]\d+)?)\s*(?:-|đến)\s*(\d+(?:[,\.]\d+)?)\s*' + _AREA_UNIT,  # "từ 25-30 m2"
+    r'(?:từ|trên)\s*(\d+(?:[,\.]\d+)?)\s*' + _AREA_UNIT + r'\s*(?:đến|đến khoảng)?\s*(\d+(?:[,\.]\d+)?)?' + _AREA_UNIT + '?',
+    r'(\d+(?:[,\.]\d+)?)\s*' + _AREA_UNIT + r'\s*(?:đến|đến khoảng)\s*(\d+(?:[,\.]\d+)?)\s*' + _AREA_UNIT,
+    r'(?:dưới|ít hơn)\s*(\d+(?:[,\.]\d+)?)\s*' + _AREA_UNIT,
+    r'(?:trên|nhiều hơn)\s*(\d+(?:[,\.]\d+)?)\s*' + _AREA_UNIT,
+)]
+# Every area pattern needs a number followed by a unit
+_AREA_HINT = re.compile(r'\d[,\.\d]*\s*' + _AREA_UNIT)
+
+_RAW_PRICE_PATTERNS = [re.compile(pattern) for pattern in (
+    r'(?:từ|trên)\s*(\d{6,})\s*(?:đến|đến khoảng)?\s*(\d{6,})?',  # From X to Y (large numbers for VND)
+    r'(\d{6,})\s*(?:đến|->|–|–)\s*(\d{6,})',  # X đến Y
+    r'(?:dưới|ít hơn)\s*(\d{6,})',  # Under X VND
+    r'(?:trên|nhiều hơn)\s*(\d{6,})',  # Over X VND
+)]
+_RAW_PRICE_HINT = re.compile(r'\d{6,}')
+
+_MILLION_PRICE_PATTERNS = [re.compile(pattern) for pattern in (
+    r'(?:tầm|khoảng|gần|ngân sách|trong khoảng)\s*(\d+(?:[,\.]\d+)?)\s*(?:triệu|tr)',
+    r'(?:từ|trên)\s*(\d+(?:[,\.]\d+)?)\s*(?:triệu|tr)\s*(?:đến|đến khoảng)?\s*(\d+(?:[,\.]\d+)?)?(?:triệu|tr)?',
+    r'(\d+(?:[,\.]\d+)?)\s*(?:triệu|tr)\s*(?:đến|đến khoảng)\s*(\d+(?:[,\.]\d+)?)\s*(?:triệu|tr)',
+    r'(?:dưới|ít hơn)\s*(\d+(?:[,\.]\d+)?)\s*(?:triệu|tr)',
+    r'(?:trên|nhiều hơn)\s*(\d+(?:[,\.]\d+)?)\s*(?:triệu|tr)',
+)]
+_MILLION_PRICE_HINT = re.compile(r'\d[,\.\d]*\s*tr')
+
+
+@dataclass
+class QueryIntent:
+    """What a question asks for: the search criteria extracted from it"""
+    is_rental_request: bool = False
+    location: str = ""
+    price_range: Optional[Tuple[float, float]] = None  # VND, max may be inf
+    area_range: Optional[Tuple[float, float]] = None  # m², max may be inf
+    category: str = ""  # Category slug, e.g. "phong-tro"
+    amenities: List[str] = field(default_factory=list)
+    is_open_question: bool = False  # Asks for advice or details (OPEN_QUESTION_KEYWORDS)
+
+    @property
+    def is_pure_search(self) -> bool:
+        """A rental search with criteria and nothing else to answer: listing the matching posts answers it"""
+        return (self.is_rental_request and not self.is_open_question
+                and bool(self.location or self.price_range or self.area_range or self.category or self.amenities))
+
+
+def _trie_regex(words: List[str]) -> str:
+    """Regex matching any of words, factored into a trie so it fails fast and matches the longest word"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node: Dict) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # A word can end here: trying the longer words first keeps the longest match
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+
+class QueryParser:
+    """Parses a question into a QueryIntent.
+
+    All keyword tables are compiled once into a single trie-shaped regex that is scanned
+    (with overlapping matches) one time per question; the result is identical to checking
+    every keyword separately with `in`. The price and area patterns are precompiled and
+    only run when the question contains a number with a matching unit.
+    """
+
+    def __init__(self):
+        self._category_names = list(CATEGORY_KEYWORDS)
+        self._amenity_names = list(AMENITY_KEYWORDS)
+
+        keywords = set(RENTAL_KEYWORDS) | set(LOCATION_KEYWORDS)
+        for words in list(CATEGORY_KEYWORDS.values()) + list(AMENITY_KEYWORDS.values()):
+            keywords.update(words)
+
+        # What finding each keyword means: (rental request, category rank, amenity bitmask, location keyword ranks).
+        # The scanner reports the longest keyword at a position, so each entry also covers
+        # the shorter keywords that are its prefixes (they match at the same position).
+        self._effects = {}
+        for word in keywords:
+            prefixes = [other for other in keywords if word.startswith(other)]
+            rental = any(prefix in RENTAL_KEYWORDS for prefix in prefixes)
+            category = min((rank for rank, words in enumerate(CATEGORY_KEYWORDS.values())
+                            if any(prefix in words for prefix in prefixes)), default=len(self._category_names))
+            amenities = sum(1 << rank for rank, words in enumerate(AMENITY_KEYWORDS.values())
+                            if any(prefix in words for prefix in prefixes))
+            locations = tuple(rank for rank, keyword in enumerate(LOCATION_KEYWORDS) if keyword in prefixes)
+            self._effects[word] = (rental, category, amenities, locations)
+
+        self._scanner = re.compile(f'(?=({_trie_regex(sorted(keywords))}))')
+        self._open_question_pattern = re.compile(rf'\b(?:{_trie_regex(sorted(OPEN_QUESTION_KEYWORDS))})\b')
+
+        # "stop word in word" is a regex search, "word in stop word" a set lookup
+        self._stop_word_pattern = re.compile('|'.join(re.escape(word) for word in LOCATION_STOP_WORDS))
+        self._stop_word_parts = {word[i:j] for word in LOCATION_STOP_WORDS
+                                 for i in range(len(word)) for j in range(i, len(word) + 1)}
+
+    def scan(self, question_lower: str) -> Tuple[bool, int, int, Dict[int, int]]:
+        """Find every keyword in one pass.
+
+        Returns (rental request, category rank, amenity bitmask, location keyword rank -> first position).
+        """
+        rental = False
+        category = len(self._category_names)
+        amenities = 0
+        locations = {}
+        effects = self._effects
+
+        for match in self._scanner.finditer(question_lower):
+            is_rental, category_rank, amenity_mask, location_ranks = effects[match.group(1)]
+            rental = rental or is_rental
+            if category_rank < category:
+                category = category_rank
+            amenities |= amenity_mask
+            for rank in location_ranks:
+                if rank not in locations:
+                    locations[rank] = match.start()
+
+        return rental, category, amenities, locations
+
+    def parse(self, question: str) -> QueryIntent:
+        question_lower = question.lower()
+        rental, category, amenities, locations = self.scan(question_lower)
+        return QueryIntent(
+            is_rental_request=rental,
+            location=self._location(question, locations),
+            price_range=self.extract_price_range(question_lower),
+            area_range=self.extract_area_range(question_lower),
+            category=self._category(category),
+            amenities=self._amenity_list(amenities),
+            is_open_question=self.is_open_question(question_lower),
+        )
+
+    # Keyword-based fields
+
+    def _category(self, rank: int) -> str:
+        return self._category_names[rank] if rank < len(self._category_names) else ""
+
+    def _amenity_list(self, mask: int) -> List[str]:
+        return [amenity for rank, amenity in enumerate(self._amenity_names) if mask >> rank & 1]
+
+    def _location(self, question: str, locations: Dict[int, int]) -> str:
+        if not locations:
+            return ""
+
+        # The first location keyword (in LOCATION_KEYWORDS order) present in the question
+        rank = min(locations)
+        position = locations[rank] + len(LOCATION_KEYWORDS[rank])
+
+        # Extract the portion after the location keyword, up to the first stop word (at most 4 words)
+        location_words = []
+        for word in question[position:].split():
+            if word in self._stop_word_parts or self._stop_word_pattern.search(word):
+                break
+            location_words.append(word)
+            if len(location_words) >= 4:
+                break
+
+        location = ' '.join(location_words).strip('.,!?')
+        # Remove common Vietnamese address words that might not be part of the location
+        return _LOCATION_FILLER.sub('', location).strip()
+
+    def is_rental_request(self, question: str) -> bool:
+        return self.scan(question.lower())[0]
+
+    def extract_location(self, question: str) -> str:
+        return self._location(question, self.scan(question.lower())[3])
+
+    def extract_category(self, question: str) -> str:
+        return self._category(self.scan(question.lower())[1])
+
+    def extract_amenities(self, question: str) -> List[str]:
+        return self._amenity_list(self.scan(question.lower())[2])
+
+    def is_open_question(self, question_lower: str) -> bool:
+        return self._open_question_pattern.search(question_lower) is not None
+
+    # Numeric fields
+
+    @staticmethod
+    def extract_area_range(question_lower: str) -> Optional[tuple]:
+        """Min and max area in m² from a lowercased question"""
+        if not _AREA_HINT.search(question_lower):
+            return None
+
+        for pattern in _AREA_PATTERNS:
+            for match in pattern.findall(question_lower):
+                if isinstance(match, tuple):
+                    if len(match) == 2 and match[0] and match[1]:  # Range
+                        return (float(match[0].replace(',', '.')), float(match[1].replace(',', '.')))
+                else:
+                    # Single value matched: allow some flexibility
+                    area = float(match.replace(',', '.'))
+                    return (area - 2, area + 2)
+
+        return None
+
+    @staticmethod
+    def extract_price_range(question_lower: str) -> Optional[tuple]:
+        """Min and max price in VND from a lowercased question"""
+        if _RAW_PRICE_HINT.search(question_lower):
+            # Raw numbers (VND) are checked first
+            for pattern in _RAW_PRICE_PATTERNS:
+                matches = pattern.findall(question_lower)
+                if matches:
+                    match = matches[0]
+                    if isinstance(match, tuple) and match[0] and match[1]:
+                        return (int(match[0]), int(match[1]))
+                    elif isinstance(match, tuple) and match[0]:
+                        price = int(match[0])
+                        if 'dưới' in question_lower or 'ít hơn' in question_lower:
+                            return (0, price)
+                        elif 'trên' in question_lower or 'nhiều hơn' in question_lower:
+                            return (price, float('inf'))
+                        else:
+                            return (price - 500000, price + 500000)  # Allow ±500k buffer
+
+        if not _MILLION_PRICE_HINT.search(question_lower):
+            return None
+
+        # Then "triệu" amounts, converted to VND
+        for pattern in _MILLION_PRICE_PATTERNS:
+            matches = pattern.findall(question_lower)
+            if matches:
+                match = matches[0]
+                if isinstance(match, tuple):
+                    if match[0] and match[1]:  # Range
+                        return (float(match[0].replace(',', '.')) * 1000000, float(match[1].replace(',', '.')) * 1000000)
+                else:
+                    # Single value matched: allow some flexibility
+                    price = float(match.replace(',', '.')) * 1000000
+                    return (price - 500000, price + 500000)
+
+        return None
+
+
+_default_parser = None
+
+def get_query_parser() -> QueryParser:
+    """Shared parser instance, compiled on first use"""
+    global _default_parser
+    if _default_parser is None:
+        _default_parser = QueryParser()
+    return _default_parser
+
+def parse_query(question: str) -> QueryIntent:
+    """Parse a question into a QueryIntent with the shared parser"""
+    return get_query_parser().parse(question)
@@ -0,0 +1,367 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+import log_config
+from vector_store import IndexingCancelled
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATES = ("succeeded", "failed", "cancelled")
+# Reindex modes from the least to the most thorough: a merged request runs the most thorough one
+MODES = ("incremental", "full", "force")
+
+
+class ReindexConflict(Exception):
+    """A reindex was requested while a job that cannot absorb it is queued"""
+
+    def __init__(self, job: "ReindexJob"):
+        super().__init__(f"Reindex job {job.id} from {job.source} is already queued")
+        self.job = job
+
+
+class ReindexJob:
+    """One reindex run: its parameters, state and last known progress"""
+
+    def __init__(self, source: str = "api", mode: str = "full", trigger: str = "api"):
+        self.id = uuid.uuid4().hex[:12]
+        self.source = source
+        self.mode = mode
+        self.trigger = trigger
+        self.status = "queued"
+        self.requests = 1  # Requests merged into this job
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.indexed_count = None
+        self.stats = None
+        self.error = None
+        self.progress: Dict[str, Any] = {}
+        self.cancel_event = threading.Event()
+        self.done = threading.Event()
+        self.saved_at = 0.0
+
+    def merge(self, mode: str):
+        self.mode = max(self.mode, mode, key=MODES.index)
+        self.requests += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        read = self.progress.get("read", 0)
+        written = self.progress.get("written", 0)
+        expected = self.progress.get("expected")
+        elapsed = (self.finished_at or time.time()) - self.started_at if self.started_at else 0
+        rate = read / elapsed if elapsed > 0 and read else None
+        eta = None
+        if self.status == "running" and rate and expected:
+            eta = round(max(expected - read, 0) / rate, 1)
+        return {
+            "id": self.id,
+            "status": self.status,
+            "source": self.source,
+            "mode": self.mode,
+            "trigger": self.trigger,
+            "requests": self.requests,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "elapsed_seconds": round(elapsed, 1),
+            "read": read,
+            "written": written,
+            "expected": expected,
+            "posts_per_second": round(rate, 1) if rate else None,
+            "eta_seconds": eta,
+            "indexed_count": self.indexed_count,
+            "stats": self.stats,
+            "error": self.error,
+            "cancel_requested": self.cancel_event.is_set(),
+            "pid": os.getpid(),
+        }
+
+
+class ReindexJobManager:
+    """Runs reindexes as background jobs, one at a time.
+
+    A request made while a job runs queues one follow-up job (the running job may already
+    have read the posts that changed); requests made while a job is queued are merged into
+    it. Across worker processes, jobs take turns on chroma_data/reindex_job.lock.
+
+    Job states are written to chroma_data/reindex_jobs/<id>.json so any worker can report
+    them, and a job is cancelled through a <id>.cancel file checked while it reads posts.
+    """
+
+    def __init__(self, vector_store, jobs_dir: Optional[str] = None, history: int = 20):
+        self.vector_store = vector_store
+        self.jobs_dir = jobs_dir or os.path.join(vector_store.persist_path, "reindex_jobs")
+        self.history = history
+        self._jobs: Dict[str, ReindexJob] = {}
+        self._queued: Optional[ReindexJob] = None
+        self._running: Optional[ReindexJob] = None
+        self._lock = threading.Lock()
+
+    def submit(self, source: str = "api", mode: str = "full", trigger: str = "api") -> Tuple[ReindexJob, bool]:
+        """Queue a reindex, returning (job, created). Raises ReindexConflict when a job from another
+        source is already queued."""
+        if mode not in MODES:
+            raise ValueError(f"Unknown reindex mode: {mode}")
+        with self._lock:
+            queued = self._queued
+            if queued is not None:
+                if queued.source != source:
+                    raise ReindexConflict(queued)
+                queued.merge(mode)
+                self._save(queued)
+                return queued, False
+
+            job = ReindexJob(source, mode, trigger)
+            self._jobs[job.id] = job
+            self._queued = job
+            self._save(job)
+            if self._running is None:
+                self._running = job  # Claimed until the worker thread takes it from the queue
+                threading.Thread(target=self._run_jobs, name="reindex-job", daemon=True).start()
+        logger.info("Queued reindex job %s (source=%s, mode=%s, trigger=%s)", job.id, source, mode, trigger)
+        return job, True
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        if job is not None:
+            self._refresh_progress(job)
+            return job.to_dict()
+        return self._load(job_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Jobs of every process, most recent first"""
+        jobs = {}
+        if os.path.isdir(self.jobs_dir):
+            for name in os.listdir(self.jobs_dir):
+                if name.endswith(".json"):
+                    job = self._load(name[:-len(".json")])
+                    if job is not None:
+                        jobs[job["id"]] = job
+        for job_id in list(self._jobs):
+            jobs[job_id] = self.get(job_id)
+        return sorted(jobs.values(), key=lambda job: -job["created_at"])
+
+    def active(self) -> Optional[Dict[str, Any]]:
+        """The running job of this process, or the queued one"""
+        job = self._running or self._queued
+        return self.get(job.id) if job else None
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cancel a queued or running job, returning its state (None if unknown). A running job
+        stops before reading its next post; finished jobs are left as they are."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                if job.status in FINISHED_STATES:
+                    return job.to_dict()
+                job.cancel_event.set()
+                if job is self._queued:
+                    self._queued = None
+                    self._finish(job, "cancelled")
+                return job.to_dict()
+
+        state = self._load(job_id)
+        if state is not None and state["status"] not in FINISHED_STATES:
+            # Owned by another process, which checks for this file
+            open(self._path(job_id, ".cancel"), "w").close()
+            state["cancel_requested"] = True
+        return state
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> bool:
+        """Wait for a job of this process to finish, returning whether it did"""
+        job = self._jobs.get(job_id)
+        return job is None or job.done.wait(timeout)
+
+    def start_scheduler(self, interval: float, source: str = "api", mode: str = "incremental"):
+        """Submit a reindex every interval seconds in a background thread"""
+        if mode not in MODES:
+            raise ValueError(f"Unknown reindex mode: {mode}")
+        def run_schedule():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.submit(source, mode, trigger="schedule")
+                except ReindexConflict as e:
+                    logger.info("Skipping scheduled reindex: %s", e)
+                except Exception as e:
+                    logger.error("Error scheduling reindex: %s", e)
+
+        logger.info("Scheduling a %s reindex from %s every %ss", mode, source, interval)
+        threading.Thread(target=run_schedule, name="reindex-scheduler", daemon=True).start()
+
+    def _run_jobs(self):
+        while True:
+            with self._lock:
+                job = self._queued
+                self._queued = None
+                self._running = job
+            if job is None:
+                return
+            self._run(job)
+
+    def _run(self, job: ReindexJob):
+        log_config.set_request_id(f"reindex-{job.id}")
+        lock_file = self._acquire_job_lock(job)
+        if lock_file is None:
+            self._finish(job, "cancelled")
+            return
+
+        job.status = "running"
+        job.started_at = time.time()
+        self._save(job)
+        logger.info("Starting reindex job %s (source=%s, mode=%s)", job.id, job.source, job.mode)
+        status = "failed"
+        try:
+            index = self.vector_store.index_posts_from_api if job.source == "api" else self.vector_store.index_posts
+            job.indexed_count = index(force=job.mode == "force", incremental=job.mode == "incremental",
+                                      should_stop=lambda: self._should_stop(job))
+            job.stats = dict(self.vector_store.last_index_stats)
+            status = "succeeded"
+        except IndexingCancelled:
+            status = "cancelled"
+        except Exception as e:
+            job.error = str(e)
+        finally:
+            lock_file.close()
+            self._finish(job, status)
+        logger.info("Reindex job %s %s: %s posts indexed, stats: %s", job.id, status, job.indexed_count, job.stats)
+
+    def _should_stop(self, job: ReindexJob) -> bool:
+        """Called before each post is read: checks for cancellation and saves the progress every second"""
+        if os.path.exists(self._path(job.id, ".cancel")):
+            job.cancel_event.set()
+        if time.time() - job.saved_at >= 1:
+            self._refresh_progress(job)
+            self._save(job)
+        return job.cancel_event.is_set()
+
+    def _refresh_progress(self, job: ReindexJob):
+        progress = self.vector_store.index_progress
+        # Before the first post is read, index_progress still describes the previous run
+        if job.started_at and (progress.get("started_at") or 0) >= job.started_at:
+            job.progress = dict(progress)
+
+    def _finish(self, job: ReindexJob, status: str):
+        self._refresh_progress(job)
+        job.status = status
+        job.finished_at = time.time()
+        self._save(job)
+        if os.path.exists(self._path(job.id, ".cancel")):
+            os.remove(self._path(job.id, ".cancel"))
+        self._prune()
+        job.done.set()
+
+    def _acquire_job_lock(self, job: ReindexJob):
+        """Lock chroma_data/reindex_job.lock, waiting while another process runs a job.
+        Returns the open lock file, or None when the job was cancelled while waiting."""
+        while True:
+            lock_file = try_lock_file(index_write_lock_path(self.vector_store))
+            if lock_file is not None:
+                return lock_file
+            if self._should_stop(job):
+                return None
+            time.sleep(1)
+
+    def _path(self, job_id: str, suffix: str = ".json") -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}{suffix}")
+
+    def _save(self, job: ReindexJob):
+        job.saved_at = time.time()
+        try:
+            os.makedirs(self.jobs_dir, exist_ok=True)
+            temp_path = self._path(job.id, f".{os.getpid()}.tmp")
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(job.to_dict(), f)
+            os.replace(temp_path, self._path(job.id))
+        except OSError as e:
+            logger.warning("Could not save reindex job %s: %s", job.id, e)
+
+    def _load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._path(job_id), encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state["status"] not in FINISHED_STATES and not _process_alive(state["pid"]):
+            state.update(status="failed", error="The process running the job exited", eta_seconds=None)
+        return state
+
+    def _prune(self):
+        """Delete the state files of finished jobs beyond the most recent history jobs"""
+        finished = [job for job in self.list() if job["status"] in FINISHED_STATES]
+        for job in finished[self.history:]:
+            self._jobs.pop(job["id"], None)
+            for suffix in (".json", ".cancel"):
+                try:
+                    os.remove(self._path(job["id"], suffix))
+                except OSError:
+                    pass
+
+
+def index_write_lock_path(vector_store) -> str:
+    """Lock held while a reindex job, or another writer of the index, runs"""
+    return os.path.join(vector_store.persist_path, "reindex_job.lock")
+
+
+# In-process side of the index write lock: flock only excludes other processes on POSIX (each open()
+# of the file is its own lock there) and is missing on Windows, where jobs and the change stream
+# share one process
+_thread_locks: Dict[str, threading.Lock] = {}
+_thread_locks_guard = threading.Lock()
+
+
+class _HeldLock:
+    """The thread lock and the open file holding the flock of a path; close() releases both"""
+
+    def __init__(self, thread_lock: threading.Lock, lock_file):
+        self._thread_lock = thread_lock
+        self._file = lock_file
+
+    def close(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        self._thread_lock.release()
+
+
+def try_lock_file(path: str):
+    """Take an exclusive lock on path without waiting, returning the lock held
+    (closing it releases the lock), or None if another process or thread holds it"""
+    with _thread_locks_guard:
+        thread_lock = _thread_locks.setdefault(os.path.abspath(path), threading.Lock())
+    if not thread_lock.acquire(blocking=False):
+        return None
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        lock_file = open(path, "w")
+    except OSError:
+        thread_lock.release()
+        raise
+    try:
+        import fcntl
+    except ImportError:
+        return _HeldLock(thread_lock, lock_file)  # Windows: a single process
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        thread_lock.release()
+        return None
+    return _HeldLock(thread_lock, lock_file)
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass  # Exists, owned by another user
+    return True
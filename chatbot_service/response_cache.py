@@ -0,0 +1,152 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+import numpy as np
+from query_parser import QueryIntent
+from text_utils import normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """In-process LRU cache of LLM answers with a time-to-live per entry.
+
+    An answer is reused for the same prompt kind, parsed intent and set of posts in the
+    prompt (IDs and updated_at, so an edited post never matches an old entry), when the
+    normalized question is the same or, with a similarity threshold set, when the
+    question's embedding is at least that similar to the one of a cached answer.
+    Entries referencing a post are dropped as soon as the post is reindexed, by this worker or,
+    through the index change log, by another one (see VectorStore.reload_if_changed); until then
+    the chatbot does not use the cache (VectorStore.has_unapplied_changes).
+    """
+
+    def __init__(self, capacity: int = 1000, ttl_seconds: float = 3600, similarity_threshold: float = 0.97):
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # key -> (expires_at, response_text, embedding)
+        self._buckets: Dict[tuple, set] = {}  # (kind, intent, posts) -> keys, for the similarity lookup
+        self._keys_by_post: Dict[str, set] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(kind: str, question: str, intent: QueryIntent, docs: List[Dict]) -> tuple:
+        """(bucket, normalized question); the bucket holds everything but the question wording"""
+        intent_key = (
+            intent.is_rental_request,
+            normalize_query(intent.location),
+            intent.price_range,
+            intent.area_range,
+            intent.category,
+            tuple(sorted(intent.amenities)),
+        )
+        posts_key = tuple(sorted((doc["id"], doc["metadata"].get("updated_at", "")) for doc in docs))
+        return (kind, intent_key, posts_key), normalize_query(question)
+
+    @staticmethod
+    def _normalize_embedding(embedding: Optional[List[float]]) -> Optional[np.ndarray]:
+        if embedding is None:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def get(self, key: tuple, embedding: Optional[List[float]] = None) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+
+            if entry is None and self.similarity_threshold > 0:
+                key = self._find_similar(key[0], self._normalize_embedding(embedding))
+                entry = self._entries.get(key) if key else None
+                if entry is not None:
+                    self.similar_hits += 1
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def _find_similar(self, bucket: tuple, vector: Optional[np.ndarray]) -> Optional[tuple]:
+        """Key of the live entry in the bucket whose question is most similar, above the threshold"""
+        if vector is None:
+            return None
+        best_key, best_similarity = None, self.similarity_threshold
+        now = time.monotonic()
+        for key in self._buckets.get(bucket, ()):
+            expires_at, _, cached_vector = self._entries[key]
+            if cached_vector is None or expires_at < now:
+                continue
+            similarity = float(cached_vector @ vector)
+            if similarity >= best_similarity:
+                best_key, best_similarity = key, similarity
+        return best_key
+
+    def put(self, key: tuple, response_text: str, embedding: Optional[List[float]] = None):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, response_text, self._normalize_embedding(embedding))
+            self._buckets.setdefault(key[0], set()).add(key)
+            for post_id, _ in key[0][2]:
+                self._keys_by_post.setdefault(post_id, set()).add(key)
+            while len(self._entries) > self.capacity:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: tuple):
+        del self._entries[key]
+        bucket = self._buckets.get(key[0])
+        if bucket is not None:
+            bucket.discard(key)
+            if not bucket:
+                del self._buckets[key[0]]
+        for post_id, _ in key[0][2]:
+            keys = self._keys_by_post.get(post_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_post[post_id]
+
+    def invalidate_posts(self, post_ids: Optional[Iterable[str]] = None):
+        """Drop the answers built from any of the posts; all answers when post_ids is None"""
+        with self._lock:
+            if post_ids is None:
+                keys = list(self._entries)
+            else:
+                keys = {key for post_id in post_ids for key in self._keys_by_post.get(post_id, ())}
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+        if keys:
+            logger.info(f"Response cache: invalidated {len(keys)} answers")
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+            "capacity": self.capacity,
+            "ttl_seconds": self.ttl_seconds,
+            "similarity_threshold": self.similarity_threshold
+        }
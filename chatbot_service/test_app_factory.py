@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Test the serving setup: the application factory, warm-up without API calls, and
+workers picking up a reindex done by another process
+"""
+
+import gc
+import sys
+import os
+import importlib.util
+import tempfile
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from document_builder import iter_documents
+from test_helpers import FakeEmbeddings, make_posts
+from vector_store import VectorStore
+
+
+def open_worker_store(persist_path, backend="numpy"):
+    """A vector store as a server worker opens it, without the embedding cache"""
+    vector_store = VectorStore()
+    vector_store.persist_path = persist_path
+    vector_store.vector_backend = backend
+    vector_store.embedding_cache_enabled = False
+    api_key = os.environ.get("OPENAI_API_KEY")
+    os.environ["OPENAI_API_KEY"] = api_key or "test-key"
+    try:
+        vector_store.init_store()
+    finally:
+        if api_key is None:
+            del os.environ["OPENAI_API_KEY"]
+    embeddings = FakeEmbeddings(vector_store)
+    vector_store.openai_client = SimpleNamespace(embeddings=embeddings)
+    return vector_store, embeddings
+
+
+def test_create_app():
+    """Every app built by the factory serves the routes"""
+    import main
+
+    first, second = main.create_app(), main.create_app()
+    assert first is not second
+    for flask_app in (first, second, main.app):
+        response = flask_app.test_client().get("/health")
+        assert response.status_code == 200 and response.get_json()["status"] == "healthy"
+    assert {rule.rule for rule in first.url_map.iter_rules()} >= {"/chat", "/chat/stream", "/reindex", "/stats"}
+
+    # Nothing to recreate in the process that initialized the services
+    main.after_fork()
+
+    # wsgi.py serves main.app (its init_services call is skipped: marked as done)
+    services_pid, main._services_pid = main._services_pid, os.getpid()
+    try:
+        import wsgi
+    finally:
+        main._services_pid = services_pid
+        gc.unfreeze()
+    assert wsgi.app is main.app
+
+    print("[PASS] Application factory")
+
+
+def test_background_tasks_after_services():
+    """Under gunicorn asgi.py loads the services when imported, so a worker's post_worker_init
+    starts the background tasks on a loaded index; called before init_services they do not start"""
+    import main
+
+    calls = []
+
+    def init_services(warmup=True):
+        calls.append("init_services")
+        main._services_pid = os.getpid()
+
+    saved = {name: getattr(main, name) for name in ("init_services", "start_index_watcher", "_acquire_reindex_lock",
+                                                     "_services_pid", "_background_pid")}
+    saved_environ = dict(os.environ)
+    main.init_services = init_services
+    main.start_index_watcher = lambda interval: calls.append("start_index_watcher")
+    main._acquire_reindex_lock = lambda: False
+    main._services_pid = main._background_pid = None
+    os.environ["INDEX_RELOAD_INTERVAL_SECONDS"] = "2"
+    try:
+        main.start_background_tasks()
+        assert calls == [] and main._background_pid is None
+
+        spec = importlib.util.spec_from_file_location(
+            "gunicorn_conf", os.path.join(os.path.dirname(os.path.abspath(__file__)), "gunicorn.conf.py"))
+        gunicorn_conf = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(gunicorn_conf)
+        # Imported anew, as the gunicorn master imports it
+        sys.modules.pop("asgi", None)
+        import asgi
+        assert calls == ["init_services"]
+
+        gunicorn_conf.post_worker_init(SimpleNamespace())
+        assert calls == ["init_services", "start_index_watcher"] and main._background_pid == os.getpid()
+    finally:
+        for name, value in saved.items():
+            setattr(main, name, value)
+        os.environ.clear()
+        os.environ.update(saved_environ)
+        gc.unfreeze()
+
+    print("[PASS] Background tasks started after the services")
+
+
+def test_warmup_and_reload():
+    """Warm-up makes no API call; a worker reloads the index after another one reindexed it"""
+    for backend in ("numpy", "chroma"):
+        check_warmup_and_reload(backend)
+
+    print("[PASS] Warm-up and reload after another worker's reindex")
+
+
+def check_warmup_and_reload(backend):
+    persist_path = tempfile.mkdtemp()
+    writer, writer_embeddings = open_worker_store(persist_path, backend)
+    posts = make_posts()
+    writer.iter_post_pages_from_api = lambda: iter([[dict(post) for post in posts]])
+    writer.index_posts_from_api(force=True)
+
+    reader, reader_embeddings = open_worker_store(persist_path, backend)
+    reader.warmup()
+    assert reader_embeddings.requests == [] and reader.collection.count() == len(posts)
+    assert not reader.reload_if_changed() and not writer.reload_if_changed()
+
+    # The writer builds a new generation with one more post
+    invalidated = []
+    reader.add_change_listener(invalidated.append)
+    posts.append(dict(posts[0], post_id="p-new", title="Phòng trọ Phú Lương mới đăng", location="Phú Lương, Hà Đông"))
+    writer.index_posts_from_api(force=True)
+    assert not writer.reload_if_changed()
+
+    assert reader.reload_if_changed()
+    assert reader.active_collection_name == writer.active_collection_name
+    assert reader.collection.count() == len(posts) and invalidated == [None]
+    assert "p-new" in [doc["id"] for doc in reader.search("phòng trọ phú lương", top_k=3)]
+    assert not reader.reload_if_changed()
+
+    # Incremental writes to the same generation are picked up too, by the lexical index as well
+    posts[1]["title"] = "Phòng trọ Thanh Xuân vừa sửa"
+    posts[1]["updatedAt"] = "2025-06-01T00:00:00Z"
+    posts.append(dict(posts[0], post_id="p-late", title="Phòng trọ Yên Nghĩa", location="Yên Nghĩa, Hà Đông"))
+    writer.index_posts_from_api(incremental=True)
+    assert not writer.reload_if_changed()
+    assert reader.reload_if_changed()
+    assert reader.get_document_by_id("p1")["title"] == "Phòng trọ Thanh Xuân vừa sửa"
+    assert reader.lexical_index.search("yên nghĩa")[0][0] == "p-late"
+    assert "p-late" in [doc["id"] for doc in reader.search("phòng trọ yên nghĩa", top_k=3)]
+    assert not reader.reload_if_changed()
+
+    # A worker catches up before writing: persisting a stale numpy collection would drop the other's posts
+    posts.append(dict(posts[0], post_id="p-last", title="Phòng trọ Kiến Hưng"))
+    writer.index_posts_from_api(incremental=True)
+    reader.apply_changes(list(iter_documents([dict(posts[2], title="Phòng trọ Văn Quán")])), [])
+    fresh, _ = open_worker_store(persist_path, backend)
+    assert fresh.get_document_by_id("p-last") and fresh.get_document_by_id("p2")["title"] == "Phòng trọ Văn Quán"
+
+
+if __name__ == "__main__":
+    test_create_app()
+    test_background_tasks_after_services()
+    test_warmup_and_reload()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Test the asyncio chat pipeline and the ASGI app serving it next to the Flask routes
+"""
+
+import sys
+import os
+import json
+import time
+import asyncio
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from test_helpers import make_chatbot, split_chunks
+
+
+class FakeAsyncEmbeddings:
+    """Stands in for async_openai_client.embeddings, counting API requests"""
+
+    def __init__(self, vector_store, delay=0.05):
+        self.vector_store = vector_store
+        self.delay = delay
+        self.requests = []
+
+    async def create(self, input, model):
+        self.requests.append(list(input))
+        await asyncio.sleep(self.delay)
+        return SimpleNamespace(data=[SimpleNamespace(embedding=self.vector_store.simple_text_embedding(text)) for text in input])
+
+
+class FakeAsyncCompletions:
+    """Stands in for async_llm_client.chat.completions, taking `delay` seconds to answer"""
+
+    def __init__(self, answer, delay=0.05):
+        self.answer = answer
+        self.delay = delay
+
+    async def create(self, stream=False, **params):
+        await asyncio.sleep(self.delay)
+        if not stream:
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.answer))])
+
+        async def chunks():
+            for chunk in split_chunks(self.answer):
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=chunk))])
+        return chunks()
+
+
+def make_async_chatbot(answer):
+    chatbot = make_chatbot(answer)
+    chatbot.async_llm_client = SimpleNamespace(chat=SimpleNamespace(completions=FakeAsyncCompletions(answer)))
+    embeddings = FakeAsyncEmbeddings(chatbot.vector_store)
+    chatbot.vector_store.async_openai_client = SimpleNamespace(embeddings=embeddings)
+    return chatbot, embeddings
+
+
+def test_async_matches_sync():
+    """The async pipeline gives the same responses and events as the sync one"""
+    answer = 'Có vài phòng. __SHOW_ROOMS__::{"message": "Các phòng phù hợp:", "roomIds": ["p0", "p4"]}'
+    chatbot, embeddings = make_async_chatbot(answer)
+    question = "Tìm phòng trọ ở Thanh Xuân"
+
+    async def collect(events):
+        return [event async for event in events]
+
+    assert asyncio.run(chatbot.aprocess_question(question)) == chatbot.process_question(question)
+    assert asyncio.run(collect(chatbot.aprocess_question_stream(question))) == list(chatbot.process_question_stream(question))
+
+    chatbot.async_llm_client = None
+    assert asyncio.run(chatbot.aprocess_question(question)) == chatbot._error_response()
+
+    print("[PASS] Async pipeline matches the sync one")
+
+
+def test_concurrent_chats():
+    """Many chats wait on the network at once, and identical queries share one embedding request"""
+    chatbot, embeddings = make_async_chatbot("Chào bạn")
+
+    async def chat_many():
+        questions = [f"Phòng trọ Cầu Giấy số {i % 20}" for i in range(200)]
+        return await asyncio.gather(*(chatbot.aprocess_question(question) for question in questions))
+
+    started = time.perf_counter()
+    responses = asyncio.run(chat_many())
+    elapsed = time.perf_counter() - started
+
+    assert all(response["response"] == "Chào bạn" for response in responses)
+    # 20 distinct queries, each embedded once although 10 chats asked it at the same time
+    assert len(embeddings.requests) == 20
+    # 200 chats waiting 50 ms for the embedding and 50 ms for the LLM overlap instead of queueing
+    assert elapsed < 5, elapsed
+
+    print(f"[PASS] 200 concurrent chats in {elapsed:.2f}s")
+
+
+def test_asgi_app():
+    """/chat and /chat/stream are served asynchronously, other routes by Flask"""
+    import main
+    import asgi
+
+    answer = 'Phòng đây. __SHOW_ROOMS__::{"message": "Xem nhé:", "roomIds": ["p1"]}'
+    chatbot, embeddings = make_async_chatbot(answer)
+
+    async def request(method, path, payload=None):
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        received = [{"type": "http.request", "body": body, "more_body": False}]
+        sent = []
+
+        async def receive():
+            return received.pop(0) if received else {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+                 "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+                 "root_path": "", "headers": [(b"content-type", b"application/json")],
+                 "client": ("127.0.0.1", 1234), "server": ("127.0.0.1", 8000)}
+        await asgi.app(scope, receive, send)
+        start = sent[0]
+        headers = dict(start["headers"])
+        return start["status"], headers, b"".join(message.get("body", b"") for message in sent[1:]).decode("utf-8")
+
+    original_chatbot, main.chatbot = main.chatbot, chatbot
+    try:
+        status, headers, body = asyncio.run(request("POST", "/chat", {"question": "Tìm phòng trọ ở Cầu Giấy"}))
+        assert status == 200 and headers[b"access-control-allow-origin"] == b"*"
+        assert [room["_id"] for room in json.loads(body)["rooms"]] == ["p1"]
+
+        status, headers, body = asyncio.run(request("POST", "/chat/stream", {"question": "Tìm phòng trọ ở Cầu Giấy"}))
+        assert headers[b"content-type"].startswith(b"text/event-stream")
+        events = [block.split("\n") for block in body.strip().split("\n\n")]
+        assert "".join(json.loads(data[len("data: "):])["text"] for event, data in events if event == "event: token") == "Phòng đây. "
+        assert events[-1][0] == "event: done"
+
+        status, headers, body = asyncio.run(request("GET", "/health"))
+        assert status == 200 and json.loads(body)["status"] == "healthy"
+    finally:
+        main.chatbot = original_chatbot
+
+    print("[PASS] ASGI app")
+
+
+if __name__ == "__main__":
+    test_async_matches_sync()
+    test_concurrent_chats()
+    test_asgi_app()
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Test near-real-time indexing from the MongoDB change stream: debounced micro-batches that
+upsert or delete only the changed posts, the saved resume token, deferral while a reindex
+runs and recovery when the token fell out of the oplog.
+
+The fake stream runs everywhere; test_replica_set runs against a real single-node replica set
+when MONGODB_REPLICA_SET_URI is set, e.g. after
+    mongod --replSet rs0 --dbpath /tmp/rs0 --port 27018 &
+    mongosh --port 27018 --eval "rs.initiate()"
+    MONGODB_REPLICA_SET_URI=mongodb://localhost:27018/?replicaSet=rs0 python test_change_stream_indexer.py
+"""
+
+import sys
+import os
+import time
+import queue
+import uuid
+from datetime import datetime, timedelta, timezone
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+from change_stream_indexer import ChangeStreamIndexer, is_listed, post_from_document
+from reindex_jobs import index_write_lock_path, try_lock_file
+from test_helpers import make_post, make_store, open_other_worker
+
+
+class FakeChangeStream:
+    def __init__(self, events):
+        self.events = events
+        self.resume_token = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def try_next(self):
+        try:
+            change = self.events.get(timeout=0.01)
+        except queue.Empty:
+            return None
+        if isinstance(change, Exception):
+            raise change
+        self.resume_token = change["_id"]
+        return change
+
+
+class FakePostsCollection:
+    """Collection whose watch() streams the events put in its queue, recording the watch options"""
+
+    def __init__(self):
+        self.events = queue.Queue()
+        self.watches = []
+        self.sequence = 0
+
+    def watch(self, pipeline, **options):
+        self.watches.append(options)
+        return FakeChangeStream(self.events)
+
+    def emit(self, operation, post_id, document=None):
+        self.sequence += 1
+        self.events.put({"_id": {"_data": f"{self.sequence:08d}"}, "operationType": operation,
+                         "documentKey": {"_id": ObjectId(post_id)}, "fullDocument": document})
+
+
+def make_document(post_id, title, status="active", end_date=None):
+    post = make_post(post_id, title, datetime(2025, 1, 1, 8, 30, 0, 123000))
+    post.pop("post_id")
+    return dict(post, _id=ObjectId(post_id), status=status, endDate=end_date or datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(days=30))
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.01)
+
+
+def make_indexer(vector_store, collection, **options):
+    options.setdefault("debounce_seconds", 0.2)
+    options.setdefault("retry_seconds", 0.1)
+    return ChangeStreamIndexer(vector_store, collection, **options)
+
+
+IDS = [str(ObjectId()) for _ in range(4)]
+
+
+def test_post_conversion():
+    """Documents become API-shaped posts; inactive and expired posts are not listed"""
+    document = make_document(IDS[0], "Phòng trọ")
+    post = post_from_document(document)
+    assert post["post_id"] == post["_id"] == IDS[0]
+    assert post["updatedAt"] == "2025-01-01T08:30:00.123Z"
+    assert is_listed(document)
+    assert not is_listed(dict(document, status="expired"))
+    assert not is_listed(dict(document, endDate=datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=1)))
+
+    print("[PASS] Change stream documents converted like API posts")
+
+
+def test_debounced_batches():
+    """Events within the debounce window become one batch; only the changed posts are embedded"""
+    vector_store, embedded = make_store([])
+    vector_store.apply_changes([], [])  # Nothing to do
+    collection = FakePostsCollection()
+    indexer = make_indexer(vector_store, collection)
+    indexer.start()
+    try:
+        collection.emit("insert", IDS[0], make_document(IDS[0], "Phòng trọ 1"))
+        collection.emit("update", IDS[0], make_document(IDS[0], "Phòng trọ 1 (mới sửa)"))
+        collection.emit("insert", IDS[1], make_document(IDS[1], "Phòng trọ 2"))
+        collection.emit("insert", IDS[2], make_document(IDS[2], "Phòng trọ 3"))
+        wait_for(lambda: indexer.counters["batches"] == 1)
+        assert len(embedded) == 3  # The first version of post 1 was never embedded
+        stored = vector_store.collection.get(include=["metadatas"])
+        assert dict(zip(stored["ids"], (meta["title"] for meta in stored["metadatas"]))) == {
+            IDS[0]: "Phòng trọ 1 (mới sửa)", IDS[1]: "Phòng trọ 2", IDS[2]: "Phòng trọ 3"}
+        assert vector_store.lexical_index.search("mới sửa")[0][0] == IDS[0]
+
+        # Deleted, deactivated and updated posts
+        embedded.clear()
+        collection.emit("delete", IDS[1])
+        collection.emit("update", IDS[2], make_document(IDS[2], "Phòng trọ 3", status="inactive"))
+        collection.emit("update", IDS[3], None)  # Deleted before the update was looked up
+        wait_for(lambda: indexer.counters["batches"] == 2)
+        assert embedded == []
+        assert vector_store.collection.get()["ids"] == [IDS[0]]
+        assert indexer.stats()["deleted"] == 3 and indexer.stats()["pending"] == 0
+    finally:
+        indexer.stop(5)
+
+    # The token of the last written event is saved, and a new indexer resumes after it
+    resumed = make_indexer(vector_store, collection)
+    assert resumed.resume_token == {"_data": "00000007"}
+    resumed.start()
+    wait_for(lambda: len(collection.watches) == 2)
+    resumed.stop(5)
+    assert collection.watches[1]["resume_after"] == {"_data": "00000007"}
+    assert collection.watches[1]["full_document"] == "updateLookup"
+
+    print("[PASS] Change events debounced into batches, resume token saved")
+
+
+def test_min_batch_interval():
+    """Changes arriving within min_batch_interval of the last batch join the next one"""
+    vector_store, embedded = make_store([])
+    collection = FakePostsCollection()
+    indexer = make_indexer(vector_store, collection, debounce_seconds=0.05, min_batch_interval=0.5)
+    indexer.start()
+    try:
+        collection.emit("insert", IDS[0], make_document(IDS[0], "Phòng trọ 1"))
+        wait_for(lambda: indexer.counters["batches"] == 1)
+        written_at = time.monotonic()
+        collection.emit("insert", IDS[1], make_document(IDS[1], "Phòng trọ 2"))
+        collection.emit("insert", IDS[2], make_document(IDS[2], "Phòng trọ 3"))
+        wait_for(lambda: indexer.counters["batches"] == 2)
+        assert time.monotonic() - written_at >= 0.5
+        assert vector_store.collection.count() == 3 and indexer.stats()["pending"] == 0
+    finally:
+        indexer.stop(5)
+
+    print("[PASS] Change batches spaced by min_batch_interval")
+
+
+def test_deferred_during_reindex():
+    """While a reindex holds the lock, batches wait and are written after it"""
+    vector_store, _ = make_store([])
+    collection = FakePostsCollection()
+    indexer = make_indexer(vector_store, collection, debounce_seconds=0.05)
+    reindex_lock = try_lock_file(index_write_lock_path(vector_store))
+    indexer.start()
+    try:
+        collection.emit("insert", IDS[0], make_document(IDS[0], "Phòng trọ 1"))
+        wait_for(lambda: indexer.counters["deferred"] > 0)
+        assert vector_store.collection.count() == 0 and indexer.resume_token is None
+        reindex_lock.close()
+        wait_for(lambda: indexer.counters["batches"] == 1, timeout=5)
+        assert vector_store.collection.count() == 1
+    finally:
+        indexer.stop(5)
+
+    print("[PASS] Change batches deferred while a reindex runs")
+
+
+def test_failed_batch_retried():
+    """A batch failing to embed is kept and retried; its token is only saved once written"""
+    vector_store, _ = make_store([])
+    failures = [RuntimeError("embedding service down")]
+    embed_texts = vector_store.embed_texts
+
+    def flaky_embed_texts(texts):
+        if failures:
+            raise failures.pop()
+        return embed_texts(texts)
+
+    vector_store.embed_texts = flaky_embed_texts
+    collection = FakePostsCollection()
+    indexer = make_indexer(vector_store, collection, debounce_seconds=0.05)
+    indexer.start()
+    try:
+        collection.emit("insert", IDS[0], make_document(IDS[0], "Phòng trọ 1"))
+        wait_for(lambda: indexer.counters["batches"] == 1)
+        assert indexer.counters["errors"] == 1 and vector_store.collection.count() == 1
+    finally:
+        indexer.stop(5)
+
+    print("[PASS] Failed change batch retried")
+
+
+def test_other_workers_apply_batches():
+    """Other workers apply only the posts of a batch, without rebuilding their lexical index"""
+    vector_store, _ = make_store([make_post(IDS[3], "Phòng trọ Hà Đông", "2025-01-01T00:00:00Z")])
+    vector_store.index_posts_from_api()
+    other = open_other_worker(vector_store)
+    changed = []
+    other.add_change_listener(changed.append)
+    other._build_lexical_index = None  # Must not be called
+
+    collection = FakePostsCollection()
+    indexer = make_indexer(vector_store, collection)
+    indexer.start()
+    try:
+        collection.emit("insert", IDS[0], make_document(IDS[0], "Phòng trọ Yên Nghĩa"))
+        collection.emit("delete", IDS[3])
+        wait_for(lambda: indexer.counters["batches"] == 1)
+    finally:
+        indexer.stop(5)
+
+    assert not vector_store.has_unapplied_changes() and other.has_unapplied_changes()
+    assert not vector_store.reload_if_changed()  # Its own batch
+    assert other.reload_if_changed()
+    assert sorted(changed) == [sorted([IDS[0], IDS[3]])]
+    assert other.lexical_index.search("yên nghĩa")[0][0] == IDS[0]
+    assert IDS[3] not in [doc_id for doc_id, _ in other.lexical_index.search("hà đông")]
+    stored = vector_store.collection.get(ids=[IDS[0]], include=["embeddings"])["embeddings"][0]
+    assert other.collection.query(query_embeddings=[list(stored)], n_results=1)["ids"] == [[IDS[0]]]
+    assert not other.reload_if_changed()
+
+    print("[PASS] Change batches applied by the other workers")
+
+
+def test_history_lost():
+    """A token the oplog no longer holds is dropped, the callback catches up and the stream restarts"""
+    vector_store, _ = make_store([])
+    collection = FakePostsCollection()
+    caught_up = []
+    indexer = make_indexer(vector_store, collection, on_history_lost=lambda: caught_up.append(True))
+    indexer.start()
+    indexer.stop(5)
+    assert caught_up == [True]  # No token yet: the posts changed before are caught up
+
+    indexer.resume_token = {"_data": "00000001"}
+    collection.events.put(OperationFailure("Resume of change stream was not possible", code=286))
+    indexer.start()
+    try:
+        wait_for(lambda: len(collection.watches) == 3)
+        assert caught_up == [True, True]
+        assert "resume_after" in collection.watches[1] and "resume_after" not in collection.watches[2]
+        assert not os.path.exists(indexer.token_path)
+    finally:
+        indexer.stop(5)
+
+    print("[PASS] Lost change stream history caught up")
+
+
+def test_replica_set():
+    """End to end against a local single-node replica set (MONGODB_REPLICA_SET_URI)"""
+    uri = os.getenv("MONGODB_REPLICA_SET_URI")
+    if not uri:
+        print("[SKIP] MONGODB_REPLICA_SET_URI not set")
+        return
+    from pymongo import MongoClient
+
+    client = MongoClient(uri, serverSelectionTimeoutMS=5000)
+    posts = client[f"test_change_stream_{uuid.uuid4().hex[:8]}"].posts
+    vector_store, _ = make_store([])
+    indexer = make_indexer(vector_store, posts)
+    indexer.start()
+    try:
+        time.sleep(0.5)  # The stream starts from when it is opened
+        post_id = posts.insert_one(make_document(str(ObjectId()), "Phòng trọ gần hồ Tây"))
+        post_id = str(post_id.inserted_id)
+        started = time.monotonic()
+        wait_for(lambda: vector_store.collection.get(ids=[post_id])["ids"], timeout=10)
+        print(f"  searchable after {time.monotonic() - started:.2f}s")
+
+        posts.update_one({"_id": ObjectId(post_id)}, {"$set": {"status": "expired"}})
+        wait_for(lambda: not vector_store.collection.get(ids=[post_id])["ids"], timeout=10)
+    finally:
+        indexer.stop(5)
+        client.drop_database(posts.database.name)
+
+    print("[PASS] Change stream indexing against a replica set")
+
+
+if __name__ == "__main__":
+    test_post_conversion()
+    test_debounced_batches()
+    test_min_batch_interval()
+    test_deferred_during_reindex()
+    test_failed_batch_retried()
+    test_other_workers_apply_batches()
+    test_history_lost()
+    test_replica_set()
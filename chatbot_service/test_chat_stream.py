@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Test streaming chat answers: token events as the LLM generates, and the room cards
+in the final event once the __SHOW_ROOMS__:: instruction has been parsed
+"""
+
+import sys
+import os
+import json
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from chatbot import ShowRoomsStreamFilter
+from test_helpers import make_chatbot
+
+
+def test_show_rooms_filter():
+    """The instruction is held back even when the prefix is split across chunks"""
+    stream_filter = ShowRoomsStreamFilter()
+    shown = [stream_filter.feed(chunk) for chunk in ["Có 2 phòng. _", "_SHOW", "_ROOMS__:", ':{"roomIds": []}']]
+    assert "".join(shown) + stream_filter.flush() == "Có 2 phòng. "
+    assert shown[1] == ""
+
+    # Text that only looks like the start of the prefix is shown once the stream ends
+    stream_filter = ShowRoomsStreamFilter()
+    assert stream_filter.feed("Giá 3 triệu _") == "Giá 3 triệu "
+    assert stream_filter.flush() == "_"
+
+    print("[PASS] show_rooms stream filter")
+
+
+def test_stream_show_rooms():
+    """Tokens are streamed before the instruction and the rooms come with the done event"""
+    answer = 'Có vài phòng ở Thanh Xuân. __SHOW_ROOMS__::{"message": "Các phòng phù hợp:", "roomIds": ["p0", "p4"]}'
+    chatbot = make_chatbot(answer)
+    question = "Tìm phòng trọ ở Thanh Xuân"
+
+    events = list(chatbot.process_question_stream(question))
+    assert [event for event, _ in events[:-1]] == ["token"] * (len(events) - 1)
+    assert "".join(payload["text"] for _, payload in events[:-1]) == "Có vài phòng ở Thanh Xuân. "
+
+    event, response = events[-1]
+    assert event == "done"
+    assert response == chatbot.process_question(question)
+    assert response["type"] == "show_rooms"
+    assert response["response"] == "Có vài phòng ở Thanh Xuân. Các phòng phù hợp:"
+    assert [room["_id"] for room in response["rooms"]] == ["p0", "p4"]
+
+    calls = chatbot.llm_client.chat.completions.calls
+    assert calls[0]["stream"] is True and calls[1]["stream"] is False
+    assert calls[0].pop("stream_options") == {"include_usage": True}
+    assert dict(calls[0], stream=False) == calls[1]
+
+    print("[PASS] Streamed show_rooms answer")
+
+
+def test_stream_gemini_and_errors():
+    """Gemini streams too, and failures end the stream with the usual error response"""
+    chatbot = make_chatbot("Chào bạn, tôi có thể giúp gì?", use_openai=False)
+    events = list(chatbot.process_question_stream("Xin chào"))
+    assert "".join(payload["text"] for event, payload in events if event == "token") == "Chào bạn, tôi có thể giúp gì?"
+    assert events[-1][0] == "done" and events[-1][1]["response"] == "Chào bạn, tôi có thể giúp gì?"
+
+    chatbot.model = None
+    events = list(chatbot.process_question_stream("Xin chào"))
+    assert events == [("done", chatbot._error_response())]
+
+    print("[PASS] Streamed Gemini answer and errors")
+
+
+def test_chat_stream_endpoint():
+    """/chat/stream frames the events as server-sent events"""
+    import main
+
+    answer = 'Phòng đây. __SHOW_ROOMS__::{"message": "Xem nhé:", "roomIds": ["p1"]}'
+    chatbot = make_chatbot(answer)
+    original_chatbot, main.chatbot = main.chatbot, chatbot
+    try:
+        response = main.app.test_client().post("/chat/stream", json={"question": "Tìm phòng trọ ở Cầu Giấy"})
+        assert response.mimetype == "text/event-stream"
+        assert response.headers["Cache-Control"] == "no-cache"
+        body = response.get_data(as_text=True)
+    finally:
+        main.chatbot = original_chatbot
+
+    events = []
+    for block in body.strip().split("\n\n"):
+        event_line, data_line = block.split("\n")
+        events.append((event_line[len("event: "):], json.loads(data_line[len("data: "):])))
+    assert "".join(payload["text"] for event, payload in events if event == "token") == "Phòng đây. "
+    assert events[-1][0] == "done"
+    assert [room["_id"] for room in events[-1][1]["rooms"]] == ["p1"]
+
+    print("[PASS] /chat/stream endpoint")
+
+
+if __name__ == "__main__":
+    test_show_rooms_filter()
+    test_stream_show_rooms()
+    test_stream_gemini_and_errors()
+    test_chat_stream_endpoint()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Test token-budgeted prompt context: posts packed by relevance within the budget,
+completion caps per answer kind, and tokens and cost recorded per LLM request
+"""
+
+import sys
+import os
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from context_builder import DETAIL_LEVELS, ContextBuilder, context_budget, llm_cost, output_token_cap
+from test_helpers import FakeOpenAICompletions, make_chatbot
+
+
+def make_docs(count):
+    return [{
+        "id": f"p{i}",
+        "title": f"Phòng trọ số {i} gần Đại học Quốc gia",
+        "price": "3 triệu/tháng",
+        "location": "Cầu Giấy, Hà Nội",
+        "area": 25,
+        "options": ["có máy lạnh", "có ban công", "có nóng lạnh"],
+        "description": "Phòng rộng rãi, thoáng mát, gần chợ và bến xe buýt, an ninh tốt. " * 5,
+        "similarity": 0.9 - i * 0.01,
+        "metadata": {"category": "phong-tro"},
+    } for i in range(count)]
+
+
+def test_pack_levels():
+    """Fields are dropped from all posts before any post is left out, posts stay in relevance order"""
+    docs = make_docs(10)
+    full = ContextBuilder("gpt-3.5-turbo", budget=100000)
+    text, included, stats = full.pack(docs)
+    assert included == docs and stats["detail_level"] == 0 and stats["dropped_posts"] == 0
+    assert "Độ tương đồng: 0.90" in text and stats["tokens"] <= stats["budget"]
+
+    sizes = [full.count_tokens("\n\n".join(ContextBuilder.format_doc(i, doc, level) for i, doc in enumerate(docs)))
+             for level in DETAIL_LEVELS]
+    assert sizes == sorted(sizes, reverse=True)
+
+    # A budget between the leanest and the second leanest level keeps every post without amenities
+    builder = ContextBuilder("gpt-3.5-turbo", budget=(sizes[-1] + sizes[-2]) // 2)
+    text, included, stats = builder.pack(docs)
+    assert included == docs and stats["detail_level"] == len(DETAIL_LEVELS) - 1
+    assert "Tiện nghi" not in text and "Chi tiết" not in text and "Độ tương đồng" not in text
+    assert builder.count_tokens(text) <= builder.budget
+
+    # Below the leanest level, the least relevant posts are left out
+    builder = ContextBuilder("gpt-3.5-turbo", budget=sizes[-1] // 3)
+    text, included, stats = builder.pack(docs)
+    assert 0 < len(included) < len(docs) and included == docs[:len(included)]
+    assert stats["posts"] + stats["dropped_posts"] == len(docs)
+    assert "ID: p0" in text and f"ID: p{len(included)}" not in text
+    assert builder.count_tokens(text) <= builder.budget
+
+    print(f"[PASS] Context packing ({sizes[0]} tokens at full detail, {sizes[-1]} at the leanest)")
+
+
+def test_budgets_caps_and_cost():
+    """Budgets and prices are looked up by model name prefix"""
+    assert context_budget("gpt-4o-mini") == 3000 and context_budget("gpt-4-turbo") == 2500
+    assert context_budget("models/gemini-pro") == 3000 and context_budget("unknown") == 2500
+    os.environ["LLM_CONTEXT_TOKENS"] = "1234"
+    try:
+        assert context_budget("gpt-4o") == 1234
+    finally:
+        del os.environ["LLM_CONTEXT_TOKENS"]
+
+    assert output_token_cap("rental") < output_token_cap("standard") and output_token_cap("other") == output_token_cap("standard")
+    assert llm_cost("gpt-4o-mini-2024-07-18", 1000000, 1000000) == 0.75
+    assert llm_cost("gpt-4o", 1000, 0) == 0.0025
+    assert llm_cost("unknown", 1000, 1000) == 0.0
+
+    print("[PASS] Budgets, output caps and prices")
+
+
+def test_usage_recorded():
+    """Each LLM request records its tokens and cost, from the API usage when reported"""
+    chatbot = make_chatbot("Đây là các phòng ở Cầu Giấy.")
+    completions = chatbot.llm_client.chat.completions
+
+    chatbot.process_question("Tìm phòng trọ ở Cầu Giấy")
+    assert completions.calls[-1]["max_completion_tokens"] == output_token_cap("rental")
+    usage = chatbot.last_llm_usage
+    assert usage["estimated"] and usage["prompt_tokens"] > 0 and usage["completion_tokens"] > 0
+
+    completions.usage = SimpleNamespace(prompt_tokens=1200, completion_tokens=80)
+    chatbot.process_question("Xin chào")
+    assert completions.calls[-1]["max_completion_tokens"] == output_token_cap("standard")
+    assert chatbot.last_llm_usage == {"model": "gpt-3.5-turbo", "prompt_tokens": 1200, "completion_tokens": 80,
+                                      "cost_usd": llm_cost("gpt-3.5-turbo", 1200, 80), "estimated": False}
+
+    # Streaming reads the usage from the last chunk
+    list(chatbot.process_question_stream("Tìm phòng trọ ở Cầu Giấy"))
+    assert not chatbot.last_llm_usage["estimated"]
+
+    totals = chatbot.get_llm_usage()
+    assert totals["requests"] == 3
+    assert totals["prompt_tokens"] == usage["prompt_tokens"] + 2400
+    assert totals["cost_usd"] > 0
+
+    # The prompt only holds the posts that fit the budget
+    chatbot.llm_client.chat.completions = FakeOpenAICompletions("Có phòng.")
+    chatbot._get_context_builder().budget = 200
+    chatbot.process_question("Tìm phòng trọ ở Cầu Giấy")
+    prompt = chatbot.llm_client.chat.completions.calls[-1]["messages"][-1]["content"]
+    assert prompt.count("--- Bài đăng #") < 5
+
+    print("[PASS] LLM usage recorded")
+
+
+if __name__ == "__main__":
+    test_pack_levels()
+    test_budgets_caps_and_cost()
+    test_usage_recorded()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Test the embedding caches (hits/misses, normalization, eviction, persistence, TTL)
+"""
+
+import sys
+import os
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from embedding_cache import EmbeddingCache, QueryEmbeddingCache
+
+
+def test_embedding_cache():
+    """Cached embeddings are reused across instances and evicted past capacity"""
+    path = os.path.join(tempfile.mkdtemp(), "embedding_cache.sqlite3")
+    cache = EmbeddingCache(path, max_entries=10)
+    model = "text-embedding-ada-002"
+
+    texts = ["Phòng trọ  giá rẻ\n Thanh Xuân", "Căn hộ mini Cầu Giấy"]
+    assert cache.get_many(model, texts) == [None, None]
+    cache.put_many(model, texts, [[0.5, 0.25], [1.0, -1.0]])
+
+    # Whitespace differences share the same entry, other models do not
+    assert cache.get_many(model, ["Phòng trọ giá rẻ Thanh Xuân"]) == [[0.5, 0.25]]
+    assert cache.get_many("text-embedding-3-small", ["Phòng trọ giá rẻ Thanh Xuân"]) == [None]
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 3 and stats["entries"] == 2
+    cache.close()
+
+    # Entries survive a restart
+    cache = EmbeddingCache(path, max_entries=10)
+    assert cache.get_many(model, texts) == [[0.5, 0.25], [1.0, -1.0]]
+
+    # Going over capacity evicts the least recently used entries
+    cache.put_many(model, [f"post {i}" for i in range(12)], [[float(i)] for i in range(12)])
+    assert cache.stats()["entries"] <= 10
+    assert cache.stats()["evictions"] > 0
+    assert cache.get_many(model, ["post 11"]) == [[11.0]]
+    cache.close()
+
+    print("[PASS] Embedding cache reuses, persists and evicts entries")
+
+
+def test_query_embedding_cache():
+    """Query cache normalizes queries, evicts least recently used entries and expires old ones"""
+    model = "text-embedding-ada-002"
+    cache = QueryEmbeddingCache(capacity=2, ttl_seconds=60)
+
+    cache.put(model, "Phòng trọ giá rẻ", [0.1])
+    assert cache.get(model, "  phòng TRỌ   giá rẻ ") == [0.1]
+    assert cache.get(model, "phong tro gia re") is None  # accents matter unless folding is enabled
+
+    folded = QueryEmbeddingCache(capacity=2, ttl_seconds=60, fold_accents=True)
+    folded.put(model, "Tìm trọ ở Thanh Xuân", [0.2])
+    assert folded.get(model, "tim tro o thanh xuan") == [0.2]
+
+    # "phòng trọ giá rẻ" was used after "b", so "b" is evicted when "c" arrives
+    cache.put(model, "b", [0.3])
+    cache.get(model, "phòng trọ giá rẻ")
+    cache.put(model, "c", [0.4])
+    assert cache.get(model, "b") is None
+    assert cache.get(model, "phòng trọ giá rẻ") == [0.1]
+
+    expiring = QueryEmbeddingCache(capacity=10, ttl_seconds=0.01)
+    expiring.put(model, "tìm trọ", [0.5])
+    time.sleep(0.02)
+    assert expiring.get(model, "tìm trọ") is None
+    assert expiring.stats()["expirations"] == 1
+
+    print("[PASS] Query embedding cache normalizes, evicts and expires entries")
+
+
+if __name__ == "__main__":
+    test_embedding_cache()
+    test_query_embedding_cache()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Test the fast path: pure searches are answered from the matching posts without the LLM,
+open-ended questions still go to the LLM
+"""
+
+import sys
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from chatbot import NO_RESULTS_MESSAGE
+from test_helpers import make_chatbot
+
+
+def make_fast_chatbot(answer="Câu trả lời của LLM"):
+    chatbot = make_chatbot(answer)
+    chatbot.fast_path_enabled = True
+    return chatbot, chatbot.llm_client.chat.completions.calls
+
+
+def test_pure_search():
+    """The show_rooms response is built from the ranked posts, with a templated message"""
+    chatbot, llm_calls = make_fast_chatbot()
+    question = "Tìm phòng trọ ở Cầu Giấy giá từ 2 triệu đến 4 triệu"
+
+    started = time.perf_counter()
+    response = chatbot.process_question(question)
+    elapsed = time.perf_counter() - started
+
+    assert llm_calls == []
+    assert response["type"] == "show_rooms"
+    assert response["response"] == "Dưới đây là 5 phòng trọ tại Cầu Giấy, giá từ 2 triệu đến 4 triệu phù hợp với yêu cầu của bạn:"
+    assert [room["_id"] for room in response["rooms"]] == [doc["id"] for doc in response["sources"][:5]]
+    assert all(doc["location"].startswith("Cầu Giấy") and 2000000 <= doc["metadata"]["price_vnd"] <= 4000000
+               for doc in response["sources"])
+    assert response["rooms"][0]["similarity"] == response["sources"][0]["similarity"]
+    assert chatbot.fast_path_count == 1
+
+    # Streaming returns the same response in its final event
+    assert list(chatbot.process_question_stream(question)) == [("done", response)]
+    assert llm_calls == []
+    assert chatbot.fast_path_count == 2
+
+    # Counted once per response returned, also from concurrent requests
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        responses = list(executor.map(chatbot.process_question, [question] * 40))
+    assert all(concurrent == response for concurrent in responses)
+    assert chatbot.fast_path_count == 42
+
+    # Responses that fail to build are not fast path answers
+    build_answer = chatbot._build_answer
+    chatbot._build_answer = lambda answer, response_text: 1 / 0
+    assert chatbot.process_question(question)["type"] == "text"
+    chatbot._build_answer = build_answer
+    assert chatbot.fast_path_count == 42
+
+    print(f"[PASS] Pure search answered without the LLM in {elapsed * 1000:.1f} ms")
+
+
+def test_no_results_and_open_questions():
+    """A pure search without matches gets the templated apology; open-ended questions go to the LLM"""
+    chatbot, llm_calls = make_fast_chatbot()
+
+    response = chatbot.process_question("Tìm phòng trọ ở Tây Hồ")
+    assert response == {"response": NO_RESULTS_MESSAGE, "type": "text", "rooms": None, "sources": []}
+    assert llm_calls == []
+
+    for question in ["Phòng trọ nào ở Cầu Giấy rẻ nhất?", "Nên thuê phòng trọ ở Cầu Giấy hay Đống Đa?", "Xin chào"]:
+        assert chatbot.process_question(question)["response"] == "Câu trả lời của LLM"
+    assert len(llm_calls) == 3
+
+    chatbot.fast_path_enabled = False
+    chatbot.process_question("Tìm phòng trọ ở Cầu Giấy giá từ 2 triệu đến 4 triệu")
+    assert len(llm_calls) == 4
+
+    print("[PASS] No results and open-ended questions")
+
+
+def test_fast_path_message():
+    """Every criterion of the search is described"""
+    from chatbot import ChatBot
+    from query_parser import QueryIntent
+
+    intent = QueryIntent(is_rental_request=True, location="Đống Đa", price_range=(0, 5500000), area_range=(30, float('inf')),
+                         category="can-ho-mini", amenities=["có máy lạnh", "có ban công"])
+    assert ChatBot._fast_path_message(intent, 3) == (
+        "Dưới đây là 3 căn hộ mini tại Đống Đa, giá dưới 5,5 triệu, diện tích từ 30 m², có máy lạnh, có ban công "
+        "phù hợp với yêu cầu của bạn:"
+    )
+    intent = QueryIntent(is_rental_request=True, price_range=(2500000, 3500000), category="o-ghep")
+    assert ChatBot._fast_path_message(intent, 1) == "Dưới đây là 1 phòng ở ghép, giá từ 2,5 triệu đến 3,5 triệu phù hợp với yêu cầu của bạn:"
+
+    print("[PASS] Fast path message")
+
+
+if __name__ == "__main__":
+    test_pure_search()
+    test_no_results_and_open_questions()
+    test_fast_path_message()
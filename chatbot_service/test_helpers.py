@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Fixtures shared by the tests: throwaway vector stores (Chroma and numpy), posts, and chatbots
+answering with a fixed text instead of calling the LLM
+"""
+
+import sys
+import os
+import tempfile
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import chromadb
+from chromadb.config import Settings
+from chatbot import ChatBot
+from vector_backends import create_vector_client
+from vector_store import VectorStore
+
+
+def make_post(post_id, title, updated_at):
+    return {
+        "post_id": post_id,
+        "title": title,
+        "description": "Phòng sạch sẽ, gần chợ",
+        "location": "Thanh Xuân, Hà Nội",
+        "price": 2500000,
+        "area": 25,
+        "options": ["Có máy lạnh"],
+        "images": [],
+        "category": "phong-tro",
+        "updatedAt": updated_at,
+    }
+
+
+def make_store(posts):
+    """Vector store backed by a throwaway Chroma collection and the local fallback embedding"""
+    vector_store = VectorStore()
+    vector_store.persist_path = tempfile.mkdtemp()
+    vector_store.client = chromadb.PersistentClient(path=vector_store.persist_path, settings=Settings(anonymized_telemetry=False))
+    vector_store.collection = vector_store.client.create_collection(vector_store.collection_name, metadata={"hnsw:space": "cosine"})
+
+    embedded = []
+
+    def embed_texts(texts):
+        embedded.extend(texts)
+        return [vector_store.simple_text_embedding(text) for text in texts]
+
+    vector_store.embed_texts = embed_texts
+    vector_store.iter_post_pages_from_api = lambda: iter([[dict(post) for post in posts]])
+    return vector_store, embedded
+
+
+def open_other_worker(vector_store):
+    """A second store on the same files, as another worker process opens them"""
+    other = VectorStore()
+    other.persist_path = vector_store.persist_path
+    other.client = create_vector_client("chroma", other.persist_path)
+    other.collection = other.client.get_collection(vector_store.active_collection_name)
+    other.lexical_index = other._build_lexical_index(other.collection)
+    other._mark_generation_loaded()
+    return other
+
+
+class FakeEmbeddings:
+    """Stands in for openai_client.embeddings, counting API requests"""
+
+    def __init__(self, vector_store):
+        self.vector_store = vector_store
+        self.requests = []
+
+    def create(self, input, model):
+        self.requests.append(list(input))
+        return SimpleNamespace(data=[SimpleNamespace(embedding=self.vector_store.simple_text_embedding(text)) for text in input])
+
+
+def make_indexed_store(posts):
+    """Vector store on the numpy backend with the posts indexed, and its FakeEmbeddings"""
+    vector_store = VectorStore()
+    vector_store.persist_path = tempfile.mkdtemp()
+    vector_store.client = create_vector_client("numpy", vector_store.persist_path)
+    vector_store.collection = vector_store.client.create_collection(vector_store.collection_name)
+    embeddings = FakeEmbeddings(vector_store)
+    vector_store.openai_client = SimpleNamespace(embeddings=embeddings)
+    vector_store.iter_post_pages_from_api = lambda: iter([[dict(post) for post in posts]])
+    vector_store.index_posts_from_api()
+    embeddings.requests.clear()
+    return vector_store, embeddings
+
+
+def make_posts():
+    locations = ["Thanh Xuân", "Cầu Giấy", "Đống Đa", "Hoàng Mai"]
+    return [{
+        "post_id": f"p{i}",
+        "title": f"Phòng trọ {locations[i % 4]} số {i}",
+        "description": "Phòng sạch sẽ",
+        "location": f"{locations[i % 4]}, Hà Nội",
+        "price": 1000000 + i * 100000,
+        "area": 15 + i,
+        "category": "phong-tro",
+        "updatedAt": "2025-01-01T00:00:00Z",
+    } for i in range(40)]
+
+
+def split_chunks(text, size=5):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class FakeOpenAICompletions:
+    """Stands in for llm_client.chat.completions, answering with a fixed text"""
+
+    def __init__(self, answer, usage=None):
+        self.answer = answer
+        self.usage = usage
+        self.calls = []
+
+    def create(self, stream=False, **params):
+        self.calls.append(dict(params, stream=stream))
+        if not stream:
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.answer))], usage=self.usage)
+        chunks = [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=chunk))])
+                  for chunk in split_chunks(self.answer)]
+        chunks.append(SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None))]))
+        if params.get("stream_options", {}).get("include_usage"):
+            # The usage comes in a last chunk without choices
+            chunks.append(SimpleNamespace(choices=[], usage=self.usage))
+        return iter(chunks)
+
+
+class FakeGeminiModel:
+    """Stands in for a Gemini GenerativeModel, answering with a fixed text"""
+
+    def __init__(self, answer):
+        self.answer = answer
+
+    def start_chat(self):
+        return self
+
+    def send_message(self, prompt, stream=False, **params):
+        assert stream
+        return iter([SimpleNamespace(text=chunk) for chunk in split_chunks(self.answer)])
+
+
+def make_chatbot(answer, use_openai=True, vector_store=None):
+    if vector_store is None:
+        vector_store, _ = make_indexed_store(make_posts())
+    chatbot = ChatBot(vector_store)
+    # Every question reaches the LLM
+    chatbot.response_cache = None
+    chatbot.fast_path_enabled = False
+    chatbot.use_openai = use_openai
+    if use_openai:
+        chatbot.model = "gpt-3.5-turbo"
+        chatbot.llm_client = SimpleNamespace(chat=SimpleNamespace(completions=FakeOpenAICompletions(answer)))
+    else:
+        chatbot.model = FakeGeminiModel(answer)
+    return chatbot
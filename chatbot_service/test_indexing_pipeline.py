@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Test the indexing pipeline (token-aware batching, backoff on rate limits, concurrent embed/write)
+"""
+
+import sys
+import os
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from indexing_pipeline import AdaptiveBackoff, IndexingPipeline, TokenBatcher
+
+
+class FakeRateLimitError(Exception):
+    status_code = 429
+    response = None
+
+
+def test_token_batching():
+    """Batches are split by item count and by token budget"""
+    batcher = TokenBatcher("text-embedding-ada-002", max_batch_size=3, max_batch_tokens=10**6)
+    records = [(str(i), f"phòng trọ số {i}", {}) for i in range(7)]
+    assert [len(batch) for batch in batcher.iter_batches(records)] == [3, 3, 1]
+
+    long_text = "phòng trọ giá rẻ gần đại học " * 50
+    budget = batcher.count_tokens(long_text) * 2
+    batcher = TokenBatcher("text-embedding-ada-002", max_batch_size=100, max_batch_tokens=budget)
+    records = [(str(i), long_text, {}) for i in range(5)]
+    assert [len(batch) for batch in batcher.iter_batches(records)] == [2, 2, 1]
+    print("[PASS] Token-aware batching")
+
+
+def test_backoff_retries_rate_limits():
+    """429 responses are retried, other errors are raised immediately"""
+    backoff = AdaptiveBackoff(max_retries=3, base_delay=0.01, max_delay=0.05)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise FakeRateLimitError("rate limited")
+        return "ok"
+
+    assert backoff.call(flaky) == "ok"
+    assert backoff.retries == 2
+
+    def broken():
+        raise ValueError("bad input")
+
+    try:
+        backoff.call(broken)
+        assert False, "ValueError should not be retried"
+    except ValueError:
+        pass
+    print("[PASS] Backoff retries 429 and raises other errors")
+
+
+def test_pipeline_embeds_and_writes_everything():
+    """All records are embedded by the workers and written by the writer thread"""
+    batcher = TokenBatcher("text-embedding-ada-002", max_batch_size=4, max_batch_tokens=10**6)
+    embed_threads = set()
+    written = {}
+    write_threads = set()
+
+    def embed(texts):
+        embed_threads.add(threading.current_thread().name)
+        return [[float(len(text))] for text in texts]
+
+    def write(ids, embeddings, metadatas):
+        write_threads.add(threading.current_thread().name)
+        for doc_id, embedding, metadata in zip(ids, embeddings, metadatas):
+            written[doc_id] = (embedding, metadata)
+
+    records = ((str(i), "x" * i, {"n": i}) for i in range(50))
+    count = IndexingPipeline(embed, batcher, max_workers=3).run(records, write, total=50)
+
+    assert count == 50
+    assert written["7"] == ([7.0], {"n": 7})
+    assert write_threads == {"index-writer"}
+    assert all(name.startswith("embed-worker") for name in embed_threads)
+    print("[PASS] Pipeline embeds and writes every record")
+
+
+def test_pipeline_raises_embedding_errors():
+    """A failing embedding batch fails the whole run"""
+    batcher = TokenBatcher("text-embedding-ada-002", max_batch_size=2, max_batch_tokens=10**6)
+
+    def embed(texts):
+        raise RuntimeError("embedding service down")
+
+    try:
+        IndexingPipeline(embed, batcher).run([("1", "a", {}), ("2", "b", {})], lambda *args: None)
+        assert False, "RuntimeError should propagate"
+    except RuntimeError:
+        pass
+    print("[PASS] Pipeline raises embedding errors")
+
+
+if __name__ == "__main__":
+    test_token_batching()
+    test_backoff_retries_rate_limits()
+    test_pipeline_embeds_and_writes_everything()
+    test_pipeline_raises_embedding_errors()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Test hybrid retrieval: the BM25 index over post text (accent-folded syllables and
+bigrams), kept in step with indexing, and its fusion with the vector ranking
+"""
+
+import sys
+import os
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from lexical_index import BM25Index, rrf_fuse, tokenize
+from vector_backends import create_vector_client
+from vector_store import VectorStore
+
+
+def make_hybrid_store(posts):
+    """Store whose embeddings ignore the location, as when it is diluted in a long question"""
+    vector_store = VectorStore()
+    vector_store.persist_path = tempfile.mkdtemp()
+    vector_store.client = create_vector_client("numpy", vector_store.persist_path)
+    vector_store.collection = vector_store.client.create_collection(vector_store.collection_name)
+    # Post i ranks i-th for every query
+    vector_store.embed_texts = lambda texts: [[1.0, int(text.split()[2]) * 0.05] for text in texts]
+    vector_store.embed_query = lambda query: [1.0, 0.0]
+    vector_store.embed_queries = lambda queries: [[1.0, 0.0] for _ in queries]
+    vector_store.iter_post_pages_from_api = lambda: iter([[dict(post) for post in posts]])
+    vector_store.index_posts_from_api()
+    return vector_store
+
+
+def make_posts():
+    return [{
+        "post_id": f"p{i}",
+        "title": f"Phòng số {i}",
+        "location": "Phú Lương, Hà Đông, Hà Nội" if i in (17, 33) else "Phú Diễn, Bắc Từ Liêm, Hà Nội",
+        "price": 2000000 + i * 100000,
+        "area": 20,
+        "category": "phong-tro",
+        "updatedAt": "2025-01-01T00:00:00Z",
+    } for i in range(40)]
+
+
+def test_tokenize_and_bm25():
+    """Queries match without accents, bigrams favour the exact place name, updates replace postings"""
+    assert tokenize("Phòng trọ Thanh Xuân, Hà Nội") == \
+        ["phong", "tro", "thanh", "xuan", "phong_tro", "tro_thanh", "thanh_xuan", "ha", "noi", "ha_noi"]
+
+    index = BM25Index()
+    index.add("a", "Phòng trọ Phú Lương, Hà Đông")
+    index.add("b", "Phòng trọ Phú Diễn, gần Lương Thế Vinh")
+    index.add("c", "Căn hộ mini Thanh Xuân")
+    index.add("d", "Phòng trọ Cầu Giấy")
+    index.add("e", "Phòng trọ Đống Đa")
+    assert [doc_id for doc_id, _ in index.search("phu luong")] == ["a", "b"]
+    # Terms in most documents are skipped
+    assert index.search("phòng trọ") == []
+    assert [doc_id for doc_id, _ in index.search("phu luong", min_relative_score=0.5)] == ["a"]
+    assert index.search("thanh xuân")[0][0] == "c"
+
+    index.add("c", "Căn hộ mini Cầu Giấy")
+    assert index.search("thanh xuân") == [] and len(index) == 5
+    index.remove(["a", "b", "c", "d", "e"])
+    assert index.stats() == {"documents": 0, "terms": 0} and index._total_length == 0
+
+    assert rrf_fuse([["x", "y"], ["y", "z"]], k=60)[0][0] == "y"
+
+    print("[PASS] Tokenizer and BM25 index")
+
+
+def test_hybrid_search_recall():
+    """Posts naming the place rank first although the vector ranking puts them deep down"""
+    vector_store = make_hybrid_store(make_posts())
+
+    started = time.perf_counter()
+    results = vector_store.search("phòng trọ ở phú lương giá rẻ", top_k=5)
+    elapsed = time.perf_counter() - started
+    # Ranked first lexically, so level with the best vector match; posts only sharing "phú" are no lexical match
+    assert [doc["id"] for doc in results] == ["p0", "p17", "p1", "p33", "p2"]
+    assert results[1]["rrf_score"] == results[0]["rrf_score"]
+    # Similarity of a lexical-only match comes from its stored embedding
+    assert abs(results[1]["similarity"] - 1 / (1 + 0.85 ** 2) ** 0.5) < 1e-4
+
+    # Filters apply to lexical matches too
+    results = vector_store.search("phòng trọ ở phú lương", top_k=5, filters={"max_price": 4000000})
+    assert "p33" not in {doc["id"] for doc in results} and results[1]["id"] == "p17"
+    assert vector_store.search_many(["phòng trọ ở phú lương"], top_k=5, filters={"max_price": 4000000})[0] == results
+
+    # Without the lexical index only the vector ranking is used
+    vector_store.hybrid_search_enabled = False
+    vector_store.lexical_index = None
+    assert [doc["id"] for doc in vector_store.search("phòng trọ ở phú lương", top_k=5)] == ["p0", "p1", "p2", "p3", "p4"]
+
+    print(f"[PASS] Hybrid search ranks exact place names first ({elapsed * 1000:.1f} ms)")
+
+
+def test_index_kept_in_step():
+    """Incremental reindexes update the index, forced ones and rollbacks switch it with the collection"""
+    posts = make_posts()
+    vector_store = make_hybrid_store(posts)
+
+    posts[0]["location"] = "Phú Lương, Hà Đông, Hà Nội"
+    posts[0]["updatedAt"] = "2025-06-01T00:00:00Z"
+    del posts[17]
+    vector_store.iter_post_pages_from_api = lambda: iter([[dict(post) for post in posts]])
+    vector_store.index_posts_from_api(incremental=True)
+    assert vector_store.last_index_stats["updated"] == 1 and vector_store.last_index_stats["removed"] == 1
+    assert {doc_id for doc_id, _ in vector_store.lexical_index.search("phú lương", min_relative_score=0.1)} == {"p0", "p33"}
+
+    old_index = vector_store.lexical_index
+    posts[1]["location"] = "Phú Lương, Hà Đông, Hà Nội"
+    vector_store.index_posts_from_api(force=True)
+    assert vector_store.lexical_index is not old_index and len(vector_store.lexical_index) == 39
+    assert {doc_id for doc_id, _ in vector_store.lexical_index.search("phú lương", min_relative_score=0.1)} == {"p0", "p1", "p33"}
+
+    vector_store.rollback_collection()
+    assert {doc_id for doc_id, _ in vector_store.lexical_index.search("phú lương", min_relative_score=0.1)} == {"p0", "p33"}
+    assert vector_store.get_cache_stats()["lexical_index"]["documents"] == 39
+
+    print("[PASS] Lexical index kept in step with the collection")
+
+
+if __name__ == "__main__":
+    test_tokenize_and_bm25()
+    test_hybrid_search_recall()
+    test_index_kept_in_step()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Test the logging setup: records written by a background thread and formatted there,
+request IDs carried by the records and the responses, and sampled verbose lines
+"""
+
+import sys
+import os
+import time
+import logging
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import log_config
+from log_config import LOG_FORMAT, create_queue_handler, set_request_id, verbose_enabled
+
+
+class SlowHandler(logging.Handler):
+    """Handler taking as long as a congested stderr or log collector, recording what it formats"""
+
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+        self.lines = []
+        self.threads = []
+        self.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    def emit(self, record):
+        time.sleep(self.delay)
+        self.lines.append(self.format(record))
+        self.threads.append(threading.current_thread().name)
+
+
+def make_logger(name, handler):
+    """Logger writing to handler through the queue, not propagating to the root logger"""
+    queue_handler, listener = create_queue_handler(handler)
+    logger = logging.getLogger(name)
+    logger.handlers = [queue_handler]
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    return logger, listener
+
+
+def test_async_logging():
+    """Logging does not wait for a slow handler; records are formatted on the listener thread"""
+    handler = SlowHandler(0.01)
+    logger, listener = make_logger("test_log_config.async", handler)
+
+    started = time.perf_counter()
+    for i in range(20):
+        logger.info("Line %d: %.5s", i, "truncated")
+    elapsed = time.perf_counter() - started
+    listener.stop()  # Writes the queued records
+
+    assert elapsed < 0.05, elapsed  # Writing them takes 0.2s
+    assert len(handler.lines) == 20
+    assert handler.lines[3].endswith("Line 3: trunc")
+    assert len(set(handler.threads)) == 1 and threading.current_thread().name not in handler.threads
+
+    print(f"[PASS] Async logging: 20 records in {elapsed * 1e3:.2f}ms")
+
+
+def test_request_ids():
+    """Each thread's records carry the request ID set in that thread"""
+    handler = SlowHandler(0)
+    logger, listener = make_logger("test_log_config.ids", handler)
+
+    def handle(request_id):
+        set_request_id(request_id)
+        time.sleep(0.01)
+        logger.info("Handled %s", request_id)
+
+    threads = [threading.Thread(target=handle, args=(f"req-{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    listener.stop()
+
+    assert len(handler.lines) == 4
+    for line in handler.lines:
+        request_id = line.rsplit(" ", 1)[-1]
+        assert f"[{request_id}]" in line, line
+
+    # Missing or unsafe IDs are replaced
+    assert set_request_id("abc-123") == "abc-123"
+    assert len(set_request_id(None)) == 16
+    assert set_request_id("forged\nINFO line") != "forged\nINFO line"
+
+    print("[PASS] Request IDs in records")
+
+
+def test_verbose_sampling():
+    """Per-document lines are only logged for the sampled requests, and only at DEBUG"""
+    logger = logging.getLogger("test_log_config.sampling")
+    logger.setLevel(logging.DEBUG)
+    sample_rate = log_config.verbose_sample_rate
+    try:
+        log_config.verbose_sample_rate = 0.0
+        set_request_id()
+        assert not verbose_enabled(logger)
+
+        log_config.verbose_sample_rate = 1.0
+        set_request_id()
+        assert verbose_enabled(logger)
+        logger.setLevel(logging.INFO)
+        assert not verbose_enabled(logger)
+
+        log_config.verbose_sample_rate = 0.25
+        sampled = 0
+        for _ in range(4000):
+            set_request_id()
+            sampled += log_config._verbose.get()
+        assert 800 < sampled < 1200, sampled
+    finally:
+        log_config.verbose_sample_rate = sample_rate
+
+    print("[PASS] Verbose lines sampled")
+
+
+def test_request_id_header():
+    """Flask responses carry the request ID, the caller's when it sent one"""
+    import main
+
+    client = main.create_app().test_client()
+    response = client.get("/health", headers={"X-Request-ID": "client-42"})
+    assert response.headers["X-Request-ID"] == "client-42"
+    generated = client.get("/health").headers["X-Request-ID"]
+    assert generated and generated != "client-42"
+
+    print("[PASS] X-Request-ID header")
+
+
+if __name__ == "__main__":
+    test_async_logging()
+    test_request_ids()
+    test_verbose_sampling()
+    test_request_id_header()
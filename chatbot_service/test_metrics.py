@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Test the metrics: Prometheus text rendering, per-stage timers recorded while answering
+a chat, the /metrics endpoint, the metrics of several worker processes and the overhead
+of the instrumentation
+"""
+
+import sys
+import os
+import time
+import tempfile
+import threading
+import multiprocessing
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from metrics import STAGE_SECONDS, MetricsRegistry, render_directory
+from test_helpers import make_chatbot
+
+
+def test_render():
+    """Histograms are rendered with cumulative buckets, sum and count per label"""
+    registry = MetricsRegistry()
+    histogram = registry.histogram("demo_seconds", "Demo", label="stage", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(value, "parse")
+    counter = registry.counter("demo_total", "Demo counter", label="type")
+    counter.inc(3, 'say "hi"')
+    registry.gauge("demo_size", "Demo gauge", lambda: 7)
+    registry.gauge("demo_broken", "Fails", lambda: 1 / 0)
+
+    assert registry.render().splitlines() == [
+        "# HELP demo_seconds Demo",
+        "# TYPE demo_seconds histogram",
+        'demo_seconds_bucket{stage="parse",le="0.1"} 1',
+        'demo_seconds_bucket{stage="parse",le="1"} 3',
+        'demo_seconds_bucket{stage="parse",le="+Inf"} 4',
+        'demo_seconds_sum{stage="parse"} 4.05',
+        'demo_seconds_count{stage="parse"} 4',
+        "# HELP demo_total Demo counter",
+        "# TYPE demo_total counter",
+        'demo_total{type="say \\"hi\\""} 3',
+        "# HELP demo_size Demo gauge",
+        "# TYPE demo_size gauge",
+        "demo_size 7",
+    ]
+
+    print("[PASS] Prometheus rendering")
+
+
+def test_chat_stages():
+    """Every stage of a chat answered by the LLM is timed, and the tokens are counted"""
+    import main
+    from chatbot import CHAT_SECONDS, LLM_TOKENS
+
+    chatbot = make_chatbot("Đây là các phòng ở Cầu Giấy.")
+    stages = ["parse", "embed_query", "vector_query", "lexical", "filter", "build_prompt", "llm"]
+    before = {stage: STAGE_SECONDS.count(stage) for stage in stages}
+    answers, tokens = CHAT_SECONDS.count("llm"), LLM_TOKENS.value("prompt")
+
+    chatbot.process_question("Tìm phòng trọ ở Cầu Giấy")
+    assert all(STAGE_SECONDS.count(stage) > before[stage] for stage in stages), \
+        {stage: STAGE_SECONDS.count(stage) - before[stage] for stage in stages}
+    assert CHAT_SECONDS.count("llm") == answers + 1
+    assert LLM_TOKENS.value("prompt") > tokens
+
+    first_tokens = STAGE_SECONDS.count("llm_first_token")
+    list(chatbot.process_question_stream("Tìm phòng trọ ở Cầu Giấy"))
+    assert STAGE_SECONDS.count("llm_first_token") == first_tokens + 1
+
+    body = main.app.test_client().get("/metrics").get_data(as_text=True)
+    assert 'chatbot_stage_seconds_bucket{stage="parse",le="+Inf"}' in body
+    assert 'chatbot_chat_seconds_count{answered_by="llm"}' in body
+    assert 'chatbot_llm_tokens_total{type="completion"}' in body
+    assert "chatbot_reindex_running 0" in body
+
+    # With several workers, a scrape reports all of them
+    main.METRICS_DIR = tempfile.mkdtemp()
+    try:
+        body = main.app.test_client().get("/metrics").get_data(as_text=True)
+    finally:
+        main.METRICS_DIR = None
+    assert f'chatbot_reindex_running{{pid="{os.getpid()}"}} 0' in body
+    assert 'chatbot_chat_seconds_count{answered_by="llm"}' in body
+
+    print("[PASS] Chat stages timed")
+
+
+def make_worker_registry():
+    registry = MetricsRegistry()
+    return (registry, registry.counter("demo_requests_total", "Requests", label="route"),
+            registry.histogram("demo_seconds", "Latency", buckets=(0.1, 1.0)),
+            registry.gauge("demo_entries", "Entries", lambda: 5))
+
+
+def run_worker(directory, requests):
+    """A worker process: serves requests, saves its metrics and exits"""
+    registry, counter, histogram, _ = make_worker_registry()
+    for _ in range(requests):
+        counter.inc(1, "/chat")
+        histogram.observe(0.5)
+    registry.write_snapshot(directory)
+
+
+def test_multiprocess_metrics():
+    """A scrape adds up the counters and histograms of every worker, exited ones included, and reports
+    the gauges of the live workers by pid"""
+    directory = tempfile.mkdtemp()
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=run_worker, args=(directory, requests)) for requests in (2, 3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+
+    registry, counter, histogram, _ = make_worker_registry()
+    counter.inc(1, "/chat")
+    histogram.observe(0.05)
+    registry.write_snapshot(directory)
+
+    assert render_directory(directory).splitlines() == [
+        "# HELP demo_requests_total Requests",
+        "# TYPE demo_requests_total counter",
+        'demo_requests_total{route="/chat"} 6',
+        "# HELP demo_seconds Latency",
+        "# TYPE demo_seconds histogram",
+        'demo_seconds_bucket{le="0.1"} 1',
+        'demo_seconds_bucket{le="1"} 6',
+        'demo_seconds_bucket{le="+Inf"} 6',
+        "demo_seconds_sum 2.55",
+        "demo_seconds_count 6",
+        "# HELP demo_entries Entries",
+        "# TYPE demo_entries gauge",
+        f'demo_entries{{pid="{os.getpid()}"}} 5',
+    ]
+
+    print("[PASS] Metrics of several worker processes")
+
+
+def measure_overhead(histogram) -> float:
+    stages = ("parse", "embed_query", "vector_query", "lexical", "filter", "build_prompt", "llm", "a", "b", "c")
+    rounds = 2000
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for stage in stages:
+            with histogram.time(stage):
+                pass
+    return (time.perf_counter() - started) / rounds
+
+
+def test_overhead():
+    """The timers of one chat (about ten stages) cost well under 50µs, also while the metrics are saved
+    for the other workers (every 10ms here, every METRICS_WRITE_INTERVAL_SECONDS when serving)"""
+    registry = MetricsRegistry()
+    histogram = registry.histogram("overhead_seconds", "Overhead", label="stage")
+    per_request = measure_overhead(histogram)
+    assert per_request < 50e-6, per_request
+
+    directory = tempfile.mkdtemp()
+    stop = threading.Event()
+
+    def write_snapshots():
+        while not stop.wait(0.01):
+            registry.write_snapshot(directory)
+
+    writer = threading.Thread(target=write_snapshots)
+    writer.start()
+    try:
+        multiprocess_per_request = measure_overhead(histogram)
+    finally:
+        stop.set()
+        writer.join()
+    assert multiprocess_per_request < 50e-6, multiprocess_per_request
+    assert "overhead_seconds_count" in render_directory(directory)
+
+    print(f"[PASS] Instrumentation overhead: {per_request * 1e6:.1f}µs per request, "
+          f"{multiprocess_per_request * 1e6:.1f}µs while saving the metrics for other workers")
+
+
+if __name__ == "__main__":
+    test_render()
+    test_chat_stages()
+    test_multiprocess_metrics()
+    test_overhead()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Test the post features parsed at index time (amenity IDs) and filtering retrieved
+documents with the feature table
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from document_builder import build_document
+from post_features import AMENITY_IDS, PostFeatureTable, amenity_mask, amenity_matches
+from vector_store import VectorStore
+
+
+def as_search_results(posts):
+    metadatas = [build_document(post)[2] for post in posts]
+    return VectorStore._format_query_results({"metadatas": [metadatas], "documents": None, "distances": [[0.1] * len(posts)]}, 0)
+
+
+def test_amenity_ids():
+    """Options are mapped to canonical amenities, including through synonyms"""
+    mask = amenity_mask(["Điều hòa", "Gác lửng", "Camera an ninh"])
+    for amenity in ("có máy lạnh", "có gác", "có an ninh"):
+        assert mask & (1 << AMENITY_IDS[amenity])
+    assert not mask & (1 << AMENITY_IDS["có máy giặt"])
+    assert amenity_mask([]) == 0
+
+    assert amenity_matches("máy lạnh", ["điều hòa"])
+    assert not amenity_matches("thang máy", ["máy giặt"])
+
+    metadata = build_document({"post_id": "p1", "options": ["Có máy giặt", "Có thang máy"]})[2]
+    assert metadata["amenity_mask"] == (1 << AMENITY_IDS["có máy giặt"]) | (1 << AMENITY_IDS["có thang máy"])
+
+    print("[PASS] Amenity IDs")
+
+
+def test_feature_table_filter():
+    """Every criterion is applied, on new and on previously indexed documents"""
+    posts = [
+        {"post_id": "p1", "location": "Nguyễn Trãi, Thanh Xuân, Hà Nội", "price": "2,5 triệu", "area": 20,
+         "options": ["Có máy lạnh", "Có gác"], "category": "phong-tro"},
+        {"post_id": "p2", "location": "Xuân Thủy, Cầu Giấy, Hà Nội", "price": 4500000, "area": "35 m2",
+         "options": ["Điều hòa"], "category": "Căn hộ mini"},
+        {"post_id": "p3", "location": "Thanh Xuân Bắc, Hà Nội", "price": 3000000, "area": 25,
+         "options": [], "category": "phong-tro"},
+    ]
+    docs = as_search_results(posts)
+    table = PostFeatureTable(docs)
+
+    def ids(**criteria):
+        return [doc["id"] for doc in table.filter(docs, **criteria)]
+
+    assert ids() == ["p1", "p2", "p3"]
+    assert ids(location="Cầu Giấy") == ["p2"]
+    # Half of the location words are enough ("Xuân" is in "Xuân Thủy" too)
+    assert ids(location="Thanh Xuân") == ["p1", "p2", "p3"]
+    assert ids(price_range=(2000000, 3000000)) == ["p1", "p3"]
+    assert ids(area_range=(30, float('inf'))) == ["p2"]
+    assert ids(category="can-ho-mini") == ["p2"]
+    assert ids(amenities=["có máy lạnh"]) == ["p1", "p2"]
+    assert ids(amenities=["có máy lạnh", "có gác"]) == ["p1"]
+    # Amenities outside the canonical list are matched against the options
+    assert ids(amenities=["điều hòa"]) == ["p1", "p2"]
+    assert ids(location="Thanh Xuân", price_range=(0, 2800000), amenities=["có gác"]) == ["p1"]
+
+    # Documents indexed before the numeric and amenity metadata existed are parsed when the table is built
+    for doc in docs:
+        for key in ("price_vnd", "area_m2", "amenity_mask"):
+            del doc["metadata"][key]
+    table = PostFeatureTable(docs)
+    assert ids(price_range=(2000000, 3000000), amenities=["có máy lạnh"]) == ["p1"]
+    assert ids(area_range=(30, 40)) == ["p2"]
+
+    assert PostFeatureTable([]).filter([], location="Hà Nội") == []
+
+    print("[PASS] Feature table filter")
+
+
+if __name__ == "__main__":
+    test_amenity_ids()
+    test_feature_table_filter()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Test the question parser (location, price, area, category, amenities in one pass)
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from query_parser import QueryIntent, QueryParser, parse_query
+
+
+def test_parse_full_question():
+    """Every criterion is extracted from a single question"""
+    intent = parse_query("Tìm phòng trọ ở Thanh Xuân giá từ 2 triệu đến 4 triệu, diện tích từ 20-30 m2, có máy lạnh và có gác")
+    assert intent == QueryIntent(
+        is_rental_request=True,
+        location="Thanh Xuân",
+        price_range=(2000000.0, 4000000.0),
+        area_range=(20.0, 30.0),
+        category="phong-tro",
+        amenities=["có gác", "có máy lạnh"],
+    )
+    print("[PASS] Full question")
+
+
+def test_parse_fields():
+    """Each field keeps the behaviour of the former ChatBot extraction methods"""
+    parser = QueryParser()
+
+    assert parser.parse("từ 2 triệu đến 4 triệu").price_range == (2000000.0, 4000000.0)
+    assert parser.parse("ngân sách khoảng 3,5 triệu").price_range == (3000000.0, 4000000.0)
+    assert parser.parse("từ 2000000 đến 3500000").price_range == (2000000, 3500000)
+    # Single amounts get a ±500k window, even after "dưới"/"trên" (as before)
+    assert parser.parse("phòng dưới 3 triệu").price_range == (2500000.0, 3500000.0)
+    assert parser.parse("giá trên 5tr").price_range == (4500000.0, 5500000.0)
+    assert parser.parse("phòng đẹp").price_range is None
+
+    assert parser.parse("diện tích từ 20-30 m2").area_range == (20.0, 30.0)
+    assert parser.parse("20m2 đến 25m2").area_range == (20.0, 25.0)
+    assert parser.parse("giá 3 triệu").area_range is None
+
+    assert parser.parse("cần thuê nhà nguyên căn tại quận 7").category == "nha-nguyen-can"
+    assert parser.parse("tìm người ở ghép").category == "o-ghep"
+    # Keyword tables are checked in order, so the broader "căn hộ" wins over "căn hộ mini"
+    assert parser.parse("căn hộ mini").category == "can-ho-chung-cu"
+
+    assert parser.parse("thuê nhà ở Gò Vấp, có điều hòa").location == "Gò Vấp"
+    assert parser.parse("phòng khu vực Đống Đa giá rẻ").location == "Đống Đa"
+    assert parser.parse("Xin chào").location == ""
+
+    assert parser.parse("an ninh tốt, bảo vệ 24/7, máy giặt").amenities == ["có an ninh", "có máy giặt"]
+    assert parser.parse("Xin chào, bạn là ai?").is_rental_request is False
+    assert parser.parse("room for rent").is_rental_request is True
+
+    # Pure searches can be answered by listing posts; advice and comparisons cannot
+    assert parser.parse("Có phòng trọ nào ở Cầu Giấy dưới 3 triệu không?").is_pure_search
+    assert not parser.parse("Phòng nào rẻ nhất ở Thanh Xuân?").is_pure_search
+    assert parser.parse("Nên thuê phòng ở Cầu Giấy hay Đống Đa?").is_open_question
+    assert not parser.parse("Xin chào").is_pure_search
+
+    # The per-field helpers give the same answers as parse
+    question = "Có căn hộ mini nào ở Cầu Giấy có máy lạnh không?"
+    intent = parser.parse(question)
+    assert parser.extract_location(question) == intent.location == "Cầu Giấy"
+    assert parser.extract_amenities(question) == intent.amenities == ["có máy lạnh"]
+    assert parser.extract_category(question) == intent.category
+    assert parser.is_rental_request(question) == intent.is_rental_request
+
+    print("[PASS] Individual fields")
+
+
+if __name__ == "__main__":
+    test_parse_full_question()
+    test_parse_fields()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Test reindexing: incremental updates (only new/changed posts are embedded, removed posts are deleted),
+paginated ingestion from the API and blue/green swaps on forced reindexes
+"""
+
+import sys
+import os
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from indexing_pipeline import AdaptiveBackoff
+from test_helpers import make_post, make_store
+from vector_store import VectorStore
+
+
+def test_incremental_index():
+    """Only new or changed posts are embedded and missing posts are removed"""
+    posts = [
+        make_post("p1", "Phòng trọ 1", "2025-01-01T00:00:00Z"),
+        make_post("p2", "Phòng trọ 2", "2025-01-01T00:00:00Z"),
+        make_post("p3", "Phòng trọ 3", "2025-01-01T00:00:00Z"),
+    ]
+    vector_store, embedded = make_store(posts)
+
+    count = vector_store.index_posts_from_api(incremental=True)
+    assert count == 3
+    assert vector_store.last_index_stats == {"added": 3, "updated": 0, "removed": 0, "skipped": 0}
+
+    # Nothing changed: nothing is embedded again
+    embedded.clear()
+    count = vector_store.index_posts_from_api(incremental=True)
+    assert count == 0
+    assert embedded == []
+    assert vector_store.last_index_stats == {"added": 0, "updated": 0, "removed": 0, "skipped": 3}
+
+    # p2 changed, p3 removed, p4 added
+    posts[1] = make_post("p2", "Phòng trọ 2 (mới sửa)", "2025-02-01T00:00:00Z")
+    posts[2] = make_post("p4", "Phòng trọ 4", "2025-02-01T00:00:00Z")
+    embedded.clear()
+    count = vector_store.index_posts_from_api(incremental=True)
+    assert count == 2
+    assert len(embedded) == 2
+    assert vector_store.last_index_stats == {"added": 1, "updated": 1, "removed": 1, "skipped": 1}
+
+    stored = vector_store.collection.get(include=['metadatas'])
+    titles = {doc_id: meta["title"] for doc_id, meta in zip(stored["ids"], stored["metadatas"])}
+    assert titles == {"p1": "Phòng trọ 1", "p2": "Phòng trọ 2 (mới sửa)", "p4": "Phòng trọ 4"}
+
+    print("[PASS] Incremental reindex only embeds new/changed posts and removes missing ones")
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+class FakeSession:
+    """Serves the post API's paginated response format (newest first, like the createdAt-desc sort).
+    before_page maps a page number to a function changing the posts before that page is served."""
+
+    def __init__(self, posts, fail_on_page=None, before_page=None):
+        self.posts = posts
+        self.fail_on_page = fail_on_page
+        self.before_page = before_page or {}
+        self.requested_pages = []
+
+    def get(self, url, params=None, timeout=None):
+        page, limit = params['page'], params['limit']
+        self.requested_pages.append(page)
+        if page == self.fail_on_page:
+            raise ConnectionError("API went away")
+        if page in self.before_page:
+            self.before_page[page](self.posts)
+        total_pages = (len(self.posts) + limit - 1) // limit
+        return FakeResponse({
+            "message": "Posts fetched successfully",
+            "metadata": {
+                "posts": [dict(post, _id=post["post_id"]) for post in self.posts[(page - 1) * limit:page * limit]],
+                "currentPage": page,
+                "totalPages": total_pages,
+                "totalPosts": len(self.posts),
+                "hasNextPage": page < total_pages
+            }
+        })
+
+
+def test_paginated_api_ingestion():
+    """Every API page is fetched and indexed; a failing page aborts without deleting anything"""
+    posts = [make_post(f"p{i}", f"Phòng trọ {i}", "2025-01-01T00:00:00Z") for i in range(25)]
+    vector_store, embedded = make_store(posts)
+    del vector_store.iter_post_pages_from_api  # use the real paginated fetcher
+    vector_store.api_page_size = 10
+    vector_store.http_session = FakeSession(posts)
+
+    pages = list(vector_store.iter_post_pages_from_api())
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert vector_store.http_session.requested_pages == [1, 2, 3]
+    assert len(vector_store.fetch_posts_from_api()) == 25
+
+    assert vector_store.index_posts_from_api(incremental=True) == 25
+    assert vector_store.collection.count() == 25
+
+    # The second page fails: the run raises and no post is treated as removed
+    vector_store.http_session = FakeSession(posts[:5], fail_on_page=2)
+    vector_store.api_page_size = 3
+    try:
+        vector_store.index_posts_from_api(incremental=True)
+        assert False, "a failing page must abort the reindex"
+    except ConnectionError:
+        pass
+    assert vector_store.collection.count() == 25
+
+    print("[PASS] Paginated API ingestion indexes every page and aborts safely")
+
+
+def test_posts_changing_while_paging():
+    """A post added between two page fetches pushes a post onto the next page too, which is then
+    written once in every mode; a post deleted between two page fetches pulls a post back onto a
+    page already read, so the incremental run removes nothing"""
+    posts = [make_post(f"p{i}", f"Phòng trọ {i}", "2025-01-01T00:00:00Z") for i in range(25)]
+
+    def add_post(served_posts):
+        served_posts.insert(0, make_post("new", "Phòng trọ mới", "2025-02-01T00:00:00Z"))
+
+    for mode in ({}, {"force": True}, {"incremental": True}):
+        vector_store, embedded = make_store(posts)
+        del vector_store.iter_post_pages_from_api  # use the real paginated fetcher
+        vector_store.api_page_size = 10
+        # p9 is served at the end of page 1 and again at the start of page 2
+        vector_store.http_session = FakeSession(list(posts), before_page={2: add_post})
+        assert vector_store.index_posts_from_api(**mode) == 25
+        assert len(embedded) == 25
+        assert vector_store.collection.count() == 25
+
+    def delete_first_post(served_posts):
+        del served_posts[0]
+
+    # p0 is deleted after page 1 was read: p10 moves to page 1 and is never read, yet it is kept
+    vector_store.http_session = FakeSession(list(posts), before_page={2: delete_first_post})
+    vector_store.index_posts_from_api(incremental=True)
+    assert vector_store.http_session.requested_pages == [1, 2, 3]
+    assert vector_store.last_index_stats["removed"] == 0
+    assert vector_store.collection.get(ids=["p10"])["ids"] == ["p10"]
+
+    # The next run reads every post and removes p0
+    vector_store.http_session = FakeSession(posts[1:])
+    vector_store.index_posts_from_api(incremental=True)
+    assert vector_store.last_index_stats["removed"] == 1
+    assert vector_store.collection.get(ids=["p0"])["ids"] == []
+    assert vector_store.collection.count() == 24
+
+    print("[PASS] Posts added or deleted while paging are neither duplicated nor wrongly removed")
+
+
+def test_force_reindex_swaps_generations():
+    """A forced reindex builds a new generation while the live one keeps serving, then allows rollback"""
+    posts = [make_post(f"p{i}", f"Phòng trọ {i}", "2025-01-01T00:00:00Z") for i in range(5)]
+    vector_store, embedded = make_store(posts)
+    vector_store.index_posts_from_api()
+    live = vector_store.collection
+    live_counts_during_rebuild = []
+
+    def embed_texts(texts):
+        live_counts_during_rebuild.append(vector_store.collection.count())
+        return [vector_store.simple_text_embedding(text) for text in texts]
+
+    vector_store.embed_texts = embed_texts
+    posts.append(make_post("p5", "Phòng trọ 5", "2025-01-01T00:00:00Z"))
+    assert vector_store.index_posts_from_api(force=True) == 6
+
+    # Searches kept hitting the full old collection during the rebuild
+    assert live_counts_during_rebuild and all(count == 5 for count in live_counts_during_rebuild)
+    assert vector_store.collection.count() == 6
+    assert vector_store.previous_collection_name == live.name
+    first_generation = vector_store.active_collection_name
+
+    # The pointer survives a restart
+    restarted = VectorStore()
+    restarted.persist_path = vector_store.persist_path
+    restarted._load_generations()
+    assert restarted.active_collection_name == first_generation
+
+    # A second forced reindex drops the oldest generation
+    vector_store.index_posts_from_api(force=True)
+    names = {collection.name for collection in vector_store.client.list_collections()}
+    assert names == {first_generation, vector_store.active_collection_name}
+
+    assert vector_store.rollback_collection() == first_generation
+    assert vector_store.collection.name == first_generation
+
+    # A failing rebuild leaves the live generation untouched and cleans up after itself
+    def failing_embed_texts(texts):
+        raise RuntimeError("embedding service down")
+
+    vector_store.embed_texts = failing_embed_texts
+    try:
+        vector_store.index_posts_from_api(force=True)
+        assert False, "the failing rebuild must raise"
+    except RuntimeError:
+        pass
+    assert vector_store.collection.name == first_generation
+    assert len(vector_store.client.list_collections()) == 2
+
+    print("[PASS] Forced reindex swaps generations without downtime and supports rollback")
+
+
+class FakeServerError(Exception):
+    status_code = 503
+    response = None
+
+
+def test_embedding_outage_fails_the_run():
+    """Posts are never stored with the local fallback embedding: when the embedding API is down the
+    run fails, and the next incremental run embeds the posts it missed"""
+    posts = [make_post("p1", "Phòng trọ 1", "2025-01-01T00:00:00Z"), make_post("p2", "Phòng trọ 2", "2025-01-01T00:00:00Z")]
+    vector_store, _ = make_store(posts)
+    vector_store.index_posts_from_api()
+
+    # The real embed_texts, against an API that is down
+    del vector_store.embed_texts
+    vector_store.embedding_cache = None
+    vector_store.embedding_backoff = AdaptiveBackoff(max_retries=1, base_delay=0.01)
+    api_up = False
+
+    def create(input, model):
+        if not api_up:
+            raise FakeServerError("service unavailable")
+        return SimpleNamespace(data=[SimpleNamespace(embedding=vector_store.simple_text_embedding(text)) for text in input])
+
+    vector_store.openai_client = SimpleNamespace(embeddings=SimpleNamespace(create=create))
+    posts = [make_post("p1", "Phòng trọ 1", "2025-01-01T00:00:00Z"), make_post("p2", "Phòng trọ 2 đã sửa", "2025-02-01T00:00:00Z"),
+             make_post("p3", "Phòng trọ 3", "2025-02-01T00:00:00Z")]
+    vector_store.iter_post_pages_from_api = lambda: iter([[dict(post) for post in posts]])
+    try:
+        vector_store.index_posts_from_api(incremental=True)
+        assert False, "the run must fail while the embedding API is down"
+    except FakeServerError:
+        pass
+    assert vector_store.embedding_backoff.retries == 1
+    assert vector_store.collection.get(ids=["p3"])["ids"] == []
+    assert vector_store._get_indexed_versions()["p2"][0] == "2025-01-01T00:00:00Z"
+
+    api_up = True
+    vector_store.index_posts_from_api(incremental=True)
+    assert vector_store.last_index_stats["added"] == 1 and vector_store.last_index_stats["updated"] == 1
+
+    print("[PASS] An embedding outage fails the run instead of storing fallback vectors")
+
+
+def test_numeric_filters_are_pushed_down():
+    """Price/area/category filters run inside the vector query and return a full top_k"""
+    posts = []
+    for i in range(40):
+        post = make_post(f"p{i}", f"Phòng {i}", "2025-01-01T00:00:00Z")
+        post.update(price=1000000 + i * 100000, area=15 + i, category="phong-tro" if i % 2 else "Căn hộ mini")
+        posts.append(post)
+    vector_store, embedded = make_store(posts)
+    vector_store.embed_query = vector_store.simple_text_embedding
+    vector_store.index_posts_from_api()
+
+    assert vector_store.numeric_filters_enabled
+    stored = vector_store.collection.get(ids=["p10"], include=['metadatas'])['metadatas'][0]
+    assert stored["price_vnd"] == 2000000.0 and stored["area_m2"] == 25.0 and stored["category"] == "can-ho-mini"
+
+    filters = {"min_price": 2000000, "max_price": 4000000, "min_area": 20, "max_area": float('inf'), "category": "phong-tro"}
+    results = vector_store.search("phòng trọ", top_k=5, filters=filters)
+    assert len(results) == 5
+    for result in results:
+        metadata = result["metadata"]
+        assert 2000000 <= metadata["price_vnd"] <= 4000000 and metadata["area_m2"] >= 20
+        assert metadata["category"] == "phong-tro"
+
+    # Documents indexed before numeric metadata existed disable the pushdown instead of hiding them
+    vector_store.collection.add(ids=["legacy"], embeddings=[vector_store.simple_text_embedding("legacy")],
+                                metadatas=[{"post_id": "legacy", "price": "2500000", "updated_at": "x"}])
+    vector_store._refresh_numeric_filter_support()
+    assert not vector_store.numeric_filters_enabled
+    assert vector_store._build_where(filters) is None
+
+    # An incremental reindex rewrites the outdated documents and turns it back on
+    vector_store.index_posts_from_api(incremental=True)
+    assert vector_store.numeric_filters_enabled
+
+    print("[PASS] Numeric filters are pushed down into the vector query")
+
+
+if __name__ == "__main__":
+    test_incremental_index()
+    test_paginated_api_ingestion()
+    test_posts_changing_while_paging()
+    test_force_reindex_swaps_generations()
+    test_embedding_outage_fails_the_run()
+    test_numeric_filters_are_pushed_down()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Test reindex jobs: background runs with progress, merged and rejected concurrent requests,
+cancellation (also from another worker process) and the /reindex job routes
+"""
+
+import sys
+import os
+import json
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from reindex_jobs import ReindexConflict, ReindexJobManager, index_write_lock_path, try_lock_file
+from test_helpers import make_post, make_store
+
+
+def make_posts(count):
+    return [make_post(f"p{i}", f"Phòng trọ {i}", "2025-01-01T00:00:00Z") for i in range(count)]
+
+
+def blocking_embed(vector_store):
+    """Embedding function waiting for the returned event before each request, and an event set
+    once the first request is waiting"""
+    release, waiting = threading.Event(), threading.Event()
+
+    def embed_texts(texts):
+        waiting.set()
+        release.wait(10)
+        return [vector_store.simple_text_embedding(text) for text in texts]
+
+    vector_store.embed_texts = embed_texts
+    return release, waiting
+
+
+def test_job_progress():
+    """A job runs in the background and reports its progress and stats, readable by other workers"""
+    vector_store, embedded = make_store(make_posts(6))
+    manager = ReindexJobManager(vector_store)
+
+    job, created = manager.submit("api", "incremental")
+    assert created and manager.wait(job.id, 10)
+    state = manager.get(job.id)
+    assert state["status"] == "succeeded", state
+    assert state["indexed_count"] == 6 and state["read"] == 6 and state["written"] == 6
+    assert state["stats"] == {"added": 6, "updated": 0, "removed": 0, "skipped": 0}
+    assert state["posts_per_second"] > 0 and state["eta_seconds"] is None
+
+    # Another worker process reads the state from chroma_data/reindex_jobs
+    other_worker = ReindexJobManager(vector_store)
+    assert other_worker.get(job.id)["status"] == "succeeded"
+    assert [listed["id"] for listed in other_worker.list()] == [job.id]
+    assert other_worker.get("unknown") is None
+
+    # The next run expects as many posts as are indexed
+    job, _ = manager.submit("api", "incremental")
+    manager.wait(job.id, 10)
+    state = manager.get(job.id)
+    assert state["expected"] == 6 and state["stats"]["skipped"] == 6
+
+    print("[PASS] Reindex job progress")
+
+
+def test_concurrent_requests():
+    """Requests made while a job runs queue one follow-up job; later requests are merged into it"""
+    vector_store, _ = make_store(make_posts(4))
+    release, waiting = blocking_embed(vector_store)
+    manager = ReindexJobManager(vector_store)
+
+    running, _ = manager.submit("api", "incremental")
+    assert waiting.wait(10)
+    assert manager.get(running.id)["status"] == "running"
+
+    queued, created = manager.submit("api", "incremental")
+    assert created and queued.id != running.id
+    merged, created = manager.submit("api", "force")
+    assert not created and merged is queued
+    assert queued.mode == "force" and queued.requests == 2
+    try:
+        manager.submit("database", "full")
+        assert False, "a request from another source must be rejected"
+    except ReindexConflict as e:
+        assert e.job is queued
+
+    # A queued job is cancelled at once; a new request then queues a new job
+    assert manager.cancel(queued.id)["status"] == "cancelled"
+    follow_up, created = manager.submit("api", "full")
+    assert created
+
+    release.set()
+    assert manager.wait(running.id, 10) and manager.wait(follow_up.id, 10)
+    assert manager.get(running.id)["status"] == "succeeded"
+    assert manager.get(follow_up.id)["status"] == "succeeded"
+    assert manager.get(follow_up.id)["started_at"] >= manager.get(running.id)["finished_at"]
+
+    print("[PASS] Concurrent reindex requests queued, merged and rejected")
+
+
+def test_cancel_from_other_worker():
+    """A forced reindex cancelled from another worker stops and keeps the active collection"""
+    vector_store, _ = make_store(make_posts(3))
+    vector_store.embedding_batch_size = 2  # Posts are read as the embedding requests progress
+    vector_store.index_posts_from_api()
+    active = vector_store.active_collection_name
+
+    vector_store.iter_post_pages_from_api = lambda: iter([[dict(post) for post in make_posts(40)]])
+    release, waiting = blocking_embed(vector_store)
+    manager = ReindexJobManager(vector_store)
+    job, _ = manager.submit("api", "force")
+    assert waiting.wait(10)
+
+    state = ReindexJobManager(vector_store).cancel(job.id)
+    assert state["cancel_requested"]
+    release.set()
+    assert manager.wait(job.id, 10)
+
+    state = manager.get(job.id)
+    assert state["status"] == "cancelled", state
+    assert state["written"] < 40
+    assert vector_store.active_collection_name == active
+    assert vector_store.collection.count() == 3
+    assert len(vector_store.client.list_collections()) == 1  # The unfinished generation was dropped
+
+    print("[PASS] Reindex job cancelled from another worker")
+
+
+def test_abandoned_job():
+    """A job left running by a process that exited is reported as failed"""
+    vector_store, _ = make_store([])
+    manager = ReindexJobManager(vector_store)
+    os.makedirs(manager.jobs_dir)
+    with open(os.path.join(manager.jobs_dir, "abc123.json"), "w") as f:
+        json.dump({"id": "abc123", "status": "running", "pid": 2 ** 22 + 1, "created_at": 0, "eta_seconds": 5}, f)
+
+    state = manager.get("abc123")
+    assert state["status"] == "failed" and state["eta_seconds"] is None
+    assert manager.get("../abc123") is None
+
+    print("[PASS] Abandoned reindex job reported as failed")
+
+
+def test_reindex_routes():
+    """POST /reindex returns a job at once; its state and cancellation are served by /reindex/jobs.
+    A rollback is refused while the job runs."""
+    import main
+
+    vector_store, _ = make_store(make_posts(3))
+    release, waiting = blocking_embed(vector_store)
+    manager, main.reindex_jobs = main.reindex_jobs, ReindexJobManager(vector_store)
+    live_store, main.vector_store = main.vector_store, vector_store
+    try:
+        client = main.create_app().test_client()
+        response = client.post("/reindex", json={"source": "api", "incremental": True})
+        assert response.status_code == 202
+        job = response.get_json()["job"]
+        assert job["status"] in ("queued", "running") and job["mode"] == "incremental"
+        assert waiting.wait(10)
+
+        response = client.post("/reindex", json={"source": "api", "force": True})
+        assert response.status_code == 202
+        follow_up = response.get_json()["job"]
+        assert client.post("/reindex", json={"source": "database"}).status_code == 409
+        assert client.post("/reindex/rollback").status_code == 409
+
+        assert client.get(f"/reindex/jobs/{job['id']}").get_json()["status"] == "running"
+        assert client.post(f"/reindex/jobs/{job['id']}/cancel").status_code == 202
+        assert client.get("/reindex/jobs/unknown").status_code == 404
+        release.set()
+        assert main.reindex_jobs.wait(follow_up["id"], 10)
+        assert len(client.get("/reindex/jobs").get_json()["jobs"]) == 2
+    finally:
+        release.set()
+        main.reindex_jobs = manager
+        main.vector_store = live_store
+
+    print("[PASS] Reindex job routes")
+
+
+def test_write_lock_between_threads():
+    """The index write lock excludes other threads of the process, also where flock is missing (Windows)"""
+    vector_store, _ = make_store([])
+    path = index_write_lock_path(vector_store)
+    fcntl_module = sys.modules.get("fcntl")
+    for flock_available in (True, False):
+        if not flock_available:
+            sys.modules["fcntl"] = None  # import fcntl raises ImportError
+        try:
+            lock = try_lock_file(path)
+            assert lock is not None
+            other = []
+            thread = threading.Thread(target=lambda: other.append(try_lock_file(path)))
+            thread.start()
+            thread.join()
+            assert other == [None]
+            lock.close()
+            lock.close()  # Closing twice is harmless
+            lock = try_lock_file(path)
+            assert lock is not None
+            lock.close()
+        finally:
+            if fcntl_module is not None:
+                sys.modules["fcntl"] = fcntl_module
+            else:
+                sys.modules.pop("fcntl", None)
+
+    print("[PASS] Index write lock held across threads")
+
+
+if __name__ == "__main__":
+    test_job_progress()
+    test_concurrent_requests()
+    test_cancel_from_other_worker()
+    test_abandoned_job()
+    test_reindex_routes()
+    test_write_lock_between_threads()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Test the response cache: repeated and near-duplicate questions are answered without the
+LLM, and answers are dropped when a post they used is reindexed
+"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from query_parser import QueryIntent
+from response_cache import ResponseCache
+from test_helpers import make_chatbot, make_posts, make_store, open_other_worker
+
+
+def make_cached_chatbot(answer, similarity_threshold=0.97):
+    chatbot = make_chatbot(answer)
+    chatbot.response_cache = ResponseCache(similarity_threshold=similarity_threshold)
+    chatbot.vector_store.add_change_listener(chatbot.response_cache.invalidate_posts)
+    return chatbot, chatbot.llm_client.chat.completions.calls
+
+
+def test_repeated_question():
+    """A repeated question is answered from the cache with the same response"""
+    answer = 'Có vài phòng. __SHOW_ROOMS__::{"message": "Các phòng phù hợp:", "roomIds": ["p0", "p4"]}'
+    chatbot, llm_calls = make_cached_chatbot(answer)
+    question = "Tìm phòng trọ ở Thanh Xuân"
+
+    first = chatbot.process_question(question)
+    started = time.perf_counter()
+    second = chatbot.process_question(question)
+    elapsed = time.perf_counter() - started
+    assert second == first and second["type"] == "show_rooms"
+    assert len(llm_calls) == 1
+    assert elapsed < 0.1, elapsed
+
+    # The streaming endpoint serves the cached answer too
+    events = list(chatbot.process_question_stream(question))
+    assert events[0] == ("token", {"text": "Có vài phòng. "})
+    assert events[-1] == ("done", first)
+    assert len(llm_calls) == 1
+
+    stats = chatbot.response_cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 1 and stats["entries"] == 1
+
+    print(f"[PASS] Repeated question served from the cache in {elapsed * 1000:.1f} ms")
+
+
+def test_near_duplicate_question():
+    """Differently worded questions with the same intent and posts share an answer when their embeddings are close"""
+    chatbot, llm_calls = make_cached_chatbot("Đây là các phòng ở Cầu Giấy.")
+    base = chatbot.vector_store.simple_text_embedding("phòng trọ Cầu Giấy")
+    embeddings = {
+        "Phòng trọ giá rẻ ở Cầu Giấy": base,
+        "Ở Cầu Giấy có phòng trọ giá rẻ không": [value * 1.01 for value in base[:8]] + base[8:],
+        "Phòng trọ ở Cầu Giấy, giá rẻ nhất có thể": [1.0 - value for value in base[:16]] + base[16:],
+    }
+    # Search queries are the questions enriched with the parsed criteria
+    chatbot.vector_store.embed_query = lambda query: next(vector for question, vector in embeddings.items() if query.startswith(question))
+
+    questions = list(embeddings)
+    first = chatbot.process_question(questions[0])
+    second = chatbot.process_question(questions[1])
+    assert second["response"] == first["response"] == "Đây là các phòng ở Cầu Giấy."
+    assert [room["_id"] for room in second["rooms"]] == [room["_id"] for room in first["rooms"]]
+    assert len(llm_calls) == 1 and chatbot.response_cache.stats()["similar_hits"] == 1
+
+    # Too different to reuse the answer
+    chatbot.process_question(questions[2])
+    assert len(llm_calls) == 2
+
+    # Without a similarity threshold only the exact question is reused
+    chatbot.response_cache.similarity_threshold = 0
+    chatbot.process_question(questions[1])
+    assert len(llm_calls) == 3
+
+    print("[PASS] Near-duplicate question served from the cache")
+
+
+def test_invalidated_on_reindex():
+    """Answers are dropped when a post they used is reindexed, other answers are kept"""
+    chatbot, llm_calls = make_cached_chatbot("Có phòng phù hợp.")
+    vector_store = chatbot.vector_store
+    rental = chatbot.process_question("Tìm phòng trọ ở Thanh Xuân")
+    greeting = chatbot.process_question("Xin chào")
+    assert chatbot.response_cache.stats()["entries"] == 2
+
+    # A post used by the first answer only
+    changed_id = next(doc["id"] for doc in rental["sources"] if doc["id"] not in {doc["id"] for doc in greeting["sources"]})
+    posts = make_posts()
+    for post in posts:
+        if post["post_id"] == changed_id:
+            post["price"] = 9900000
+            post["updatedAt"] = "2025-06-01T00:00:00Z"
+    vector_store.iter_post_pages_from_api = lambda: iter([posts])
+    vector_store.index_posts_from_api(incremental=True)
+    assert vector_store.last_index_stats["updated"] == 1
+
+    stats = chatbot.response_cache.stats()
+    assert stats["invalidations"] == 1 and stats["entries"] == 1
+    chatbot.process_question("Tìm phòng trọ ở Thanh Xuân")
+    assert len(llm_calls) == 3
+
+    # Switching collection generation drops everything
+    vector_store._activate_collection(vector_store.collection)
+    assert chatbot.response_cache.stats()["entries"] == 0
+
+    print("[PASS] Answers invalidated on reindex")
+
+
+def test_invalidated_by_other_worker():
+    """A worker drops the answers using a post that another worker reindexed (Chroma backend) when its
+    index watcher picks up the change, and bypasses the cache until then"""
+    posts = make_posts()
+    writer, _ = make_store(posts)
+    writer.index_posts_from_api()
+    reader = open_other_worker(writer)
+    reader.embed_query = reader.simple_text_embedding
+    chatbot = make_chatbot("Có phòng phù hợp.", vector_store=reader)
+    chatbot.response_cache = ResponseCache()
+    reader.add_change_listener(chatbot.response_cache.invalidate_posts)
+    llm_calls = chatbot.llm_client.chat.completions.calls
+    question = "Tìm phòng trọ ở Thanh Xuân"
+
+    first = chatbot.process_question(question)
+    chatbot.process_question(question)
+    assert len(llm_calls) == 1 and chatbot.response_cache.stats()["entries"] == 1
+
+    changed_id = first["sources"][0]["id"]
+    for post in posts:
+        if post["post_id"] == changed_id:
+            post["price"] = 9900000
+            post["updatedAt"] = "2025-06-01T00:00:00Z"
+    writer.iter_post_pages_from_api = lambda: iter([posts])
+    writer.index_posts_from_api(incremental=True)
+    assert writer.last_index_stats["updated"] == 1
+
+    # Until the index watcher applies the change, the cache is bypassed (nothing is looked up or stored)
+    assert reader.has_unapplied_changes()
+    chatbot.process_question(question)
+    assert len(llm_calls) == 2 and chatbot.response_cache.stats()["invalidations"] == 0
+
+    assert reader.reload_if_changed()
+    assert chatbot.response_cache.stats()["invalidations"] == 1 and not reader.has_unapplied_changes()
+    again = chatbot.process_question(question)
+    assert len(llm_calls) == 3
+    changed = next(doc for doc in again["sources"] if doc["id"] == changed_id)
+    assert changed["metadata"]["price_vnd"] == 9900000 and changed["metadata"]["updated_at"] == "2025-06-01T00:00:00Z"
+
+    # The new answer is cached in turn
+    chatbot.process_question(question)
+    assert len(llm_calls) == 3
+
+    print("[PASS] Answers invalidated when another worker reindexes a post")
+
+
+def test_cache_bookkeeping():
+    """Evicted and expired entries leave no trace in the lookup tables"""
+    cache = ResponseCache(capacity=2, ttl_seconds=60)
+    docs = [{"id": f"p{i}", "metadata": {"updated_at": "2025"}} for i in range(4)]
+    keys = [ResponseCache.make_key("standard", f"câu hỏi {i}", QueryIntent(), docs[i:i + 2]) for i in range(3)]
+
+    for i, key in enumerate(keys):
+        cache.put(key, f"trả lời {i}")
+    assert cache.get(keys[0]) is None and cache.get(keys[2]) == "trả lời 2"
+    assert cache.stats()["evictions"] == 1
+    assert set(cache._keys_by_post) == {"p1", "p2", "p3"}
+
+    cache.invalidate_posts(["p1"])
+    assert cache.stats()["entries"] == 1 and set(cache._keys_by_post) == {"p2", "p3"}
+
+    cache.ttl_seconds = -1
+    cache.put(keys[0], "trả lời 0")
+    assert cache.get(keys[0]) is None and cache.stats()["expirations"] == 1
+
+    # Questions are normalized
+    assert ResponseCache.make_key("standard", "  Phòng  TRỌ ", QueryIntent(), []) == \
+           ResponseCache.make_key("standard", "phòng trọ", QueryIntent(), [])
+
+    print("[PASS] Cache bookkeeping")
+
+
+if __name__ == "__main__":
+    test_repeated_question()
+    test_near_duplicate_question()
+    test_invalidated_on_reindex()
+    test_invalidated_by_other_worker()
+    test_cache_bookkeeping()
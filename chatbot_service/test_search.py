@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Test searching the vector store: batched multi-query search, batched lookups of the
+rooms picked by the LLM and adaptive over-fetch for strict criteria
+"""
+
+import sys
+import os
+import json
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from test_helpers import make_indexed_store, make_posts
+from vector_backends import create_vector_client
+from vector_store import VectorStore
+
+
+def test_search_many_matches_search():
+    """search_many returns what separate searches return, with one embedding request"""
+    vector_store, embeddings = make_indexed_store(make_posts())
+    queries = ["phòng trọ Thanh Xuân", "phòng trọ Cầu Giấy", "phòng trọ Thanh Xuân", "phòng Hoàng Mai"]
+
+    batched = vector_store.search_many(queries, top_k=5)
+    assert len(embeddings.requests) == 1
+    assert embeddings.requests[0] == ["phòng trọ Thanh Xuân", "phòng trọ Cầu Giấy", "phòng Hoàng Mai"]
+
+    # Separate searches hit the query cache filled by search_many
+    separate = [vector_store.search(query, top_k=5) for query in queries]
+    assert len(embeddings.requests) == 1
+    assert [[result["id"] for result in results] for results in batched] == \
+           [[result["id"] for result in results] for results in separate]
+    assert abs(batched[0][0]["similarity"] - separate[0][0]["similarity"]) < 1e-6
+
+    print("[PASS] search_many matches separate searches")
+
+
+def test_search_many_filters():
+    """Shared and per-query filters are both applied"""
+    vector_store, embeddings = make_indexed_store(make_posts())
+
+    shared = vector_store.search_many(["phòng trọ", "phòng Đống Đa"], top_k=5, filters={"max_price": 2000000})
+    for results in shared:
+        assert len(results) == 5
+        assert all(result["metadata"]["price_vnd"] <= 2000000 for result in results)
+
+    per_query = vector_store.search_many(["phòng trọ", "phòng trọ", "phòng trọ"], top_k=3,
+                                         filters=[{"min_area": 50}, None, {"min_area": 50}])
+    assert all(result["metadata"]["area_m2"] >= 50 for result in per_query[0] + per_query[2])
+    assert [result["id"] for result in per_query[1]] == [result["id"] for result in vector_store.search("phòng trọ", top_k=3)]
+    assert vector_store.search_many([]) == []
+
+    print("[PASS] search_many applies shared and per-query filters")
+
+
+def test_show_rooms_lookup():
+    """Rooms from the search results are reused; the rest are fetched in one lookup"""
+    from chatbot import ChatBot
+
+    vector_store, embeddings = make_indexed_store(make_posts())
+    relevant_docs = vector_store.search("phòng trọ Thanh Xuân", top_k=3)
+    gets = []
+    collection_get = vector_store.collection.get
+    vector_store.collection.get = lambda **kwargs: gets.append(kwargs["ids"]) or collection_get(**kwargs)
+
+    room_ids = [relevant_docs[1]["id"], "p39", "missing", relevant_docs[0]["id"], "p38"]
+    response_text = 'Có vài phòng. __SHOW_ROOMS__::{"message": "Các phòng phù hợp:", "roomIds": ' + json.dumps(room_ids) + '}'
+    response = ChatBot(vector_store)._format_room_response(response_text, relevant_docs)
+
+    assert gets == [["p39", "missing", "p38"]]
+    assert response["type"] == "show_rooms"
+    assert response["response"] == "Có vài phòng. Các phòng phù hợp:"
+    assert [room["_id"] for room in response["rooms"]] == [relevant_docs[1]["id"], "p39", relevant_docs[0]["id"], "p38"]
+    assert response["rooms"][0]["similarity"] == relevant_docs[1]["similarity"]
+    assert response["rooms"][1]["similarity"] == 0
+    assert response["rooms"][1]["title"] == "Phòng trọ Hoàng Mai số 39"
+
+    assert vector_store.get_document_by_id("p5")["title"] == "Phòng trọ Cầu Giấy số 5"
+    assert vector_store.get_document_by_id("missing") is None
+
+    print("[PASS] show_rooms rooms are looked up in one batch")
+
+
+def test_adaptive_overfetch():
+    """top_k is widened until enough posts pass the filters, within the budget"""
+    from chatbot import ChatBot
+    from query_parser import QueryIntent
+
+    # Post i ranks i-th for every query; only five posts deep in the ranking match the criteria
+    matching = {20, 25, 30, 35, 38}
+    posts = [{
+        "post_id": f"p{i}",
+        "title": f"Phòng số {i}",
+        "location": "Hoàng Mai, Hà Nội" if i in matching else "Cầu Giấy, Hà Nội",
+        "price": 3000000,
+        "options": ["Có thang máy"] if i in matching else [],
+        "updatedAt": "2025-01-01T00:00:00Z",
+    } for i in range(40)]
+
+    vector_store = VectorStore()
+    vector_store.persist_path = tempfile.mkdtemp()
+    vector_store.client = create_vector_client("numpy", vector_store.persist_path)
+    vector_store.collection = vector_store.client.create_collection(vector_store.collection_name)
+    vector_store.embed_texts = lambda texts: [[1.0, int(text.split()[2]) * 0.05] for text in texts]
+    vector_store.iter_post_pages_from_api = lambda: iter([posts])
+    vector_store.index_posts_from_api()
+    searches = []
+    vector_store.embed_query = lambda query: searches.append(query) or [1.0, 0.0]
+    # Vector ranking only: the lexical matches of "thang máy" would be found by the first search
+    vector_store.lexical_index = None
+
+    chatbot = ChatBot(vector_store)
+    intent = QueryIntent(location="Hoàng Mai", amenities=["có thang máy"])
+
+    relevant_docs, filtered_docs = chatbot._retrieve_documents("phòng có thang máy", {}, intent)
+    assert [doc["id"] for doc in filtered_docs] == [f"p{i}" for i in sorted(matching)]
+    assert chatbot.last_retrieval_stats == {"rounds": 3, "top_k": 60, "candidates": 40, "matched": 5, "outcome": "enough"}
+    assert len(searches) == 3
+
+    chatbot.retrieval_max_top_k = 30
+    relevant_docs, filtered_docs = chatbot._retrieve_documents("phòng có thang máy", {}, intent)
+    assert len(relevant_docs) == 30 and [doc["id"] for doc in filtered_docs] == ["p20", "p25"]
+    assert chatbot.last_retrieval_stats["outcome"] == "budget"
+
+    chatbot.retrieval_max_top_k = 120
+    chatbot.retrieval_min_results = 10
+    chatbot._retrieve_documents("phòng có thang máy", {}, intent)
+    assert chatbot.last_retrieval_stats["outcome"] == "exhausted"
+
+    # Easy criteria are served by the first search
+    chatbot._retrieve_documents("phòng", {}, QueryIntent())
+    assert chatbot.last_retrieval_stats["rounds"] == 1
+
+    stats = chatbot.get_retrieval_stats()
+    assert stats["requests"] == 4 and stats["widened"] == 3 and stats["searches"] == 3 + 2 + 3 + 1
+    assert stats["enough"] == 2 and stats["budget"] == 1 and stats["exhausted"] == 1
+
+    print("[PASS] Adaptive over-fetch")
+
+
+if __name__ == "__main__":
+    test_search_many_matches_search()
+    test_search_many_filters()
+    test_show_rooms_lookup()
+    test_adaptive_overfetch()
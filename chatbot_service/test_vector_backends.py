@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Test the NumPy vector backend (exact and IVF search, where filters, persistence) and
+running the vector store on it
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from vector_backends import NumpyVectorClient, VectorClient, VectorCollection, create_vector_client
+from vector_store import VectorStore
+
+
+def random_vectors(count, dim=64, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+
+
+def test_exact_search_and_filters():
+    """Exact search returns the true cosine top-k and respects where clauses"""
+    client = NumpyVectorClient(tempfile.mkdtemp())
+    collection = client.create_collection("posts", metadata={"hnsw:space": "cosine"})
+    vectors = random_vectors(500)
+    ids = [f"p{i}" for i in range(500)]
+    metadatas = [{"post_id": ids[i], "price_vnd": float(i * 10000), "category": "phong-tro" if i % 2 else "can-ho-mini"}
+                 for i in range(500)]
+    for start in range(0, 500, 128):
+        collection.add(ids=ids[start:start+128], embeddings=vectors[start:start+128].tolist(), metadatas=metadatas[start:start+128])
+    assert collection.count() == 500
+
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    query = vectors[7] + 0.1
+    expected = np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:10]
+
+    results = collection.query(query_embeddings=[query.tolist()], n_results=10, include=['metadatas', 'distances'])
+    assert results['ids'][0] == [f"p{i}" for i in expected]
+    assert results['distances'][0] == sorted(results['distances'][0])
+    assert results['ids'][0][0] == "p7" and results['distances'][0][0] < 0.01
+
+    where = {"$and": [{"price_vnd": {"$gte": 1000000}}, {"price_vnd": {"$lte": 3000000}}, {"category": "phong-tro"}]}
+    results = collection.query(query_embeddings=[query.tolist()], n_results=10, where=where)
+    assert len(results['ids'][0]) == 10
+    for metadata in results['metadatas'][0]:
+        assert 1000000 <= metadata["price_vnd"] <= 3000000 and metadata["category"] == "phong-tro"
+
+    # get with ids, where, paging and include=[] behaves like Chroma
+    assert collection.get(ids=["p3", "missing", "p1"], include=[])['ids'] == ["p3", "p1"]
+    assert len(collection.get(where={"price_vnd": {"$lt": 100000}}, include=[])['ids']) == 10
+    assert collection.get(limit=5, offset=495, include=['metadatas'])['ids'] == ids[495:]
+
+    # Upserts replace, deletes keep the remaining rows searchable
+    collection.upsert(ids=["p7"], embeddings=[vectors[8].tolist()], metadatas=[{"post_id": "p7", "price_vnd": 0.0}])
+    collection.delete(ids=["p8", "p0"])
+    assert collection.count() == 498
+    results = collection.query(query_embeddings=[vectors[8].tolist()], n_results=1)
+    assert results['ids'][0] == ["p7"] and results['metadatas'][0][0]["price_vnd"] == 0.0
+
+    print("[PASS] Exact search and where filters")
+
+
+def test_persistence_and_float16():
+    """Collections survive a restart (memory-mapped) and float16 storage keeps the ranking"""
+    path = tempfile.mkdtemp()
+    vectors = random_vectors(300, seed=1)
+    ids = [f"p{i}" for i in range(300)]
+
+    for dtype in ("float32", "float16"):
+        client = NumpyVectorClient(os.path.join(path, dtype), dtype=dtype)
+        collection = client.create_collection("posts")
+        collection.add(ids=ids, embeddings=vectors.tolist(), metadatas=[{"post_id": doc_id} for doc_id in ids])
+        collection.persist()
+
+        reopened = NumpyVectorClient(os.path.join(path, dtype), dtype=dtype).get_collection("posts")
+        assert reopened.count() == 300
+        assert isinstance(reopened._matrix, np.memmap) and reopened._matrix.dtype == np.dtype(dtype)
+        results = reopened.query(query_embeddings=[vectors[42].tolist()], n_results=3)
+        assert results['ids'][0][0] == "p42"
+
+        # Writing after a reload fills the next row of the mapped file
+        reopened.add(ids=["new"], embeddings=[vectors[0].tolist()], metadatas=[{"post_id": "new"}])
+        assert reopened.count() == 301 and isinstance(reopened._matrix, np.memmap)
+
+    client = NumpyVectorClient(os.path.join(path, "float32"))
+    client.delete_collection("posts")
+    assert os.listdir(client.path) == []
+    try:
+        client.get_collection("posts")
+        assert False, "a deleted collection must not be found"
+    except ValueError:
+        pass
+
+    print("[PASS] Persistence and float16 storage")
+
+
+def test_incremental_persist():
+    """A small write is logged to the delta log, not rewritten, and replayed by the other processes;
+    the collection is rewritten without dead rows once delta_max_rows changes were logged"""
+    path = tempfile.mkdtemp()
+    vectors = random_vectors(400, seed=3)
+    ids = [f"p{i}" for i in range(400)]
+    writer = NumpyVectorClient(path, delta_max_rows=50).create_collection("posts")
+    writer.add(ids=ids[:300], embeddings=vectors[:300].tolist(), metadatas=[{"post_id": doc_id} for doc_id in ids[:300]])
+    writer.persist()
+    reader = NumpyVectorClient(path).get_collection("posts")
+    vectors_file = writer._vectors_file
+    records_mtime = os.path.getmtime(os.path.join(writer.path, "records.json"))
+
+    writer.upsert(ids=["p300", "p5"], embeddings=vectors[300:302].tolist(),
+                  metadatas=[{"post_id": "p300"}, {"post_id": "p5", "title": "mới sửa"}])
+    writer.delete(ids=["p7"])
+    writer.persist()
+    assert writer._vectors_file == vectors_file
+    assert os.path.getmtime(os.path.join(writer.path, "records.json")) == records_mtime
+    assert os.path.getsize(os.path.join(writer.path, writer._delta_file)) < 1000
+
+    # Until it replays the log the reader keeps its rows; the new vector is already in the shared file
+    assert reader.count() == 300 and reader.get(ids=["p300"])["ids"] == []
+    assert NumpyVectorClient(path).reload_collection("posts").count() == 300
+    reader_client = NumpyVectorClient(path)
+    reader = reader_client.get_collection("posts")
+    assert reader_client.reload_collection("posts") is reader
+    assert reader.count() == 300 and reader.get(ids=["p7"])["ids"] == []
+    assert reader.get(ids=["p5"])["metadatas"][0]["title"] == "mới sửa"
+    assert reader.query(query_embeddings=[vectors[300].tolist()], n_results=1)["ids"] == [["p300"]]
+    assert reader.query(query_embeddings=[vectors[301].tolist()], n_results=1)["ids"] == [["p5"]]
+    assert "p7" not in reader.query(query_embeddings=[vectors[7].tolist()], n_results=5)["ids"][0]
+    assert len(reader.get(include=[])["ids"]) == 300
+
+    # More changes than delta_max_rows: rewritten without the dead row, the reader reloads it
+    writer.add(ids=ids[301:400], embeddings=vectors[301:400].tolist(), metadatas=[{"post_id": doc_id} for doc_id in ids[301:400]])
+    writer.persist()
+    assert writer._vectors_file != vectors_file and writer._size == writer.count() == 399
+    reader_client.reload_collection("posts")
+    assert reader.count() == 399 and reader.get(ids=["p399"])["ids"] == ["p399"]
+    assert not os.path.exists(os.path.join(writer.path, vectors_file))
+
+    print("[PASS] Small writes logged to the delta log and replayed")
+
+
+def test_ivf_search():
+    """The approximate mode finds nearly the same neighbours as exact search"""
+    # Clustered data, as real embeddings are
+    rng = np.random.default_rng(2)
+    centers = rng.normal(size=(30, 64))
+    vectors = (centers[rng.integers(0, 30, size=3000)] + rng.normal(scale=0.3, size=(3000, 64))).astype(np.float32)
+    ids = [f"p{i}" for i in range(3000)]
+
+    exact = NumpyVectorClient(tempfile.mkdtemp()).create_collection("posts")
+    client = NumpyVectorClient(tempfile.mkdtemp(), index_mode="ivf", nprobe=8)
+    approximate = client.create_collection("posts")
+    approximate.ivf_min_size = 1000
+    for collection in (exact, approximate):
+        collection.add(ids=ids, embeddings=vectors.tolist(), metadatas=[{"post_id": doc_id} for doc_id in ids])
+        collection.persist()
+    assert approximate._ivf is not None
+
+    recalls = []
+    for i in range(0, 3000, 100):
+        query = [vectors[i].tolist()]
+        truth = set(exact.query(query_embeddings=query, n_results=10)['ids'][0])
+        found = set(approximate.query(query_embeddings=query, n_results=10)['ids'][0])
+        recalls.append(len(truth & found) / 10)
+    assert np.mean(recalls) >= 0.9, np.mean(recalls)
+
+    # Rows written after the index was built join their nearest cluster, without training it again
+    centroids = approximate._ivf[0]
+    approximate.add(ids=["late"], embeddings=[(vectors[5] * 3).tolist()], metadatas=[{"post_id": "late"}])
+    approximate.upsert(ids=["p9"], embeddings=[vectors[6].tolist()], metadatas=[{"post_id": "p9"}])
+    approximate.persist()
+    assert approximate._ivf[0] is centroids
+    assert "late" in approximate.query(query_embeddings=[vectors[5].tolist()], n_results=2)['ids'][0]
+    found = approximate.query(query_embeddings=[vectors[6].tolist()], n_results=2)['ids'][0]
+    assert sorted(found) == ["p6", "p9"]
+
+    # Trained again once the writes since the training reach a fifth of the rows
+    approximate.delete(ids=ids[:1000])
+    approximate.persist()
+    assert approximate._ivf[0] is not centroids and approximate.count() == 2001
+
+    print(f"[PASS] IVF search (recall@10 = {np.mean(recalls):.2f})")
+
+
+def test_backends_satisfy_interfaces():
+    """Chroma's client and collection and the numpy ones all provide what VectorStore uses"""
+    for backend in ("chroma", "numpy"):
+        client = create_vector_client(backend, tempfile.mkdtemp())
+        collection = client.create_collection("posts")
+        assert isinstance(client, VectorClient) and isinstance(collection, VectorCollection), backend
+
+    print("[PASS] Both backends satisfy the vector interfaces")
+
+
+def test_vector_store_on_numpy_backend():
+    """Indexing, incremental updates and filtered search work the same on the numpy backend"""
+    posts = []
+    for i in range(20):
+        posts.append({"post_id": f"p{i}", "title": f"Phòng {i}", "description": "Phòng sạch sẽ", "location": "Hà Nội",
+                      "price": 1000000 + i * 200000, "area": 15 + i, "category": "phong-tro",
+                      "updatedAt": "2025-01-01T00:00:00Z"})
+
+    vector_store = VectorStore()
+    vector_store.persist_path = tempfile.mkdtemp()
+    vector_store.vector_backend = "numpy"
+    vector_store.client = create_vector_client("numpy", vector_store.persist_path)
+    vector_store.collection = vector_store.client.create_collection(vector_store.collection_name)
+    vector_store.embed_texts = lambda texts: [vector_store.simple_text_embedding(text) for text in texts]
+    vector_store.embed_query = vector_store.simple_text_embedding
+    vector_store.iter_post_pages_from_api = lambda: iter([[dict(post) for post in posts]])
+
+    assert vector_store.index_posts_from_api() == 20
+    assert vector_store.numeric_filters_enabled
+    results = vector_store.search("phòng", top_k=5, filters={"min_price": 2000000, "max_price": 3000000})
+    assert len(results) == 5
+    assert all(2000000 <= result["metadata"]["price_vnd"] <= 3000000 for result in results)
+
+    posts.pop()
+    vector_store.index_posts_from_api(incremental=True)
+    assert vector_store.last_index_stats["removed"] == 1
+
+    # Forced reindexes swap generations on disk just like with Chroma
+    vector_store.index_posts_from_api(force=True)
+    restarted = NumpyVectorClient(os.path.join(vector_store.persist_path, "numpy"))
+    assert restarted.get_collection(vector_store.active_collection_name).count() == 19
+
+    print("[PASS] Vector store on the numpy backend")
+
+
+if __name__ == "__main__":
+    test_exact_search_and_filters()
+    test_persistence_and_float16()
+    test_incremental_persist()
+    test_ivf_search()
+    test_backends_satisfy_interfaces()
+    test_vector_store_on_numpy_backend()
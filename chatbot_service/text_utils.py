@@ -0,0 +1,46 @@
+import functools
+import logging
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+# "đ" is a separate letter in Vietnamese, not "d" with a combining mark, so NFD does not strip it
+_ACCENT_FOLD_TABLE = str.maketrans({"đ": "d", "Đ": "D"})
+
+def collapse_whitespace(text: str) -> str:
+    """Collapse runs of whitespace into single spaces and trim the ends"""
+    return " ".join(text.split())
+
+def fold_accents(text: str) -> str:
+    """Remove Vietnamese diacritics, e.g. "phòng trọ Đống Đa" -> "phong tro Dong Da" """
+    decomposed = unicodedata.normalize("NFD", text.translate(_ACCENT_FOLD_TABLE))
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+def normalize_query(text: str, fold: bool = False) -> str:
+    """Normalize a user query for cache lookups: NFC, lowercase, collapsed whitespace.
+    With fold=True accents are removed as well so "phong tro" and "phòng trọ" share a key."""
+    normalized = collapse_whitespace(unicodedata.normalize("NFC", text).lower())
+    if fold:
+        normalized = fold_accents(normalized)
+    return normalized
+
+@functools.lru_cache(maxsize=None)
+def get_token_encoding(model: str):
+    """tiktoken encoding of a model (cl100k_base for unknown models), loaded once per model.
+    None when tiktoken cannot be loaded (e.g. no network to download the BPE file)."""
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken unavailable, estimating token counts from text length: {e}")
+        return None
+
+def count_tokens(text: str, encoding) -> int:
+    """Number of tokens of text, estimated from its length without an encoding"""
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    # Vietnamese text averages well under 2 characters per token, so this overestimates
+    return len(text) // 2 + 1
@@ -0,0 +1,712 @@
+import os
+import json
+import shutil
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Protocol, runtime_checkable
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+@runtime_checkable
+class VectorCollection(Protocol):
+    """Vector collection, the subset of chromadb's Collection API that VectorStore uses; chromadb's
+    Collection and NumpyVectorCollection both satisfy it.
+
+    get/query return dicts in Chroma's format: get -> {"ids": [...], "metadatas": [...], ...},
+    query -> {"ids": [[...]], "metadatas": [[...]], "distances": [[...]], ...} with one inner list per
+    query embedding. Distances are cosine distances (1 - cosine similarity).
+
+    Collections buffering their writes in memory (numpy) also have persist(), which VectorStore
+    calls when present before other processes may read the writes.
+    """
+
+    name: str
+
+    def count(self) -> int: ...
+
+    def add(self, ids: List[str], embeddings: List[List[float]], metadatas: List[Dict[str, Any]]): ...
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], metadatas: List[Dict[str, Any]]): ...
+
+    def delete(self, ids: List[str]): ...
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            limit: Optional[int] = None, offset: Optional[int] = None, include: Optional[List[str]] = None) -> Dict[str, Any]: ...
+
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10, where: Optional[Dict[str, Any]] = None,
+              include: Optional[List[str]] = None) -> Dict[str, Any]: ...
+
+
+@runtime_checkable
+class VectorClient(Protocol):
+    """Vector database client, the subset of chromadb's client API that VectorStore uses; Chroma's
+    PersistentClient and NumpyVectorClient both satisfy it.
+
+    A client able to refresh an open collection with what other processes wrote (numpy) also has
+    reload_collection(name), used by VectorStore when present.
+    """
+
+    def get_collection(self, name: str) -> VectorCollection: ...
+
+    def create_collection(self, name: str, metadata: Optional[Dict[str, Any]] = None) -> VectorCollection: ...
+
+    def get_or_create_collection(self, name: str, metadata: Optional[Dict[str, Any]] = None) -> VectorCollection: ...
+
+    def delete_collection(self, name: str): ...
+
+
+def create_vector_client(backend: str, persist_path: str, reopen: bool = False, **options) -> VectorClient:
+    """Create the client for the configured backend: "chroma" (default) or "numpy".
+    reopen=True makes a Chroma client read the index from disk again (see below)."""
+    if backend == "numpy":
+        return NumpyVectorClient(os.path.join(persist_path, "numpy"), **options)
+
+    # Imported lazily so the numpy backend does not pay chromadb's import time
+    import chromadb
+    from chromadb.config import Settings
+    if reopen:
+        # Clients of one path share a system per process, whose in-memory HNSW index does not see the
+        # vectors other processes wrote since it was loaded. Dropping the shared systems makes the new
+        # client load the index from disk; clients opened before keep working on the system they hold.
+        from chromadb.api.client import SharedSystemClient
+        SharedSystemClient.clear_system_cache()
+    return chromadb.PersistentClient(
+        path=persist_path,
+        settings=Settings(
+            anonymized_telemetry=False
+        )
+    )
+
+
+def _matches(value: Any, condition: Any) -> bool:
+    """Evaluate one Chroma field condition ({"$gte": 3}, {"$in": [...]}, or a plain value) against value"""
+    if not isinstance(condition, dict):
+        return value == condition
+
+    for operator, operand in condition.items():
+        if operator == "$eq":
+            ok = value == operand
+        elif operator == "$ne":
+            ok = value != operand
+        elif operator == "$in":
+            ok = value in operand
+        elif operator == "$nin":
+            ok = value not in operand
+        elif value is None or isinstance(value, str) != isinstance(operand, str):
+            ok = False  # Missing fields never satisfy a range condition
+        elif operator == "$gt":
+            ok = value > operand
+        elif operator == "$gte":
+            ok = value >= operand
+        elif operator == "$lt":
+            ok = value < operand
+        elif operator == "$lte":
+            ok = value <= operand
+        else:
+            raise ValueError(f"Unsupported where operator: {operator}")
+        if not ok:
+            return False
+    return True
+
+
+class NumpyVectorCollection:
+    """Collection held as a NumPy matrix of unit-normalized vectors.
+
+    Vectors are stored in float32 (or float16 to halve memory) in a file with room for more
+    rows, memory-mapped by every process serving the collection, so several worker processes
+    share one copy through the page cache. Queries compute cosine similarity with one matrix
+    product and select the top k with argpartition. With index_mode="ivf" large collections
+    are searched through an inverted file index (k-means clusters), probing only the nprobe
+    closest clusters.
+
+    Writes go to the mapped file in place: an upsert overwrites its row or fills the next free
+    one, a delete leaves a dead row. persist() then only appends the IDs and metadata of the
+    changed posts to a delta log, which the other processes replay (refresh). The file and
+    records.json are rewritten without dead rows when the file is full, or once delta_max_rows
+    changes were logged since the last rewrite.
+    """
+
+    def __init__(self, name: str, path: str, dtype: str = "float32", index_mode: str = "exact",
+                 nprobe: int = 16, ivf_min_size: int = 20000, delta_max_rows: int = 5000,
+                 metadata: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.index_mode = index_mode
+        self.nprobe = nprobe
+        self.ivf_min_size = ivf_min_size
+        self.delta_max_rows = delta_max_rows
+        self.metadata = metadata or {}
+
+        self._lock = threading.RLock()
+        self._reset()
+        self._load()
+
+    def _reset(self):
+        self._matrix = None  # Rows [0, _size) are used; the mapped file, or an array until the next rewrite
+        self._size = 0
+        self._ids = []  # Per row; None for a dead row
+        self._metadatas = []
+        self._rows = {}  # id -> row of the live rows
+        self._changed = set()  # IDs upserted or deleted since the last persist
+        self._dirty = False
+        self._needs_rewrite = True  # The matrix is not the mapped file (new collection, or the file was full)
+        self._vectors_file = None
+        self._delta_file = None
+        self._delta_position = 0  # End of the delta log read or written
+        self._delta_rows = 0  # Changes logged since the last rewrite
+        self._records_stat = None
+        self._ivf = None  # (centroids, list of row arrays) of the last training
+        self._ivf_added = []  # Per cluster, rows assigned since the training
+        self._ivf_trained = 0  # Rows the clusters were trained on
+        self._columns = {}  # (field, numeric) -> metadata column used to evaluate where clauses
+        self._live = None  # Cached _live_mask
+
+    # Storage
+
+    @property
+    def _records_path(self) -> str:
+        return os.path.join(self.path, "records.json")
+
+    def _stat_records(self):
+        try:
+            stat = os.stat(self._records_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _load(self):
+        records_stat = self._stat_records()
+        if records_stat is None:
+            return
+
+        with open(self._records_path, encoding="utf-8") as f:
+            records = json.load(f)
+        self._records_stat = records_stat
+        self.metadata = records.get("metadata", self.metadata)
+        self._ids = records["ids"]
+        self._metadatas = records["metadatas"]
+        self._rows = {doc_id: row for row, doc_id in enumerate(self._ids) if doc_id is not None}
+        self._size = len(self._ids)
+        self._vectors_file = records["vectors_file"]
+        self._delta_file = records.get("delta_file")
+        self._needs_rewrite = self._delta_file is None  # Written before the delta log existed
+        if self._size:
+            self._matrix = np.load(os.path.join(self.path, self._vectors_file), mmap_mode="r+")
+            self.dtype = self._matrix.dtype
+        self._read_delta()
+        if self.index_mode == "ivf":
+            self._build_ivf()
+
+    def refresh(self):
+        """Pick up what another process persisted: the delta log appended since the last read, or
+        the whole collection after a rewrite"""
+        with self._lock:
+            if self._stat_records() != self._records_stat:
+                self._reset()
+                self._load()
+                return
+            rows = self._read_delta()
+            self._ivf_assign(rows)
+            if self._ivf_drifted():
+                self._build_ivf()
+
+    def _read_delta(self) -> List[int]:
+        """Apply the delta log from _delta_position, returning the rows upserted. A line still being
+        written is left for the next read."""
+        if self._delta_file is None:
+            return []
+        try:
+            with open(os.path.join(self.path, self._delta_file), "rb") as f:
+                f.seek(self._delta_position)
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        end = data.rfind(b"\n") + 1
+        self._delta_position += end
+
+        upserted_rows = []
+        for line in data[:end].splitlines():
+            entry = json.loads(line)
+            self._delta_rows += len(entry["upserted"]) + len(entry["removed"])
+            for doc_id in entry["removed"]:
+                self._kill(doc_id)
+            if entry["size"] > self._size:
+                self._ids.extend([None] * (entry["size"] - self._size))
+                self._metadatas.extend([None] * (entry["size"] - self._size))
+                self._size = entry["size"]
+            for doc_id, row, metadata in entry["upserted"]:
+                if self._rows.get(doc_id, row) != row:
+                    self._kill(doc_id)
+                self._ids[row] = doc_id
+                self._metadatas[row] = metadata
+                self._rows[doc_id] = row
+                upserted_rows.append(row)
+        if end:
+            if self._matrix is None or len(self._matrix) < self._size:
+                # Rows were written to a file mapped after this one was (not the case unless the file was replaced)
+                self._matrix = np.load(os.path.join(self.path, self._vectors_file), mmap_mode="r+")
+            self._columns = {}
+            self._live = None
+        return upserted_rows
+
+    def persist(self):
+        """Log the changes since the last persist, or rewrite the collection when it is due"""
+        with self._lock:
+            if not self._dirty:
+                return
+            dead = self._size - len(self._rows)
+            if (self._needs_rewrite or self._delta_rows + len(self._changed) > self.delta_max_rows
+                    or dead > max(self.delta_max_rows, self._size // 4)):
+                self._rewrite()
+            else:
+                self._append_delta()
+                if self._ivf_drifted():
+                    self._build_ivf()
+            self._changed = set()
+            self._dirty = False
+
+    def _append_delta(self):
+        """Append the changed posts to the delta log; their vectors are already in the mapped file"""
+        self._matrix.flush()
+        entry = {"size": self._size, "upserted": [], "removed": []}
+        for doc_id in self._changed:
+            row = self._rows.get(doc_id)
+            if row is None:
+                entry["removed"].append(doc_id)
+            else:
+                entry["upserted"].append([doc_id, row, self._metadatas[row]])
+        with open(os.path.join(self.path, self._delta_file), "ab") as f:
+            f.write((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+            self._delta_position = f.tell()
+        self._delta_rows += len(self._changed)
+
+    def _rewrite(self):
+        """Write the live rows to a new vectors file with room to grow, and records.json naming it and a
+        new, empty delta log; the processes mapping the old file reload (see refresh)"""
+        os.makedirs(self.path, exist_ok=True)
+        live = [row for row in range(self._size) if self._ids[row] is not None]
+        # New file names per version: a memory-mapped old file can't be replaced on Windows
+        version = time.time_ns()
+        vectors_file, delta_file = f"vectors-{version}.npy", f"delta-{version}.jsonl"
+        vectors_path = os.path.join(self.path, vectors_file)
+        if self._matrix is None:
+            np.save(vectors_path, np.zeros((0, 0), dtype=self.dtype))
+            matrix = None
+        else:
+            matrix = np.lib.format.open_memmap(vectors_path, mode="w+", dtype=self.dtype,
+                                               shape=(len(live) + max(1024, len(live) // 4), self._matrix.shape[1]))
+            for start in range(0, len(live), 8192):
+                chunk = live[start:start + 8192]
+                matrix[start:start + len(chunk)] = self._matrix[chunk]
+            matrix.flush()
+
+        ids = [self._ids[row] for row in live]
+        metadatas = [self._metadatas[row] for row in live]
+        with open(self._records_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"metadata": self.metadata, "ids": ids, "metadatas": metadatas,
+                       "vectors_file": vectors_file, "delta_file": delta_file}, f, ensure_ascii=False)
+        os.replace(self._records_path + ".tmp", self._records_path)
+
+        previous_files = [self._vectors_file, self._delta_file]
+        self._matrix = matrix
+        self._ids, self._metadatas = ids, metadatas
+        self._rows = {doc_id: row for row, doc_id in enumerate(ids)}
+        self._size = len(ids)
+        self._vectors_file, self._delta_file = vectors_file, delta_file
+        self._delta_position = self._delta_rows = 0
+        self._records_stat = self._stat_records()
+        self._needs_rewrite = False
+        self._columns = {}
+        self._live = None
+        for previous_file in previous_files:
+            if previous_file:
+                try:
+                    os.remove(os.path.join(self.path, previous_file))
+                except OSError:
+                    pass  # Still mapped by another process; harmless leftover
+        if self.index_mode == "ivf":
+            self._build_ivf()
+
+    def _ensure_capacity(self, rows: int, dim: int):
+        """Make room for `rows` rows: the mapped file while it has room, otherwise an array growing
+        geometrically, written to a new file by the next persist"""
+        if self._matrix is not None and self._matrix.shape[1] != dim:
+            raise ValueError(f"Embedding dimension {dim} does not match collection dimension {self._matrix.shape[1]}")
+        if self._matrix is not None and self._matrix.shape[0] >= rows:
+            return
+
+        capacity = max(rows, 1024, self._size * 2)
+        matrix = np.zeros((capacity, dim), dtype=self.dtype)
+        if self._size:
+            matrix[:self._size] = self._matrix[:self._size]
+        self._matrix = matrix
+        self._needs_rewrite = True
+
+    @staticmethod
+    def _normalize(embeddings) -> np.ndarray:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    # Writes
+
+    def add(self, ids, embeddings, metadatas=None, documents=None):
+        with self._lock:
+            new = [i for i, doc_id in enumerate(ids) if doc_id not in self._rows]
+            if len(new) != len(ids):
+                logger.warning(f"Ignoring {len(ids) - len(new)} existing IDs in add")
+            self._write([ids[i] for i in new], [embeddings[i] for i in new],
+                        [metadatas[i] if metadatas else {} for i in new])
+
+    def upsert(self, ids, embeddings, metadatas=None, documents=None):
+        with self._lock:
+            self._write(list(ids), list(embeddings), list(metadatas) if metadatas else [{} for _ in ids])
+
+    def _write(self, ids, embeddings, metadatas):
+        if not ids:
+            return
+        vectors = self._normalize(embeddings)
+        self._ensure_capacity(self._size + len(ids), vectors.shape[1])
+
+        rows = []
+        for doc_id, vector, metadata in zip(ids, vectors, metadatas):
+            row = self._rows.get(doc_id)
+            if row is None:
+                row = self._size
+                self._size += 1
+                self._rows[doc_id] = row
+                self._ids.append(doc_id)
+                self._metadatas.append(metadata)
+            else:
+                self._metadatas[row] = metadata
+            self._matrix[row] = vector
+            self._changed.add(doc_id)
+            rows.append(row)
+        self._ivf_assign(rows)
+        self._columns = {}
+        self._live = None
+        self._dirty = True
+
+    def delete(self, ids=None, where=None):
+        with self._lock:
+            if where is not None:
+                ids = list(ids or []) + [self._ids[row] for row in np.flatnonzero(self._filter_mask(where))]
+            for doc_id in ids or []:
+                if self._kill(doc_id):
+                    self._changed.add(doc_id)
+                    self._dirty = True
+
+    def _kill(self, doc_id: str) -> bool:
+        """Mark the row of a post dead, until the next rewrite drops it"""
+        row = self._rows.pop(doc_id, None)
+        if row is None:
+            return False
+        self._ids[row] = None
+        self._metadatas[row] = None
+        self._columns = {}
+        self._live = None
+        return True
+
+    # Reads
+
+    def count(self) -> int:
+        return len(self._rows)
+
+    def _column(self, field: str, numeric: bool) -> np.ndarray:
+        """A metadata field as an array (NaN/None where missing), cached until the next write"""
+        key = (field, numeric)
+        column = self._columns.get(key)
+        if column is None:
+            values = [metadata.get(field) if metadata is not None else None for metadata in self._metadatas[:self._size]]
+            if numeric:
+                column = np.array([value if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+                                   for value in values], dtype=np.float64)
+            else:
+                column = np.empty(self._size, dtype=object)
+                column[:] = values
+            self._columns[key] = column
+        return column
+
+    def _condition_mask(self, field: str, condition: Any) -> np.ndarray:
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+
+        mask = np.ones(self._size, dtype=bool)
+        for operator, operand in condition.items():
+            if operator in ("$gt", "$gte", "$lt", "$lte") and isinstance(operand, (int, float)):
+                # NaN (missing or non-numeric) compares False, matching Chroma
+                column = self._column(field, numeric=True)
+                if operator == "$gt":
+                    mask &= column > operand
+                elif operator == "$gte":
+                    mask &= column >= operand
+                elif operator == "$lt":
+                    mask &= column < operand
+                else:
+                    mask &= column <= operand
+            elif operator in ("$eq", "$ne") and not isinstance(operand, (list, dict)):
+                equal = self._column(field, numeric=False) == operand
+                mask &= equal if operator == "$eq" else ~equal
+            else:
+                column = self._column(field, numeric=False)
+                mask &= np.fromiter((_matches(value, {operator: operand}) for value in column), dtype=bool, count=self._size)
+        return mask
+
+    def _where_mask(self, where: Optional[Dict[str, Any]]) -> np.ndarray:
+        """Evaluate a Chroma where clause over all rows as a boolean mask"""
+        mask = np.ones(self._size, dtype=bool)
+        for key, condition in (where or {}).items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self._where_mask(clause)
+            elif key == "$or":
+                mask &= np.logical_or.reduce([self._where_mask(clause) for clause in condition])
+            else:
+                mask &= self._condition_mask(key, condition)
+        return mask
+
+    def _live_mask(self) -> Optional[np.ndarray]:
+        """Rows holding a post, or None when no row is dead; cached until the next write"""
+        if len(self._rows) == self._size:
+            return None
+        if self._live is None:
+            self._live = np.fromiter((doc_id is not None for doc_id in self._ids[:self._size]), dtype=bool, count=self._size)
+        return self._live
+
+    def _filter_mask(self, where: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Live rows matching a where clause, or None when every row qualifies"""
+        live = self._live_mask()
+        if not where:
+            return live
+        mask = self._where_mask(where)
+        return mask & live if live is not None else mask
+
+    def _result_fields(self, rows, include, nested: bool):
+        include = ["metadatas", "documents"] if include is None else include
+        wrap = (lambda values: [values]) if nested else (lambda values: values)
+        result = {"ids": wrap([self._ids[row] for row in rows])}
+        result["metadatas"] = wrap([self._metadatas[row] for row in rows]) if "metadatas" in include else None
+        result["documents"] = wrap([None for _ in rows]) if "documents" in include else None
+        result["embeddings"] = wrap([np.asarray(self._matrix[row], dtype=np.float32) for row in rows]) if "embeddings" in include else None
+        return result
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=None):
+        with self._lock:
+            if ids is not None:
+                rows = [self._rows[doc_id] for doc_id in ids if doc_id in self._rows]
+                if where:
+                    mask = self._where_mask(where)
+                    rows = [row for row in rows if mask[row]]
+            else:
+                mask = self._filter_mask(where)
+                rows = np.flatnonzero(mask).tolist() if mask is not None else list(range(self._size))
+            start = offset or 0
+            rows = rows[start:start + limit] if limit is not None else rows[start:]
+            return self._result_fields(rows, include, nested=False)
+
+    def query(self, query_embeddings, n_results=10, where=None, include=None):
+        queries = self._normalize(query_embeddings)
+        include = ["metadatas", "documents", "distances"] if include is None else include
+        results = {"ids": [], "metadatas": [] if "metadatas" in include else None,
+                   "documents": [] if "documents" in include else None,
+                   "distances": [] if "distances" in include else None}
+
+        with self._lock:
+            if not self._rows:
+                for key in results:
+                    if results[key] is not None:
+                        results[key] = [[] for _ in queries]
+                return results
+
+            mask = self._filter_mask(where)
+
+            # Without a cluster index every query scans every row: one matrix product for the whole batch
+            batch_scores = None
+            if self._ivf is None and len(queries) > 1:
+                batch_scores = self._dot(self._matrix[:self._size], queries.T)
+
+            for i, query in enumerate(queries):
+                rows, scores = self._search_one(query, n_results, mask,
+                                                batch_scores[:, i] if batch_scores is not None else None)
+                fields = self._result_fields(rows, include, nested=False)
+                results["ids"].append(fields["ids"])
+                if results["metadatas"] is not None:
+                    results["metadatas"].append(fields["metadatas"])
+                if results["documents"] is not None:
+                    results["documents"].append(fields["documents"])
+                if results["distances"] is not None:
+                    results["distances"].append([float(1.0 - score) for score in scores])
+
+        return results
+
+    def _candidate_rows(self, query: np.ndarray) -> Optional[np.ndarray]:
+        """Rows to score for the approximate mode, or None to score every row"""
+        if self._ivf is None:
+            return None
+        centroids, lists = self._ivf
+        nearest = np.argpartition(-(centroids @ query), min(self.nprobe, len(lists)) - 1)[:self.nprobe]
+        candidates = [lists[i] for i in nearest] + [np.array(self._ivf_added[i], dtype=np.int64) for i in nearest]
+        # A row updated since the training is listed in its old cluster too
+        return np.unique(np.concatenate(candidates))
+
+    def _search_one(self, query: np.ndarray, k: int, mask: Optional[np.ndarray],
+                    all_scores: Optional[np.ndarray] = None):
+        matrix = self._matrix[:self._size]
+        rows = self._candidate_rows(query) if all_scores is None else None
+        if rows is not None and mask is not None:
+            rows = rows[mask[rows]]
+            if len(rows) < k:
+                rows = None  # A selective filter left too few candidates in the probed clusters
+        if rows is not None:
+            scores = self._dot(matrix, query, rows)
+        else:
+            scores = self._dot(matrix, query) if all_scores is None else all_scores
+            if mask is not None:
+                rows = np.flatnonzero(mask)
+                scores = scores[rows]
+            else:
+                rows = np.arange(self._size)
+
+        k = min(k, len(rows))
+        if k <= 0:
+            return [], []
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return rows[top].tolist(), scores[top].tolist()
+
+    @staticmethod
+    def _dot(matrix: np.ndarray, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        if rows is not None:
+            return matrix[rows].astype(np.float32, copy=False) @ query
+        if matrix.dtype == np.float32:
+            return matrix @ query
+        # float16 has no BLAS kernel; convert in chunks to bound the temporary memory
+        return np.concatenate([matrix[i:i + 2048].astype(np.float32) @ query for i in range(0, len(matrix), 2048)])
+
+    def _build_ivf(self, iterations: int = 8):
+        """Cluster the live vectors with k-means for the approximate (IVF) search mode"""
+        self._ivf_added = []
+        self._ivf_trained = len(self._rows)
+        if len(self._rows) < self.ivf_min_size:
+            self._ivf = None
+            return
+
+        started = time.time()
+        live = self._live_mask()
+        rows = np.flatnonzero(live) if live is not None else np.arange(self._size)
+        nlist = int(np.sqrt(len(rows)))
+        rng = np.random.default_rng(0)
+        sample = self._matrix[np.sort(rng.choice(rows, size=min(len(rows), nlist * 64), replace=False))].astype(np.float32)
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for cluster in range(nlist):
+                members = sample[assignment == cluster]
+                if len(members):
+                    centroid = members.mean(axis=0)
+                    centroids[cluster] = centroid / (np.linalg.norm(centroid) or 1.0)
+
+        assignment = np.concatenate([
+            np.argmax(self._matrix[rows[i:i + 8192]].astype(np.float32) @ centroids.T, axis=1)
+            for i in range(0, len(rows), 8192)
+        ])
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(nlist + 1))
+        lists = [rows[order[bounds[i]:bounds[i + 1]]] for i in range(nlist)]
+        self._ivf = (centroids, lists)
+        self._ivf_added = [[] for _ in range(nlist)]
+        logger.info(f"Built IVF index for {self.name}: {nlist} clusters over {len(rows)} vectors in {time.time() - started:.1f}s")
+
+    def _ivf_assign(self, rows: List[int]):
+        """Add rows written since the training to the list of their nearest cluster"""
+        if self._ivf is None or not rows:
+            return
+        centroids = self._ivf[0]
+        clusters = np.argmax(self._matrix[rows].astype(np.float32) @ centroids.T, axis=1)
+        for row, cluster in zip(rows, clusters):
+            self._ivf_added[cluster].append(row)
+
+    def _ivf_drifted(self) -> bool:
+        """Whether the clusters should be trained again: rows written or deleted since the training amount
+        to a fifth of the rows it covered, or the collection grew past ivf_min_size"""
+        if self.index_mode != "ivf":
+            return False
+        if self._ivf is None:
+            return len(self._rows) >= self.ivf_min_size
+        added = sum(len(rows) for rows in self._ivf_added)
+        dead = self._size - len(self._rows)
+        return added + dead > max(1000, self._ivf_trained // 5)
+
+
+class NumpyVectorClient:
+    """Client managing NumPy collections, one directory per collection under path"""
+
+    def __init__(self, path: str, dtype: str = "float32", index_mode: str = "exact", nprobe: int = 16,
+                 delta_max_rows: int = 5000):
+        self.path = path
+        self.dtype = dtype
+        self.index_mode = index_mode
+        self.nprobe = nprobe
+        self.delta_max_rows = delta_max_rows
+        self._collections = {}
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def _open(self, name: str, metadata: Optional[Dict[str, Any]] = None) -> NumpyVectorCollection:
+        collection = NumpyVectorCollection(name, os.path.join(self.path, name), dtype=self.dtype,
+                                           index_mode=self.index_mode, nprobe=self.nprobe,
+                                           delta_max_rows=self.delta_max_rows, metadata=metadata)
+        self._collections[name] = collection
+        return collection
+
+    def _exists(self, name: str) -> bool:
+        return name in self._collections or os.path.exists(os.path.join(self.path, name, "records.json"))
+
+    def get_collection(self, name: str) -> NumpyVectorCollection:
+        with self._lock:
+            if name in self._collections:
+                return self._collections[name]
+            if not self._exists(name):
+                raise ValueError(f"Collection {name} does not exist")
+            return self._open(name)
+
+    def reload_collection(self, name: str) -> NumpyVectorCollection:
+        """Pick up what another process persisted to a collection: an open collection replays the
+        changes appended to its delta log (see NumpyVectorCollection.refresh), others are opened"""
+        with self._lock:
+            if not os.path.exists(os.path.join(self.path, name, "records.json")):
+                raise ValueError(f"Collection {name} does not exist")
+            collection = self._collections.get(name)
+            if collection is None:
+                return self._open(name)
+        collection.refresh()
+        return collection
+
+    def create_collection(self, name: str, metadata: Optional[Dict[str, Any]] = None) -> NumpyVectorCollection:
+        with self._lock:
+            if self._exists(name):
+                raise ValueError(f"Collection {name} already exists")
+            collection = self._open(name, metadata)
+            collection._dirty = True
+            collection.persist()
+            return collection
+
+    def get_or_create_collection(self, name: str, metadata: Optional[Dict[str, Any]] = None) -> NumpyVectorCollection:
+        try:
+            return self.get_collection(name)
+        except ValueError:
+            return self.create_collection(name, metadata)
+
+    def delete_collection(self, name: str):
+        with self._lock:
+            if not self._exists(name):
+                raise ValueError(f"Collection {name} does not exist")
+            self._collections.pop(name, None)
+            shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
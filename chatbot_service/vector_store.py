@@ -1,26 +1,121 @@
 import os
+import asyncio
 import logging
 import time
-from typing import List, Dict, Any, Optional
+import itertools
+import threading
+import json
+from typing import Callable, List, Dict, Any, Optional, Iterable, Iterator
 import openai
-from openai import OpenAI
-import chromadb
-from chromadb.config import Settings
+from openai import AsyncOpenAI, OpenAI
 import numpy as np
 from datetime import datetime, timedelta
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from embedding_cache import EmbeddingCache, QueryEmbeddingCache
+from index_changes import IndexChangeLog
+from indexing_pipeline import AdaptiveBackoff, IndexingPipeline, TokenBatcher
+from lexical_index import BM25Index, metadata_text, rrf_fuse
+from metrics import registry, stage_timer
+from document_builder import NUMERIC_METADATA_SCHEMA_VERSION, Record, iter_documents
+from post_features import canonical_category
+from text_utils import get_token_encoding
+from vector_backends import create_vector_client
 
 logger = logging.getLogger(__name__)
 
+EMBEDDING_REQUESTS = registry.counter("chatbot_embedding_requests_total", "Requests to the embeddings API", label="purpose")
+EMBEDDED_TEXTS = registry.counter("chatbot_embedded_texts_total", "Texts sent to the embeddings API", label="purpose")
+REINDEX_SECONDS = registry.histogram("chatbot_reindex_seconds", "Duration of reindex runs", label="mode",
+                                     buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600))
+
+
+class IndexingCancelled(Exception):
+    """Raised in a reindex whose should_stop callback returned True"""
+
+
 class VectorStore:
     def __init__(self, db_handler = None):
         self.db_handler = db_handler
         self.client = None
         self.collection = None
         self.openai_client = None
+        self.async_openai_client = None
+        # Query embeddings being requested by the async pipeline, shared by concurrent identical queries
+        self._pending_query_embeddings: Dict[str, asyncio.Future] = {}
+        # Called with the IDs of posts written or removed by a reindex (None: the whole collection changed)
+        self.change_listeners: List[Callable[[Optional[List[str]]], None]] = []
         self.api_url = os.getenv("API_URL", "http://localhost:3000/api/get-posts")  # API endpoint to fetch data
+        self.api_page_size = int(os.getenv("API_PAGE_SIZE", "100"))
+        self.api_timeout = (5, 60)  # (connect, read) seconds
+        # Largest totalPosts the API reported during the last paginated fetch (None: not reported)
+        self.api_reported_total = None
+        self.http_session = self._create_http_session()
         self.embedding_model = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-ada-002")
         self.collection_name = os.getenv("VECTOR_COLLECTION_NAME", "rental_posts")
+        self.embedding_cache = None
+        self.embedding_cache_enabled = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+        self.embedding_cache_path = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(os.getcwd(), "embedding_cache.sqlite3"))
+        self.embedding_cache_max_entries = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+        # Indexing pipeline: concurrent embedding workers, token-aware batches, shared backoff on 429/5xx
+        self.embedding_workers = int(os.getenv("EMBEDDING_WORKERS", "4"))
+        self.embedding_batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", "200"))
+        self.embedding_batch_max_tokens = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "60000"))
+        self.embedding_backoff = AdaptiveBackoff(max_retries=int(os.getenv("EMBEDDING_MAX_RETRIES", "5")))
+        self._token_batcher = None
+        self.query_cache = None
+        query_cache_size = int(os.getenv("QUERY_CACHE_SIZE", "1000"))
+        if query_cache_size > 0:
+            self.query_cache = QueryEmbeddingCache(
+                capacity=query_cache_size,
+                ttl_seconds=float(os.getenv("QUERY_CACHE_TTL_SECONDS", "3600")),
+                fold_accents=os.getenv("QUERY_CACHE_FOLD_ACCENTS", "false").lower() == "true"
+            )
+        # Forced reindexes build a new collection generation and switch to it when complete;
+        # the names of the active and previous generations are kept in chroma_data/active_collection.json
+        self.persist_path = os.path.join(os.getcwd(), "chroma_data")
+        # "chroma" or "numpy" (in-process matrix search, see vector_backends.py)
+        self.vector_backend = os.getenv("VECTOR_BACKEND", "chroma").lower()
+        self.numpy_vector_dtype = os.getenv("NUMPY_VECTOR_DTYPE", "float32")
+        self.numpy_index_mode = os.getenv("NUMPY_INDEX_MODE", "exact")
+        self.numpy_ivf_nprobe = int(os.getenv("NUMPY_IVF_NPROBE", "16"))
+        self.numpy_delta_max_rows = int(os.getenv("NUMPY_DELTA_MAX_ROWS", "5000"))
+        self.active_collection_name = self.collection_name
+        self.previous_collection_name = None
+        # Counts from the most recent indexing run (added/updated/removed/skipped)
+        self.last_index_stats = {"added": 0, "updated": 0, "removed": 0, "skipped": 0}
+        # False while the active collection still holds documents without price_vnd/area_m2
+        self.numeric_filters_enabled = False
+        # Hybrid retrieval: a BM25 index over the post text of the active collection, kept in memory and
+        # updated with every write, whose ranking is fused with the vector ranking (reciprocal rank fusion)
+        self.hybrid_search_enabled = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+        self.rrf_k = int(os.getenv("HYBRID_RRF_K", "60"))
+        self.lexical_index = BM25Index() if self.hybrid_search_enabled else None
+        # Workers of a multi-process server each hold the index in memory: the generation pointer and the
+        # change log every writer appends to are watched, so writes of another process are picked up
+        # (see reload_if_changed). The pointer's mtime when loaded (0: no pointer), and how far the log was read:
+        self._generation_version = 0
+        self._changes_position = 0
+        self._writes_in_progress = 0
+        # Chroma systems of the clients _reopen_collection created, and of those they replaced (stopped at the next reopen)
+        self._own_chroma_systems = []
+        self._replaced_chroma_systems = []
+        # Serializes reloads (index watcher, request threads) and the start of writes
+        self._reload_lock = threading.Lock()
+        # Progress of the running (or last) reindex, for /stats, /metrics and the reindex jobs:
+        # posts read from the source, posts embedded and written, and the expected total (the size of the index)
+        self.index_progress = {"running": False, "mode": None, "read": 0, "written": 0, "expected": None,
+                               "started_at": None, "finished_at": None}
+
+    @staticmethod
+    def _create_http_session() -> requests.Session:
+        """Pooled keep-alive session for paginated API ingestion, retrying transient gateway errors"""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=4, max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504]))
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
 
     def init_store(self):
         """Initialize the vector store and OpenAI client"""
@@ -31,69 +126,344 @@ class VectorStore:
                 raise Exception("OPENAI_API_KEY environment variable not set")
 
             self.openai_client = OpenAI(api_key=openai_api_key)
-
-            # Initialize ChromaDB client with absolute path for Windows compatibility
-            persist_path = os.path.join(os.getcwd(), "chroma_data")
-            self.client = chromadb.PersistentClient(
-                path=persist_path,
-                settings=Settings(
-                    anonymized_telemetry=False
+            self.async_openai_client = AsyncOpenAI(api_key=openai_api_key)
+
+            # Initialize the vector database client with absolute path for Windows compatibility
+            if self.vector_backend == "numpy":
+                self.client = create_vector_client(
+                    "numpy", self.persist_path,
+                    dtype=self.numpy_vector_dtype,
+                    index_mode=self.numpy_index_mode,
+                    nprobe=self.numpy_ivf_nprobe,
+                    delta_max_rows=self.numpy_delta_max_rows
                 )
-            )
+            else:
+                self.client = create_vector_client("chroma", self.persist_path)
+            logger.info(f"Using vector backend: {self.vector_backend}")
+
+            # Resume the generation that was active when the service last ran
+            self._load_generations()
+            # Before the collection is loaded: a write made meanwhile is picked up by reload_if_changed
+            self._mark_generation_loaded()
 
             # Create or get collection
             try:
-                self.collection = self.client.get_collection(self.collection_name)
-                logger.info(f"Loaded existing collection: {self.collection_name}")
+                self.collection = self.client.get_collection(self.active_collection_name)
+                logger.info(f"Loaded existing collection: {self.active_collection_name}")
             except:
-                self.collection = self.client.create_collection(
+                self.active_collection_name = self.collection_name
+                self.previous_collection_name = None
+                self.collection = self.client.get_or_create_collection(
                     self.collection_name,
                     metadata={"hnsw:space": "cosine"}  # Use cosine similarity
                 )
                 logger.info(f"Created new collection: {self.collection_name}")
 
+            self._refresh_numeric_filter_support()
+            self.lexical_index = self._build_lexical_index(self.collection)
             logger.info(f"Using OpenAI embedding model: {self.embedding_model}")
 
+            # Persistent cache so unchanged post text is never embedded twice
+            if self.embedding_cache_enabled:
+                self.embedding_cache = EmbeddingCache(self.embedding_cache_path, self.embedding_cache_max_entries)
+                logger.info(f"Using embedding cache: {self.embedding_cache_path} ({self.embedding_cache.stats()['entries']} entries)")
+
         except Exception as e:
             logger.error(f"Error initializing vector store: {e}")
             raise
 
+    def warmup(self):
+        """Load what the first search would otherwise load, without calling the API: the stored
+        vectors are paged in (or Chroma's HNSW index loaded) by a query with a stored embedding,
+        and the tokenizer used to batch embedding requests is read"""
+        started = time.time()
+        try:
+            sample = self.collection.get(limit=1, include=['embeddings'])
+            if sample['ids']:
+                embedding = [float(value) for value in sample['embeddings'][0]]
+                self.collection.query(query_embeddings=[embedding], n_results=1, include=['distances'])
+            get_token_encoding(self.embedding_model)
+            logger.info(f"Vector store warmed up in {time.time() - started:.2f}s ({self.collection.count()} documents)")
+        except Exception as e:
+            logger.warning(f"Vector store warm-up failed: {e}")
+
+    def after_fork(self):
+        """Recreate the connections of a worker forked from a process that loaded the store.
+        The collection and the lexical index are kept: the workers share them copy-on-write
+        (the numpy backend's vectors are memory-mapped and shared through the page cache)."""
+        openai_api_key = os.getenv("OPENAI_API_KEY")
+        self.openai_client = OpenAI(api_key=openai_api_key)
+        self.async_openai_client = AsyncOpenAI(api_key=openai_api_key)
+        self._pending_query_embeddings = {}
+        self.http_session = self._create_http_session()
+        # SQLite connections must not be shared across processes
+        if self.embedding_cache is not None:
+            self.embedding_cache = EmbeddingCache(self.embedding_cache_path, self.embedding_cache_max_entries)
+
+    @property
+    def change_log(self) -> IndexChangeLog:
+        """Writes to each collection generation, announced to the other processes (see index_changes.py)"""
+        return IndexChangeLog(os.path.join(self.persist_path, "index_changes"))
+
+    @property
+    def _writer_id(self) -> str:
+        """Identifies the writes of this store in the change log (a forked worker gets its own)"""
+        return f"{os.getpid()}-{id(self):x}"
+
+    def _read_generation_version(self) -> float:
+        pointer = os.path.join(self.persist_path, "active_collection.json")
+        return os.path.getmtime(pointer) if os.path.exists(pointer) else 0
+
+    def _mark_generation_loaded(self):
+        """Record the generation pointer and the end of the change log of the generation being loaded"""
+        self._generation_version = self._read_generation_version()
+        self._changes_position = self.change_log.position(self.active_collection_name)
+
+    def has_unapplied_changes(self) -> bool:
+        """Whether another process wrote to the index since this one last picked up changes: two file
+        stats, without waiting for the reload lock. Request threads check it, the index watcher applies them."""
+        if self.client is None:
+            return False
+        return (self._read_generation_version() != self._generation_version
+                or self.change_log.position(self.active_collection_name) != self._changes_position)
+
+    def reload_if_changed(self) -> bool:
+        """Pick up what another process wrote to the index, returning whether anything changed.
+        Called by the index watcher thread (and before writes), never on a request thread.
+
+        A switch of generation (forced reindex, rollback) reloads the collection and its lexical index.
+        Writes to the active generation are read from its change log: the collection is reopened
+        and only the posts they name are updated in the lexical index and the caches.
+        """
+        with self._reload_lock:
+            return self._pick_up_changes()
+
+    def _begin_write(self):
+        """Catch up with the other processes before writing (the numpy backend places its rows
+        after those it knows of), and keep reload_if_changed from swapping the collection until _end_write"""
+        with self._reload_lock:
+            self._pick_up_changes()
+            self._writes_in_progress += 1
+
+    def _end_write(self):
+        with self._reload_lock:
+            self._writes_in_progress -= 1
+
+    def _pick_up_changes(self) -> bool:
+        if self._writes_in_progress or self.client is None:
+            return False
+        if self._read_generation_version() != self._generation_version:
+            return self._reload_generation()
+
+        name = self.active_collection_name
+        position = self.change_log.position(name)
+        if position == self._changes_position:
+            return False
+        if position < self._changes_position:
+            return self._reload_generation()  # The log was started over
+        changes, self._changes_position = self.change_log.read(name, self._changes_position)
+        # The writes of this store are already applied
+        changes = [change for change in changes if change.get("writer") != self._writer_id]
+        return self._apply_logged_changes(changes) if changes else False
+
+    def _reload_generation(self) -> bool:
+        self._load_generations()
+        self._mark_generation_loaded()
+        collection = self._reopen_collection(self.active_collection_name)
+        self.lexical_index = self._build_lexical_index(collection)
+        self.collection = collection
+        self._refresh_numeric_filter_support()
+        logger.info(f"Reloaded collection {collection.name} written by another process ({collection.count()} documents)")
+        self._notify_change(None)
+        return True
+
+    def _apply_logged_changes(self, changes: List[Dict[str, Any]]) -> bool:
+        """Apply the writes of other processes to the collection, the lexical index and the caches"""
+        present = {}  # post_id -> whether its last logged write kept it in the collection
+        for change in changes:
+            present.update(dict.fromkeys(change.get("upserted", ()), True))
+            present.update(dict.fromkeys(change.get("removed", ()), False))
+
+        collection = self._reopen_collection(self.active_collection_name)
+        lexical_index = self.lexical_index
+        if lexical_index is not None:
+            lexical_index.remove([doc_id for doc_id, kept in present.items() if not kept])
+            upserted = [doc_id for doc_id, kept in present.items() if kept]
+            for i in range(0, len(upserted), 1000):
+                page_ids = upserted[i:i+1000]
+                results = collection.get(ids=page_ids, include=['metadatas'])
+                for doc_id, metadata in zip(results['ids'], results['metadatas']):
+                    lexical_index.add(doc_id, metadata_text(metadata or {}))
+                # Removed since by a write not logged yet
+                lexical_index.remove(list(set(page_ids) - set(results['ids'])))
+        self.collection = collection
+        if not self.numeric_filters_enabled:
+            self._refresh_numeric_filter_support()
+        logger.info("Applied %d posts changed by another process to %s", len(present), collection.name)
+        self._notify_change(list(present))
+        return True
+
+    def _reopen_collection(self, name: str):
+        """Open a collection again, with what other processes wrote to it. The numpy backend reads its
+        files again; Chroma's client is reopened, its vectors index being loaded once per client (getting
+        the collection again from the same client sees the new metadata, but its queries miss the new vectors)."""
+        if hasattr(self.client, "reload_collection"):
+            return self.client.reload_collection(name)
+        # Searches started before the previous reopen are over: stop the systems it replaced
+        for system in self._replaced_chroma_systems:
+            system.stop()
+        self._replaced_chroma_systems = self._own_chroma_systems
+        self.client = create_vector_client("chroma", self.persist_path, reopen=True)
+        # Only the systems of clients this store created are stopped, other stores of the process may use the first one
+        self._own_chroma_systems = [self.client._system]
+        return self.client.get_collection(name)
+
+    def _request_embeddings(self, texts: List[str], purpose: str = "index") -> List[List[float]]:
+        """Call the OpenAI embeddings API, raising on failure"""
+        EMBEDDING_REQUESTS.inc(1, purpose)
+        EMBEDDED_TEXTS.inc(len(texts), purpose)
+        response = self.openai_client.embeddings.create(
+            input=texts,
+            model=self.embedding_model
+        )
+        return [data.embedding for data in response.data]
+
     def embed_text(self, text: str) -> List[float]:
         """Generate embedding for a text using OpenAI"""
         if not self.openai_client:
             raise Exception("OpenAI client not initialized")
 
         try:
-            response = self.openai_client.embeddings.create(
-                input=text,
-                model=self.embedding_model
-            )
-            return response.data[0].embedding
+            return self._request_embeddings([text])[0]
         except Exception as e:
             logger.error(f"Error generating embedding: {e}")
             # Fallback to a simple embedding if OpenAI fails
             return self.simple_text_embedding(text)
 
-    def embed_texts(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for multiple texts using OpenAI"""
+    def embed_query(self, query: str) -> List[float]:
+        """Generate embedding for a search query, served from the query cache when possible"""
         if not self.openai_client:
             raise Exception("OpenAI client not initialized")
 
+        if self.query_cache:
+            cached = self.query_cache.get(self.embedding_model, query)
+            if cached is not None:
+                return cached
+
+        try:
+            embedding = self._request_embeddings([query], "query")[0]
+        except Exception as e:
+            logger.error("Error generating query embedding: %s", e)
+            # Fallback embeddings are not cached so the next request retries OpenAI
+            return self.simple_text_embedding(query)
+
+        if self.query_cache:
+            self.query_cache.put(self.embedding_model, query, embedding)
+        return embedding
+
+    async def aembed_query(self, query: str) -> List[float]:
+        """Async embed_query: served from the query cache, and concurrent requests for the same
+        query wait for a single API call"""
+        if not self.async_openai_client:
+            raise Exception("OpenAI client not initialized")
+
+        if self.query_cache:
+            cached = self.query_cache.get(self.embedding_model, query)
+            if cached is not None:
+                return cached
+
+        pending = self._pending_query_embeddings.get(query)
+        if pending is None:
+            pending = asyncio.ensure_future(self._arequest_query_embedding(query))
+            self._pending_query_embeddings[query] = pending
+            pending.add_done_callback(lambda _: self._pending_query_embeddings.pop(query, None))
+        # A cancelled request must not cancel the call other requests are waiting for
+        return await asyncio.shield(pending)
+
+    async def _arequest_query_embedding(self, query: str) -> List[float]:
+        """Call the OpenAI embeddings API for one query, caching the result"""
+        EMBEDDING_REQUESTS.inc(1, "query")
+        EMBEDDED_TEXTS.inc(1, "query")
         try:
-            response = self.openai_client.embeddings.create(
-                input=texts,
+            response = await self.async_openai_client.embeddings.create(
+                input=[query],
                 model=self.embedding_model
             )
-            return [data.embedding for data in response.data]
+            embedding = response.data[0].embedding
         except Exception as e:
-            logger.error(f"Error generating embeddings: {e}")
-            # Fallback to individual embeddings if batch fails
-            embeddings = []
-            for text in texts:
-                embedding = self.embed_text(text)
-                embeddings.append(embedding)
+            logger.error("Error generating query embedding: %s", e)
+            # Fallback embeddings are not cached so the next request retries OpenAI
+            return self.simple_text_embedding(query)
+
+        if self.query_cache:
+            self.query_cache.put(self.embedding_model, query, embedding)
+        return embedding
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Generate embeddings for several search queries with one API request for the cache misses"""
+        if not self.openai_client:
+            raise Exception("OpenAI client not initialized")
+
+        embeddings = [None] * len(queries)
+        if self.query_cache:
+            for i, query in enumerate(queries):
+                embeddings[i] = self.query_cache.get(self.embedding_model, query)
+
+        # Each distinct uncached query is sent once
+        missing = list(dict.fromkeys(query for query, embedding in zip(queries, embeddings) if embedding is None))
+        if missing:
+            try:
+                fresh = dict(zip(missing, self._request_embeddings(missing, "query")))
+                if self.query_cache:
+                    for query, embedding in fresh.items():
+                        self.query_cache.put(self.embedding_model, query, embedding)
+            except Exception as e:
+                logger.error("Error generating query embeddings: %s", e)
+                # Fallback embeddings are not cached so the next request retries OpenAI
+                fresh = {query: self.simple_text_embedding(query) for query in missing}
+
+            embeddings = [fresh[query] if embedding is None else embedding for query, embedding in zip(queries, embeddings)]
+
+        return embeddings
+
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings for multiple texts using OpenAI.
+        Texts already in the embedding cache are not sent to the API. Raises once the backoff gives up:
+        a post stored with the local fallback embedding would never be re-embedded by incremental
+        reindexes, so the batch fails instead and the job or change stream batch is retried."""
+        if not self.openai_client:
+            raise Exception("OpenAI client not initialized")
+
+        if self.embedding_cache:
+            embeddings = self.embedding_cache.get_many(self.embedding_model, texts)
+        else:
+            embeddings = [None] * len(texts)
+
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if not missing:
             return embeddings
 
+        missing_texts = [texts[i] for i in missing]
+        try:
+            fresh = self.embedding_backoff.call(self._request_embeddings, missing_texts)
+        except Exception as e:
+            logger.error(f"Error generating embeddings: {e}")
+            raise
+        if self.embedding_cache:
+            self.embedding_cache.put_many(self.embedding_model, missing_texts, fresh)
+
+        for i, embedding in zip(missing, fresh):
+            embeddings[i] = embedding
+        return embeddings
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters of the embedding caches, and the size of the lexical index"""
+        return {
+            "embedding_cache": self.embedding_cache.stats() if self.embedding_cache else None,
+            "query_cache": self.query_cache.stats() if self.query_cache else None,
+            "lexical_index": self.lexical_index.stats() if self.lexical_index is not None else None
+        }
+
     def simple_text_embedding(self, text: str) -> List[float]:
         """Simple fallback embedding for when OpenAI is unavailable"""
         # This is a basic fallback - in production you might want to use a local model
@@ -114,92 +484,22 @@ class VectorStore:
 
         return embedding
 
-    def index_posts(self, force: bool = False) -> int:
+    def index_posts(self, force: bool = False, incremental: bool = False,
+                    should_stop: Optional[Callable[[], bool]] = None) -> int:
         """Index all posts from database into vector store.
-        If no database handler is available, fallback to API."""
-        try:
-            # If no database handler, use API instead
-            if not self.db_handler:
-                logger.info("No database handler found, using API to fetch posts")
-                posts = self.fetch_posts_from_api()
-            else:
-                # Get all posts from database
-                posts = self.db_handler.get_all_posts()
-
-            if not posts:
-                logger.warning("No posts found from database or API")
-                return 0
-
-            # Prepare data for indexing
-            documents = []
-            metadatas = []
-            ids = []
-
-            for post in posts:
-                # Create combined text for embedding
-                title = post.get('title', '')
-                description = post.get('description', '')
-                location = post.get('location', '') or (post.get('address', {}).get('fullAddress', '') if post.get('address') else '')
-                price = str(post.get('price', ''))
-                area = str(post.get('area', ''))
-                options = ' '.join(post.get('options', [])) if isinstance(post.get('options', []), list) else str(post.get('options', ''))
-
-                post_text = f"{title} {description} {location} {price} {area} {options}".strip()
-
-                document_id = post.get('post_id') or post.get('_id') or str(post.get('id', ''))
-
-                documents.append(post_text)
-                metadatas.append({
-                    "post_id": document_id,
-                    "title": title,
-                    "description": description,
-                    "location": location,
-                    "price": str(post.get('price', 0)),
-                    "area": str(post.get('area', 0)),
-                    "options": ', '.join(post.get('options', [])) if isinstance(post.get('options', []), list) else str(post.get('options', '')),
-                    "phone": post.get('phone', ''),
-                    "username": post.get('username', ''),
-                    "category": post.get('category', ''),
-                    "images": ', '.join(post.get('images', [])) if isinstance(post.get('images', []), list) else str(post.get('images', '')),
-                    "user_id": post.get('user_id', post.get('userId', '')),
-                    "created_at": str(post.get('createdAt', '')),
-                    "updated_at": str(post.get('updatedAt', ''))
-                })
-                ids.append(document_id)
-
-            # Clear collection if force is True
-            if force:
-                try:
-                    self.client.delete_collection(self.collection_name)
-                    self.collection = self.client.create_collection(
-                        self.collection_name,
-                        metadata={"hnsw:space": "cosine"}
-                    )
-                except:
-                    pass  # Collection might not exist yet
-
-            # Batch process embeddings
-            batch_size = 100  # Process in batches to avoid memory issues
-            total_processed = 0
-
-            for i in range(0, len(documents), batch_size):
-                batch_docs = documents[i:i+batch_size]
-                batch_metas = metadatas[i:i+batch_size]
-                batch_ids = ids[i:i+batch_size]
-
-                # Generate embeddings for batch
-                embeddings = self.embed_texts(batch_docs)
-
-                # Add to collection
-                self.collection.add(
-                    embeddings=embeddings,
-                    metadatas=batch_metas,
-                    ids=batch_ids
-                )
+        If no database handler is available, fallback to API.
+        With incremental=True only new or changed posts are embedded (see _write_documents)."""
+        # If no database handler, use API instead
+        if not self.db_handler:
+            logger.info("No database handler found, using API to fetch posts")
+            return self.index_posts_from_api(force=force, incremental=incremental, should_stop=should_stop)
 
-                total_processed += len(batch_docs)
-                logger.info(f"Indexed batch: {total_processed}/{len(documents)} posts")
+        try:
+            # Get all posts from database
+            posts = self.db_handler.get_all_posts()
 
+            total_processed = self._write_documents(iter_documents(posts), force=force, incremental=incremental,
+                                                    should_stop=should_stop)
             logger.info(f"Successfully indexed {total_processed} posts in vector store")
             return total_processed
 
@@ -207,63 +507,531 @@ class VectorStore:
             logger.error(f"Error indexing posts: {e}")
             raise
 
-    def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
-        """Search for relevant documents based on query"""
+    def _get_indexed_versions(self) -> Dict[str, tuple]:
+        """Return a map of post_id -> (updated_at, schema_version) for every post currently in the collection"""
+        versions = {}
+        page_size = 1000
+        offset = 0
+
+        while True:
+            results = self.collection.get(include=['metadatas'], limit=page_size, offset=offset)
+            page_ids = results.get('ids') or []
+            page_metas = results.get('metadatas') or []
+
+            for doc_id, metadata in zip(page_ids, page_metas):
+                metadata = metadata or {}
+                versions[doc_id] = (metadata.get('updated_at', ''), metadata.get('schema_version', 1))
+
+            if len(page_ids) < page_size:
+                break
+            offset += page_size
+
+        return versions
+
+    def add_change_listener(self, listener: Callable[[Optional[List[str]]], None]):
+        """Register a callback told which posts a reindex changed (None when searches switch collection)"""
+        self.change_listeners.append(listener)
+
+    def _notify_change(self, doc_ids: Optional[List[str]]):
+        for listener in self.change_listeners:
+            try:
+                listener(doc_ids)
+            except Exception as e:
+                logger.warning(f"Change listener failed: {e}")
+
+    def _write_documents(self, records: Iterable[Record], force: bool = False, incremental: bool = False,
+                         should_stop: Optional[Callable[[], bool]] = None,
+                         expected_count: Optional[Callable[[], Optional[int]]] = None) -> int:
+        """Embed and store a stream of records, returning the number of posts embedded.
+
+        Records are consumed as they arrive, so embedding starts before the source has
+        been read completely. In incremental mode the incoming updated_at of each post is
+        compared with the one stored in the collection: unchanged posts are skipped, new
+        or changed posts are upserted and, once the whole source has been read without
+        errors, posts that were not returned are deleted. Posts returned twice (offset pages
+        overlap when posts are added while paging) are only written once, in every mode.
+
+        expected_count is called once the source has been read and returns how many posts the
+        source reported (None if unknown); when fewer distinct posts were read, a post may have
+        been skipped by shifting pages, and nothing is deleted this run.
+
+        should_stop is called before each record is read; when it returns True the run raises
+        IndexingCancelled like any failure: an unfinished generation is dropped and an
+        incremental run deletes nothing, the posts already upserted are kept.
+        """
+        stats = {"added": 0, "updated": 0, "removed": 0, "skipped": 0}
+        self.last_index_stats = stats
+
+        # Make sure the source returned something before touching the collection
+        records = iter(records)
+        first = next(records, None)
+        if first is None:
+            logger.warning("No posts found to index")
+            return 0
+        records = self._track_records(itertools.chain([first], records), should_stop)
+        incremental = incremental and not force
+        mode = "force" if force else "incremental" if incremental else "full"
+        started = time.time()
+        self.index_progress = {"running": True, "mode": mode, "read": 0, "written": 0,
+                               "expected": self.collection.count() if self.collection else None,
+                               "started_at": started, "finished_at": None}
+        # Start from what other processes wrote (the numpy backend places its rows after those it knows of); until
+        # the write is over, reload_if_changed leaves the collection of this process alone
+        self._begin_write()
+        try:
+            # A forced reindex builds a fresh generation next to the live one, which keeps serving searches
+            if force:
+                collection = self.client.create_collection(
+                    f"{self.collection_name}_{int(time.time() * 1000)}",
+                    metadata={"hnsw:space": "cosine"}
+                )
+                logger.info(f"Building new collection generation: {collection.name}")
+            else:
+                collection = self.collection
+            seen_ids = set()
+            # Posts written to, and removed from, the live collection, logged for the other processes
+            written_ids = []
+            removed_ids = []
+            # A new generation gets its own lexical index, swapped in with the collection
+            lexical_index = BM25Index() if force and self.hybrid_search_enabled else self.lexical_index
+
+            def unique_records():
+                # Write batches must not contain duplicate IDs (pages can overlap while posts are added)
+                for record in records:
+                    if record[0] in seen_ids:
+                        continue
+                    seen_ids.add(record[0])
+                    yield record
+
+            if incremental:
+                indexed_versions = self._get_indexed_versions()
+
+                def changed_records():
+                    for doc_id, text, meta in unique_records():
+                        indexed_version = indexed_versions.get(doc_id)
+                        if indexed_version is None:
+                            stats["added"] += 1
+                        elif not meta.get("updated_at") or indexed_version != (meta.get("updated_at"), meta.get("schema_version")):
+                            stats["updated"] += 1
+                        else:
+                            stats["skipped"] += 1
+                            continue
+                        yield doc_id, text, meta
+
+                source = changed_records()
+                # Upsert in incremental mode so changed posts replace their old vectors
+                store = collection.upsert
+            else:
+                def counted_records():
+                    for record in unique_records():
+                        stats["added"] += 1
+                        yield record
+
+                source = counted_records()
+                store = collection.add
+
+            def write_batch(batch_ids, embeddings, batch_metas):
+                store(embeddings=embeddings, metadatas=batch_metas, ids=batch_ids)
+                self.index_progress["written"] += len(batch_ids)
+                if lexical_index is not None:
+                    for doc_id, meta in zip(batch_ids, batch_metas):
+                        lexical_index.add(doc_id, metadata_text(meta))
+                if not force:
+                    written_ids.extend(batch_ids)
+                    self._notify_change(batch_ids)
+
+            try:
+                total_processed = self._create_pipeline().run(source, write_batch)
+            except Exception:
+                if force:
+                    logger.error(f"Reindex failed, dropping unfinished generation {collection.name}")
+                    self.client.delete_collection(collection.name)
+                    self.change_log.delete(collection.name)
+                else:
+                    # The posts written before the failure are kept (see above)
+                    try:
+                        self._commit_writes(collection, written_ids, [])
+                    except Exception as e:
+                        logger.error(f"Could not save the posts written before the failure: {e}")
+                raise
+
+            if incremental:
+                expected = expected_count() if expected_count is not None else None
+                if expected is not None and len(seen_ids) < expected:
+                    # Posts deleted while paging shift later posts back a page, so one of them was never read
+                    logger.warning(f"Read {len(seen_ids)} of {expected} posts, not removing any post this run")
+                else:
+                    removed_ids = [doc_id for doc_id in indexed_versions if doc_id not in seen_ids]
+                for i in range(0, len(removed_ids), 1000):
+                    collection.delete(ids=removed_ids[i:i+1000])
+                if lexical_index is not None:
+                    lexical_index.remove(removed_ids)
+                if removed_ids:
+                    self._notify_change(removed_ids)
+                stats["removed"] = len(removed_ids)
+                logger.info(f"Incremental index result: {stats}")
+
+            if force:
+                if hasattr(collection, "persist"):
+                    collection.persist()
+                self._activate_collection(collection, lexical_index)
+            else:
+                self._commit_writes(collection, written_ids, removed_ids)
+
+            self._refresh_numeric_filter_support()
+            return total_processed
+        finally:
+            self._end_write()
+            self.index_progress["running"] = False
+            self.index_progress["finished_at"] = time.time()
+            REINDEX_SECONDS.observe(self.index_progress["finished_at"] - started, mode)
+
+    def apply_changes(self, records: List[Record], removed_ids: List[str]) -> int:
+        """Upsert records and delete removed_ids in the active collection, returning the number of posts
+        embedded. Used for near-real-time indexing of individual posts between reindexes."""
+        if not self.collection:
+            raise Exception("Vector store not initialized")
+        self._begin_write()
+        try:
+            return self._apply_changes(records, removed_ids)
+        finally:
+            self._end_write()
+
+    def _apply_changes(self, records: List[Record], removed_ids: List[str]) -> int:
+        collection = self.collection
+        lexical_index = self.lexical_index
+        written_ids = []
+
+        def write_batch(batch_ids, embeddings, batch_metas):
+            collection.upsert(embeddings=embeddings, metadatas=batch_metas, ids=batch_ids)
+            written_ids.extend(batch_ids)
+            if lexical_index is not None:
+                for doc_id, meta in zip(batch_ids, batch_metas):
+                    lexical_index.add(doc_id, metadata_text(meta))
+            self._notify_change(batch_ids)
+
+        written = self._create_pipeline().run(records, write_batch) if records else 0
+        if removed_ids:
+            collection.delete(ids=removed_ids)
+            if lexical_index is not None:
+                lexical_index.remove(removed_ids)
+            self._notify_change(removed_ids)
+        self._commit_writes(collection, written_ids, removed_ids)
+        return written
+
+    def _commit_writes(self, collection, upserted_ids: List[str], removed_ids: List[str]):
+        """Flush the writes of backends buffering them in memory (numpy; Chroma writes through), then
+        log them so the other processes pick them up"""
+        if hasattr(collection, "persist"):
+            collection.persist()
+        logged = self.change_log.append(collection.name, self._writer_id, upserted_ids, removed_ids)
+        with self._reload_lock:
+            # Nothing for this store to pick up in its own line, unless another process logged before it
+            if logged is not None and collection.name == self.active_collection_name and logged[0] == self._changes_position:
+                self._changes_position = logged[1]
+
+    def _track_records(self, records: Iterator[Record], should_stop: Optional[Callable[[], bool]]) -> Iterator[Record]:
+        """Count the records read into index_progress, stopping when should_stop returns True"""
+        for record in records:
+            if should_stop is not None and should_stop():
+                raise IndexingCancelled("Reindex cancelled")
+            self.index_progress["read"] += 1
+            yield record
+
+    def _refresh_numeric_filter_support(self):
+        """Filters are only pushed down once every document carries the numeric metadata"""
+        try:
+            # Documents indexed before numeric metadata existed have no schema_version at all
+            current = self.collection.get(where={"schema_version": {"$gte": NUMERIC_METADATA_SCHEMA_VERSION}}, include=[])
+            self.numeric_filters_enabled = len(current['ids']) == self.collection.count()
+        except Exception as e:
+            logger.warning(f"Could not check numeric metadata support: {e}")
+            self.numeric_filters_enabled = False
+
+        if not self.numeric_filters_enabled:
+            logger.warning("Collection has documents without numeric metadata; filters are applied after retrieval until it is reindexed")
+
+    def _load_generations(self):
+        """Read the active/previous collection names written by the last swap"""
+        try:
+            with open(os.path.join(self.persist_path, "active_collection.json"), encoding="utf-8") as f:
+                generations = json.load(f)
+            self.active_collection_name = generations.get("active") or self.collection_name
+            self.previous_collection_name = generations.get("previous")
+        except FileNotFoundError:
+            self.active_collection_name = self.collection_name
+            self.previous_collection_name = None
+
+    def _save_generations(self):
+        # Write to a temp file and rename so a crash never leaves a half-written pointer
+        path = os.path.join(self.persist_path, "active_collection.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"active": self.active_collection_name, "previous": self.previous_collection_name}, f)
+        os.replace(path + ".tmp", path)
+
+    def _activate_collection(self, collection, lexical_index: Optional[BM25Index] = None):
+        """Switch searches to a completed collection generation.
+        The generation it replaces is kept for rollback, older ones are deleted.
+        lexical_index is the one built with the generation, rebuilt from its metadata when not given."""
+        outdated = self.previous_collection_name
+
+        self.previous_collection_name = self.active_collection_name
+        self.active_collection_name = collection.name
+        self.lexical_index = lexical_index if lexical_index is not None else self._build_lexical_index(collection)
+        self.collection = collection  # Single reference assignment: searches see either old or new
+        self._save_generations()
+        self._mark_generation_loaded()
+        logger.info(f"Activated collection {collection.name} (previous: {self.previous_collection_name})")
+        self._notify_change(None)
+
+        if outdated and outdated not in (self.active_collection_name, self.previous_collection_name):
+            try:
+                self.client.delete_collection(outdated)
+                self.change_log.delete(outdated)
+                logger.info(f"Deleted outdated collection generation: {outdated}")
+            except Exception as e:
+                logger.warning(f"Could not delete outdated collection {outdated}: {e}")
+
+    def rollback_collection(self) -> str:
+        """Switch back to the previous collection generation, returning its name"""
+        if not self.previous_collection_name:
+            raise Exception("No previous collection generation to roll back to")
+
+        collection = self.client.get_collection(self.previous_collection_name)
+        self.previous_collection_name, self.active_collection_name = self.active_collection_name, collection.name
+        self.lexical_index = self._build_lexical_index(collection)
+        self.collection = collection
+        self._save_generations()
+        self._mark_generation_loaded()
+        self._refresh_numeric_filter_support()
+        logger.info(f"Rolled back to collection {collection.name}")
+        self._notify_change(None)
+        return collection.name
+
+    def _build_lexical_index(self, collection) -> Optional[BM25Index]:
+        """BM25 index of every post in a collection (None when hybrid search is disabled)"""
+        if not self.hybrid_search_enabled:
+            return None
+        lexical_index = BM25Index()
+        page_size = 1000
+        offset = 0
+        while True:
+            results = collection.get(include=['metadatas'], limit=page_size, offset=offset)
+            page_ids = results.get('ids') or []
+            for doc_id, metadata in zip(page_ids, results.get('metadatas') or []):
+                lexical_index.add(doc_id, metadata_text(metadata or {}))
+            if len(page_ids) < page_size:
+                break
+            offset += page_size
+        logger.info(f"Built lexical index: {lexical_index.stats()}")
+        return lexical_index
+
+    def _create_pipeline(self) -> IndexingPipeline:
+        """Pipeline that embeds batches concurrently while earlier batches are written"""
+        if self._token_batcher is None:
+            self._token_batcher = TokenBatcher(
+                self.embedding_model,
+                max_batch_size=self.embedding_batch_size,
+                max_batch_tokens=self.embedding_batch_max_tokens
+            )
+        return IndexingPipeline(self.embed_texts, self._token_batcher, max_workers=self.embedding_workers)
+
+    def _build_where(self, filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Translate structured filters into a Chroma where clause.
+
+        Supported keys: min_price / max_price (VND), min_area / max_area (m²) and category (slug).
+        Unbounded limits (None or infinity) are left out.
+        """
+        if not filters or not self.numeric_filters_enabled:
+            return None
+
+        conditions = []
+        for key, field, operator in (("min_price", "price_vnd", "$gte"), ("max_price", "price_vnd", "$lte"),
+                                     ("min_area", "area_m2", "$gte"), ("max_area", "area_m2", "$lte")):
+            value = filters.get(key)
+            if value is not None and value not in (float('inf'), float('-inf')):
+                conditions.append({field: {operator: float(value)}})
+        if filters.get("category"):
+            conditions.append({"category": {"$eq": canonical_category(filters["category"])}})
+
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+    def search(self, query: str, top_k: int = 5, filters: Optional[Dict[str, Any]] = None,
+               query_embedding: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """Search for relevant documents based on query.
+        Structured filters (see _build_where) are applied inside the vector query, so top_k
+        matching posts are returned instead of top_k posts that are filtered afterwards.
+        query_embedding skips embedding the query when it is already known."""
         try:
             if not self.collection:
                 raise Exception("Vector store not initialized")
 
-            # Generate embedding for query
-            query_embedding = self.embed_text(query)
+            # Generate embedding for query (cached for repeated queries)
+            if query_embedding is None:
+                query_embedding = self.embed_query(query)
 
             # Search in vector store
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=top_k,
-                include=['metadatas', 'documents', 'distances']
-            )
-
-            # Format results
-            formatted_results = []
-            if results['metadatas'] and results['metadatas'][0]:
-                for i in range(len(results['metadatas'][0])):
-                    metadata = results['metadatas'][0][i]
-                    document = results['documents'][0][i] if results['documents'] and results['documents'][0] else ""
-                    distance = results['distances'][0][i] if results['distances'] and results['distances'][0] else 0
-
-                    formatted_results.append({
-                        "id": metadata.get("post_id"),
-                        "title": metadata.get("title", ""),
-                        "description": metadata.get("description", ""),
-                        "location": metadata.get("location", ""),
-                        "price": metadata.get("price", 0),
-                        "area": metadata.get("area", 0),
-                        "options": metadata.get("options", "").split(", ") if metadata.get("options", "") else [],
-                        "images": metadata.get("images", "").split(", ") if metadata.get("images", "") else [],
-                        "document": document,
-                        "similarity": 1 - distance,  # Convert distance to similarity
-                        "metadata": metadata
-                    })
+            where = self._build_where(filters)
+            with stage_timer("vector_query"):
+                results = self.collection.query(
+                    query_embeddings=[query_embedding],
+                    n_results=top_k,
+                    where=where,
+                    include=['metadatas', 'documents', 'distances']
+                )
 
-            return formatted_results
+            return self._fuse_lexical(query, query_embedding, self._format_query_results(results, 0), top_k, where)
 
         except Exception as e:
-            logger.error(f"Error searching vector store: {e}")
+            logger.error("Error searching vector store: %s", e)
             return []
 
+    def search_many(self, queries: List[str], top_k: int = 5,
+                    filters: Optional[Any] = None) -> List[List[Dict[str, Any]]]:
+        """Search for several queries at once, returning one result list per query.
+
+        All queries are embedded in one request and sent to the collection as a single
+        multi-vector query. filters is either one filter dict for every query or a list
+        with one per query; queries sharing the same filters share a collection query.
+        """
+        if not queries:
+            return []
+        try:
+            if not self.collection:
+                raise Exception("Vector store not initialized")
+
+            embeddings = self.embed_queries(queries)
+            per_query_filters = filters if isinstance(filters, list) else [filters] * len(queries)
+
+            # Group query positions by where clause (Chroma takes one where per query call)
+            groups = {}
+            for i, query_filters in enumerate(per_query_filters):
+                where = self._build_where(query_filters)
+                key = json.dumps(where, sort_keys=True)
+                groups.setdefault(key, (where, []))[1].append(i)
+
+            formatted = [[] for _ in queries]
+            for where, positions in groups.values():
+                with stage_timer("vector_query"):
+                    results = self.collection.query(
+                        query_embeddings=[embeddings[i] for i in positions],
+                        n_results=top_k,
+                        where=where,
+                        include=['metadatas', 'documents', 'distances']
+                    )
+                for index, position in enumerate(positions):
+                    formatted[position] = self._fuse_lexical(queries[position], embeddings[position],
+                                                             self._format_query_results(results, index), top_k, where)
+            return formatted
+
+        except Exception as e:
+            logger.error("Error searching vector store: %s", e)
+            return [[] for _ in queries]
+
+    def _fuse_lexical(self, query: str, query_embedding: List[float], vector_results: List[Dict[str, Any]],
+                      top_k: int, where: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Merge the BM25 matches of the query into the vector results with reciprocal rank fusion.
+
+        Exact place and street names ("phú lương") rank posts that mention them even when
+        the embedding similarity is diluted by the rest of the question. Lexical matches
+        missing from the vector results are read from the collection with the same where
+        clause and get their cosine similarity from the stored embeddings; no API call is made.
+        """
+        lexical_index = self.lexical_index
+        if lexical_index is None or not len(lexical_index):
+            return vector_results
+        with stage_timer("lexical"):
+            return self._fuse_lexical_results(lexical_index, query, query_embedding, vector_results, top_k, where)
+
+    def _fuse_lexical_results(self, lexical_index: BM25Index, query: str, query_embedding: List[float],
+                              vector_results: List[Dict[str, Any]], top_k: int,
+                              where: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        try:
+            # Over-fetch, lexical matches outside the filters are dropped. Posts only sharing syllables
+            # found in nearly every post ("phòng", "trọ") score close to 0 and are not lexical matches.
+            lexical_ids = [doc_id for doc_id, _ in lexical_index.search(query, top_k * 4, min_relative_score=0.1)]
+            by_id = {doc["id"]: doc for doc in vector_results}
+            missing = [doc_id for doc_id in lexical_ids if doc_id not in by_id]
+            if missing:
+                by_id.update(self._get_scored_documents(missing, query_embedding, where))
+            lexical_ids = [doc_id for doc_id in lexical_ids if doc_id in by_id][:top_k]
+
+            fused = rrf_fuse([[doc["id"] for doc in vector_results], lexical_ids], self.rrf_k)
+            return [dict(by_id[doc_id], rrf_score=score) for doc_id, score in fused[:top_k]]
+        except Exception as e:
+            logger.warning("Lexical search failed, using vector results only: %s", e)
+            return vector_results
+
+    def _get_scored_documents(self, doc_ids: List[str], query_embedding: List[float],
+                              where: Optional[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Documents matching the where clause, formatted like query results, keyed by ID"""
+        results = self.collection.get(ids=doc_ids, where=where, include=['metadatas', 'documents', 'embeddings'])
+        if not results['ids']:
+            return {}
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        matrix = np.asarray(results['embeddings'], dtype=np.float32)
+        similarities = matrix @ query / np.maximum(np.linalg.norm(matrix, axis=1), 1e-12)
+        nested = {
+            "metadatas": [results['metadatas']],
+            "documents": [results['documents']] if results.get('documents') is not None else None,
+            "distances": [[float(1.0 - similarity) for similarity in similarities]]
+        }
+        return {doc["id"]: doc for doc in self._format_query_results(nested, 0)}
+
+    @staticmethod
+    def _format_query_results(results: Dict[str, Any], index: int) -> List[Dict[str, Any]]:
+        """Format the matches of query number index in a collection.query result"""
+        formatted_results = []
+        if not results['metadatas'] or not results['metadatas'][index]:
+            return formatted_results
+
+        metadatas = results['metadatas'][index]
+        documents = results['documents'][index] if results['documents'] and results['documents'][index] else None
+        distances = results['distances'][index] if results['distances'] and results['distances'][index] else None
+
+        for i, metadata in enumerate(metadatas):
+            document = documents[i] if documents else ""
+            distance = distances[i] if distances else 0
+
+            formatted_results.append({
+                "id": metadata.get("post_id"),
+                "title": metadata.get("title", ""),
+                "description": metadata.get("description", ""),
+                "location": metadata.get("location", ""),
+                "price": metadata.get("price", 0),
+                "area": metadata.get("area", 0),
+                "options": metadata.get("options", "").split(", ") if metadata.get("options", "") else [],
+                "images": metadata.get("images", "").split(", ") if metadata.get("images", "") else [],
+                "document": document,
+                "similarity": 1 - distance,  # Convert distance to similarity
+                "metadata": metadata
+            })
+
+        return formatted_results
+
     def get_document_by_id(self, doc_id: str) -> Optional[Dict[str, Any]]:
         """Get a specific document by ID"""
+        return self.get_documents_by_ids([doc_id]).get(doc_id)
+
+    def get_documents_by_ids(self, doc_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get several documents in one collection lookup, as a dict keyed by ID (missing IDs are left out)"""
+        if not doc_ids:
+            return {}
         try:
             results = self.collection.get(
-                ids=[doc_id],
+                ids=list(dict.fromkeys(doc_ids)),
                 include=['metadatas', 'documents']
             )
 
-            if results['metadatas'] and len(results['metadatas']) > 0:
-                metadata = results['metadatas'][0]
-                document = results['documents'][0] if results['documents'] and len(results['documents']) > 0 else ""
+            documents = {}
+            for i, doc_id in enumerate(results['ids']):
+                metadata = results['metadatas'][i]
+                document = results['documents'][i] if results['documents'] else ""
 
-                return {
+                documents[doc_id] = {
                     "id": metadata.get("post_id"),
                     "title": metadata.get("title", ""),
                     "description": metadata.get("description", ""),
@@ -275,134 +1043,101 @@ class VectorStore:
                     "document": document,
                     "metadata": metadata
                 }
-
-            return None
+            return documents
         except Exception as e:
-            logger.error(f"Error getting document by ID: {e}")
-            return None
-
-    def fetch_posts_from_api(self) -> List[Dict[str, Any]]:
-        """Fetch posts directly from the API instead of database"""
-        try:
-            # Fetch posts from the API
-            response = requests.get(self.api_url, params={'limit': 1000})  # Fetch up to 1000 posts
+            logger.error(f"Error getting documents by ID: {e}")
+            return {}
+
+    def iter_post_pages_from_api(self, page_size: Optional[int] = None) -> Iterator[List[Dict[str, Any]]]:
+        """Yield pages of posts from the API as they are downloaded.
+        Raises on HTTP errors so callers never mistake a partial download for the full catalogue."""
+        page_size = page_size or self.api_page_size
+        page = 1
+        previous_first_id = None
+        self.api_reported_total = None
+
+        while True:
+            response = self.http_session.get(self.api_url, params={'page': page, 'limit': page_size}, timeout=self.api_timeout)
             response.raise_for_status()
 
-            data = response.json()
-
-            # Handle different response formats
-            if 'metadata' in data and isinstance(data, dict):
-                posts = data['metadata']['posts'] if 'posts' in data['metadata'] else data['metadata']
-            else:
-                posts = data
-
-            if isinstance(posts, dict) and 'posts' in posts:
-                posts = posts['posts']
-
-            # Ensure posts is a list
-            if not isinstance(posts, list):
-                posts = []
-
-            # Convert ObjectId to string for each post if needed
-            for post in posts:
-                if isinstance(post, dict):
-                    if '_id' in post and isinstance(post['_id'], dict) and '$oid' in post['_id']:
-                        # Handle MongoDB ObjectID format if needed
-                        post['post_id'] = post['_id']['$oid']
-                    elif '_id' in post:
-                        post['post_id'] = str(post['_id'])
-                    else:
-                        post['post_id'] = str(post.get('id', ''))
+            posts, has_next_page, total = self._parse_posts_page(response.json())
+            if total is not None:
+                self.api_reported_total = max(total, self.api_reported_total or 0)
+            if not posts:
+                return
+
+            # Guard against an API that ignores the page parameter and keeps returning the same page
+            if posts[0].get('post_id') == previous_first_id:
+                logger.warning(f"API returned page {page} twice, stopping pagination")
+                return
+            previous_first_id = posts[0].get('post_id')
+
+            logger.info(f"Fetched page {page} with {len(posts)} posts from API")
+            yield posts
+
+            if has_next_page is False or (has_next_page is None and len(posts) < page_size):
+                return
+            page += 1
+
+    def _parse_posts_page(self, data: Any) -> tuple:
+        """Extract (posts, has_next_page, total_posts) from an API response; the last two are None if unknown"""
+        has_next_page = None
+        total = None
+
+        # Handle different response formats
+        if 'metadata' in data and isinstance(data, dict):
+            if isinstance(data['metadata'], dict) and 'hasNextPage' in data['metadata']:
+                has_next_page = bool(data['metadata']['hasNextPage'])
+            if isinstance(data['metadata'], dict) and isinstance(data['metadata'].get('totalPosts'), int):
+                total = data['metadata']['totalPosts']
+            posts = data['metadata']['posts'] if 'posts' in data['metadata'] else data['metadata']
+        else:
+            posts = data
+
+        if isinstance(posts, dict) and 'posts' in posts:
+            posts = posts['posts']
+
+        # Ensure posts is a list
+        if not isinstance(posts, list):
+            posts = []
+
+        # Convert ObjectId to string for each post if needed
+        for post in posts:
+            if isinstance(post, dict):
+                if '_id' in post and isinstance(post['_id'], dict) and '$oid' in post['_id']:
+                    # Handle MongoDB ObjectID format if needed
+                    post['post_id'] = post['_id']['$oid']
+                elif '_id' in post:
+                    post['post_id'] = str(post['_id'])
+                else:
+                    post['post_id'] = str(post.get('id', ''))
+
+        return [post for post in posts if isinstance(post, dict)], has_next_page, total
 
+    def fetch_posts_from_api(self) -> List[Dict[str, Any]]:
+        """Fetch all posts directly from the API instead of database"""
+        try:
+            posts = [post for page in self.iter_post_pages_from_api() for post in page]
             logger.info(f"Fetched {len(posts)} posts from API")
             return posts
         except Exception as e:
             logger.error(f"Error fetching posts from API: {e}")
             return []
 
-    def index_posts_from_api(self, force: bool = False) -> int:
-        """Index all posts fetched from API into vector store"""
+    def index_posts_from_api(self, force: bool = False, incremental: bool = False,
+                             should_stop: Optional[Callable[[], bool]] = None) -> int:
+        """Index all posts fetched from API into vector store.
+        Pages are embedded while the following pages are still being downloaded."""
         try:
-            # Get all posts from API
-            posts = self.fetch_posts_from_api()
-
-            if not posts:
-                logger.warning("No posts found from API")
-                return 0
-
-            # Prepare data for indexing
-            documents = []
-            metadatas = []
-            ids = []
-
-            for post in posts:
-                # Create combined text for embedding
-                title = post.get('title', '')
-                description = post.get('description', '')
-                location = post.get('location', '') or (post.get('address', {}).get('fullAddress', '') if post.get('address') else '')
-                price = str(post.get('price', ''))
-                area = str(post.get('area', ''))
-                options = ' '.join(post.get('options', [])) if isinstance(post.get('options', []), list) else str(post.get('options', ''))
-
-                post_text = f"{title} {description} {location} {price} {area} {options}".strip()
-
-                document_id = post.get('post_id') or post.get('_id') or str(post.get('id', ''))
-
-                documents.append(post_text)
-                metadatas.append({
-                    "post_id": document_id,
-                    "title": title,
-                    "description": description,
-                    "location": location,
-                    "price": str(post.get('price', 0)),
-                    "area": str(post.get('area', 0)),
-                    "options": ', '.join(post.get('options', [])) if isinstance(post.get('options', []), list) else str(post.get('options', '')),
-                    "phone": post.get('phone', ''),
-                    "username": post.get('username', ''),
-                    "category": post.get('category', ''),
-                    "images": ', '.join(post.get('images', [])) if isinstance(post.get('images', []), list) else str(post.get('images', '')),
-                    "user_id": post.get('user_id', post.get('userId', '')),
-                    "created_at": str(post.get('createdAt', '')),
-                    "updated_at": str(post.get('updatedAt', ''))
-                })
-                ids.append(document_id)
-
-            # Clear collection if force is True
-            if force:
-                try:
-                    self.client.delete_collection(self.collection_name)
-                    self.collection = self.client.create_collection(
-                        self.collection_name,
-                        metadata={"hnsw:space": "cosine"}
-                    )
-                except:
-                    pass  # Collection might not exist yet
-
-            # Batch process embeddings
-            batch_size = 100  # Process in batches to avoid memory issues
-            total_processed = 0
-
-            for i in range(0, len(documents), batch_size):
-                batch_docs = documents[i:i+batch_size]
-                batch_metas = metadatas[i:i+batch_size]
-                batch_ids = ids[i:i+batch_size]
-
-                # Generate embeddings for batch
-                embeddings = self.embed_texts(batch_docs)
-
-                # Add to collection
-                self.collection.add(
-                    embeddings=embeddings,
-                    metadatas=batch_metas,
-                    ids=batch_ids
-                )
-
-                total_processed += len(batch_docs)
-                logger.info(f"Indexed batch from API: {total_processed}/{len(documents)} posts")
+            self.api_reported_total = None
+            records = (record for page in self.iter_post_pages_from_api() for record in iter_documents(page))
 
+            total_processed = self._write_documents(records, force=force, incremental=incremental,
+                                                    should_stop=should_stop,
+                                                    expected_count=lambda: self.api_reported_total)
             logger.info(f"Successfully indexed {total_processed} posts from API into vector store")
             return total_processed
 
         except Exception as e:
             logger.error(f"Error indexing posts from API: {e}")
-            raise
\ No newline at end of file
+            raise
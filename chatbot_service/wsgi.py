@@ -0,0 +1,20 @@
+"""
+WSGI entry point for multi-process servers:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The vector index and the LLM client are loaded and warmed up when this module is
+imported, before any request is handled. With preload_app (see gunicorn.conf.py) that
+happens once in the master process and the forked workers share the loaded index.
+"""
+import gc
+
+import main
+
+main.init_services()
+# The app built by main.py when imported, not a second one
+app = main.app
+
+# Everything loaded so far lives as long as the process: keep the garbage collector from
+# touching it, which would copy its memory pages into every forked worker
+gc.freeze()
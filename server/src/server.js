@@ -128,8 +128,8 @@ connectDB().then(() => {
 
     // Initialize RAG system by indexing all posts on startup
     console.log('Initializing RAG system...');
-    reindexPosts('api').then(count => {  // Changed to use API as source
-        console.log(`RAG system initialized with ${count.indexed_count} posts from ${count.source}`);
+    reindexPosts('api').then(result => {  // Changed to use API as source; runs as a background job
+        console.log(`RAG system reindex job ${result.job.id} started from ${result.source}`);
     }).catch(err => {
         console.error('Error initializing RAG system:', err);
     });